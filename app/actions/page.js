@@ -2,7 +2,8 @@
 
 import React, { useState, useEffect } from 'react';
 import { api } from '../utils/api';
-import { getRoutines, addRoutine, updateRoutine, deleteRoutine, reorderRoutines } from '../actions/routines';
+import { getRoutines, addRoutine, updateRoutine, deleteRoutine } from '../actions/routines';
+import { moveNeighbours } from '../utils/ordering';
 import MobileMenuButton from '../../components/MobileMenuButton';
 
 const WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'];
@@ -243,10 +244,10 @@ export default function ActionsPage() {
     }
 
     const onDragEnd = async () => {
+        if (!draggedItem) return;
         setDraggedItem(null);
-        const ids = routines.map(r => r.id);
         try {
-            await reorderRoutines(ids);
+            await api.moveRoutine(draggedItem.id, moveNeighbours(routines, draggedItem.id));
         } catch (e) {
             console.error("Failed to reorder", e);
             fetchRoutines();
@@ -1,7 +1,9 @@
 "use client";
 
 import React, { useState, useEffect, useRef } from 'react';
-import { getBacklogItems, addBacklogItem, updateBacklogItem, deleteBacklogItem, reorderBacklogItems } from '../actions/backlog';
+import { getBacklogItems, addBacklogItem, updateBacklogItem, deleteBacklogItem } from '../actions/backlog';
+import { api } from '../utils/api';
+import { moveNeighbours } from '../utils/ordering';
 import { getCurrentSprint, addTasksToSprint } from '../actions/sprint';
 import { pickFromBacklog } from '../actions/daily';
 
@@ -263,10 +265,11 @@ export default function BacklogPage() {
     };
 
     const onDragEnd = async () => {
+        if (!draggedItem) return;
         setDraggedItem(null);
-        // Persist order
+        // Persist order (single write for the moved item)
         try {
-            await reorderBacklogItems(tasks.map(t => t.id));
+            await api.moveBacklogItem(draggedItem.id, moveNeighbours(tasks, draggedItem.id));
         } catch (e) {
             console.error('Failed to save order', e);
         }
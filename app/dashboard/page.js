@@ -3,7 +3,8 @@
 import React, { useState, useEffect, useRef, Suspense } from 'react';
 import { api } from '../utils/api';
 import { getDailyTasks, addQuickTask } from '../actions/dashboard';
-import { toggleTaskComplete, skipTask, highlightTask, updateTaskTitle, reorderDailyTasks, postponeTask } from '../actions/daily';
+import { toggleTaskComplete, skipTask, highlightTask, updateTaskTitle, postponeTask } from '../actions/daily';
+import { moveNeighbours } from '../utils/ordering';
 import { formatDate, getBusinessDateJST } from '../utils/date';
 import DatePicker from "react-datepicker";
 import "react-datepicker/dist/react-datepicker.css";
@@ -491,9 +492,8 @@ function DashboardContent() {
         if (!draggedItem) return;
         setDraggedItem(null);
 
-        const ids = tasks.map(t => t.id);
         try {
-            await reorderDailyTasks(ids);
+            await api.moveDaily(draggedItem.id, moveNeighbours(tasks, draggedItem.id));
         } catch (e) {
             console.error("Failed to reorder", e);
         }
@@ -524,9 +524,8 @@ function DashboardContent() {
         setTasks(newTasks);
         saveCache(newTasks);
 
-        const ids = newTasks.map(t => t.id);
         try {
-            await reorderDailyTasks(ids);
+            await api.moveDaily(task.id, moveNeighbours(newTasks, task.id));
         } catch (e) {
             console.error("Failed to reorder manually", e);
         }
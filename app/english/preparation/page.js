@@ -2,11 +2,14 @@
 import React, { useState, useEffect } from "react";
 import ReactMarkdown from "react-markdown";
 import MobileMenuButton from "../../../components/MobileMenuButton";
+import { fetchSummaryPage, fetchDetail } from "../../utils/paging";
 import AiChatSidebar from "../../../components/AiChatSidebar";
 import PhraseRegisterModal from "../../../components/english/PhraseRegisterModal";
 
 export default function PreparationPage() {
     const [tasks, setTasks] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null); // X-Next-Cursor of the last loaded page (null = all loaded)
+    const [isLoadingMore, setIsLoadingMore] = useState(false);
     const [selectedTask, setSelectedTask] = useState(null);
     const [isCreating, setIsCreating] = useState(false);
     const [newTopic, setNewTopic] = useState("");
@@ -91,15 +94,27 @@ export default function PreparationPage() {
         return () => window.removeEventListener('resize', handleResize);
     }, []);
 
-    const fetchTasks = async () => {
+    const fetchTasks = async (cursor = null) => {
+        if (cursor) setIsLoadingMore(true);
         try {
-            const res = await fetch("/api/english/preparation");
-            if (res.ok) {
-                const data = await res.json();
-                setTasks(data);
-            }
+            // Summary rows only; the full task is loaded when it is selected
+            const page = await fetchSummaryPage("/api/english/preparation", cursor);
+            setTasks(prev => cursor ? [...prev, ...page.items.filter(t => !prev.some(p => p.id === t.id))] : page.items);
+            setNextCursor(page.nextCursor);
         } catch (error) {
             console.error("Failed to fetch tasks", error);
+        } finally {
+            setIsLoadingMore(false);
+        }
+    };
+
+    const loadTaskDetail = async (id) => {
+        try {
+            const detail = await fetchDetail("/api/english/preparation", id);
+            setTasks(prev => prev.map(t => t.id === id ? detail : t));
+            setSelectedTask(current => current?.id === id ? detail : current);
+        } catch (error) {
+            console.error("Failed to fetch task", error);
         }
     };
 
@@ -175,6 +190,7 @@ export default function PreparationPage() {
 
     const handleSelectTask = (task) => {
         setSelectedTask(task);
+        loadTaskDetail(task.id);
         if (window.innerWidth < 768) {
             setIsSidebarOpen(false);
         }
@@ -345,6 +361,15 @@ export default function PreparationPage() {
                                 </div>
                             </div>
                         ))}
+                        {nextCursor && (
+                            <button
+                                onClick={() => fetchTasks(nextCursor)}
+                                disabled={isLoadingMore}
+                                className="w-full p-3 text-sm text-cyan-700 hover:bg-cyan-50 disabled:text-gray-400 transition-colors"
+                            >
+                                {isLoadingMore ? "Loading..." : "Load more"}
+                            </button>
+                        )}
                     </div>
                 </div>
             </div>
@@ -2,10 +2,13 @@
 import React, { useState, useEffect } from "react";
 import ReactMarkdown from "react-markdown";
 import MobileMenuButton from "../../../components/MobileMenuButton";
+import { fetchSummaryPage, fetchDetail } from "../../utils/paging";
 import AiChatSidebar from "../../../components/AiChatSidebar";
 
 export default function YouTubePrepPage() {
     const [tasks, setTasks] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null); // X-Next-Cursor of the last loaded page (null = all loaded)
+    const [isLoadingMore, setIsLoadingMore] = useState(false);
     const [selectedTask, setSelectedTask] = useState(null);
     const [isCreating, setIsCreating] = useState(false);
     const [newUrl, setNewUrl] = useState("");
@@ -40,15 +43,27 @@ export default function YouTubePrepPage() {
         fetchTasks();
     }, []);
 
-    const fetchTasks = async () => {
+    const fetchTasks = async (cursor = null) => {
+        if (cursor) setIsLoadingMore(true);
         try {
-            const res = await fetch("/api/english/youtube-prep");
-            if (res.ok) {
-                const data = await res.json();
-                setTasks(data);
-            }
+            // Summary rows only; the full task is loaded when it is selected
+            const page = await fetchSummaryPage("/api/english/youtube-prep", cursor);
+            setTasks(prev => cursor ? [...prev, ...page.items.filter(t => !prev.some(p => p.id === t.id))] : page.items);
+            setNextCursor(page.nextCursor);
         } catch (error) {
             console.error("Failed to fetch tasks", error);
+        } finally {
+            setIsLoadingMore(false);
+        }
+    };
+
+    const loadTaskDetail = async (id) => {
+        try {
+            const detail = await fetchDetail("/api/english/youtube-prep", id);
+            setTasks(prev => prev.map(t => t.id === id ? detail : t));
+            setSelectedTask(current => current?.id === id ? detail : current);
+        } catch (error) {
+            console.error("Failed to fetch task", error);
         }
     };
 
@@ -125,6 +140,7 @@ export default function YouTubePrepPage() {
 
     const handleSelectTask = (task) => {
         setSelectedTask(task);
+        loadTaskDetail(task.id);
         if (window.innerWidth < 768) {
             setIsSidebarOpen(false);
         }
@@ -237,6 +253,15 @@ export default function YouTubePrepPage() {
                                 </div>
                             </div>
                         ))}
+                        {nextCursor && (
+                            <button
+                                onClick={() => fetchTasks(nextCursor)}
+                                disabled={isLoadingMore}
+                                className="w-full p-3 text-sm text-cyan-700 hover:bg-cyan-50 disabled:text-gray-400 transition-colors"
+                            >
+                                {isLoadingMore ? "Loading..." : "Load more"}
+                            </button>
+                        )}
                     </div>
                 </div>
             </div>
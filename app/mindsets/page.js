@@ -2,7 +2,8 @@
 
 import React, { useState, useEffect } from 'react';
 import { api } from '../utils/api';
-import { getRoutines, addRoutine, updateRoutine, deleteRoutine, reorderRoutines } from '../actions/routines';
+import { getRoutines, addRoutine, updateRoutine, deleteRoutine } from '../actions/routines';
+import { moveNeighbours } from '../utils/ordering';
 import MobileMenuButton from '../../components/MobileMenuButton';
 
 export default function MindsetsPage() {
@@ -96,10 +97,10 @@ export default function MindsetsPage() {
     };
 
     const onDragEnd = async () => {
+        if (!draggedItem) return;
         setDraggedItem(null);
-        const ids = mindsets.map(m => m.id);
         try {
-            await reorderRoutines(ids);
+            await api.moveRoutine(draggedItem.id, moveNeighbours(mindsets, draggedItem.id));
         } catch (e) {
             console.error("Failed to reorder", e);
             fetchMindsets();
@@ -2,9 +2,10 @@
 
 import React, { useState, useEffect } from 'react';
 import {
-    getProjects, createProject, deleteProject, reorderProjects, updateProject,
-    getProjectTasks, createProjectTask, updateProjectTask, deleteProjectTask, reorderProjectTasks, toggleProjectTask
+    getProjects, createProject, deleteProject, moveProject, updateProject,
+    getProjectTasks, createProjectTask, updateProjectTask, deleteProjectTask, moveProjectTask, toggleProjectTask
 } from '../utils/projectsApi';
+import { moveNeighbours } from '../utils/ordering';
 import MobileMenuButton from '../../components/MobileMenuButton';
 
 
@@ -169,9 +170,8 @@ export default function ProjectsPage() {
         if (!draggedProject) return;
         setDraggedProject(null);
 
-        const ids = projects.map(p => p.id);
         try {
-            await reorderProjects(ids);
+            await moveProject(draggedProject.id, moveNeighbours(projects, draggedProject.id));
         } catch (e) {
             console.error("Failed to reorder projects", e);
         }
@@ -264,9 +264,8 @@ export default function ProjectsPage() {
         if (!draggedTask || !selectedProject) return;
         setDraggedTask(null);
 
-        const ids = tasks.map(t => t.id);
         try {
-            await reorderProjectTasks(selectedProject.id, ids);
+            await moveProjectTask(selectedProject.id, draggedTask.id, moveNeighbours(tasks, draggedTask.id));
         } catch (e) {
             console.error(e);
         }
@@ -292,8 +291,7 @@ export default function ProjectsPage() {
         setTasks(newTasks);
 
         try {
-            const ids = newTasks.map(t => t.id);
-            await reorderProjectTasks(selectedProject.id, ids);
+            await moveProjectTask(selectedProject.id, task.id, moveNeighbours(newTasks, task.id));
         } catch (e) {
             console.error("Failed to reorder manually", e);
             fetchTasks(selectedProject.id); // Revert on failure
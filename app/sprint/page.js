@@ -2,7 +2,9 @@
 
 import React, { useState, useEffect } from 'react';
 import { getCurrentSprint, createSprint, updateSprintGoal, completeSprint, addTasksToSprint, getSprintTasks, removeTaskFromSprint, deleteSprint } from '../actions/sprint';
-import { updateBacklogItem, reorderBacklogItems, addBacklogItem } from '../actions/backlog'; // Import for status update, reorder, and add
+import { updateBacklogItem, addBacklogItem } from '../actions/backlog'; // Import for status update and add
+import { api } from '../utils/api';
+import { moveNeighbours } from '../utils/ordering';
 import { getBacklogItems } from '../actions/backlog';
 import { formatDate } from '../utils/date';
 import CustomDatePicker from '../../components/CustomDatePicker';
@@ -320,10 +322,11 @@ export default function SprintPage() {
     };
 
     const onDragEnd = async () => {
+        if (!draggedItem) return;
         setDraggedItem(null);
         try {
-            // Persist order
-            await reorderBacklogItems(sprintTasks.map(t => t.id));
+            // Persist order: the item lands between its sprint neighbours (single write)
+            await api.moveBacklogItem(draggedItem.id, moveNeighbours(sprintTasks, draggedItem.id));
         } catch (e) {
             console.error('Failed to save order', e);
         }
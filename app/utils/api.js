@@ -58,6 +58,17 @@ export const api = {
         return res.json();
     },
 
+    moveBacklogItem: async (id, neighbours) => {
+        // neighbours: { prev_id, next_id } after the drop (see utils/ordering.js)
+        const res = await fetch(`${API_BASE}/backlog/${id}/move`, {
+            method: 'PUT',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(neighbours),
+        });
+        if (!res.ok) throw new Error('Failed to move item');
+        return res.json();
+    },
+
 
 
     // Routines (Actions&Mindsets)
@@ -123,6 +134,17 @@ export const api = {
         return res.json();
     },
 
+    moveRoutine: async (id, neighbours) => {
+        // neighbours: { prev_id, next_id } after the drop (see utils/ordering.js)
+        const res = await fetch(`${API_BASE}/routines/${id}/move`, {
+            method: 'PUT',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(neighbours),
+        });
+        if (!res.ok) throw new Error('Failed to move routine');
+        return res.json();
+    },
+
     // Factory (Generate Daily)
     generateDailyTasks: async () => {
         const res = await fetch(`${API_BASE}/generate-daily`, {
@@ -165,6 +187,17 @@ export const api = {
         return res.json();
     },
 
+    moveDaily: async (id, neighbours) => {
+        // neighbours: { prev_id, next_id } after the drop (see utils/ordering.js)
+        const res = await fetch(`${API_BASE}/daily/${id}/move`, {
+            method: 'PUT',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(neighbours),
+        });
+        if (!res.ok) throw new Error('Failed to move daily task');
+        return res.json();
+    },
+
     skipTask: async (id) => {
         const res = await fetch(`${API_BASE}/daily/${id}/skip`, {
             method: 'PATCH',
@@ -0,0 +1,9 @@
+// Neighbours of `id` in an already reordered list, as expected by the backend `/move` endpoints
+// (one write for the moved item instead of rewriting the order of the whole list).
+export function moveNeighbours(items, id) {
+    const index = items.findIndex(item => item.id === id);
+    return {
+        prev_id: index > 0 ? items[index - 1].id : null,
+        next_id: index >= 0 && index < items.length - 1 ? items[index + 1].id : null,
+    };
+}
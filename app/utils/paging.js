@@ -0,0 +1,18 @@
+// Paged list endpoints (backend services/pagination.py): summary rows one page at a time,
+// the full item from GET <url>/{id} when it is opened.
+export const LIST_PAGE_SIZE = 30;
+
+export async function fetchSummaryPage(url, cursor = null, pageSize = LIST_PAGE_SIZE) {
+    const params = new URLSearchParams({ view: "summary", page_size: String(pageSize) });
+    if (cursor) params.set("cursor", cursor);
+    const res = await fetch(`${url}?${params.toString()}`);
+    if (!res.ok) throw new Error(`Failed to fetch ${url}`);
+    // nextCursor is null on the last page
+    return { items: await res.json(), nextCursor: res.headers.get("X-Next-Cursor") };
+}
+
+export async function fetchDetail(url, id) {
+    const res = await fetch(`${url}/${id}`);
+    if (!res.ok) throw new Error(`Failed to fetch ${url}/${id}`);
+    return res.json();
+}
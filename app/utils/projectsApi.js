@@ -54,6 +54,17 @@ export async function reorderProjects(ids) {
     return res.json();
 }
 
+// neighbours: { prev_id, next_id } after the drop (see utils/ordering.js); a single write on the backend
+export async function moveProject(projectId, neighbours) {
+    const res = await fetch(`${API_BASE_URL}/${projectId}/move`, {
+        method: "PUT",
+        headers: getHeaders(),
+        body: JSON.stringify(neighbours),
+    });
+    if (!res.ok) throw new Error("Failed to move project");
+    return res.json();
+}
+
 // --- Tasks ---
 
 export async function getProjectTasks(projectId) {
@@ -104,6 +115,16 @@ export async function reorderProjectTasks(projectId, ids) {
     return res.json();
 }
 
+export async function moveProjectTask(projectId, taskId, neighbours) {
+    const res = await fetch(`${API_BASE_URL}/${projectId}/tasks/${taskId}/move`, {
+        method: "PUT",
+        headers: getHeaders(),
+        body: JSON.stringify(neighbours),
+    });
+    if (!res.ok) throw new Error("Failed to move project task");
+    return res.json();
+}
+
 export async function toggleProjectTask(projectId, taskId) {
     const res = await fetch(`${API_BASE_URL}/${projectId}/tasks/${taskId}/toggle`, {
         method: "PATCH",
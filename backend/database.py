@@ -1,43 +1,32 @@
-import os
-from google.cloud import firestore
-from google.cloud import storage
-from pathlib import Path
+from services.clients import get_client_registry
 
-# Singleton instances
-_db_client = None
-_storage_client = None
+# Clients are owned by the process-wide ClientRegistry (services/clients.py)
 
 def get_db():
-    global _db_client
-    if _db_client is not None:
-        return _db_client
-
-    current_dir = Path(__file__).parent
-    # key.json is in the project root (one level up from backend)
-    key_path = current_dir.parent / "key.json"
-    
-    if key_path.exists():
-        _db_client = firestore.Client.from_service_account_json(str(key_path))
-    else:
-        _db_client = firestore.Client()
-    
-    return _db_client
+    return get_client_registry().firestore()
 
 def get_storage_client():
-    global _storage_client
-    if _storage_client is not None:
-        return _storage_client
-
-    current_dir = Path(__file__).parent
-    # key.json is in the project root (one level up from backend)
-    key_path = current_dir.parent / "key.json"
-    
-    if key_path.exists():
-        _storage_client = storage.Client.from_service_account_json(str(key_path))
-    else:
-        _storage_client = storage.Client()
-    
-    return _storage_client
+    return get_client_registry().storage()
+
+def get_signing_storage_client():
+    """Storage client for signed upload/download URLs (SERVICE_ACCOUNT_KEY when set)."""
+    return get_client_registry().signing_storage()
 
 def get_firestore_client():
     return get_db()
+
+def get_uow():
+    """Per-request UnitOfWork (FastAPI caches dependencies per request, so sub-dependencies share it)."""
+    from services.unit_of_work import UnitOfWork
+    return UnitOfWork(get_db())
+
+def get_async_db():
+    """
+    Shared firestore.AsyncClient for `async def` handlers (await .get()/.set(), `async for` over .stream()).
+    Its gRPC channel binds to the event loop that first uses it, so use it only from the server loop.
+    """
+    return get_client_registry().async_firestore()
+
+def get_async_storage():
+    from services.async_data import get_async_storage as _get
+    return _get()
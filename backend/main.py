@@ -5,21 +5,13 @@ import os
 env_path = Path(__file__).parent.parent / '.env.local'
 load_dotenv(dotenv_path=env_path)
 
+# Installed before the imports below so their import time is recorded (GET /api/startup)
+from services.startup import get_startup
+startup = get_startup()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from routers import generate
-from routers import generate_genai 
-from routers import rag
-from routers import management
-from routers import tasks
-from routers import car_quiz
-from routers import projects
-from routers import consulting
-from routers import consulting_training
-from routers import ai_chat
-from routers import agent
-
 app = FastAPI()
 
 # Configure CORS
@@ -29,6 +21,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"], # Paged list endpoints (services/pagination.py)
 )
 
 # --- Security Middleware ---
@@ -37,8 +30,8 @@ from starlette.middleware.base import BaseHTTPMiddleware
 
 class APIKeyMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
-        # Skip check for health check or OPTIONS requests
-        if request.url.path == "/health" or request.method == "OPTIONS":
+        # Skip check for health/readiness probes or OPTIONS requests
+        if request.url.path in ("/health", "/ready") or request.method == "OPTIONS":
             return await call_next(request)
 
         # Skip check for WebSocket endpoint (Browser limitations for custom headers)
@@ -61,53 +54,82 @@ class APIKeyMiddleware(BaseHTTPMiddleware):
         return response
 
 from fastapi.responses import JSONResponse
-from middleware import PerformanceMiddleware
+from middleware import PerformanceMiddleware, LazyRouterMiddleware
+from services.pagination import InvalidCursor
+from services.gemini_gateway import GeminiDeadlineExceeded, get_gemini_gateway
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request: Request, exc: InvalidCursor):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(GeminiDeadlineExceeded)
+async def gemini_deadline_handler(request: Request, exc: GeminiDeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
 
+app.add_middleware(LazyRouterMiddleware, startup=startup)
 app.add_middleware(PerformanceMiddleware)
 app.add_middleware(APIKeyMiddleware)
 # ---------------------------
 
 @app.on_event("startup")
 async def startup_event():
-    # Trigger background loading of heavy libraries to fix cold start
+    # Warm-up (STARTUP_WARM_ROUTERS, then heavy libraries) runs in the background; /ready reports when it is done
     try:
-        from services.background_loader import BackgroundLoader
-        loader = BackgroundLoader.get_instance()
-        loader.start_loading([
-            "vertexai",
-            "pdf2image",
-            "google.cloud.aiplatform",
-            "services.ai_analysis", 
-            "services.ingestion"
-        ])
-        print("Application startup complete. Background loading initiated.")
+        startup.warm_up()
+        print("Application startup complete. Background warm-up initiated.")
     except Exception as e:
-        print(f"Background Loader Init Failed: {e}")
+        print(f"Startup Warm-up Init Failed: {e}")
+
+    # Pick up backlog<->daily sync events left by a previous instance
+    try:
+        from services.sync_outbox import get_sync_outbox
+        get_sync_outbox().start()
+    except Exception as e:
+        print(f"Sync Outbox Start Failed: {e}")
 
 # Include routers
-app.include_router(generate.router, prefix="/api", tags=["generate"])
-app.include_router(generate_genai.router, prefix="/api", tags=["generate_genai"])
-app.include_router(rag.router, prefix="/api", tags=["rag"])
-app.include_router(management.router, prefix="/api", tags=["management"])
-app.include_router(tasks.router, prefix="/api", tags=["tasks"])
-app.include_router(car_quiz.router, prefix="/api", tags=["car_quiz"])
-app.include_router(projects.router, prefix="/api", tags=["projects"])
-app.include_router(consulting.router, prefix="/api", tags=["consulting"])
-app.include_router(consulting_training.router, prefix="/api", tags=["consulting_training"])
-app.include_router(ai_chat.router, prefix="/api", tags=["ai-chat"])
-from routers import english
-from routers import roleplay
-app.include_router(english.router, prefix="/api", tags=["english"])
-app.include_router(roleplay.router, prefix="/api", tags=["roleplay"])
-app.include_router(agent.router, prefix="/api", tags=["agent"])
+# Each router module is imported on the first request under its prefix (LazyRouterMiddleware),
+# so a cold instance only pays for the routers it actually serves.
+routers = startup.lazy_routers(app, api_prefix="/api")
+routers.register("generate", ["/generate"])
+routers.register("generate_genai", ["/generate_genai"])
+routers.register("rag", ["/rag"])
+routers.register("management", ["/management"])
+routers.register("tasks", ["/tasks"])
+routers.register("car_quiz", ["/car-quiz"])
+routers.register("projects", ["/projects"])
+routers.register("consulting", ["/consulting"])
+routers.register("consulting_training", ["/consulting/training"])
+routers.register("ai_chat", ["/ai-chat"], tags=["ai-chat"])
+routers.register("english", ["/english"])
+routers.register("roleplay", ["/roleplay"])
+routers.register("agent", ["/agent"])
+routers.register("hobbies", ["/hobbies"])
+routers.register("dab", ["/dab"])
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
-from routers import hobbies
-app.include_router(hobbies.router, prefix="/api", tags=["hobbies"])
-
-from routers import dab
-app.include_router(dab.router, prefix="/api", tags=["dab"])
+@app.get("/ready")
+async def readiness_check():
+    """200 once the startup warm-up has finished, 503 while it is still running."""
+    status = {"status": "ready" if startup.ready else "warming", "pending_routers": routers.pending()}
+    return JSONResponse(status_code=200 if startup.ready else 503, content=status)
+
+@app.get("/api/startup")
+def startup_status(top: int = 30):
+    """Warm-up state, per-router load time and the slowest module imports (services/startup.py)."""
+    return startup.status(top)
+
+@app.get("/api/gemini/metrics")
+def gemini_metrics():
+    """Per-model Gemini calls, retries, queueing, tokens and latency (services/gemini_gateway.py)."""
+    return get_gemini_gateway().metrics()
+
+@app.get("/api/gemini/context-cache")
+def gemini_context_cache_metrics():
+    """Context cache handles, hits and inline fallbacks (services/context_cache.py)."""
+    from services.context_cache import get_context_cache
+    return get_context_cache().metrics()
 
@@ -27,3 +27,43 @@ class PerformanceMiddleware(BaseHTTPMiddleware):
         
         response.headers["X-Process-Time"] = str(process_time)
         return response
+
+
+class LazyRouterMiddleware:
+    """
+    Imports a lazily registered router (services/startup.py) before the first
+    HTTP or WebSocket request under its prefix reaches routing. The import runs
+    off the event loop, so other requests and Live API sockets keep flowing.
+    """
+
+    def __init__(self, app, startup):
+        self.app = app
+        self.startup = startup
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        registry = self.startup.routers
+        path = scope.get("path", "")
+        if path in ("/docs", "/redoc", "/openapi.json"):
+            pending = registry.pending()
+        else:
+            pending = registry.pending_for(path)
+
+        from services.async_data import offload
+        for name in pending:
+            try:
+                await offload(registry.load, name)
+            except Exception as e:
+                if scope["type"] == "websocket":
+                    await send({"type": "websocket.close", "code": 1011})
+                    return
+                from starlette.responses import JSONResponse
+                response = JSONResponse(status_code=503, content={"detail": f"Router '{name}' failed to load: {e}"})
+                return await response(scope, receive, send)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.startup.first_request.set()
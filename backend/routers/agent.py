@@ -3,43 +3,35 @@ import json
 import asyncio
 import traceback
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from google import genai
 from google.genai import types
 from google.cloud.firestore import FieldFilter
 from config import GEMINI_LIVE_MODEL
-from services.ai_shared import get_firestore_client
+from services.ai_shared import get_firestore_client, get_live_genai_client
+from services.config_replica import get_config_replica
 
 router = APIRouter(
     prefix="/agent",
     tags=["agent"],
 )
 
-# Vertex AIの設定を読み込んでGenAIクライアントを初期化
-client = genai.Client(
-    vertexai=True,
-    project=os.getenv("PROJECT_ID"),
-    location=os.getenv("LOCATION", "us-central1"),
-    http_options={'api_version': 'v1beta1'}
-)
-
 async def get_dab_context():
     """FirestoreからDABのアクティブトピックとユーザーの長期記憶を読み込み、スピーキング用の文脈を作成する"""
     try:
         db = get_firestore_client()
         # ACTIVEなトピックの取得
-        topics_ref = db.collection("dab_hot_topics").where(filter=FieldFilter("status", "==", "ACTIVE")).stream()
+        replica = get_config_replica()
         topics = []
-        for doc in topics_ref:
-            data = doc.to_dict()
+        for data in (await replica.collection_async(db, "dab_hot_topics")).values():
+            if data.get("status") != "ACTIVE":
+                continue
             topics.append(f"- {data.get('name', 'Untitled')}: {data.get('description', '')}")
         topics_str = "\n".join(topics) if topics else "特に登録されていません。"
 
         # ユーザーメモリの取得
-        memory_ref = db.collection("dab_user_memory").document("default_user").get()
+        mem_data = await replica.document_async(db, "dab_user_memory", "default_user")
         learning_goals = "設定されていません。"
         known_concepts_str = "登録されていません。"
-        if memory_ref.exists:
-            mem_data = memory_ref.to_dict()
+        if mem_data:
             learning_goals = mem_data.get("learning_goals", "設定されていません。")
             known_concepts = mem_data.get("known_concepts", [])
             if known_concepts:
@@ -216,6 +208,8 @@ async def websocket_endpoint(websocket: WebSocket):
 
                     session_config = types.LiveConnectConfig(**connect_config_kwargs)
 
+                # Vertex AIの設定を読み込んでGenAIクライアントを取得（初回接続時に生成、以降は共有）
+                client = get_live_genai_client()
                 async with client.aio.live.connect(
                     model=config["model"],
                     config=session_config
@@ -1,15 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
 from google.cloud import firestore
-from database import get_db
+from database import get_db, get_async_db
 import os
 from google.genai import types
 from services.ai_shared import get_genai_client
+from services.config_replica import get_config_replica
+from services.async_data import offload
+from services.pagination import PageParams, fetch_page_async, set_next_cursor
 import uuid
 from routers.consulting import search_knowledge_db
 from config import GEMINI_CHAT_MODEL, GEMINI_EMBEDDING_MODEL
+from services.gemini_gateway import gemini_generate_async, gemini_embed_async
 
 router = APIRouter(
     prefix="/ai-chat",
@@ -53,7 +57,7 @@ class ChatRequest(BaseModel):
 # --- Endpoints ---
 
 @router.post("/sessions", response_model=ChatSession)
-async def create_session(req: ChatSessionCreate, db: firestore.Client = Depends(get_db)):
+async def create_session(req: ChatSessionCreate, db: firestore.AsyncClient = Depends(get_async_db)):
     session_id = str(uuid.uuid4())
     now = datetime.now()
     
@@ -65,56 +69,55 @@ async def create_session(req: ChatSessionCreate, db: firestore.Client = Depends(
         "last_message": None
     }
     
-    db.collection("ai_chat_sessions").document(session_id).set(session_data)
+    await db.collection("ai_chat_sessions").document(session_id).set(session_data)
     return ChatSession(**session_data)
 
 @router.get("/settings", response_model=ChatSettings)
-async def get_settings(db: firestore.Client = Depends(get_db)):
-    doc = db.collection("system_settings").document("ai_chat").get()
-    if doc.exists:
-        return ChatSettings(**doc.to_dict())
+def get_settings(db: firestore.Client = Depends(get_db)):
+    data = get_config_replica().document(db, "system_settings", "ai_chat")
+    if data:
+        return ChatSettings(**data)
     return ChatSettings() # Defaults
 
 @router.post("/settings", response_model=ChatSettings)
-async def save_settings(settings: ChatSettings, db: firestore.Client = Depends(get_db)):
-    db.collection("system_settings").document("ai_chat").set(settings.dict())
+async def save_settings(settings: ChatSettings, db: firestore.AsyncClient = Depends(get_async_db)):
+    await db.collection("system_settings").document("ai_chat").set(settings.dict())
+    get_config_replica().put("system_settings", "ai_chat", settings.dict())
     return settings
 
 @router.get("/sessions", response_model=List[ChatSession])
-async def get_sessions(db: firestore.Client = Depends(get_db)):
-    docs = db.collection("ai_chat_sessions").order_by("updated_at", direction=firestore.Query.DESCENDING).limit(50).stream()
-    sessions = []
-    for d in docs:
-        sessions.append(ChatSession(**d.to_dict()))
-    return sessions
+async def get_sessions(response: Response, page: PageParams = Depends(), db: firestore.AsyncClient = Depends(get_async_db)):
+    rows, next_cursor = await fetch_page_async(db.collection("ai_chat_sessions"), page.default_size(50), order_field="updated_at")
+    set_next_cursor(response, next_cursor)
+    return [ChatSession(**data) for _, data in rows]
 
 @router.delete("/sessions/{session_id}")
-async def delete_session(session_id: str, db: firestore.Client = Depends(get_db)):
+async def delete_session(session_id: str, db: firestore.AsyncClient = Depends(get_async_db)):
     # Delete session and messages
     batch = db.batch()
     session_ref = db.collection("ai_chat_sessions").document(session_id)
     batch.delete(session_ref)
     
     messages = db.collection("ai_chat_sessions").document(session_id).collection("messages").stream()
-    for m in messages:
+    async for m in messages:
         batch.delete(m.reference)
     
-    batch.commit()
+    await batch.commit()
     return {"status": "deleted"}
 
 @router.get("/sessions/{session_id}/messages", response_model=List[ChatMessage])
-async def get_messages(session_id: str, db: firestore.Client = Depends(get_db)):
+async def get_messages(session_id: str, db: firestore.AsyncClient = Depends(get_async_db)):
     docs = db.collection("ai_chat_sessions").document(session_id).collection("messages").order_by("timestamp").stream()
     messages = []
-    for d in docs:
+    async for d in docs:
         messages.append(ChatMessage(**d.to_dict()))
     return messages
 
 @router.post("/sessions/{session_id}/messages")
-async def send_message(session_id: str, req: ChatRequest, db: firestore.Client = Depends(get_db)):
+async def send_message(session_id: str, req: ChatRequest, db: firestore.AsyncClient = Depends(get_async_db)):
     print(f"DEBUG: send_message started for session {session_id}, model {req.model}")
     session_ref = db.collection("ai_chat_sessions").document(session_id)
-    session_doc = session_ref.get()
+    session_doc = await session_ref.get()
     if not session_doc.exists:
         print(f"DEBUG: Session {session_id} not found")
         raise HTTPException(status_code=404, detail="Session not found")
@@ -126,11 +129,11 @@ async def send_message(session_id: str, req: ChatRequest, db: firestore.Client =
         "content": req.message,
         "timestamp": datetime.now()
     }
-    session_ref.collection("messages").document(user_msg_id).set(user_msg)
+    await session_ref.collection("messages").document(user_msg_id).set(user_msg)
     print(f"DEBUG: User message saved: {user_msg_id}")
 
     # 2. Prepare History for Gemini (Latest 20 messages)
-    history_docs = session_ref.collection("messages").order_by("timestamp", direction=firestore.Query.DESCENDING).limit(20).get()
+    history_docs = await session_ref.collection("messages").order_by("timestamp", direction=firestore.Query.DESCENDING).limit(20).get()
     
     # Needs to be chronologically ordered for Gemini
     history_list = list(reversed(list(history_docs)))
@@ -153,8 +156,8 @@ async def send_message(session_id: str, req: ChatRequest, db: firestore.Client =
             raise HTTPException(status_code=500, detail="AI Client not initialized. Check environment variables.")
 
         # Fetch Settings (System Prompt, Profile, etc.)
-        settings_doc = db.collection("system_settings").document("ai_chat").get()
-        settings = settings_doc.to_dict() if settings_doc.exists else {}
+        # In-memory replica (see services/config_replica.py); a cold read goes through the sync client off the loop
+        settings = await get_config_replica().document_async(get_db(), "system_settings", "ai_chat") or {}
         
         base_system_prompt = settings.get("system_prompt", "あなたは有能で親切なAIアシスタントです。ユーザーの質問に対して正確かつ丁寧に回答してください。")
         user_profile = settings.get("user_profile", "")
@@ -177,7 +180,8 @@ async def send_message(session_id: str, req: ChatRequest, db: firestore.Client =
             try:
                 print("DEBUG: RAG Enabled. Searching Knowledge Base...")
                 # Embed Query
-                embed_res = await client.aio.models.embed_content(
+                embed_res = await gemini_embed_async(
+                    client=client,
                     model=GEMINI_EMBEDDING_MODEL,
                     contents=req.message
                 )
@@ -185,7 +189,7 @@ async def send_message(session_id: str, req: ChatRequest, db: firestore.Client =
                 
                 # Search
                 # Only 3 top results to avoid context overflow/pollution
-                rag_results = search_knowledge_db(query_vector, top_k=rag_top_k)
+                rag_results = await offload(search_knowledge_db, query_vector, top_k=rag_top_k)
                 
                 if rag_results:
                     rag_context_str = "\n\n## Internal Knowledge Base (RAG)\nThe following internal documents were found relevant to the user's query. Use them to answer if applicable.\n"
@@ -219,7 +223,8 @@ async def send_message(session_id: str, req: ChatRequest, db: firestore.Client =
         print(f"DEBUG: Calling Gemini {req.model} (Async)...")
         import time
         start_ai = time.time()
-        response = await client.aio.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=req.model,
             contents=contents,
             config=types.GenerateContentConfig(
@@ -281,7 +286,7 @@ async def send_message(session_id: str, req: ChatRequest, db: firestore.Client =
         "timestamp": datetime.now(),
         "grounding_metadata": grounding_metadata_dict
     }
-    session_ref.collection("messages").document(model_msg_id).set(model_msg)
+    await session_ref.collection("messages").document(model_msg_id).set(model_msg)
     print(f"DEBUG: Model message saved: {model_msg_id}")
 
     # 5. Update Session (last message, updated_at, maybe auto-title)
@@ -294,7 +299,7 @@ async def send_message(session_id: str, req: ChatRequest, db: firestore.Client =
     if session_doc.to_dict().get("title") == "New Chat":
         update_data["title"] = req.message[:30] + ("..." if len(req.message) > 30 else "")
     
-    session_ref.update(update_data)
+    await session_ref.update(update_data)
     print(f"DEBUG: Session updated")
 
     return {"response": model_content, "grounding_metadata": grounding_metadata_dict}
@@ -1,19 +1,21 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Response
 from pydantic import BaseModel
 from typing import List, Optional
 import os
 
-from google import genai
+from services.ai_shared import get_api_key_genai_client
 from google.genai import types
 
 from googleapiclient.discovery import build
-from database import get_firestore_client, get_storage_client
+from database import get_firestore_client, get_storage_client, get_async_db
+from services.pagination import PageParams, fetch_page_async, set_next_cursor
 from google.cloud import firestore
 import uuid
 import json
 import asyncio
 import concurrent.futures
 from config import GEMINI_PRO_MODEL
+from services.gemini_gateway import gemini_generate_async
 
 router = APIRouter()
 
@@ -53,15 +55,7 @@ async def generate_car_list(request: GenerationRequest):
         if not project_id:
             print("Warning: PROJECT_ID not found in env, using default or implicit.")
 
-        api_key = os.getenv("GOOGLE_CLOUD_API_KEY")
-        if api_key:
-            api_key = api_key.strip()
-
-        client = genai.Client(
-            vertexai=True,
-            api_key=api_key,
-            http_options={'api_version': 'v1beta1'}
-        ) 
+        client = get_api_key_genai_client()
 
         full_prompt = f"""
         Rank the following request and generate a list of cars in JSON format.
@@ -86,7 +80,8 @@ async def generate_car_list(request: GenerationRequest):
         
         model_name = GEMINI_PRO_MODEL
         try:
-            response = client.models.generate_content(
+            response = await gemini_generate_async(
+                client=client,
                 model=model_name,
                 contents=full_prompt,
                 config=types.GenerateContentConfig(
@@ -99,7 +94,8 @@ async def generate_car_list(request: GenerationRequest):
         except Exception:
             # Fallback to 2.5 Pro if 3.0 fails
             model_name = GEMINI_PRO_MODEL
-            response = client.models.generate_content(
+            response = await gemini_generate_async(
+                client=client,
                 model=model_name,
                 contents=full_prompt,
                 config=types.GenerateContentConfig(
@@ -205,13 +201,12 @@ async def collect_images(request: ImageCollectionRequest):
     return updated_cars
 
 @router.get("/car-quiz/fetch-list")
-async def fetch_car_list():
-    """Fetches all cars from Firestore for the admin list."""
+async def fetch_car_list(response: Response, page: PageParams = Depends(), db: firestore.AsyncClient = Depends(get_async_db)):
+    """Fetches cars from Firestore for the admin list (all of them unless page_size/cursor is given)."""
     try:
-        db = get_firestore_client()
-        docs = db.collection("cars").order_by("created_at", direction=firestore.Query.DESCENDING).stream()
-        cars = [doc.to_dict() for doc in docs]
-        return cars
+        rows, next_cursor = await fetch_page_async(db.collection("cars"), page)
+        set_next_cursor(response, next_cursor)
+        return [data for _, data in rows]
     except Exception as e:
         print(f"Error fetching list: {e}")
         raise HTTPException(status_code=500, detail=str(e))
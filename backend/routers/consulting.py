@@ -8,7 +8,8 @@ from fastapi import (
     BackgroundTasks,
     Depends,
     WebSocket,
-    WebSocketDisconnect
+    WebSocketDisconnect,
+    Response
 )
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pydantic import BaseModel
@@ -38,17 +39,17 @@ warnings.filterwarnings("ignore", category=UserWarning, module="vertexai.vision_
 
 from fastapi.responses import StreamingResponse
 from google.genai import types
-from google import genai
-from google.cloud import firestore, storage
-from google.oauth2 import service_account
+from google.cloud import firestore
 import traceback
 
 # --- Import from Services ---
 from services.ai_shared import (
     get_genai_client,
+    get_live_genai_client,
     get_storage_client,
     get_firestore_client,
     get_embedding,
+    get_embedding_async,
     trace,
     PROJECT_ID,
     LOCATION,
@@ -58,6 +59,13 @@ from services.ai_shared import (
     RESULT_COLLECTION_NAME,
     Vector
 )
+from services.vector_index import get_slide_index, note_slide_written
+from services.signed_url import generate_signed_url, generate_signed_urls
+from services.async_data import AsyncStorage, offload
+from database import get_async_db, get_async_storage, get_signing_storage_client
+from services.clients import get_client_registry
+from services.pagination import PageParams, fetch_page, fetch_page_async, set_next_cursor
+from services.gemini_gateway import gemini_generate_async, gemini_embed_async
 # from services.ai_analysis import analyze_slide_structure
 # from services.ingestion import run_batch_ingestion
 
@@ -72,28 +80,6 @@ trace(f"LOCATION={LOCATION}")
 trace(f"BUCKET={GCS_BUCKET_NAME}, COLLECTION={FIRESTORE_COLLECTION_NAME}")
 
 
-# --- Helpers Wrappers (for backward compatibility if needed) ---
-def generate_signed_url(gcs_uri: str) -> str:
-    """Generates a signed URL for a GCS object."""
-    try:
-        if not gcs_uri.startswith("gs://"):
-            return ""
-        parts = gcs_uri.replace("gs://", "").split("/", 1)
-        if len(parts) != 2:
-            return ""
-        bucket_name, blob_name = parts
-        g_client = get_storage_client()
-        bucket = g_client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        return blob.generate_signed_url(
-            version="v4",
-            expiration=datetime.timedelta(minutes=60),
-            method="GET",
-        )
-    except Exception as e:
-        print(f"Error generating signed URL: {e}")
-        return ""
-
 def download_and_upload_worker(pdf_url: str):
     """Helper for threading."""
     try:
@@ -159,69 +145,95 @@ async def retry_batch_worker(batch_id: str, item_ids: List[str] = None):
         g_client = get_storage_client()
         bucket = g_client.bucket(GCS_BUCKET_NAME)
         main_collection = db.collection(FIRESTORE_COLLECTION_NAME)
-        
-        for doc in target_docs:
-            data = doc.to_dict()
-            blob_name = data.get("filename")
-            doc.reference.update({"status": "processing", "error": firestore.DELETE_FIELD, "updated_at": firestore.SERVER_TIMESTAMP})
-            
-            try:
-                blob = bucket.blob(blob_name)
-                pdf_bytes = blob.download_as_bytes()
-                from pdf2image import convert_from_bytes
-                images = convert_from_bytes(pdf_bytes, fmt="jpeg")
-                pages_success = 0
-                for i, image in enumerate(images):
-                    page_num = i + 1
-                    img_byte_arr = io.BytesIO()
-                    image.save(img_byte_arr, format='JPEG')
-                    img_bytes = img_byte_arr.getvalue()
-                    
-                    
-                    from services.ai_analysis import analyze_slide_structure
-                    analysis = analyze_slide_structure(img_bytes)
-                    text_context = f"Structure: {analysis.get('structure_type', '')}. Key Message: {analysis.get('key_message', '')}. {analysis.get('description', '')}"
-                    emb = get_embedding(image_bytes=img_bytes, text=text_context)
-                    
-                    if emb:
-                        safe_filename = "".join(c for c in blob_name if c.isalnum() or c in "._-")
-                        doc_id = f"{safe_filename}_p{page_num}"
-                        main_collection.document(doc_id).set({
-                            "uri": f"gs://{GCS_BUCKET_NAME}/{blob_name}",
-                            "filename": blob_name,
-                            "page_number": page_num,
-                            "structure_type": analysis.get("structure_type"),
-                            "key_message": analysis.get("key_message"),
-                            "description": analysis.get("description"),
-                            "embedding": Vector(emb),
-                            "created_at": firestore.SERVER_TIMESTAMP
-                        })
-                        pages_success += 1
-                
-                if pages_success > 0:
-                    doc.reference.update({"status": "success", "pages_processed": pages_success, "updated_at": firestore.SERVER_TIMESTAMP})
-                else:
-                    doc.reference.update({"status": "failed", "error": "Retry failed: No pages", "updated_at": firestore.SERVER_TIMESTAMP})
-                    
-            except Exception as e:
-                doc.reference.update({"status": "failed", "error": f"Retry error: {str(e)}", "updated_at": firestore.SERVER_TIMESTAMP})
-        
+
+        from services.bulk_writer import BufferedWriter
+        writer = BufferedWriter(db, name=f"retry-writer-{batch_id[:8]}")
+        try:
+            _retry_docs(target_docs, bucket, main_collection, writer)
+        finally:
+            writer.close()
+
         batch_ref.update({"status": "completed"}) 
         
     except Exception as e:
         batch_ref.update({"status": "failed", "error": f"Retry Crash: {str(e)}"})
 
-def search_vector_db(vector: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
+def _retry_docs(target_docs, bucket, main_collection, writer):
+    """Re-processes each failed result document, buffering all writes through `writer`."""
+    for doc in target_docs:
+        data = doc.to_dict()
+        blob_name = data.get("filename")
+        writer.update(doc.reference, {"status": "processing", "error": firestore.DELETE_FIELD, "updated_at": firestore.SERVER_TIMESTAMP})
+        
+        try:
+            blob = bucket.blob(blob_name)
+            pdf_bytes = blob.download_as_bytes()
+            from pdf2image import convert_from_bytes
+            images = convert_from_bytes(pdf_bytes, fmt="jpeg")
+            pages_success = 0
+            for i, image in enumerate(images):
+                page_num = i + 1
+                img_byte_arr = io.BytesIO()
+                image.save(img_byte_arr, format='JPEG')
+                img_bytes = img_byte_arr.getvalue()
+                
+                
+                # Unchanged pages are served from the content-addressed cache
+                from services.slide_cache import analyze_slides_cached, embed_slide_cached
+                analysis = analyze_slides_cached([img_bytes])[0]
+                text_context = f"Structure: {analysis.get('structure_type', '')}. Key Message: {analysis.get('key_message', '')}. {analysis.get('description', '')}"
+                emb = embed_slide_cached(img_bytes, text_context)
+                
+                if emb:
+                    safe_filename = "".join(c for c in blob_name if c.isalnum() or c in "._-")
+                    doc_id = f"{safe_filename}_p{page_num}"
+                    doc_data = {
+                        "uri": f"gs://{GCS_BUCKET_NAME}/{blob_name}",
+                        "filename": blob_name,
+                        "page_number": page_num,
+                        "structure_type": analysis.get("structure_type"),
+                        "key_message": analysis.get("key_message"),
+                        "description": analysis.get("description"),
+                        "embedding": Vector(emb),
+                        "created_at": firestore.SERVER_TIMESTAMP
+                    }
+                    writer.set(main_collection.document(doc_id), doc_data)
+                    note_slide_written(doc_id, doc_data, emb)
+                    pages_success += 1
+            
+            if pages_success > 0:
+                writer.update(doc.reference, {"status": "success", "pages_processed": pages_success, "updated_at": firestore.SERVER_TIMESTAMP})
+            else:
+                writer.update(doc.reference, {"status": "failed", "error": "Retry failed: No pages", "updated_at": firestore.SERVER_TIMESTAMP})
+                
+        except Exception as e:
+            writer.update(doc.reference, {"status": "failed", "error": f"Retry error: {str(e)}", "updated_at": firestore.SERVER_TIMESTAMP})
+
+def search_vector_db(vector: List[float], top_k: int = 5, structure_type: Optional[str] = None, filename: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Searches the in-process slide index (real cosine scores). Falls back to Firestore Vector Search."""
+    try:
+        return get_slide_index().search(vector, top_k=top_k, structure_type=structure_type, filename=filename)
+    except Exception as e:
+        print(f"Slide index search failed, using Firestore: {e}")
+    return _search_vector_firestore(vector, top_k, structure_type, filename)
+
+def _search_vector_firestore(vector: List[float], top_k: int = 5, structure_type: Optional[str] = None, filename: Optional[str] = None) -> List[Dict[str, Any]]:
     """Searches Firestore using Vector Search."""
     try:
         db = get_firestore_client()
         collection = db.collection(FIRESTORE_COLLECTION_NAME)
+        query = collection
+        if structure_type:
+            query = query.where("structure_type", "==", structure_type)
+        if filename:
+            query = query.where("filename", "==", filename)
         
-        vector_query = collection.find_nearest(
+        vector_query = query.find_nearest(
             vector_field="embedding",
             query_vector=Vector(vector),
             distance_measure=firestore.VectorQuery.DistanceMeasure.COSINE,
-            limit=top_k
+            limit=top_k,
+            distance_result_field="vector_distance"
         )
         
         docs = vector_query.get()
@@ -229,14 +241,17 @@ def search_vector_db(vector: List[float], top_k: int = 5) -> List[Dict[str, Any]
         results = []
         for doc in docs:
             data = doc.to_dict()
+            distance = data.get("vector_distance")
             results.append({
                 "id": data.get("uri"), # GCS URI
-                "score": 0.0, # Placeholder
+                "doc_id": doc.id,
+                "score": 1.0 - distance if distance is not None else 0.0, # Cosine distance -> similarity
                 "metadata": {
                     "structure_type": data.get("structure_type"),
                     "key_message": data.get("key_message"),
                     "description": data.get("description"),
-                    "page_number": data.get("page_number")
+                    "page_number": data.get("page_number"),
+                    "filename": data.get("filename")
                 }
             })
         return results
@@ -253,7 +268,7 @@ class ConsultingReviewCreateRequest(BaseModel):
 class ConsultingReviewTask(BaseModel):
     id: str
     media_filename: str
-    feedback: str # Markdown content
+    feedback: Optional[str] = None # Markdown content (omitted in summary lists)
     created_at: datetime.datetime
     status: int = 0
 
@@ -263,9 +278,15 @@ class CollectRequest(BaseModel):
 
 class LogicMapperRequest(BaseModel):
     query: str
+    top_k: int = 5
+    structure_type: Optional[str] = None
+    filename: Optional[str] = None
 
 class VisualSearchRequest(BaseModel):
     image: str # base64
+    top_k: int = 5
+    structure_type: Optional[str] = None
+    filename: Optional[str] = None
 
 class SlidePolisherRequest(BaseModel):
     text: Optional[str] = None
@@ -297,6 +318,10 @@ class KnowledgeUploadResponse(BaseModel):
     id: str
     message: str
 
+# Summary projections for ?view=summary lists
+REVIEW_SUMMARY_FIELDS = ["id", "media_filename", "created_at", "status"]
+KNOWLEDGE_SUMMARY_FIELDS = ["id", "title", "summary", "gcs_uri", "file_type", "status", "created_at"]
+
 class KnowledgeListResponse(BaseModel):
     items: List[KnowledgeItem]
     next_page_token: Optional[str] = None
@@ -304,12 +329,15 @@ class KnowledgeListResponse(BaseModel):
 # --- Endpoints ---
 
 @router.get("/consulting/files")
-async def list_files(max_results: int = 100, page_token: Optional[str] = None, search: Optional[str] = None):
+async def list_files(
+    max_results: int = 100,
+    page_token: Optional[str] = None,
+    search: Optional[str] = None,
+    db: firestore.AsyncClient = Depends(get_async_db),
+    gcs: AsyncStorage = Depends(get_async_storage)
+):
     """Lists PDF files in the consulting_raw directory with pagination and optional search."""
     try:
-        g_client = get_storage_client()
-        bucket = g_client.bucket(GCS_BUCKET_NAME)
-        
         prefix = "consulting_raw/"
         match_glob = None
         
@@ -325,18 +353,17 @@ async def list_files(max_results: int = 100, page_token: Optional[str] = None, s
             match_glob = f"consulting_raw/*{search}*"
             # When match_glob is used, prefix is often ignored or used as a filter. 
             # We'll use match_glob primarily.
-            blobs_iter = bucket.list_blobs(match_glob=match_glob, max_results=max_results, page_token=page_token)
+            blobs, next_page_token = await gcs.list_blobs(GCS_BUCKET_NAME, match_glob=match_glob, max_results=max_results, page_token=page_token)
         else:
-            blobs_iter = bucket.list_blobs(prefix=prefix, max_results=max_results, page_token=page_token)
+            blobs, next_page_token = await gcs.list_blobs(GCS_BUCKET_NAME, prefix=prefix, max_results=max_results, page_token=page_token)
         
         file_list = []
-        db = get_firestore_client()
         summary_collection = db.collection("ingestion_file_summaries")
         
         doc_refs = []
         file_map = {} 
         
-        for blob in blobs_iter:
+        for blob in blobs:
             if blob.name.endswith(".pdf"):
                 safe_filename = "".join(c for c in blob.name if c.isalnum() or c in "._-")
                 item = {
@@ -356,8 +383,7 @@ async def list_files(max_results: int = 100, page_token: Optional[str] = None, s
                 doc_refs.append(summary_collection.document(safe_filename))
         
         if doc_refs:
-            docs = db.get_all(doc_refs)
-            for doc in docs:
+            async for doc in db.get_all(doc_refs):
                 if doc.exists:
                     data = doc.to_dict()
                     safe_fname = doc.id
@@ -373,25 +399,22 @@ async def list_files(max_results: int = 100, page_token: Optional[str] = None, s
                         item["design_rating"] = data.get("design_rating")
         
         file_list.sort(key=lambda x: x["updated"] or "", reverse=True)
-        return {"files": file_list, "next_page_token": blobs_iter.next_page_token}
+        return {"files": file_list, "next_page_token": next_page_token}
     except Exception as e:
         print(f"List Files Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/consulting/files/delete")
-async def delete_files(req: DeleteFilesRequest):
+async def delete_files(req: DeleteFilesRequest, gcs: AsyncStorage = Depends(get_async_storage)):
     try:
-        g_client = get_storage_client()
-        bucket = g_client.bucket(GCS_BUCKET_NAME)
+        results = await asyncio.gather(*(gcs.delete(GCS_BUCKET_NAME, f) for f in req.filenames), return_exceptions=True)
         deleted_count = 0
         errors = []
-        for filename in req.filenames:
-            try:
-                blob = bucket.blob(filename)
-                blob.delete()
+        for filename, result in zip(req.filenames, results):
+            if isinstance(result, Exception):
+                errors.append(f"{filename}: {result}")
+            else:
                 deleted_count += 1
-            except Exception as e:
-                errors.append(f"{filename}: {e}")
         return {"deleted_count": deleted_count, "errors": errors}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -399,16 +422,15 @@ async def delete_files(req: DeleteFilesRequest):
 @router.post("/consulting/files/signed-url")
 async def get_file_signed_url(req: GenerateSignedUrlRequest):
     try:
-        g_client = get_storage_client()
-        bucket = g_client.bucket(GCS_BUCKET_NAME)
-        blob = bucket.blob(req.filename)
-        url = blob.generate_signed_url(version="v4", expiration=datetime.timedelta(minutes=60), method="GET")
+        url = await offload(generate_signed_url, f"gs://{GCS_BUCKET_NAME}/{req.filename}", minutes=60)
+        if not url:
+            raise Exception(f"Could not sign {req.filename}")
         return {"url": url}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/consulting/files/upload")
-async def simple_upload_file(file: UploadFile = File(...)):
+async def simple_upload_file(file: UploadFile = File(...), gcs: AsyncStorage = Depends(get_async_storage)):
     try:
         if not GCS_BUCKET_NAME:
             raise HTTPException(status_code=500, detail="GCS config missing")
@@ -416,10 +438,7 @@ async def simple_upload_file(file: UploadFile = File(...)):
         filename = file.filename
         filename = "".join(c for c in filename if c.isalnum() or c in "._-")
         if not filename.lower().endswith(".pdf"): filename += ".pdf"
-        g_client = get_storage_client()
-        bucket = g_client.bucket(GCS_BUCKET_NAME)
-        blob = bucket.blob(f"consulting_raw/{filename}")
-        blob.upload_from_string(content, content_type="application/pdf")
+        await gcs.upload_bytes(GCS_BUCKET_NAME, f"consulting_raw/{filename}", content, content_type="application/pdf")
         return {"message": "Uploaded", "filename": f"consulting_raw/{filename}"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -427,12 +446,11 @@ async def simple_upload_file(file: UploadFile = File(...)):
 # --- Batch Ingestion Endpoints ---
 
 @router.post("/consulting/ingest")
-async def trigger_ingest(background_tasks: BackgroundTasks):
+async def trigger_ingest(background_tasks: BackgroundTasks, db: firestore.AsyncClient = Depends(get_async_db)):
     """Starts a new ingestion batch (Via Cloud Run Job in Prod, or Thread in Local)."""
     try:
         batch_id = str(uuid.uuid4())
-        db = get_firestore_client()
-        db.collection(BATCH_COLLECTION_NAME).document(batch_id).set({
+        await db.collection(BATCH_COLLECTION_NAME).document(batch_id).set({
             "id": batch_id,
             "created_at": firestore.SERVER_TIMESTAMP,
             "status": "pending",
@@ -459,7 +477,7 @@ async def trigger_ingest(background_tasks: BackgroundTasks):
                         ]
                     )
                 )
-                operation = client.run_job(request=request)
+                operation = await offload(client.run_job, request=request)
                 print(f"Triggered Cloud Run Job: {operation.operation.name}")
                 return {"batch_id": batch_id, "message": "Batch started (Cloud Run Job)"}
                 
@@ -477,24 +495,26 @@ async def trigger_ingest(background_tasks: BackgroundTasks):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/consulting/batches")
-async def list_batches():
+async def list_batches(page: PageParams = Depends(), db: firestore.AsyncClient = Depends(get_async_db)):
     try:
-        db = get_firestore_client()
-        docs = db.collection(BATCH_COLLECTION_NAME).order_by("created_at", direction=firestore.Query.DESCENDING).limit(20).stream()
-        batches = [d.to_dict() for d in docs]
-        return {"batches": batches}
+        rows, next_cursor = await fetch_page_async(db.collection(BATCH_COLLECTION_NAME), page.default_size(20))
+        return {"batches": [data for _, data in rows], "next_cursor": next_cursor}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/consulting/batches/{batch_id}")
-async def get_batch_details(batch_id: str):
+async def get_batch_details(batch_id: str, page: PageParams = Depends(), db: firestore.AsyncClient = Depends(get_async_db)):
     try:
-        db = get_firestore_client()
-        batch = db.collection(BATCH_COLLECTION_NAME).document(batch_id).get().to_dict()
-        items_ref = db.collection(RESULT_COLLECTION_NAME).where("batch_id", "==", batch_id).stream()
-        items = [d.to_dict() for d in items_ref]
+        results = db.collection(RESULT_COLLECTION_NAME)
+        # Paged by document name: the equality filter then needs no composite index
+        batch_snap, (rows, next_cursor) = await asyncio.gather(
+            db.collection(BATCH_COLLECTION_NAME).document(batch_id).get(),
+            fetch_page_async(results.where("batch_id", "==", batch_id), page, collection=results, order_field=None, descending=False)
+        )
+        batch = batch_snap.to_dict()
+        items = [data for _, data in rows]
         items.sort(key=lambda x: (x.get("status") != "failed", x.get("filename")))
-        return {"batch": batch, "items": items}
+        return {"batch": batch, "items": items, "next_cursor": next_cursor}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -504,11 +524,10 @@ async def retry_batch(batch_id: str, req: RetryBatchRequest, background_tasks: B
     return {"message": "Retry started"}
 
 @router.post("/consulting/batches/{batch_id}/cancel")
-async def cancel_batch(batch_id: str):
+async def cancel_batch(batch_id: str, db: firestore.AsyncClient = Depends(get_async_db)):
     try:
-        db = get_firestore_client()
         batch_ref = db.collection(BATCH_COLLECTION_NAME).document(batch_id)
-        batch_ref.update({"status": "cancelling"})
+        await batch_ref.update({"status": "cancelling"})
         return {"message": "Cancellation requested"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -526,15 +545,15 @@ async def process_knowledge_worker(doc_id: str, gcs_uri: str, file_type: str):
     3. Store in Firestore
     """
     print(f"DEBUG: Starting Knowledge Processing for {doc_id} ({gcs_uri})")
-    db = get_firestore_client()
+    db = get_async_db()
     collection_name = os.getenv("FIRESTORE_COLLECTION_KNOWLEDGE", "consulting_knowledge")
     doc_ref = db.collection(collection_name).document(doc_id)
     
     try:
-        doc_ref.update({"status": "processing"})
+        await doc_ref.update({"status": "processing"})
         
         # 1. Extraction with Gemini 2.5 Flash Lite
-        print(f"DEBUGGING: Initializing Custom GenAI client for {doc_id} to ensure correct Auth")
+        print(f"DEBUGGING: Resolving GenAI client for {doc_id} to ensure correct Auth")
         
         # Mirroring logic from ai_shared.py
         api_key = os.getenv("GOOGLE_CLOUD_API_KEY")
@@ -554,11 +573,7 @@ async def process_knowledge_worker(doc_id: str, gcs_uri: str, file_type: str):
         if not custom_client and p_id:
             try:
                 print(f"DEBUGGING: Attempting Vertex AI with ADC (Project={p_id}, Location={p_loc})...")
-                custom_client = genai.Client(
-                    vertexai=True,
-                    project=p_id,
-                    location=p_loc
-                )
+                custom_client = get_client_registry().genai_vertex(project=p_id, location=p_loc)
                 auth_mode = f"Vertex AI (ADC, Project={p_id})"
             except Exception as e:
                 print(f"DEBUGGING: Failed Init Vertex+ADC: {e}")
@@ -567,10 +582,7 @@ async def process_knowledge_worker(doc_id: str, gcs_uri: str, file_type: str):
         if not custom_client and api_key:
             try:
                 print("DEBUGGING: Attempting Vertex AI with API Key...")
-                custom_client = genai.Client(
-                    vertexai=True,
-                    api_key=api_key.strip()
-                )
+                custom_client = get_client_registry().genai_api_key()
                 auth_mode = "Vertex AI (API Key)"
             except Exception as e:
                 print(f"DEBUGGING: Failed Init Vertex+APIKey: {e}")
@@ -579,9 +591,7 @@ async def process_knowledge_worker(doc_id: str, gcs_uri: str, file_type: str):
         if not custom_client and api_key:
             try:
                 print("DEBUGGING: Attempting AI Studio with API Key...")
-                custom_client = genai.Client(
-                    api_key=api_key.strip()
-                )
+                custom_client = get_client_registry().genai_api_key(vertexai=False)
                 auth_mode = "AI Studio (API Key)"
             except Exception as e:
                 print(f"DEBUGGING: Failed Init AI Studio: {e}")
@@ -621,10 +631,7 @@ async def process_knowledge_worker(doc_id: str, gcs_uri: str, file_type: str):
             bucket_name = gcs_path_parts[0]
             blob_name = gcs_path_parts[1]
             
-            storage_client = get_storage_client()
-            bucket = storage_client.bucket(bucket_name)
-            blob = bucket.blob(blob_name)
-            file_bytes = blob.download_as_bytes()
+            file_bytes = await get_async_storage().download_bytes(bucket_name, blob_name)
             
             file_part = types.Part.from_bytes(data=file_bytes, mime_type=file_type)
         except Exception as dl_err:
@@ -645,7 +652,8 @@ async def process_knowledge_worker(doc_id: str, gcs_uri: str, file_type: str):
         
         try:
             # Using default timeout (proven to work in isolate_gemini_call.py with ADC)
-            response = await custom_client.aio.models.generate_content(
+            response = await gemini_generate_async(
+                client=custom_client,
                 model=GEMINI_FLASH_LITE_MODEL, 
                 contents=[user_content],
                 config=types.GenerateContentConfig(
@@ -671,7 +679,8 @@ async def process_knowledge_worker(doc_id: str, gcs_uri: str, file_type: str):
         print(f"DEBUGGING: Embed Text Length: {len(text_to_embed)}. Calling embed_content...")
         
         # Use local client for embedding too for consistency
-        embed_response = await custom_client.aio.models.embed_content(
+        embed_response = await gemini_embed_async(
+            client=custom_client,
             model=GEMINI_EMBEDDING_MODEL, 
             contents=text_to_embed
         )
@@ -679,7 +688,7 @@ async def process_knowledge_worker(doc_id: str, gcs_uri: str, file_type: str):
         print(f"DEBUGGING: Embedding received. Vector size: {len(embedding_vector)}")
         
         # 3. Store in Firestore
-        doc_ref.update({
+        await doc_ref.update({
             "status": "completed",
             "title": title,
             "summary": summary,
@@ -694,12 +703,14 @@ async def process_knowledge_worker(doc_id: str, gcs_uri: str, file_type: str):
         traceback_str = traceback.format_exc()
         print(f"CRITICAL ERROR in process_knowledge_worker for {doc_id}: {e}")
         print(f"TRACEBACK:\n{traceback_str}")
-        doc_ref.update({"status": "failed", "error": f"{str(e)}"})
+        await doc_ref.update({"status": "failed", "error": f"{str(e)}"})
 
 @router.post("/consulting/knowledge/upload")
 async def upload_knowledge(
     background_tasks: BackgroundTasks,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    db: firestore.AsyncClient = Depends(get_async_db),
+    gcs: AsyncStorage = Depends(get_async_storage)
 ):
     try:
         bucket_name = os.getenv("GCS_BUCKET_KNOWLEDGE", "genai-app-knowledge") # Default or Env
@@ -710,23 +721,19 @@ async def upload_knowledge(
         filename = f"{uuid.uuid4()}_{file.filename}"
         filename = "".join(c for c in filename if c.isalnum() or c in "._-")
         
-        g_client = get_storage_client()
         # Ensure bucket exists or use main bucket if specific one not set up
         # For safety in this environment, let's use the main GCS_BUCKET_NAME but with a subfolder
         # unless GCS_BUCKET_KNOWLEDGE is explicitly set and different.
         target_bucket_name = bucket_name if bucket_name != "genai-app-knowledge" else GCS_BUCKET_NAME
         
-        bucket = g_client.bucket(target_bucket_name)
-        blob = bucket.blob(f"knowledge/{filename}")
-        blob.upload_from_string(content, content_type=file.content_type)
+        await gcs.upload_bytes(target_bucket_name, f"knowledge/{filename}", content, content_type=file.content_type)
         GCS_URI = f"gs://{target_bucket_name}/knowledge/{filename}"
         
         # 2. Create Initial Firestore Record
-        db = get_firestore_client()
         doc_ref = db.collection(collection_name).document()
         doc_id = doc_ref.id
         
-        doc_ref.set({
+        await doc_ref.set({
             "id": doc_id,
             "gcs_uri": GCS_URI,
             "original_filename": file.filename,
@@ -744,13 +751,16 @@ async def upload_knowledge(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/consulting/knowledge/{doc_id}")
-async def delete_knowledge(doc_id: str):
+async def delete_knowledge(
+    doc_id: str,
+    db: firestore.AsyncClient = Depends(get_async_db),
+    gcs: AsyncStorage = Depends(get_async_storage)
+):
     try:
-        db = get_firestore_client()
         collection_name = os.getenv("FIRESTORE_COLLECTION_KNOWLEDGE", "consulting_knowledge")
         doc_ref = db.collection(collection_name).document(doc_id)
         
-        doc = doc_ref.get()
+        doc = await doc_ref.get()
         if not doc.exists:
             raise HTTPException(status_code=404, detail="Knowledge item not found")
         
@@ -760,66 +770,49 @@ async def delete_knowledge(doc_id: str):
         # Delete from GCS
         if gcs_uri and gcs_uri.startswith("gs://"):
             try:
-                g_client = get_storage_client()
                 # Parse gs://bucket/path
                 parts = gcs_uri.replace("gs://", "").split("/", 1)
                 if len(parts) == 2:
                     bucket_name, blob_name = parts
-                    bucket = g_client.bucket(bucket_name)
-                    blob = bucket.blob(blob_name)
-                    blob.delete()
+                    await gcs.delete(bucket_name, blob_name)
             except Exception as e:
                 print(f"GCS Delete Warning: {e}")
         
         # Delete from Firestore
-        doc_ref.delete()
+        await doc_ref.delete()
         
         return {"message": "Deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def generate_signed_url(gcs_uri: str) -> str:
-    """Generates a v4 signed URL for the given GCS URI."""
-    try:
-        if not gcs_uri or not gcs_uri.startswith("gs://"):
-            return ""
-        
-        parts = gcs_uri.replace("gs://", "").split("/", 1)
-        if len(parts) != 2:
-            return ""
-            
-        bucket_name, blob_name = parts
-        g_client = get_storage_client()
-        bucket = g_client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        
-        url = blob.generate_signed_url(
-            version="v4",
-            expiration=datetime.timedelta(minutes=15),
-            method="GET",
-        )
-        return url
-    except Exception as e:
-        print(f"Signed URL Gen Error: {e}")
-        return ""
+@router.get("/consulting/knowledge/{doc_id}")
+async def get_knowledge(doc_id: str, db: firestore.AsyncClient = Depends(get_async_db)):
+    collection_name = os.getenv("FIRESTORE_COLLECTION_KNOWLEDGE", "consulting_knowledge")
+    doc = await db.collection(collection_name).document(doc_id).get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Knowledge item not found")
+    data = doc.to_dict()
+    data.pop("embedding", None)
+    data["id"] = doc.id
+    data["signed_url"] = await offload(generate_signed_url, data.get("gcs_uri", ""))
+    return data
 
 @router.get("/consulting/knowledge")
-async def list_knowledge(limit: int = 50):
+async def list_knowledge(limit: int = 50, page: PageParams = Depends(), db: firestore.AsyncClient = Depends(get_async_db)):
     try:
-        db = get_firestore_client()
         collection_name = os.getenv("FIRESTORE_COLLECTION_KNOWLEDGE", "consulting_knowledge")
-        docs = db.collection(collection_name).order_by("created_at", direction=firestore.Query.DESCENDING).limit(limit).stream()
+        # The list never needs the embedding; summary view also drops content_text
+        fields = page.fields(KNOWLEDGE_SUMMARY_FIELDS) or KNOWLEDGE_SUMMARY_FIELDS + ["content_text"]
+        docs, next_cursor = await fetch_page_async(db.collection(collection_name), page.default_size(limit), fields=fields)
+        signed = await offload(generate_signed_urls, [data.get("gcs_uri") for _, data in docs])
         
         items = []
-        for d in docs:
-            data = d.to_dict()
+        for doc_id, data in docs:
             gcs_uri = data.get("gcs_uri", "")
-            signed_url = ""
-            if gcs_uri:
-                signed_url = generate_signed_url(gcs_uri)
+            signed_url = signed.get(gcs_uri, "")
 
             items.append({
-                "id": d.id,
+                "id": doc_id,
                 "title": data.get("title", "Processing..."),
                 "summary": data.get("summary", ""),
                 "content_text": data.get("content_text", ""),
@@ -829,7 +822,7 @@ async def list_knowledge(limit: int = 50):
                 "created_at": data.get("created_at"),
                 "signed_url": signed_url
             })
-        return {"items": items}
+        return {"items": items, "next_page_token": next_cursor}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -856,18 +849,16 @@ def search_knowledge_db(vector: List[float], top_k: int = 3) -> List[Dict[str, A
             limit=top_k
         )
         
-        docs = vector_query.get()
+        docs = [(doc.id, doc.to_dict()) for doc in vector_query.get()]
+        signed = generate_signed_urls(data.get("gcs_uri") for _, data in docs)
         
         results = []
-        for doc in docs:
-            data = doc.to_dict()
+        for doc_id, data in docs:
             gcs_uri = data.get("gcs_uri")
-            signed_url = ""
-            if gcs_uri:
-                signed_url = generate_signed_url(gcs_uri)
+            signed_url = signed.get(gcs_uri, "") if gcs_uri else ""
                 
             results.append({
-                "id": doc.id,
+                "id": doc_id,
                 "score": 0.0, # Placeholder
                 "metadata": {
                     "title": data.get("title"),
@@ -888,13 +879,14 @@ async def search_knowledge(req: KnowledgeSearchRequest):
     try:
         client = get_genai_client()
         # Embed Query
-        embed_response = await client.aio.models.embed_content(
+        embed_response = await gemini_embed_async(
+            client=client,
             model=GEMINI_EMBEDDING_MODEL,
             contents=req.query
         )
         vector = embed_response.embeddings[0].values
         
-        results = search_knowledge_db(vector, req.top_k)
+        results = await offload(search_knowledge_db, vector, req.top_k)
         return {"results": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1002,17 +994,21 @@ async def collect_file(background_tasks: BackgroundTasks, file: UploadFile = Fil
     background_tasks.add_task(run_background_collection, task_id, 'file_bytes', content)
     return {"task_id": task_id, "message": "Task started"}
 
+def _search_and_sign(vector, top_k, structure_type, filename):
+    """Vector search (index or Firestore fallback) plus URL signing; blocking, run via offload()."""
+    neighbors = search_vector_db(vector, top_k=top_k, structure_type=structure_type, filename=filename)
+    return neighbors, generate_signed_urls(n['id'] for n in neighbors)
+
 @router.post("/consulting/logic-mapper")
 async def logic_mapper(req: LogicMapperRequest):
     try:
-        vector = get_embedding(text=req.query)
+        vector = await get_embedding_async(text=req.query)
         if not vector: return {"results": []}
-        neighbors = search_vector_db(vector)
+        neighbors, signed = await offload(_search_and_sign, vector, req.top_k, req.structure_type, req.filename)
         results = []
         for n in neighbors:
             uri = n['id']
-            url = generate_signed_url(uri)
-            results.append({"url": url, "uri": uri, "score": n['score'], "metadata": n['metadata']})
+            results.append({"url": signed.get(uri, ""), "uri": uri, "score": n['score'], "metadata": n['metadata']})
         return {"results": results}
     except Exception as e:
         print(f"Logic Mapper Error: {e}")
@@ -1022,14 +1018,13 @@ async def logic_mapper(req: LogicMapperRequest):
 async def visual_search(req: VisualSearchRequest):
     try:
         image_bytes = base64.b64decode(req.image)
-        vector = get_embedding(image_bytes=image_bytes)
+        vector = await get_embedding_async(image_bytes=image_bytes)
         if not vector: return {"results": []}
-        neighbors = search_vector_db(vector)
+        neighbors, signed = await offload(_search_and_sign, vector, req.top_k, req.structure_type, req.filename)
         results = []
         for n in neighbors:
             uri = n['id']
-            url = generate_signed_url(uri)
-            results.append({"url": url, "uri": uri, "score": n['score'], "metadata": n['metadata']})
+            results.append({"url": signed.get(uri, ""), "uri": uri, "score": n['score'], "metadata": n['metadata']})
         return {"results": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1048,7 +1043,7 @@ async def slide_polisher(req: SlidePolisherRequest):
              image_bytes = base64.b64decode(req.image)
              contents.append(types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg"))
              contents.append("Refine the layout of this slide sketch/draft.")
-        response = client.models.generate_content(model=GEMINI_STABLE_PRO_MODEL, contents=contents)
+        response = await gemini_generate_async(client=client, model=GEMINI_STABLE_PRO_MODEL, contents=contents)
         html_content = response.text
         if html_content.startswith("```html"): html_content = html_content.replace("```html", "").replace("```", "")
         elif html_content.startswith("```"): html_content = html_content.replace("```", "")
@@ -1058,19 +1053,18 @@ async def slide_polisher(req: SlidePolisherRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/consulting/files/{filename}/pages")
-async def list_file_pages(filename: str):
+async def list_file_pages(filename: str, db: firestore.AsyncClient = Depends(get_async_db)):
     try:
-        db = get_firestore_client()
         collection = db.collection(FIRESTORE_COLLECTION_NAME)
         docs = collection.where("filename", "==", filename).stream()
         results = []
-        for doc in docs:
+        async for doc in docs:
             d = doc.to_dict()
             results.append({"id": doc.id, "page_number": d.get("page_number"), "structure_type": d.get("structure_type"), "key_message": d.get("key_message"), "description": d.get("description"), "uri": d.get("uri"), "created_at": d.get("created_at")})
         if not results and not filename.startswith("consulting_raw/"):
              alt_filename = f"consulting_raw/{filename}"
              docs_alt = collection.where("filename", "==", alt_filename).stream()
-             for doc in docs_alt:
+             async for doc in docs_alt:
                 d = doc.to_dict()
                 results.append({"id": doc.id, "page_number": d.get("page_number"), "structure_type": d.get("structure_type"), "key_message": d.get("key_message"), "description": d.get("description"), "uri": d.get("uri"), "created_at": d.get("created_at")})
         results.sort(key=lambda x: x["page_number"] or 0)
@@ -1101,29 +1095,8 @@ def get_consulting_upload_url(filename: str, content_type: Optional[str] = "vide
     try:
         # Generate with Standard Storage Client
         # Note: If running on Cloud Run, default credentials should    try:
-        # Check for service account key in env (Shared/Similar to English Review)
-        # This is CRITICAL for signing URLs on Cloud Run where ADC doesn't provide a private key suitable for signing
-        service_account_info_str = os.getenv("SERVICE_ACCOUNT_KEY")
-        if service_account_info_str:
-            try:
-                print("DEBUG: using SERVICE_ACCOUNT_KEY from env for Consulting Upload")
-                # Handle potential quoting issues if raw json was stringified weirdly
-                if service_account_info_str.startswith("'") and service_account_info_str.endswith("'"):
-                     service_account_info_str = service_account_info_str[1:-1]
-                
-                info = json.loads(service_account_info_str)
-                creds = service_account.Credentials.from_service_account_info(info)
-                # Create a specific client with these creds
-                current_storage_client = storage.Client(project=PROJECT_ID, credentials=creds)
-                bucket = current_storage_client.bucket(GCS_BUCKET_NAME)
-            except Exception as json_e:
-                print(f"Warning: Failed to parse SERVICE_ACCOUNT_KEY: {json_e}")
-                # Fallback to default
-                g_client = get_storage_client()
-                bucket = g_client.bucket(GCS_BUCKET_NAME)
-        else:
-             g_client = get_storage_client()
-             bucket = g_client.bucket(GCS_BUCKET_NAME)
+        # SERVICE_ACCOUNT_KEY client when set (ADC on Cloud Run cannot sign), shared across requests
+        bucket = get_signing_storage_client().bucket(GCS_BUCKET_NAME)
 
         # GCSやAPIで安全に扱えるよう、スペースや非ASCII文字を除去してファイル名をクリーンアップします
         safe_filename = "".join(c for c in filename if c.isalnum() or c in "._-")
@@ -1151,7 +1124,7 @@ def get_consulting_upload_url(filename: str, content_type: Optional[str] = "vide
 
 
 @router.post("/consulting/review", response_model=ConsultingReviewTask)
-async def create_consulting_review(req: ConsultingReviewCreateRequest):
+async def create_consulting_review(req: ConsultingReviewCreateRequest, db: firestore.AsyncClient = Depends(get_async_db)):
     """
     Analyzes an uploaded MTG audio/video file and provides feedback for Mr. Ushikoshi.
     """
@@ -1216,7 +1189,8 @@ async def create_consulting_review(req: ConsultingReviewCreateRequest):
         """
         
         # 音声デコードの失敗を避けるため、テスト済みの安定したモデルである gemini-2.5-flash を使用します
-        response = await client.aio.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_FLASH_MODEL, 
             contents=[prompt, part],
             config=types.GenerateContentConfig(
@@ -1227,7 +1201,6 @@ async def create_consulting_review(req: ConsultingReviewCreateRequest):
         feedback_content = response.text
         
         # 4. Save to Firestore
-        db = get_firestore_client()
         doc_ref = db.collection("consulting_review").document()
         
         task = ConsultingReviewTask(
@@ -1237,7 +1210,7 @@ async def create_consulting_review(req: ConsultingReviewCreateRequest):
             created_at=datetime.datetime.now()
         )
         
-        doc_ref.set(task.dict())
+        await doc_ref.set(task.dict())
         
         return task
 
@@ -1248,12 +1221,12 @@ async def create_consulting_review(req: ConsultingReviewCreateRequest):
 
 
 @router.get("/consulting/review", response_model=List[ConsultingReviewTask])
-def get_consulting_reviews(db: firestore.Client = Depends(get_firestore_client)):
+def get_consulting_reviews(response: Response, page: PageParams = Depends(), db: firestore.Client = Depends(get_firestore_client)):
     try:
-        docs = db.collection("consulting_review").order_by("created_at", direction=firestore.Query.DESCENDING).stream()
+        rows, next_cursor = fetch_page(db.collection("consulting_review"), page, fields=page.fields(REVIEW_SUMMARY_FIELDS))
+        set_next_cursor(response, next_cursor)
         tasks = []
-        for d in docs:
-            data = d.to_dict()
+        for _, data in rows:
             # Migration: handle legacy status if needed
             if isinstance(data.get("status"), str):
                  if data["status"] == "DONE":
@@ -1266,6 +1239,16 @@ def get_consulting_reviews(db: firestore.Client = Depends(get_firestore_client))
         print(f"Get Reviews Error: {e}")
         return []
 
+@router.get("/consulting/review/{task_id}", response_model=ConsultingReviewTask)
+def get_consulting_review(task_id: str, db: firestore.Client = Depends(get_firestore_client)):
+    doc = db.collection("consulting_review").document(task_id).get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Task not found")
+    data = doc.to_dict()
+    if isinstance(data.get("status"), str):
+        data["status"] = 2 if data["status"] == "DONE" else 0
+    return ConsultingReviewTask(**data)
+
 @router.patch("/consulting/review/{task_id}/status")
 def update_consulting_review_status(task_id: str, status: int, db: firestore.Client = Depends(get_firestore_client)):
     doc_ref = db.collection("consulting_review").document(task_id)
@@ -1291,12 +1274,7 @@ async def consulting_sme_websocket(websocket: WebSocket):
 
     # Use Direct GenAI Client (Fix for 1007 Error)
     # Using same pattern as working roleplay.py
-    client = genai.Client(
-        vertexai=True,
-        project=os.getenv("PROJECT_ID"),
-        location=os.getenv("LOCATION", "us-central1"),
-        http_options={'api_version': 'v1beta1'}
-    )
+    client = get_live_genai_client()
 
     # Model Configuration
     # verified working model for Live API connection & transcription
@@ -4,7 +4,8 @@ from fastapi import (
     Depends,
     status,
     UploadFile,
-    File
+    File,
+    Response
 )
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
@@ -23,6 +24,11 @@ from services.ai_shared import (
     LOCATION,
     GCS_BUCKET_NAME
 )
+from services.config_replica import get_config_replica
+from services.async_data import offload
+from services.pagination import PageParams, fetch_page, set_next_cursor
+from services.gemini_gateway import gemini_generate_async
+from services.context_cache import get_context_cache
 
 from config import (
     GEMINI_FLASH_MODEL,
@@ -38,7 +44,10 @@ router = APIRouter(
 # --- Firestore コレクション設定 ---
 CONFIG_COLLECTION = "consulting_settings"
 CONFIG_DOC_ID = "mtg_training_config"
+TASK_SUMMARY_FIELDS = ["id", "media_filename", "gcs_path", "overall_scores", "total_score", "filler_density", "status", "created_at"]
 TASKS_COLLECTION = "consulting_training_tasks"
+# システム指示＋ルーブリックのコンテキストキャッシュ保持時間（設定が変わればキーも変わる）
+RUBRIC_CACHE_TTL_SECONDS = int(os.environ.get("TRAINING_RUBRIC_CACHE_TTL_SECONDS", "3600"))
 
 # --- デフォルトのシステム指示と評価ルーブリック ---
 DEFAULT_SYSTEM_INSTRUCTION = """あなたはData・AI領域の専門コンサルタントチームの長であり、部下の会話能力を鍛える一流のコミュニケーションコーチです。
@@ -163,9 +172,10 @@ class TrainingReviewTask(BaseModel):
     media_filename: str
     gcs_path: str
     overall_scores: Dict[str, int]
-    overall_feedback: str
-    topic_evaluations: List[TopicEvaluation]
-    detected_fillers: List[FillerItem]
+    # Detail fields below are omitted in ?view=summary lists
+    overall_feedback: Optional[str] = None
+    topic_evaluations: Optional[List[TopicEvaluation]] = None
+    detected_fillers: Optional[List[FillerItem]] = None
     full_transcript: Optional[str] = None # 過去データとの互換性のためにOptionalとします
     checklist: Optional[MetricChecklist] = None
     total_words_estimate: Optional[int] = None
@@ -178,10 +188,9 @@ class TrainingReviewTask(BaseModel):
 
 def get_or_create_config(db: firestore.Client) -> Dict[str, Any]:
     """Firestoreから設定を取得、存在しない場合はデフォルト値で作成する"""
-    doc_ref = db.collection(CONFIG_COLLECTION).document(CONFIG_DOC_ID)
-    doc = doc_ref.get()
-    if doc.exists:
-        data = doc.to_dict()
+    replica = get_config_replica()
+    data = replica.document(db, CONFIG_COLLECTION, CONFIG_DOC_ID)
+    if data:
         if "updated_at" in data and not isinstance(data["updated_at"], datetime.datetime):
             data["updated_at"] = None
         return data
@@ -192,7 +201,8 @@ def get_or_create_config(db: firestore.Client) -> Dict[str, Any]:
         "rubric_definition": DEFAULT_RUBRIC_DEFINITION,
         "updated_at": datetime.datetime.now()
     }
-    doc_ref.set(default_data)
+    db.collection(CONFIG_COLLECTION).document(CONFIG_DOC_ID).set(default_data)
+    replica.put(CONFIG_COLLECTION, CONFIG_DOC_ID, default_data)
     return default_data
 
 # --- Endpoints ---
@@ -224,6 +234,7 @@ def update_training_config(req: TrainingConfigUpdateRequest, db: firestore.Clien
             "updated_at": now
         }
         doc_ref.set(update_data)
+        get_config_replica().put(CONFIG_COLLECTION, CONFIG_DOC_ID, update_data)
         return TrainingConfigResponse(
             system_instruction=req.system_instruction,
             rubric_definition=req.rubric_definition,
@@ -262,7 +273,8 @@ JSON構造：
 
 上記の要望を反映し、システムプロンプトとルーブリックを適切に更新してください。"""
 
-        response = await client.aio.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_CHAT_MODEL,
             contents=prompt,
             config=types.GenerateContentConfig(
@@ -302,7 +314,7 @@ async def create_training_review(req: TrainingReviewCreateRequest, db: firestore
         part = types.Part.from_uri(file_uri=req.gcs_path, mime_type=mime_type)
 
         # 2. Firestoreから最新のプロンプトとルーブリックを読み込む
-        config = get_or_create_config(db)
+        config = await offload(get_or_create_config, db)
         system_instruction = config.get("system_instruction")
         rubric_definition = config.get("rubric_definition")
 
@@ -327,10 +339,14 @@ async def create_training_review(req: TrainingReviewCreateRequest, db: firestore
 """
 
         # 4. Gemini API の呼び出し（構造化出力: JSON スキーマ）
+        # システム指示とルーブリック入りのプロンプトは全レビュー共通なのでコンテキストキャッシュから参照し、音声だけを毎回送る
         client = get_genai_client()
-        response = await client.aio.models.generate_content(
+        response = await get_context_cache().generate_async(
+            client=client,
             model=GEMINI_FLASH_MODEL,
-            contents=[prompt, part],
+            cached_contents=[prompt],
+            contents=[part],
+            ttl_seconds=RUBRIC_CACHE_TTL_SECONDS,
             config=types.GenerateContentConfig(
                 system_instruction=system_instruction,
                 response_mime_type="application/json",
@@ -422,18 +438,23 @@ async def create_training_review(req: TrainingReviewCreateRequest, db: firestore
         raise HTTPException(status_code=500, detail=f"トレーニング解析に失敗しました: {str(e)}")
 
 @router.get("", response_model=List[TrainingReviewTask])
-def get_training_tasks(db: firestore.Client = Depends(get_firestore_client)):
-    """MTGトレーニングの履歴一覧を最新順で取得します"""
+def get_training_tasks(response: Response, page: PageParams = Depends(), db: firestore.Client = Depends(get_firestore_client)):
+    """MTGトレーニングの履歴一覧を最新順で取得します（cursor/page_size/view=summary に対応）"""
     try:
-        docs = db.collection(TASKS_COLLECTION).order_by("created_at", direction=firestore.Query.DESCENDING).stream()
-        tasks = []
-        for d in docs:
-            data = d.to_dict()
-            tasks.append(TrainingReviewTask(**data))
-        return tasks
+        rows, next_cursor = fetch_page(db.collection(TASKS_COLLECTION), page, fields=page.fields(TASK_SUMMARY_FIELDS))
+        set_next_cursor(response, next_cursor)
+        return [TrainingReviewTask(**data) for _, data in rows]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/{task_id}", response_model=TrainingReviewTask)
+def get_training_task(task_id: str, db: firestore.Client = Depends(get_firestore_client)):
+    """トレーニング履歴1件の詳細（文字起こし・評価を含む）を取得します"""
+    doc = db.collection(TASKS_COLLECTION).document(task_id).get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return TrainingReviewTask(**doc.to_dict())
+
 @router.patch("/{task_id}/status")
 def update_training_task_status(task_id: str, status: int, db: firestore.Client = Depends(get_firestore_client)):
     """タスクのステータス（TODO / DONE）を更新します"""
@@ -498,10 +519,9 @@ async def analyze_live_audio(
         # Firestoreからシステム設定を取得して思考設定を適用
         thinking_enabled_sme_train = True
         try:
-            doc_ref = db.collection(CONFIG_COLLECTION).document("sidebar_visible_config")
-            doc = doc_ref.get()
-            if doc.exists:
-                thinking_enabled_sme_train = doc.to_dict().get("thinking_enabled_sme_train", True)
+            sidebar = await get_config_replica().document_async(db, CONFIG_COLLECTION, "sidebar_visible_config")
+            if sidebar:
+                thinking_enabled_sme_train = sidebar.get("thinking_enabled_sme_train", True)
         except Exception as se:
             print(f"Warning: Failed to fetch settings in analyze_live_audio: {se}")
 
@@ -517,7 +537,8 @@ async def analyze_live_audio(
             print("DEBUG: Thinking process disabled in SME Train (analyze_live_audio)", flush=True)
 
         client = get_genai_client()
-        response = await client.aio.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_FLASH_MODEL,
             contents=[prompt, part],
             config=types.GenerateContentConfig(**config_kwargs)
@@ -543,10 +564,8 @@ class SidebarSettingsModel(BaseModel):
 def get_sidebar_settings(db: firestore.Client = Depends(get_firestore_client)):
     """サイドバーの非表示設定を取得します"""
     try:
-        doc_ref = db.collection(CONFIG_COLLECTION).document("sidebar_visible_config")
-        doc = doc_ref.get()
-        if doc.exists:
-            data = doc.to_dict()
+        data = get_config_replica().document(db, CONFIG_COLLECTION, "sidebar_visible_config")
+        if data:
             return SidebarSettingsModel(
                 hidden_items=data.get("hidden_items", []),
                 thinking_enabled_agent=data.get("thinking_enabled_agent", True),
@@ -578,6 +597,8 @@ def update_sidebar_settings(req: SidebarSettingsModel, db: firestore.Client = De
             "thinking_enabled_sme_train": req.thinking_enabled_sme_train,
             "updated_at": firestore.SERVER_TIMESTAMP
         })
+        # updated_at is resolved server-side; re-read rather than caching the sentinel
+        get_config_replica().invalidate(CONFIG_COLLECTION, "sidebar_visible_config")
         return req
     except Exception as e:
         print(f"Error in update_sidebar_settings: {e}")
@@ -595,7 +616,7 @@ async def create_training_review_text(req: TrainingReviewTextCreateRequest, db:
             raise HTTPException(status_code=400, detail="文字起こしテキストが空です。")
 
         # 1. Firestoreから最新のプロンプトとルーブリックを読み込む
-        config = get_or_create_config(db)
+        config = await offload(get_or_create_config, db)
         system_instruction = config.get("system_instruction")
         rubric_definition = config.get("rubric_definition")
 
@@ -622,7 +643,8 @@ async def create_training_review_text(req: TrainingReviewTextCreateRequest, db:
 
         # 3. Gemini API の呼び出し（構造化出力: JSON スキーマ）
         client = get_genai_client()
-        response = await client.aio.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_FLASH_MODEL,
             contents=prompt,
             config=types.GenerateContentConfig(
@@ -3,13 +3,15 @@ from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timezone
 from google.cloud import firestore
-from database import get_db
+from database import get_db, get_async_db
 from google.genai import types
 from services.ai_shared import get_genai_client
+from services.config_replica import get_config_replica
 from services.dab_ingestion import run_ingestion_pipeline
 import uuid
 import json
 from config import GEMINI_FLASH_MODEL
+from services.gemini_gateway import gemini_generate_async
 
 router = APIRouter(
     prefix="/dab",
@@ -120,7 +122,7 @@ class SkipAllRequest(BaseModel):
 
 # --- Helpers ---
 
-async def update_user_memory_async(db: firestore.Client, topic_ids: List[str], eval_data: Dict[str, Any]):
+async def update_user_memory_async(db: firestore.AsyncClient, topic_ids: List[str], eval_data: Dict[str, Any]):
     """非同期バックグラウンド処理：ユーザー評価に基づいて長期記憶を更新する"""
     try:
         client = get_genai_client()
@@ -129,22 +131,22 @@ async def update_user_memory_async(db: firestore.Client, topic_ids: List[str], e
             return
             
         # 1. ユーザーの現在のメモリを取得
+        replica = get_config_replica()
         memory_ref = db.collection("dab_user_memory").document("default_user")
-        memory_doc = memory_ref.get()
-        if not memory_doc.exists:
+        memory = await replica.document_async(get_db(), "dab_user_memory", "default_user")
+        if not memory:
             print("WARNING: default_user memory not found")
             return
         
-        memory = memory_doc.to_dict()
         known_concepts = memory.get("known_concepts", [])
         learning_goals = memory.get("learning_goals", "")
         
         # 2. 評価されたトピックの情報を取得
         topics_info = []
+        hot_topics = await replica.collection_async(get_db(), "dab_hot_topics")
         for t_id in topic_ids:
-            t_doc = db.collection("dab_hot_topics").document(t_id).get()
-            if t_doc.exists:
-                topics_info.append(t_doc.to_dict()["name"])
+            if t_id in hot_topics:
+                topics_info.append(hot_topics[t_id]["name"])
         
         # 3. Geminiに投げて長期記憶の概念更新案を決定させる
         eval_summary = (
@@ -158,7 +160,8 @@ async def update_user_memory_async(db: firestore.Client, topic_ids: List[str], e
             "JSON以外の説明は含めないでください。例: [\"GraphRAG\", \"Vector Search\"]"
         )
         
-        response = await client.aio.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_FLASH_MODEL,
             contents=eval_summary,
             config=types.GenerateContentConfig(
@@ -172,10 +175,11 @@ async def update_user_memory_async(db: firestore.Client, topic_ids: List[str], e
             if isinstance(suggested_concepts, list):
                 # マージして一意にする
                 updated_concepts = list(set(known_concepts + suggested_concepts))
-                memory_ref.update({
+                await memory_ref.update({
                     "known_concepts": updated_concepts,
                     "updated_at": datetime.now(timezone.utc)
                 })
+                replica.invalidate("dab_user_memory", "default_user")
                 print(f"DEBUG: Long-term memory updated. Known concepts count: {len(updated_concepts)}")
         except Exception as json_e:
             print(f"Failed to parse memory update response: {response.text}, Error: {json_e}")
@@ -183,7 +187,7 @@ async def update_user_memory_async(db: firestore.Client, topic_ids: List[str], e
         # 4. ホットトピックの関心スコア・既知スコアの更新
         for t_id in topic_ids:
             t_ref = db.collection("dab_hot_topics").document(t_id)
-            t_doc = t_ref.get()
+            t_doc = await t_ref.get()
             if t_doc.exists:
                 t_data = t_doc.to_dict()
                 known_score = t_data.get("known_score", 1)
@@ -210,7 +214,8 @@ async def update_user_memory_async(db: firestore.Client, topic_ids: List[str], e
                 
                 # 既知スコアが5（完全に理解）に達した場合、ACTIVEからARCHIVEDへの移行候補となる
                 # (ここでは自動移行ではなく、スコア更新のみを行い、トピックライフサイクルマネージャ側で後ほど検知する)
-                t_ref.update(update_fields)
+                await t_ref.update(update_fields)
+        replica.invalidate("dab_hot_topics")
                 
     except Exception as e:
         print(f"Error in update_user_memory_async: {e}")
@@ -218,28 +223,26 @@ async def update_user_memory_async(db: firestore.Client, topic_ids: List[str], e
 # --- Endpoints ---
 
 @router.get("/topics", response_model=List[Topic])
-async def get_topics(db: firestore.Client = Depends(get_db)):
+def get_topics(db: firestore.Client = Depends(get_db)):
     """現在登録されているすべてのトピック（ACTIVE、CANDIDATE等）を取得する"""
     try:
-        docs = db.collection("dab_hot_topics").order_by("category").stream()
+        docs = get_config_replica().collection(db, "dab_hot_topics").values()
+        # Same as order_by("category"): documents without the field are left out
+        docs = sorted((d for d in docs if "category" in d), key=lambda d: d["category"])
         topics = []
-        for d in docs:
-            data = d.to_dict()
-            if data is not None:
-                topics.append(Topic(**data))  # type: ignore
+        for data in docs:
+            topics.append(Topic(**data))  # type: ignore
         return topics
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/memory", response_model=UserMemory)
-async def get_user_memory(db: firestore.Client = Depends(get_db)):
+def get_user_memory(db: firestore.Client = Depends(get_db)):
     """長期記憶・ユーザープロファイル情報を取得する"""
     try:
-        doc = db.collection("dab_user_memory").document("default_user").get()
-        if doc.exists:
-            data = doc.to_dict()
-            if data is not None:
-                return UserMemory(**data)  # type: ignore
+        data = get_config_replica().document(db, "dab_user_memory", "default_user")
+        if data:
+            return UserMemory(**data)  # type: ignore
         raise HTTPException(status_code=404, detail="User memory profile not found.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -292,7 +295,8 @@ async def edit_topics_ai(req: EditChatRequest):
     )
 
     try:
-        response = await client.aio.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_FLASH_MODEL,
             contents=prompt,
             config=types.GenerateContentConfig(
@@ -310,7 +314,7 @@ async def edit_topics_ai(req: EditChatRequest):
         raise HTTPException(status_code=500, detail=f"Failed to generate changes: {str(e)}")
 
 @router.post("/topics/commit")
-async def commit_topics(req: TopicCommitRequest, db: firestore.Client = Depends(get_db)):
+async def commit_topics(req: TopicCommitRequest, db: firestore.AsyncClient = Depends(get_async_db)):
     """AIが生成し、ユーザーが確定したトピック変更をFirestoreにコミットする"""
     try:
         batch = db.batch()
@@ -319,8 +323,7 @@ async def commit_topics(req: TopicCommitRequest, db: firestore.Client = Depends(
         incoming_ids = {t.id for t in req.topics}
         
         # 2. 現在Firestoreにあるトピックを取得
-        current_docs = db.collection("dab_hot_topics").stream()
-        current_ids = {d.id for d in current_docs}
+        current_ids = {d.id async for d in db.collection("dab_hot_topics").select([]).stream()}
         
         # 3. 削除対象のトピックをFirestoreから削除
         for doc_id in current_ids:
@@ -340,7 +343,8 @@ async def commit_topics(req: TopicCommitRequest, db: firestore.Client = Depends(
             
             batch.set(doc_ref, topic_dict)
             
-        batch.commit()
+        await batch.commit()
+        get_config_replica().invalidate("dab_hot_topics")
         return {"status": "success", "message": "Topics committed successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -369,7 +373,8 @@ async def edit_prompt_ai(req: PromptEditRequest):
     )
 
     try:
-        response = await client.aio.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_FLASH_MODEL,
             contents=prompt,
             config=types.GenerateContentConfig(
@@ -385,14 +390,15 @@ async def edit_prompt_ai(req: PromptEditRequest):
         raise HTTPException(status_code=500, detail=f"Failed to edit prompt: {str(e)}")
 
 @router.post("/prompt/commit")
-async def commit_prompt(req: PromptCommitRequest, db: firestore.Client = Depends(get_db)):
+async def commit_prompt(req: PromptCommitRequest, db: firestore.AsyncClient = Depends(get_async_db)):
     """修正した要約プロンプトをFirestoreに確定保存する"""
     try:
         ref = db.collection("dab_user_memory").document("default_user")
-        ref.update({
+        await ref.update({
             "summary_prompt_template": req.prompt,
             "updated_at": datetime.now(timezone.utc)
         })
+        get_config_replica().invalidate("dab_user_memory", "default_user")
         return {"status": "success", "message": "Prompt template committed successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -421,7 +427,8 @@ async def edit_filter_prompt_ai(req: FilterPromptEditRequest):
     )
 
     try:
-        response = await client.aio.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_FLASH_MODEL,
             contents=prompt,
             config=types.GenerateContentConfig(
@@ -437,25 +444,26 @@ async def edit_filter_prompt_ai(req: FilterPromptEditRequest):
         raise HTTPException(status_code=500, detail=f"Failed to edit filter prompt: {str(e)}")
 
 @router.post("/filter-prompt/commit")
-async def commit_filter_prompt(req: FilterPromptCommitRequest, db: firestore.Client = Depends(get_db)):
+async def commit_filter_prompt(req: FilterPromptCommitRequest, db: firestore.AsyncClient = Depends(get_async_db)):
     """修正したフィルタプロンプトをFirestoreに確定保存する"""
     try:
         ref = db.collection("dab_user_memory").document("default_user")
-        ref.update({
+        await ref.update({
             "filter_prompt_template": req.prompt,
             "updated_at": datetime.now(timezone.utc)
         })
+        get_config_replica().invalidate("dab_user_memory", "default_user")
         return {"status": "success", "message": "Filter prompt template committed successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/feed", response_model=List[FeedItem])
-async def get_feed(db: firestore.Client = Depends(get_db)):
+async def get_feed(db: firestore.AsyncClient = Depends(get_async_db)):
     """蓄積された要約記事フィードを取得する"""
     try:
         docs = db.collection("dab_feeds").order_by("created_at", direction=firestore.Query.DESCENDING).limit(50).stream()
         feed_items = []
-        for d in docs:
+        async for d in docs:
             data = d.to_dict()
             if data is not None:
                 feed_items.append(FeedItem(**data))  # type: ignore
@@ -468,12 +476,12 @@ async def evaluate_feed_item(
     feed_id: str, 
     req: EvaluationRequest, 
     background_tasks: BackgroundTasks, 
-    db: firestore.Client = Depends(get_db)
+    db: firestore.AsyncClient = Depends(get_async_db)
 ):
     """記事フィードに対するユーザーの評価（既知/未知、興味あり/なし）を登録し、非同期で長期記憶を更新する"""
     try:
         feed_ref = db.collection("dab_feeds").document(feed_id)
-        feed_doc = feed_ref.get()
+        feed_doc = await feed_ref.get()
         if not feed_doc.exists:
             raise HTTPException(status_code=404, detail="Feed item not found.")
             
@@ -482,7 +490,7 @@ async def evaluate_feed_item(
         
         # 評価データを保存
         eval_dict = req.dict()
-        feed_ref.update({
+        await feed_ref.update({
             "read_status": "READ",
             "user_evaluations": eval_dict
         })
@@ -497,7 +505,7 @@ async def evaluate_feed_item(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/feed/skip-all")
-async def skip_all_feeds(req: SkipAllRequest, db: firestore.Client = Depends(get_db)):
+async def skip_all_feeds(req: SkipAllRequest, db: firestore.AsyncClient = Depends(get_async_db)):
     """指定されたすべての記事フィードを一括でスキップ（既読化）する"""
     try:
         batch = db.batch()
@@ -512,7 +520,7 @@ async def skip_all_feeds(req: SkipAllRequest, db: firestore.Client = Depends(get
                     "skipped": True
                 }
             })
-        batch.commit()
+        await batch.commit()
         return {"status": "success", "message": f"{len(req.feed_ids)} items skipped successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -604,10 +612,10 @@ async def test_imagen_generation(request: ImagenTestRequest):
 # --- 有識者フォロー・詳細評価・探索 API エンドポイント ---
 
 @router.get("/experts", response_model=List[Expert])
-async def get_experts(db: firestore.Client = Depends(get_db)):
+async def get_experts(db: firestore.AsyncClient = Depends(get_async_db)):
     """登録されている有識者の一覧を取得する（空の場合はデフォルトデータを自動シード）"""
     try:
-        docs = list(db.collection("dab_experts").order_by("name").stream())
+        docs = [d async for d in db.collection("dab_experts").order_by("name").stream()]
         
         # データが空の場合はデフォルトデータを投入
         if not docs:
@@ -717,10 +725,10 @@ async def get_experts(db: firestore.Client = Depends(get_db)):
                 exp["updated_at"] = datetime.now(timezone.utc)
                 doc_ref = db.collection("dab_experts").document(exp["id"])
                 batch.set(doc_ref, exp)
-            batch.commit()
+            await batch.commit()
             
             # 再度取得
-            docs = db.collection("dab_experts").order_by("name").stream()
+            docs = [d async for d in db.collection("dab_experts").order_by("name").stream()]
             
         experts = []
         for d in docs:
@@ -738,56 +746,57 @@ async def get_experts(db: firestore.Client = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/experts", response_model=Expert)
-async def create_expert(expert: Expert, db: firestore.Client = Depends(get_db)):
+async def create_expert(expert: Expert, db: firestore.AsyncClient = Depends(get_async_db)):
     """新しい有識者を登録する"""
     try:
         doc_ref = db.collection("dab_experts").document(expert.id)
         expert_dict = expert.dict()
         expert_dict["created_at"] = datetime.now(timezone.utc)
         expert_dict["updated_at"] = datetime.now(timezone.utc)
-        doc_ref.set(expert_dict)
+        await doc_ref.set(expert_dict)
         return Expert(**expert_dict)  # type: ignore
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/experts/{expert_id}", response_model=Expert)
-async def update_expert(expert_id: str, expert: Expert, db: firestore.Client = Depends(get_db)):
+async def update_expert(expert_id: str, expert: Expert, db: firestore.AsyncClient = Depends(get_async_db)):
     """有識者の登録情報を更新する"""
     try:
         doc_ref = db.collection("dab_experts").document(expert_id)
-        if not doc_ref.get().exists:
+        existing = await doc_ref.get()
+        if not existing.exists:
             raise HTTPException(status_code=404, detail="Expert not found.")
         expert_dict = expert.dict()
         expert_dict["id"] = expert_id
         expert_dict["updated_at"] = datetime.now(timezone.utc)
         
         # created_atを保持する
-        existing_data = doc_ref.get().to_dict()
+        existing_data = existing.to_dict()
         expert_dict["created_at"] = (
             existing_data.get("created_at")
             if existing_data and isinstance(existing_data, dict)
             else datetime.now(timezone.utc)
         )
         
-        doc_ref.set(expert_dict)
+        await doc_ref.set(expert_dict)
         return Expert(**expert_dict)  # type: ignore
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/experts/{expert_id}")
-async def delete_expert(expert_id: str, db: firestore.Client = Depends(get_db)):
+async def delete_expert(expert_id: str, db: firestore.AsyncClient = Depends(get_async_db)):
     """有識者の登録を解除する"""
     try:
         doc_ref = db.collection("dab_experts").document(expert_id)
-        if not doc_ref.get().exists:
+        if not (await doc_ref.get()).exists:
             raise HTTPException(status_code=404, detail="Expert not found.")
-        doc_ref.delete()
+        await doc_ref.delete()
         return {"status": "success", "message": f"Expert {expert_id} deleted successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/experts/analytics")
-async def get_experts_analytics(db: firestore.Client = Depends(get_db)):
+async def get_experts_analytics(db: firestore.AsyncClient = Depends(get_async_db)):
     """登録されている有識者ごとの詳細評価平均値を集計して返す"""
     try:
         # すべての記事フィードを取得
@@ -797,7 +806,7 @@ async def get_experts_analytics(db: firestore.Client = Depends(get_db)):
         # { expert_id: { reliability: [], practicality: [], novelty: [], value: [] } }
         expert_scores = {}
         
-        for d in docs:
+        async for d in docs:
             data = d.to_dict()
             expert_id = data.get("expert_id")
             if not expert_id:
@@ -839,7 +848,7 @@ async def get_experts_analytics(db: firestore.Client = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/experts/discovery")
-async def discover_new_experts(db: firestore.Client = Depends(get_db)):
+async def discover_new_experts(db: firestore.AsyncClient = Depends(get_async_db)):
     """長期記憶や関心から、AIが新しい有識者を提案する"""
     client = get_genai_client()
     if not client:
@@ -847,15 +856,13 @@ async def discover_new_experts(db: firestore.Client = Depends(get_db)):
         
     try:
         # 現在のアクティブトピックと、ユーザーの長期記憶を取得
-        topics_docs = db.collection("dab_hot_topics").where("status", "==", "ACTIVE").get()
+        replica = get_config_replica()
         active_topics = []
-        for doc in topics_docs:
-            d_data = doc.to_dict()
-            if d_data and "name" in d_data:
+        for d_data in (await replica.collection_async(get_db(), "dab_hot_topics")).values():
+            if d_data.get("status") == "ACTIVE" and "name" in d_data:
                 active_topics.append(d_data["name"])
         
-        memory_doc = db.collection("dab_user_memory").document("default_user").get()
-        memory_data = memory_doc.to_dict() if memory_doc.exists else None
+        memory_data = await replica.document_async(get_db(), "dab_user_memory", "default_user")
         if not memory_data or not isinstance(memory_data, dict):
             memory_data = {}
         known_concepts = memory_data.get("known_concepts", [])
@@ -864,7 +871,7 @@ async def discover_new_experts(db: firestore.Client = Depends(get_db)):
         # 既存の有識者名を取得して重複提案を避ける
         existing_experts_docs = db.collection("dab_experts").stream()
         existing_names = []
-        for d in existing_experts_docs:
+        async for d in existing_experts_docs:
             d_data = d.to_dict()
             if d_data and "name" in d_data:
                 existing_names.append(d_data["name"])
@@ -900,7 +907,8 @@ async def discover_new_experts(db: firestore.Client = Depends(get_db)):
             "指示: 上記の条件に合う「AIレディデータ」「モダンデータスタック」「データエンジニアリング」に関する良質な発信を行っている、実在する専門家を3名探し、JSON形式で提案してください。"
         )
         
-        response = await client.aio.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_FLASH_MODEL,
             contents=prompt,
             config=types.GenerateContentConfig(
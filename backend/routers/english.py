@@ -1,9 +1,9 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Query
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Query, Response
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime, timedelta
-from google.cloud import firestore, storage
-from database import get_db
+from google.cloud import firestore
+from database import get_db, get_signing_storage_client
 import os
 import shutil
 import uuid
@@ -11,10 +11,12 @@ from pathlib import Path
 from google import genai
 from google.genai import types
 import google.auth
-from google.oauth2 import service_account
 import json
 from services.ai_shared import get_genai_client
+from services.pagination import PageParams, fetch_page, set_next_cursor
 from config import GEMINI_CHAT_MODEL, GEMINI_PRO_MODEL, GEMINI_FLASH_MODEL
+from services.gemini_gateway import gemini_generate, gemini_generate_async, gemini_deadline, GeminiDeadlineExceeded
+from services.context_cache import get_context_cache
 
 try:
     from moviepy import VideoFileClip
@@ -37,12 +39,11 @@ router = APIRouter(
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME_FOR_ENGLISH_REVIEW")
+REVIEW_DEADLINE_SECONDS = float(os.getenv("ENGLISH_REVIEW_DEADLINE_SECONDS", "240"))
 
 # Client is obtained via get_genai_client()
 client = get_genai_client()
 
-storage_client = storage.Client()
-
 # --- Models ---
 
 class PreparationRequest(BaseModel):
@@ -51,7 +52,7 @@ class PreparationRequest(BaseModel):
 class PreparationTask(BaseModel):
     id: str
     topic: str
-    content: str
+    content: Optional[str] = None # Omitted in summary lists
     created_at: datetime
     status: int = 0 # 0: Unlearned, 1: Learned Once, 2: Mastered
     prompt: Optional[str] = None
@@ -63,7 +64,7 @@ class ReviewCreateRequest(BaseModel):
 class ReviewTask(BaseModel):
     id: str
     video_filename: str
-    content: str
+    content: Optional[str] = None # Omitted in summary lists
     script: Optional[str] = None
     created_at: datetime
     status: int = 0
@@ -77,7 +78,7 @@ class YouTubePrepTask(BaseModel):
     video_id: str
     video_url: str
     topic: str
-    content: str
+    content: Optional[str] = None # Omitted in summary lists
     # Legacy fields
     script: Optional[str] = None
     script_formatted: Optional[str] = None
@@ -192,6 +193,23 @@ def clean_roll_up_captions(transcript_items) -> str:
 
 # --- Endpoints ---
 
+# Summary projections for ?view=summary lists (the rest comes from GET /<kind>/{id})
+PREPARATION_SUMMARY_FIELDS = ["id", "topic", "created_at", "status"]
+YOUTUBE_PREP_SUMMARY_FIELDS = ["id", "video_id", "video_url", "topic", "created_at", "status"]
+REVIEW_SUMMARY_FIELDS = ["id", "video_filename", "created_at", "status"]
+
+def _migrate_status(data: dict) -> dict:
+    # Migration: "TODO" -> 0, "DONE" -> 2
+    if isinstance(data.get("status"), str):
+        data["status"] = 2 if data["status"] == "DONE" else 0
+    return data
+
+def _get_task(db: firestore.Client, collection: str, task_id: str) -> dict:
+    doc = db.collection(collection).document(task_id).get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return _migrate_status(doc.to_dict())
+
 @router.post("/preparation", response_model=PreparationTask)
 def create_preparation(req: PreparationRequest, db: firestore.Client = Depends(get_db)):
     print(f"DEBUG: Received preparation request for topic: {req.topic}")
@@ -240,7 +258,8 @@ def create_preparation(req: PreparationRequest, db: firestore.Client = Depends(g
     
     # 1. Generate Content with Gemini
     try:
-        response = client.models.generate_content(
+        response = gemini_generate(
+            client=client,
             model=GEMINI_PRO_MODEL,
             contents=prompt,
         )
@@ -261,7 +280,8 @@ def create_preparation(req: PreparationRequest, db: firestore.Client = Depends(g
     """
     
     try:
-        response_prompt = client.models.generate_content(
+        response_prompt = gemini_generate(
+            client=client,
             model=GEMINI_FLASH_MODEL,
             contents=prompt_generation_query,
         )
@@ -345,24 +365,20 @@ def seed_test_topics(db: firestore.Client):
         biz_ref.set(biz_task.dict())
 
 @router.get("/preparation", response_model=List[PreparationTask])
-def get_preparation_list(db: firestore.Client = Depends(get_db)):
-    try:
-        seed_test_topics(db)
-    except Exception as e:
-        print(f"Error seeding test topics: {e}")
+def get_preparation_list(response: Response, page: PageParams = Depends(), db: firestore.Client = Depends(get_db)):
+    if not page.cursor:
+        try:
+            seed_test_topics(db)
+        except Exception as e:
+            print(f"Error seeding test topics: {e}")
         
-    docs = db.collection("english_preparation").order_by("created_at", direction=firestore.Query.DESCENDING).stream()
-    tasks = []
-    for d in docs:
-        data = d.to_dict()
-        # Migration: "TODO" -> 0, "DONE" -> 2
-        if isinstance(data.get("status"), str):
-             if data["status"] == "DONE":
-                 data["status"] = 2
-             else:
-                 data["status"] = 0
-        tasks.append(PreparationTask(**data))
-    return tasks
+    rows, next_cursor = fetch_page(db.collection("english_preparation"), page, fields=page.fields(PREPARATION_SUMMARY_FIELDS))
+    set_next_cursor(response, next_cursor)
+    return [PreparationTask(**_migrate_status(data)) for _, data in rows]
+
+@router.get("/preparation/{task_id}", response_model=PreparationTask)
+def get_preparation(task_id: str, db: firestore.Client = Depends(get_db)):
+    return PreparationTask(**_get_task(db, "english_preparation", task_id))
 
 @router.patch("/preparation/{task_id}/prompt")
 def update_preparation_prompt(task_id: str, req: PreparationPromptUpdateRequest, db: firestore.Client = Depends(get_db)):
@@ -394,7 +410,8 @@ def refine_prompt(req: RefinePromptRequest):
     """
     try:
         client = get_genai_client()
-        response = client.models.generate_content(
+        response = gemini_generate(
+            client=client,
             model=GEMINI_FLASH_MODEL,
             contents=prompt,
             config=types.GenerateContentConfig(
@@ -531,7 +548,8 @@ async def create_youtube_prep(req: YouTubePrepRequest, db: firestore.Client = De
         
         try:
             # Using 1.5 Flash for long text processing with high attention to constraints
-            response = await client.aio.models.generate_content(
+            response = await gemini_generate_async(
+                client=client,
                 model=GEMINI_CHAT_MODEL,
                 contents=prompt,
                 config=types.GenerateContentConfig(
@@ -554,7 +572,8 @@ async def create_youtube_prep(req: YouTubePrepRequest, db: firestore.Client = De
     try:
         # Parallel Execution: Notes + Manual Script + Auto Script
         client = get_genai_client()
-        task_notes = client.aio.models.generate_content(
+        task_notes = gemini_generate_async(
+                client=client,
                 model=GEMINI_CHAT_MODEL,
                 contents=prompt_notes,
         )
@@ -604,18 +623,14 @@ async def create_youtube_prep(req: YouTubePrepRequest, db: firestore.Client = De
     return task
 
 @router.get("/youtube-prep", response_model=List[YouTubePrepTask])
-def get_youtube_prep_list(db: firestore.Client = Depends(get_db)):
-    docs = db.collection("english_youtube_prep").order_by("created_at", direction=firestore.Query.DESCENDING).stream()
-    tasks = []
-    for d in docs:
-        data = d.to_dict()
-        if isinstance(data.get("status"), str):
-             if data["status"] == "DONE":
-                 data["status"] = 2
-             else:
-                 data["status"] = 0
-        tasks.append(YouTubePrepTask(**data))
-    return tasks
+def get_youtube_prep_list(response: Response, page: PageParams = Depends(), db: firestore.Client = Depends(get_db)):
+    rows, next_cursor = fetch_page(db.collection("english_youtube_prep"), page, fields=page.fields(YOUTUBE_PREP_SUMMARY_FIELDS))
+    set_next_cursor(response, next_cursor)
+    return [YouTubePrepTask(**_migrate_status(data)) for _, data in rows]
+
+@router.get("/youtube-prep/{task_id}", response_model=YouTubePrepTask)
+def get_youtube_prep(task_id: str, db: firestore.Client = Depends(get_db)):
+    return YouTubePrepTask(**_get_task(db, "english_youtube_prep", task_id))
 
 @router.delete("/youtube-prep/{task_id}")
 def delete_youtube_prep(task_id: str, db: firestore.Client = Depends(get_db)):
@@ -640,26 +655,8 @@ def get_upload_url(filename: str, content_type: Optional[str] = "video/mp4"):
         raise HTTPException(status_code=500, detail="GCS_BUCKET_NAME not configured")
     
     try:
-        # Check for service account key in env (injected from Secret Manager)
-        service_account_info_str = os.getenv("SERVICE_ACCOUNT_KEY")
-        if service_account_info_str:
-            try:
-                print("DEBUG: using SERVICE_ACCOUNT_KEY from env")
-                # Handle potential quoting issues if raw json was stringified weirdly
-                if service_account_info_str.startswith("'") and service_account_info_str.endswith("'"):
-                     service_account_info_str = service_account_info_str[1:-1]
-                
-                info = json.loads(service_account_info_str)
-                creds = service_account.Credentials.from_service_account_info(info)
-                # Create a specific client with these creds
-                current_storage_client = storage.Client(credentials=creds)
-                bucket = current_storage_client.bucket(GCS_BUCKET_NAME)
-            except Exception as json_e:
-                print(f"Warning: Failed to parse SERVICE_ACCOUNT_KEY: {json_e}")
-                # Fallback to default
-                bucket = storage_client.bucket(GCS_BUCKET_NAME)
-        else:
-             bucket = storage_client.bucket(GCS_BUCKET_NAME)
+        # SERVICE_ACCOUNT_KEY client when set (ADC on Cloud Run cannot sign), shared across requests
+        bucket = get_signing_storage_client().bucket(GCS_BUCKET_NAME)
 
         # GCSやAPIで安全に扱えるよう、スペースや非ASCII文字を除去してファイル名をクリーンアップします
         safe_filename = "".join(c for c in filename if c.isalnum() or c in "._-")
@@ -789,30 +786,6 @@ async def create_review(req: ReviewCreateRequest, db: firestore.Client = Depends
         4. 冒頭の挨拶やメタコメントは不要です。スクリプトのみを出力してください。
         """
 
-    async def generate_content(p_prompt, p_part, p_model=GEMINI_PRO_MODEL):
-        # Retry logic for 429 RESOURCE_EXHAUSTED
-        import time
-        max_retries = 3
-        retry_delay = 5 # seconds
-        
-        for attempt in range(max_retries):
-            try:
-                response = client.models.generate_content(
-                    model=p_model,
-                    contents=[p_prompt, p_part]
-                )
-                return response.text
-            except Exception as e:
-                error_str = str(e)
-                if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
-                    print(f"WARNING: Rate limit hit (Attempt {attempt + 1}/{max_retries}). Retrying in {retry_delay}s...")
-                    if attempt == max_retries - 1:
-                        raise e # Re-raise if last attempt
-                    time.sleep(retry_delay)
-                    retry_delay *= 2 # Exponential backoff
-                else:
-                    raise e # Re-raise other errors immediately
-
     try:
         print(f"DEBUG: STARTING GEMINI GENERATION (Parallel)")
         import asyncio
@@ -832,15 +805,26 @@ async def create_review(req: ReviewCreateRequest, db: firestore.Client = Depends
 
         async def run_parallel():
              client = get_genai_client()
-             task_review = client.aio.models.generate_content(
-                model=GEMINI_PRO_MODEL,
-                contents=[prompt_review, part]
-             )
-             task_script = client.aio.models.generate_content(
-                model=GEMINI_CHAT_MODEL, # Use Flash for script to save cost/time
-                contents=[prompt_script, part]
-             )
-             return await asyncio.gather(task_review, task_script)
+             context_cache = get_context_cache()
+             # Both calls (queueing and retries included) share one budget, so the request ends before Cloud Run cuts it
+             with gemini_deadline(REVIEW_DEADLINE_SECONDS):
+                 # The media goes first so it can be served from a context cache. Caches are per model and
+                 # a first run uses each one once, so the audio is only cached when the same file is reviewed again.
+                 task_review = context_cache.generate_async(
+                    client=client,
+                    model=GEMINI_PRO_MODEL,
+                    cached_contents=[part],
+                    contents=[prompt_review],
+                    min_uses=2,
+                 )
+                 task_script = context_cache.generate_async(
+                    client=client,
+                    model=GEMINI_CHAT_MODEL, # Use Flash for script to save cost/time
+                    cached_contents=[part],
+                    contents=[prompt_script],
+                    min_uses=2,
+                 )
+                 return await asyncio.gather(task_review, task_script)
 
         results = await run_parallel()
         content_review = results[0].text
@@ -850,6 +834,8 @@ async def create_review(req: ReviewCreateRequest, db: firestore.Client = Depends
 
     except Exception as e:
         print(f"Review Processing Error: {e}")
+        if isinstance(e, GeminiDeadlineExceeded):
+            raise HTTPException(status_code=504, detail="AI Service Busy (Timed out). Please try again in a few minutes.")
         error_detail = str(e)
         if "429" in error_detail or "RESOURCE_EXHAUSTED" in error_detail:
              error_detail = "AI Service Busy (Rate Limit). Please try again in a few minutes."
@@ -870,18 +856,14 @@ async def create_review(req: ReviewCreateRequest, db: firestore.Client = Depends
 
 
 @router.get("/review", response_model=List[ReviewTask])
-def get_review_list(db: firestore.Client = Depends(get_db)):
-    docs = db.collection("english_review").order_by("created_at", direction=firestore.Query.DESCENDING).stream()
-    tasks = []
-    for d in docs:
-        data = d.to_dict()
-        if isinstance(data.get("status"), str):
-             if data["status"] == "DONE":
-                 data["status"] = 2
-             else:
-                 data["status"] = 0
-        tasks.append(ReviewTask(**data))
-    return tasks
+def get_review_list(response: Response, page: PageParams = Depends(), db: firestore.Client = Depends(get_db)):
+    rows, next_cursor = fetch_page(db.collection("english_review"), page, fields=page.fields(REVIEW_SUMMARY_FIELDS))
+    set_next_cursor(response, next_cursor)
+    return [ReviewTask(**_migrate_status(data)) for _, data in rows]
+
+@router.get("/review/{task_id}", response_model=ReviewTask)
+def get_review(task_id: str, db: firestore.Client = Depends(get_db)):
+    return ReviewTask(**_get_task(db, "english_review", task_id))
 
 @router.delete("/review/{task_id}")
 def delete_review(task_id: str, db: firestore.Client = Depends(get_db)):
@@ -944,7 +926,8 @@ def generate_phrases(req: PhraseGenerateRequest):
     
     try:
         client = get_genai_client()
-        response = client.models.generate_content(
+        response = gemini_generate(
+            client=client,
             model=GEMINI_CHAT_MODEL,
             contents=prompt,
         )
@@ -990,15 +973,16 @@ def create_phrases(req_list: List[PhraseCreateRequest], db: firestore.Client = D
 
 @router.get("/phrases", response_model=List[Phrase])
 def get_phrases(
+    response: Response,
     filter_memorized: bool = Query(False, description="Deprecated: Use status filtering"), # Keeping for backward compat logic if needed
+    page: PageParams = Depends(),
     db: firestore.Client = Depends(get_db)
 ):
-    query = db.collection("english_phrases").order_by("created_at", direction=firestore.Query.DESCENDING)
-    
-    docs = query.stream()
+    # Phrases are small already: paging only, no summary projection
+    rows, next_cursor = fetch_page(db.collection("english_phrases"), page)
+    set_next_cursor(response, next_cursor)
     phrases = []
-    for d in docs:
-        data = d.to_dict()
+    for _, data in rows:
         # Migration: is_memorized=True -> status=2, False -> status=0
         if "status" not in data:
             data["status"] = 2 if data.get("is_memorized", False) else 0
@@ -1043,11 +1027,13 @@ def chat_with_context(req: ChatRequest):
         4. **親しみやすさ**: 丁寧ですが、硬すぎないトーンで話してください。
         """
         
+        context_contents = []
         contents = []
         
         # Add context as the first user message part if provided
+        # (cached with the system instruction, so later turns don't resend it)
         if req.context:
-             contents.append(types.Content(
+             context_contents.append(types.Content(
                  role="user",
                  parts=[types.Part.from_text(text=f"【以下の資料（Context）を前提に回答してください】\n\n{req.context}")]
              ))
@@ -1062,8 +1048,10 @@ def chat_with_context(req: ChatRequest):
         print(f"DEBUG: sending chat request with {len(req.messages)} messages")
         
         client = get_genai_client()
-        response = client.models.generate_content(
+        response = get_context_cache().generate(
+            client=client,
             model=req.model or GEMINI_FLASH_MODEL,
+            cached_contents=context_contents,
             contents=contents,
             config=types.GenerateContentConfig(
                 system_instruction=system_instruction,
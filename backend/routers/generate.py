@@ -2,9 +2,10 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 import os
-from google import genai
+from services.ai_shared import get_api_key_genai_client
 from google.genai import types
 from config import GEMINI_CHAT_MODEL
+from services.gemini_gateway import gemini_generate_async
 
 router = APIRouter()
 
@@ -18,15 +19,7 @@ class GenerateRequest(BaseModel):
 @router.post("/generate")
 async def generate_content(request: GenerateRequest):
     try:
-        api_key = os.getenv("GOOGLE_CLOUD_API_KEY")
-        if api_key:
-            api_key = api_key.strip()
-
-        client = genai.Client(
-            vertexai=True,
-            api_key=api_key,
-            http_options={'api_version': 'v1beta1'}
-        )
+        client = get_api_key_genai_client()
 
         model = GEMINI_CHAT_MODEL
 
@@ -57,7 +50,8 @@ async def generate_content(request: GenerateRequest):
         if not contents:
             return {"answer": "(no content to generate)"}
 
-        response = client.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=model,
             contents=contents,
             config=types.GenerateContentConfig(
@@ -3,11 +3,12 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional, List
 
-from google import genai
+from services.ai_shared import get_api_key_genai_client
 from google.genai import types
 import base64
 import os
 from config import GEMINI_CHAT_MODEL
+from services.gemini_gateway import gemini_generate_async
 
 # ---- FastAPI router ----
 router = APIRouter(
@@ -24,15 +25,7 @@ class GenerateRequest(BaseModel):
 # ---- google-genai クライアント ----
 # Explicitly initialize with Vertex AI settings
 # Ensure PROJECT_ID is set in Cloud Run environment variables
-api_key = os.getenv("GOOGLE_CLOUD_API_KEY")
-if api_key:
-    api_key = api_key.strip()
-
-client = genai.Client(
-    vertexai=True,
-    api_key=api_key,
-    http_options={'api_version': 'v1beta1'}
-)
+client = get_api_key_genai_client()
 
 
 def build_contents(req: GenerateRequest) -> List[types.Part | str]:
@@ -84,7 +77,8 @@ async def generate_with_google_genai(request: GenerateRequest):
 
         # モデル名はお好みで変更可能（2.0 / 2.5 など）
         # 例: "gemini-2.5-flash" / "gemini-2.5-pro" :contentReference[oaicite:5]{index=5}
-        response = client.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_CHAT_MODEL,
             contents=contents,
             config=config,
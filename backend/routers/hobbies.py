@@ -1,18 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime, timedelta
-from google.cloud import firestore, storage
-from database import get_db
+from google.cloud import firestore
+from database import get_db, get_async_db, get_async_storage, get_signing_storage_client
 import os
 import uuid
 import json
 from google import genai
 from google.genai import types
 import asyncio
-from google.oauth2 import service_account
 from services.ai_shared import get_genai_client
+from services.async_data import AsyncStorage, offload
+from services.pagination import PageParams, fetch_page, set_next_cursor
 from config import GEMINI_CHAT_MODEL, GEMINI_PRO_MODEL
+from services.gemini_gateway import gemini_generate_async
 
 router = APIRouter(
     prefix="/hobbies",
@@ -29,8 +31,6 @@ if not GCS_BUCKET_NAME:
 # Client is obtained via get_genai_client()
 client = get_genai_client()
 
-storage_client = storage.Client()
-
 # --- Models ---
 
 class PhotoUploadRequest(BaseModel):
@@ -88,25 +88,8 @@ class FinanceAnalysisResult(BaseModel):
 def get_photo_upload_url(filename: str, content_type: str = "image/jpeg"):
     """Generates a PUT Signed URL for uploading photo directly to GCS."""
     try:
-        # Check for service account key in env (injected from Secret Manager)
-        service_account_info_str = os.getenv("SERVICE_ACCOUNT_KEY")
-        if service_account_info_str:
-            try:
-                # Handle potential quoting issues if raw json was stringified weirdly
-                if service_account_info_str.startswith("'") and service_account_info_str.endswith("'"):
-                     service_account_info_str = service_account_info_str[1:-1]
-                
-                info = json.loads(service_account_info_str)
-                creds = service_account.Credentials.from_service_account_info(info)
-                # Create a specific client with these creds
-                current_storage_client = storage.Client(credentials=creds)
-                bucket = current_storage_client.bucket(GCS_BUCKET_NAME)
-            except Exception as json_e:
-                print(f"Warning: Failed to parse SERVICE_ACCOUNT_KEY: {json_e}")
-                # Fallback to default
-                bucket = storage_client.bucket(GCS_BUCKET_NAME)
-        else:
-             bucket = storage_client.bucket(GCS_BUCKET_NAME)
+        # SERVICE_ACCOUNT_KEY client when set (ADC on Cloud Run cannot sign), shared across requests
+        bucket = get_signing_storage_client().bucket(GCS_BUCKET_NAME)
 
         unique_name = f"hobbies/photos/{uuid.uuid4()}_{filename}"
         blob = bucket.blob(unique_name)
@@ -128,7 +111,11 @@ def get_photo_upload_url(filename: str, content_type: str = "image/jpeg"):
         raise HTTPException(status_code=500, detail=f"Failed to generate upload URL: {str(e)}")
 
 @router.post("/photos/analyze", response_model=PhotoTask)
-async def analyze_photo(req: PhotoAnalyzeRequest, db: firestore.Client = Depends(get_db)):
+async def analyze_photo(
+    req: PhotoAnalyzeRequest,
+    db: firestore.AsyncClient = Depends(get_async_db),
+    gcs: AsyncStorage = Depends(get_async_storage)
+):
     # 1. Processing Input (GCS vs URL)
     gcs_path = req.gcs_path
     
@@ -146,7 +133,7 @@ async def analyze_photo(req: PhotoAnalyzeRequest, db: firestore.Client = Depends
             if "photos.app.goo.gl" in req.photo_url or "photos.google.com" in req.photo_url:
                 try:
                     # 1. Get the shared page
-                    resp = requests.get(req.photo_url, allow_redirects=True)
+                    resp = await offload(requests.get, req.photo_url, allow_redirects=True)
                     soup = BeautifulSoup(resp.content, "html.parser")
                     # 2. Extract og:image
                     og_image = soup.find("meta", property="og:image")
@@ -161,7 +148,7 @@ async def analyze_photo(req: PhotoAnalyzeRequest, db: firestore.Client = Depends
 
             # Download Image
             # Note: requests.get for image
-            img_resp = requests.get(target_image_url)
+            img_resp = await offload(requests.get, target_image_url)
             if img_resp.status_code != 200:
                 raise HTTPException(status_code=400, detail="Failed to download image from extracted URL")
             
@@ -169,10 +156,8 @@ async def analyze_photo(req: PhotoAnalyzeRequest, db: firestore.Client = Depends
             content_type = img_resp.headers.get("Content-Type", "image/jpeg")
             
             # Upload to GCS
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
             unique_name = f"hobbies/photos/{uuid.uuid4()}_imported.jpg"
-            blob = bucket.blob(unique_name)
-            blob.upload_from_string(image_bytes, content_type=content_type)
+            await gcs.upload_bytes(GCS_BUCKET_NAME, unique_name, image_bytes, content_type=content_type)
             
             gcs_path = f"gs://{GCS_BUCKET_NAME}/{unique_name}"
             # Update filename if it was just "imported" or generic
@@ -212,7 +197,8 @@ async def analyze_photo(req: PhotoAnalyzeRequest, db: firestore.Client = Depends
         
         # 2. Call Gemini 3 Flash
         client = get_genai_client()
-        response = await client.aio.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_CHAT_MODEL,
             contents=[prompt, part]
         )
@@ -241,14 +227,24 @@ async def analyze_photo(req: PhotoAnalyzeRequest, db: firestore.Client = Depends
         created_at=datetime.now(),
         status="processed"
     )
-    doc_ref.set(task.dict())
+    await doc_ref.set(task.dict())
     
     return task
 
+PHOTO_SUMMARY_FIELDS = ["id", "filename", "gcs_path", "camera_model", "score", "created_at", "status"]
+
 @router.get("/photos", response_model=List[PhotoTask])
-def get_photos(db: firestore.Client = Depends(get_db)):
-    docs = db.collection("hobbies_photos").order_by("created_at", direction=firestore.Query.DESCENDING).stream()
-    return [PhotoTask(**d.to_dict()) for d in docs]
+def get_photos(response: Response, page: PageParams = Depends(), db: firestore.Client = Depends(get_db)):
+    rows, next_cursor = fetch_page(db.collection("hobbies_photos"), page, fields=page.fields(PHOTO_SUMMARY_FIELDS))
+    set_next_cursor(response, next_cursor)
+    return [PhotoTask(**data) for _, data in rows]
+
+@router.get("/photos/{photo_id}", response_model=PhotoTask)
+def get_photo(photo_id: str, db: firestore.Client = Depends(get_db)):
+    doc = db.collection("hobbies_photos").document(photo_id).get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    return PhotoTask(**doc.to_dict())
 
 @router.delete("/photos/{photo_id}")
 def delete_photo(photo_id: str, db: firestore.Client = Depends(get_db)):
@@ -275,25 +271,8 @@ def get_photo_image_url(photo_id: str, db: firestore.Client = Depends(get_db)):
             
         bucket_name, blob_name = parts
         
-        # Check for service account key in env (injected from Secret Manager)
-        service_account_info_str = os.getenv("SERVICE_ACCOUNT_KEY")
-        if service_account_info_str:
-            try:
-                # Handle potential quoting issues if raw json was stringified weirdly
-                if service_account_info_str.startswith("'") and service_account_info_str.endswith("'"):
-                     service_account_info_str = service_account_info_str[1:-1]
-                
-                info = json.loads(service_account_info_str)
-                creds = service_account.Credentials.from_service_account_info(info)
-                # Create a specific client with these creds
-                current_storage_client = storage.Client(credentials=creds)
-                bucket = current_storage_client.bucket(bucket_name)
-            except Exception as json_e:
-                print(f"Warning: Failed to parse SERVICE_ACCOUNT_KEY: {json_e}")
-                # Fallback to default
-                bucket = storage_client.bucket(bucket_name)
-        else:
-             bucket = storage_client.bucket(bucket_name)
+        # SERVICE_ACCOUNT_KEY client when set (ADC on Cloud Run cannot sign), shared across requests
+        bucket = get_signing_storage_client().bucket(bucket_name)
 
         blob = bucket.blob(blob_name)
         
@@ -332,7 +311,8 @@ async def chat_camera_guide(req: ChatRequest):
     # Gemini 1.5/2.0 supports system_instruction param.
     
     try:
-        response = await client.aio.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_CHAT_MODEL,
             contents=history,
             config=types.GenerateContentConfig(
@@ -348,9 +328,10 @@ async def chat_camera_guide(req: ChatRequest):
 # --- Endpoints: Financial Assets ---
 
 @router.get("/finance/assets", response_model=List[FinancialAsset])
-def get_assets(db: firestore.Client = Depends(get_db)):
-    docs = db.collection("hobbies_finance_assets").order_by("created_at", direction=firestore.Query.DESCENDING).stream()
-    return [FinancialAsset(**d.to_dict()) for d in docs]
+def get_assets(response: Response, page: PageParams = Depends(), db: firestore.Client = Depends(get_db)):
+    rows, next_cursor = fetch_page(db.collection("hobbies_finance_assets"), page)
+    set_next_cursor(response, next_cursor)
+    return [FinancialAsset(**data) for _, data in rows]
 
 @router.post("/finance/assets", response_model=FinancialAsset)
 def create_asset(req: AssetCreateRequest, db: firestore.Client = Depends(get_db)):
@@ -372,14 +353,13 @@ def delete_asset(asset_id: str, db: firestore.Client = Depends(get_db)):
     return {"status": "deleted"}
 
 @router.post("/finance/analyze")
-async def analyze_finance(req: FinanceAnalysisRequest, db: firestore.Client = Depends(get_db)):
+async def analyze_finance(req: FinanceAnalysisRequest, db: firestore.AsyncClient = Depends(get_async_db)):
     """
     Analyzes assets using Gemini 3 Pro.
     Gathers news/info (simulated or using grounding if enabled) and provides outlook.
     """
     # 1. Fetch Assets
-    assets_ref = db.collection("hobbies_finance_assets").stream()
-    assets = [d.to_dict() for d in assets_ref]
+    assets = [d.to_dict() async for d in db.collection("hobbies_finance_assets").stream()]
     
     if not assets:
         return {"analysis": "登録されている資産がありません。", "created_at": datetime.now()}
@@ -411,7 +391,8 @@ async def analyze_finance(req: FinanceAnalysisRequest, db: firestore.Client = De
         tools = [types.Tool(google_search=types.GoogleSearch())]
         
         client = get_genai_client()
-        response = await client.aio.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_PRO_MODEL,
             contents=prompt,
             config=types.GenerateContentConfig(
@@ -427,7 +408,7 @@ async def analyze_finance(req: FinanceAnalysisRequest, db: firestore.Client = De
         
         # Save most recent analysis
         analysis_ref = db.collection("hobbies_finance_analysis").document("latest")
-        analysis_ref.set({
+        await analysis_ref.set({
             "analysis": analysis_text,
             "created_at": datetime.now()
         })
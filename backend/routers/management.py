@@ -3,31 +3,22 @@ import sys
 import os
 from pathlib import Path
 from typing import List
-from google.cloud import storage
+from database import get_storage_client
 
 # Add the scripts directory to path to import prep_data
 sys.path.append(str(Path(__file__).parent.parent / "scripts"))
 
-# Import the logic function. 
-from scripts import prep_data
-
 router = APIRouter(
     tags=["management"],
 )
 
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
 
-def get_storage_client():
-    # Use same key logic as Firestore if possible, or default
-    key_path = Path(__file__).parent.parent / "key.json"
-    if key_path.exists():
-        return storage.Client.from_service_account_json(str(key_path))
-    else:
-        return storage.Client()
-
 def run_prep_data_task():
     print("Starting data preparation task...")
     try:
+        # Imported here: prep_data pulls in vertexai, which only this task needs
+        from scripts import prep_data
         prep_data.generate_embeddings()
         print("Data preparation task completed successfully.")
     except Exception as e:
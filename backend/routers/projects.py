@@ -1,9 +1,11 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime, timedelta, timezone
 from google.cloud import firestore
 from database import get_db
+from services.ordering import move_item, rebalance, append_order
+from google.api_core.exceptions import NotFound
 
 JST = timezone(timedelta(hours=9))
 
@@ -17,7 +19,7 @@ router = APIRouter(
 class ProjectBase(BaseModel):
     title: str
     description: Optional[str] = None
-    order: int = 0
+    order: float = 0
 
 class ProjectCreate(ProjectBase):
     pass
@@ -30,7 +32,7 @@ class ProjectResponse(ProjectBase):
 class ProjectTaskBase(BaseModel):
     title: str
     details: Optional[str] = None
-    order: int = 0
+    order: float = 0
     is_completed: bool = False
 
 class ProjectTaskCreate(ProjectTaskBase):
@@ -45,6 +47,11 @@ class ProjectTaskResponse(ProjectTaskBase):
 class ReorderRequest(BaseModel):
     ids: List[str]
 
+class MoveRequest(BaseModel):
+    # Neighbours of the item after the drop (None at either end of the list)
+    prev_id: Optional[str] = None
+    next_id: Optional[str] = None
+
 # --- Endpoints ---
 
 @router.get("", response_model=List[ProjectResponse])
@@ -114,14 +121,13 @@ def create_project_task(project_id: str, task: ProjectTaskCreate, db: firestore.
     if not project_ref.get().exists:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Determine order
-    current_tasks = project_ref.collection("tasks").order_by("order").stream()
-    max_order = -1
-    for t in current_tasks:
-        o = t.to_dict().get('order', 0)
-        if o > max_order: max_order = o
+    # Determine order: append after the last task (single-field index, no scan)
+    last_tasks = project_ref.collection("tasks").order_by("order", direction=firestore.Query.DESCENDING).limit(1).stream()
+    max_order = None
+    for t in last_tasks:
+        max_order = t.to_dict().get('order', 0)
     
-    new_order = max_order + 1
+    new_order = append_order(max_order)
     
     doc_ref = project_ref.collection("tasks").document()
     data = task.dict()
@@ -149,6 +155,28 @@ def reorder_project_tasks(project_id: str, request: ReorderRequest, db: firestor
     batch.commit()
     return {"status": "reordered", "count": len(request.ids)}
 
+def _move(db: firestore.Client, collection_ref, item_id: str, request: MoveRequest, background_tasks: BackgroundTasks, label: str):
+    """Single-write move between two neighbours; rebalances in the background when gaps get too small."""
+    list_query = lambda: collection_ref.order_by("order")
+    try:
+        new_order, needs_rebalance = move_item(db, collection_ref, item_id, request.prev_id, request.next_id, list_query)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Neighbour not found: {e}")
+    except NotFound:
+        raise HTTPException(status_code=404, detail="Item not found")
+    if needs_rebalance:
+        background_tasks.add_task(rebalance, db, list_query(), label)
+    return {"status": "moved", "id": item_id, "order": new_order}
+
+@router.put("/{project_id}/move")
+def move_project(project_id: str, request: MoveRequest, background_tasks: BackgroundTasks, db: firestore.Client = Depends(get_db)):
+    return _move(db, db.collection("projects"), project_id, request, background_tasks, "projects")
+
+@router.put("/{project_id}/tasks/{task_id}/move")
+def move_project_task(project_id: str, task_id: str, request: MoveRequest, background_tasks: BackgroundTasks, db: firestore.Client = Depends(get_db)):
+    tasks_ref = db.collection("projects").document(project_id).collection("tasks")
+    return _move(db, tasks_ref, task_id, request, background_tasks, f"projects/{project_id}/tasks")
+
 @router.put("/{project_id}/tasks/{task_id}", response_model=ProjectTaskResponse)
 def update_project_task(project_id: str, task_id: str, task: ProjectTaskCreate, db: firestore.Client = Depends(get_db)):
     project_ref = db.collection("projects").document(project_id)
@@ -8,8 +8,10 @@ import datetime
 from google.cloud import aiplatform
 from google.cloud import storage
 from google.genai import types
-from google import genai
+from services.ai_shared import get_api_key_genai_client
 from config import GEMINI_PRO_MODEL
+from services.signed_url import generate_signed_urls
+from services.gemini_gateway import gemini_generate_async
 # import vertexai
 # from vertexai.vision_models import MultiModalEmbeddingModel, Image
 
@@ -32,56 +34,14 @@ class RagRequest(BaseModel):
     mimeType: Optional[str] = None   # "image/png" etc
     top_k: int = 3
 
-_vertexai_initialized = False
-
-def _ensure_vertexai_init():
-    global _vertexai_initialized
-    if not _vertexai_initialized:
-        if not PROJECT_ID or not LOCATION:
-            print("Warning: PROJECT_ID or LOCATION not set for Vertex AI init")
-        else:
-            import vertexai
-            vertexai.init(project=PROJECT_ID, location=LOCATION)
-            _vertexai_initialized = True
-
 def get_embedding(text: str = None, image_bytes: bytes = None):
-    _ensure_vertexai_init()
-    from vertexai.vision_models import MultiModalEmbeddingModel, Image
-    model = MultiModalEmbeddingModel.from_pretrained("multimodalembedding@001")
-    if image_bytes:
-        image = Image(image_bytes)
-        embeddings = model.get_embeddings(image=image, contextual_text=text)
-        return embeddings.image_embedding
-    elif text:
-        embeddings = model.get_embeddings(contextual_text=text)
-        return embeddings.text_embedding
-    return None
+    # Shared service keeps one model handle and coalesces concurrent requests
+    from services.embedding_service import get_embedding_service
+    return get_embedding_service().embed(text=text, image_bytes=image_bytes)
 
-def generate_signed_url(gcs_uri: str) -> str:
-    """Generates a signed URL for a GCS object."""
-    try:
-        if not gcs_uri.startswith("gs://"):
-            return ""
-        
-        # Parse bucket and blob name
-        parts = gcs_uri.replace("gs://", "").split("/", 1)
-        if len(parts) != 2:
-            return ""
-        bucket_name, blob_name = parts
-        
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        
-        url = blob.generate_signed_url(
-            version="v4",
-            expiration=datetime.timedelta(minutes=15),
-            method="GET",
-        )
-        return url
-    except Exception as e:
-        print(f"Error generating signed URL for {gcs_uri}: {e}")
-        return ""
+async def get_embedding_async(text: str = None, image_bytes: bytes = None):
+    from services.embedding_service import get_embedding_service
+    return await get_embedding_service().embed_async(text=text, image_bytes=image_bytes)
 
 def search_vector_db(vector: List[float], top_k: int) -> List[Dict[str, Any]]:
     if not INDEX_ENDPOINT_ID or not DEPLOYED_INDEX_ID:
@@ -130,7 +90,7 @@ async def generate_rag(request: RagRequest):
             except:
                 pass
         
-        vector = get_embedding(text=request.query, image_bytes=image_bytes)
+        vector = await get_embedding_async(text=request.query, image_bytes=image_bytes)
         
         if not vector:
              raise HTTPException(status_code=400, detail="Could not generate embedding for input")
@@ -138,28 +98,20 @@ async def generate_rag(request: RagRequest):
         # 2. Retrieve
         retrieved_items = search_vector_db(vector, request.top_k)
         
+        signed = generate_signed_urls(item['id'] for item in retrieved_items)
         retrieved_contexts = []
         for item in retrieved_items:
             uri = item['id']
-            signed_url = generate_signed_url(uri)
             retrieved_contexts.append({
                 "uri": uri,
                 "distance": item['distance'],
-                "signed_url": signed_url
+                "signed_url": signed.get(uri, "")
             })
         
         print(f"Retrieved items: {retrieved_contexts}")
 
         # 3. Generate with Gemini
-        api_key = os.getenv("GOOGLE_CLOUD_API_KEY")
-        if api_key:
-            api_key = api_key.strip()
-            
-        client = genai.Client(
-            vertexai=True,
-            api_key=api_key,
-            http_options={'api_version': 'v1beta1'}
-        )
+        client = get_api_key_genai_client()
         
         contents = []
         
@@ -185,7 +137,8 @@ async def generate_rag(request: RagRequest):
 
         contents.append("Based on the provided manual pages (if any), please answer the user's question. If the manual pages don't contain the answer, state that.")
 
-        response = client.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_PRO_MODEL,
             contents=contents
         )
@@ -3,12 +3,11 @@ import json
 import asyncio
 import traceback
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from google import genai
 from google.genai import types
 from database import get_db
 # Helper to fetch context
 from routers.english import PreparationTask, Phrase
-# from services.ai_shared import get_genai_client
+from services.ai_shared import get_live_genai_client
 from config import GEMINI_LIVE_MODEL
 
 router = APIRouter(
@@ -16,13 +15,6 @@ router = APIRouter(
     tags=["roleplay"],
 )
 
-client = genai.Client(
-    vertexai=True,
-    project=os.getenv("PROJECT_ID"),
-    location=os.getenv("LOCATION", "us-central1"),
-    http_options={'api_version': 'v1beta1'}
-)
-
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
@@ -150,6 +142,8 @@ async def websocket_endpoint(websocket: WebSocket):
                     
                     session_config = types.LiveConnectConfig(**connect_config_kwargs)
 
+                # The Live client is created on first connection (not at import), then shared
+                client = get_live_genai_client()
                 async with client.aio.live.connect(
                     model=config["model"],
                     config=session_config
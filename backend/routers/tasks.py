@@ -7,7 +7,13 @@ import enum
 from google.cloud import firestore
 from google.cloud import firestore
 from google.cloud.firestore import FieldFilter
-from database import get_db
+from database import get_db, get_uow
+from services.unit_of_work import UnitOfWork, StaleWriteError
+from services.routine_schedule import compile_schedule, due_keys, is_due, ensure_schedule_index
+from services.sync_outbox import get_sync_outbox
+from services.ordering import move_item, rebalance, append_order, fallback_append_order
+from google.api_core.exceptions import NotFound
+import os
 import time
 import json
 
@@ -42,7 +48,7 @@ class BacklogItemCreate(BaseModel):
     deadline: Optional[date] = None
     scheduled_date: Optional[date] = None
     status: str = "STOCK" 
-    order: int = 0
+    order: float = 0
     place: Optional[str] = None
     is_highlighted: bool = False
     is_pet_allowed: bool = False
@@ -85,7 +91,7 @@ class RoutineCreate(BaseModel):
     goal_config: Optional[GoalConfig] = None
     icon: Optional[str] = None
     scheduled_time: str = "05:00"
-    order: int = 0
+    order: float = 0
     is_highlighted: bool = False
     is_active: bool = True # 有効・無効フラグ
 
@@ -103,7 +109,7 @@ class DailyTaskResponse(BaseModel):
     target_date: str 
     title: Optional[str] = None
     completed_at: Optional[datetime] = None
-    order: int = 0
+    order: float = 0
     scheduled_time: Optional[str] = "05:00"
     is_highlighted: bool = False
     current_goal_progress: Optional[str] = None # e.g. "1/3"
@@ -111,93 +117,161 @@ class DailyTaskResponse(BaseModel):
 class ReorderRequest(BaseModel):
     ids: List[str]
 
-# --- Helper Functions (Async Sync) ---
+class MoveRequest(BaseModel):
+    # Neighbours of the item after the drop (None at either end of the list)
+    prev_id: Optional[str] = None
+    next_id: Optional[str] = None
 
-def sync_backlog_update_to_daily(source_id: str, title: str, is_highlighted: bool, db: firestore.Client):
-    """
-    Update title and highlight status of all FUTURE or TODAY daily tasks 
-    that are sourced from this backlog item.
-    """
-    try:
-        # Find tasks sourced from this backlog item that are not completed (optional optimization)
-        # or just find all for simplicity/correctness even if done?
-        # Let's find all for today and future.
+# --- Helper Functions (Async Sync) ---
+# Changes are recorded in a durable outbox (services/sync_outbox.py) and applied by its worker,
+# so rapid edits to the same source coalesce into one propagation.
+
+SYNC_BACKLOG_TO_DAILY = "backlog_to_daily"
+SYNC_ROUTINE_TO_DAILY = "routine_to_daily"
+SYNC_ROUTINE_GOAL_PROGRESS = "routine_goal_progress"
+SYNC_DAILY_TO_BACKLOG = "daily_to_backlog"
+
+def _apply_to_future_daily(source_type: str):
+    def apply(db: firestore.Client, source_id: str, payload: dict, writer):
+        """
+        Update all FUTURE or TODAY daily tasks sourced from this item with the coalesced fields.
+        """
         today_str = datetime.now(JST).date().isoformat()
-        
         docs = db.collection("daily_tasks")\
             .where(filter=FieldFilter("source_id", "==", source_id))\
-            .where(filter=FieldFilter("source_type", "==", SourceType.BACKLOG.value))\
+            .where(filter=FieldFilter("source_type", "==", source_type))\
             .where(filter=FieldFilter("target_date", ">=", today_str))\
+            .select([])\
             .stream()
-            
-        batch = db.batch()
-        count = 0
         for doc in docs:
-            batch.update(doc.reference, {
-                "title": title,
-                "is_highlighted": is_highlighted
-            })
-            count += 1
-            if count >= 400: # Batch limit safe guard
-                batch.commit()
-                batch = db.batch()
-                count = 0
-        
-        if count > 0:
-            batch.commit()
-            
-    except Exception as e:
-        print(f"Async Sync Error (Backlog->Daily): {e}")
+            writer.update(doc.reference, payload)
+    return apply
 
-def sync_routine_to_daily(source_id: str, title: str, db: firestore.Client):
-    """
-    Update title of all FUTURE or TODAY daily tasks sourced from this routine.
-    """
-    try:
-        today_str = datetime.now(JST).date().isoformat()
-        
-        docs = db.collection("daily_tasks")\
-            .where(filter=FieldFilter("source_id", "==", source_id))\
-            .where(filter=FieldFilter("source_type", "==", SourceType.ROUTINE.value))\
-            .where(filter=FieldFilter("target_date", ">=", today_str))\
-            .stream()
-            
-        batch = db.batch()
-        count = 0
-        for doc in docs:
-            batch.update(doc.reference, {"title": title})
-            count += 1
-            if count >= 400:
-                batch.commit()
-                batch = db.batch()
-                count = 0
-        if count > 0:
-            batch.commit()
-    except Exception as e:
-        print(f"Async Sync Error (Routine->Daily): {e}")
+def _apply_routine_goal_progress(db: firestore.Client, routine_id: str, payload: dict, writer):
+    # Written in its own transaction from a fresh routine read (not through `writer`),
+    # so a completion that lands meanwhile can't be overwritten with an older count
+    refresh_routine_goal_progress(routine_id, db)
 
-def sync_daily_completion_to_backlog(backlog_id: str, completed: bool, db: firestore.Client):
-    """
-    Sync completion status back to backlog item.
-    """
+def _apply_daily_to_backlog(db: firestore.Client, backlog_id: str, payload: dict, writer):
+    writer.update(db.collection("backlog_items").document(backlog_id), payload)
+
+sync_outbox = get_sync_outbox()
+sync_outbox.register(SYNC_BACKLOG_TO_DAILY, _apply_to_future_daily(SourceType.BACKLOG.value))
+sync_outbox.register(SYNC_ROUTINE_TO_DAILY, _apply_to_future_daily(SourceType.ROUTINE.value))
+sync_outbox.register(SYNC_ROUTINE_GOAL_PROGRESS, _apply_routine_goal_progress)
+sync_outbox.register(SYNC_DAILY_TO_BACKLOG, _apply_daily_to_backlog)
+
+def _enqueue_sync(kind: str, source_id: str, fields: dict, label: str):
     try:
-        new_status = "DONE" if completed else "STOCK"
-        db.collection("backlog_items").document(backlog_id).update({"status": new_status})
+        sync_outbox.enqueue(kind, source_id, fields)
     except Exception as e:
-        print(f"Async Sync Error (Daily->Backlog Status): {e}")
+        print(f"Async Sync Error ({label}): {e}")
+
+def sync_backlog_update_to_daily(source_id: str, title: str, is_highlighted: bool):
+    _enqueue_sync(SYNC_BACKLOG_TO_DAILY, source_id, {"title": title, "is_highlighted": is_highlighted}, "Backlog->Daily")
+
+def sync_routine_to_daily(source_id: str, title: str):
+    _enqueue_sync(SYNC_ROUTINE_TO_DAILY, source_id, {"title": title}, "Routine->Daily")
+
+def sync_routine_goal_progress_to_daily(source_id: str):
+    # Progress is recomputed when applied, so the payload carries nothing
+    _enqueue_sync(SYNC_ROUTINE_GOAL_PROGRESS, source_id, {}, "Routine->Daily Goal Progress")
 
-def sync_daily_highlight_to_backlog(backlog_id: str, highlighted: bool, db: firestore.Client):
+def sync_daily_completion_to_backlog(backlog_id: str, completed: bool):
+    _enqueue_sync(SYNC_DAILY_TO_BACKLOG, backlog_id, {"status": "DONE" if completed else "STOCK"}, "Daily->Backlog Status")
+
+def sync_daily_highlight_to_backlog(backlog_id: str, highlighted: bool):
+    _enqueue_sync(SYNC_DAILY_TO_BACKLOG, backlog_id, {"is_highlighted": highlighted}, "Daily->Backlog Highlight")
+
+def sync_daily_title_to_backlog(backlog_id: str, title: str):
+    _enqueue_sync(SYNC_DAILY_TO_BACKLOG, backlog_id, {"title": title}, "Daily->Backlog Title")
+
+
+def _commit(uow: UnitOfWork, not_found: str = "Item not found"):
     try:
-        db.collection("backlog_items").document(backlog_id).update({"is_highlighted": highlighted})
-    except Exception as e:
-        print(f"Async Sync Error (Daily->Backlog Highlight): {e}")
+        uow.commit()
+    except StaleWriteError:
+        raise HTTPException(status_code=409, detail="Item was modified concurrently, please reload and retry")
+    except NotFound:
+        raise HTTPException(status_code=404, detail=not_found)
+
+
+# --- Goal Progress ---
+
+def _rolled_stats(goal: dict, stats: dict, now: datetime) -> dict:
+    """Stats as of `now`: counts are reset when the goal period changed since last_updated."""
+    last_updated = stats.get('last_updated')
+    # If last_updated is naive, make it aware (firestore timestamps usually okay)
+    if last_updated and last_updated.tzinfo is None:
+        last_updated = last_updated.replace(tzinfo=JST)
+    if last_updated:
+        last_updated = last_updated.astimezone(JST)
+
+    needs_reset = False
+    if last_updated:
+        if goal['period'] == 'WEEKLY':
+            if now.isocalendar()[:2] != last_updated.isocalendar()[:2]:
+                needs_reset = True
+        elif goal['period'] == 'MONTHLY':
+            if now.month != last_updated.month or now.year != last_updated.year:
+                needs_reset = True
+    else:
+        needs_reset = True # First time
+
+    if needs_reset:
+        return {"weekly_count": 0, "monthly_count": 0, "last_updated": now}
+    return dict(stats)
+
+def _format_goal_progress(goal: Optional[dict], stats: Optional[dict]) -> Optional[str]:
+    if not goal or not stats:
+        return None
+    current = 0
+    if goal['period'] == 'WEEKLY': current = stats.get('weekly_count', 0)
+    elif goal['period'] == 'MONTHLY': current = stats.get('monthly_count', 0)
+    return f"{current}/{goal['target_count']}"
+
+def goal_progress_time(day: date, now: datetime) -> datetime:
+    """The moment a task's progress is computed for: its own date (a future week/month starts at 0), never before now."""
+    return max(datetime.combine(day, datetime.min.time(), JST), now)
+
+def routine_goal_progress(routine: dict, at: Optional[datetime] = None) -> Optional[str]:
+    """The "1/3" string stored on daily tasks as current_goal_progress (None for routines without a goal)."""
+    goal = routine.get('goal_config')
+    stats = routine.get('stats')
+    if not goal or not stats:
+        return None
+    return _format_goal_progress(goal, _rolled_stats(goal, stats, at or datetime.now(JST)))
+
+def _future_routine_tasks(txn, db: firestore.Client, routine_id: str, now: datetime):
+    return list(txn.get(db.collection("daily_tasks")\
+        .where(filter=FieldFilter("source_id", "==", routine_id))\
+        .where(filter=FieldFilter("source_type", "==", SourceType.ROUTINE.value))\
+        .where(filter=FieldFilter("target_date", ">=", now.date().isoformat()))))
 
-def sync_daily_title_to_backlog(backlog_id: str, title: str, db: firestore.Client):
+def _task_progress_time(task_data: dict, now: datetime) -> datetime:
     try:
-        db.collection("backlog_items").document(backlog_id).update({"title": title})
-    except Exception as e:
-        print(f"Async Sync Error (Daily->Backlog Title): {e}")
+        return goal_progress_time(date.fromisoformat(task_data.get('target_date')), now)
+    except (TypeError, ValueError):
+        return now
+
+def refresh_routine_goal_progress(routine_id: str, db: firestore.Client):
+    """
+    Rewrites current_goal_progress on today's/future daily tasks of a routine from its stored
+    stats (e.g. after its goal_config changed), per task date, in one transaction. Raises on failure.
+    """
+    doc_ref = db.collection("routines").document(routine_id)
+    transaction = db.transaction()
+
+    @firestore.transactional
+    def apply(txn):
+        snap = doc_ref.get(transaction=txn)
+        if not snap.exists: return
+        data = snap.to_dict()
+        now = datetime.now(JST)
+        for d in _future_routine_tasks(txn, db, routine_id, now):
+            txn.update(d.reference, {"current_goal_progress": routine_goal_progress(data, _task_progress_time(d.to_dict() or {}, now))})
 
+    apply(transaction)
 
 # --- API Endpoints ---
 
@@ -228,6 +302,46 @@ def reorder_backlog_items(request: BacklogReorderRequest, db: firestore.Client =
     batch.commit()
     return {"status": "reordered", "count": len(request.ids)}
 
+def _move(db: firestore.Client, collection_ref, item_id: str, request: MoveRequest, list_query, background_tasks: BackgroundTasks, label: str):
+    """Single-write move between two neighbours; rebalances the list in the background when gaps get too small."""
+    try:
+        new_order, needs_rebalance = move_item(db, collection_ref, item_id, request.prev_id, request.next_id, list_query)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Neighbour not found: {e}")
+    except NotFound:
+        raise HTTPException(status_code=404, detail="Item not found")
+    if needs_rebalance:
+        background_tasks.add_task(rebalance, db, list_query(), label)
+    return {"status": "moved", "id": item_id, "order": new_order}
+
+@router.get("/sync/metrics")
+def get_sync_metrics():
+    """Outbox lag / coalescing metrics for backlog<->daily propagation."""
+    return sync_outbox.metrics()
+
+@router.put("/daily/{task_id}/move")
+def move_daily_task(task_id: str, request: MoveRequest, background_tasks: BackgroundTasks, db: firestore.Client = Depends(get_db)):
+    collection_ref = db.collection("daily_tasks")
+    def list_query():
+        snap = collection_ref.document(task_id).get()
+        if not snap.exists:
+            raise NotFound("Task not found")
+        target_date_str = snap.to_dict().get("target_date")
+        return collection_ref.where(filter=FieldFilter("target_date", "==", target_date_str)).order_by("order")
+    return _move(db, collection_ref, task_id, request, list_query, background_tasks, "daily_tasks")
+
+@router.put("/routines/{routine_id}/move")
+def move_routine(routine_id: str, request: MoveRequest, background_tasks: BackgroundTasks, db: firestore.Client = Depends(get_db)):
+    collection_ref = db.collection("routines")
+    return _move(db, collection_ref, routine_id, request, lambda: collection_ref.order_by("order"), background_tasks, "routines")
+
+@router.put("/backlog/{item_id}/move")
+def move_backlog_item(item_id: str, request: MoveRequest, background_tasks: BackgroundTasks, db: firestore.Client = Depends(get_db)):
+    collection_ref = db.collection("backlog_items")
+    def list_query():
+        return collection_ref.where(filter=FieldFilter("is_archived", "==", False)).order_by("order")
+    return _move(db, collection_ref, item_id, request, list_query, background_tasks, "backlog_items")
+
 @router.post("/backlog", response_model=BacklogItemResponse)
 def create_backlog_item(item: BacklogItemCreate, db: firestore.Client = Depends(get_db)):
     start_time_total = time.time()
@@ -277,9 +391,10 @@ def get_backlog_items(limit: int = 100, db: firestore.Client = Depends(get_db)):
     return items
 
 @router.put("/backlog/{item_id}", response_model=BacklogItemResponse)
-def update_backlog_item(item_id: str, item: BacklogItemCreate, background_tasks: BackgroundTasks, db: firestore.Client = Depends(get_db)):
-    doc_ref = db.collection("backlog_items").document(item_id)
-    if not doc_ref.get().exists:
+def update_backlog_item(item_id: str, item: BacklogItemCreate, background_tasks: BackgroundTasks, uow: UnitOfWork = Depends(get_uow)):
+    doc_ref = uow.db.collection("backlog_items").document(item_id)
+    current_data = uow.data(doc_ref)
+    if current_data is None:
         raise HTTPException(status_code=404, detail="Item not found")
     
     data = item.dict()
@@ -289,34 +404,31 @@ def update_backlog_item(item_id: str, item: BacklogItemCreate, background_tasks:
     if data.get('scheduled_date'):
         data['scheduled_date'] = datetime.combine(data['scheduled_date'], datetime.min.time()).replace(tzinfo=JST)
 
-    current_data = doc_ref.get().to_dict()
     data.update({
         "id": item_id,
         "created_at": current_data.get("created_at"),
         "is_archived": current_data.get("is_archived", False)
     })
     
-    doc_ref.set(data)
+    uow.set(doc_ref, data)
+    _commit(uow)
     
     # Async Sync
-    background_tasks.add_task(sync_backlog_update_to_daily, item_id, item.title, item.is_highlighted, db)
+    sync_backlog_update_to_daily(item_id, item.title, item.is_highlighted)
 
     return data
 
 @router.delete("/backlog/{item_id}")
-def delete_backlog_item(item_id: str, db: firestore.Client = Depends(get_db)):
-    doc_ref = db.collection("backlog_items").document(item_id)
-    if not doc_ref.get().exists:
-        raise HTTPException(status_code=404, detail="Item not found")
-    doc_ref.delete()
+def delete_backlog_item(item_id: str, uow: UnitOfWork = Depends(get_uow)):
+    # exists precondition instead of a read: a missing item fails the commit with NotFound
+    uow.delete(uow.db.collection("backlog_items").document(item_id))
+    _commit(uow)
     return {"status": "deleted", "id": item_id}
 
 @router.patch("/backlog/{item_id}/archive")
-def archive_backlog_item(item_id: str, db: firestore.Client = Depends(get_db)):
-    doc_ref = db.collection("backlog_items").document(item_id)
-    if not doc_ref.get().exists:
-        raise HTTPException(status_code=404, detail="Item not found")
-    doc_ref.update({"is_archived": True})
+def archive_backlog_item(item_id: str, uow: UnitOfWork = Depends(get_uow)):
+    uow.update(uow.db.collection("backlog_items").document(item_id), {"is_archived": True})
+    _commit(uow)
     return {"status": "archived"}
 
 @router.post("/routines", response_model=RoutineResponse)
@@ -339,6 +451,7 @@ def create_routine(routine: RoutineCreate, db: firestore.Client = Depends(get_db
         "id": doc_ref.id,
         "created_at": datetime.now(JST)
     })
+    data.update(compile_schedule(data.get('frequency'), data['routine_type'], data.get('is_active', True)))
     doc_ref.set(data)
     return data
 
@@ -362,9 +475,10 @@ def get_routines(type: Optional[RoutineType] = None, db: firestore.Client = Depe
     return routines
 
 @router.put("/routines/{routine_id}", response_model=RoutineResponse)
-def update_routine(routine_id: str, routine: RoutineCreate, background_tasks: BackgroundTasks, db: firestore.Client = Depends(get_db)):
-    doc_ref = db.collection("routines").document(routine_id)
-    if not doc_ref.get().exists:
+def update_routine(routine_id: str, routine: RoutineCreate, background_tasks: BackgroundTasks, uow: UnitOfWork = Depends(get_uow)):
+    doc_ref = uow.db.collection("routines").document(routine_id)
+    current_data = uow.data(doc_ref)
+    if current_data is None:
         raise HTTPException(status_code=404, detail="Routine not found")
     
     data = routine.dict()
@@ -374,8 +488,7 @@ def update_routine(routine_id: str, routine: RoutineCreate, background_tasks: Ba
         data['frequency']['type'] = routine.frequency.type.value
     if routine.goal_config:
         data['goal_config'] = routine.goal_config.dict()
-        # Preserve existing stats if present, else init
-        current_data = doc_ref.get().to_dict()
+        # Preserve existing stats if present, else init (guarded write: a concurrent stats update fails this save)
         if 'stats' in current_data:
             data['stats'] = current_data['stats']
         else:
@@ -386,22 +499,23 @@ def update_routine(routine_id: str, routine: RoutineCreate, background_tasks: Ba
             }
     
     data['id'] = routine_id
-    current_data = doc_ref.get().to_dict()
     data['created_at'] = current_data.get('created_at', datetime.now(JST)) 
+    data.update(compile_schedule(data.get('frequency'), data['routine_type'], data.get('is_active', True)))
     
-    doc_ref.set(data)
+    uow.set(doc_ref, data)
+    _commit(uow, "Routine not found")
     
-    # Async Sync
-    background_tasks.add_task(sync_routine_to_daily, routine_id, routine.title, db)
+    # Async Sync (progress only when the goal changed; completions keep it current via update_routine_stats)
+    sync_routine_to_daily(routine_id, routine.title)
+    if data.get('goal_config') != current_data.get('goal_config'):
+        sync_routine_goal_progress_to_daily(routine_id)
     
     return data
 
 @router.delete("/routines/{routine_id}")
-def delete_routine(routine_id: str, db: firestore.Client = Depends(get_db)):
-    doc_ref = db.collection("routines").document(routine_id)
-    if not doc_ref.get().exists:
-        raise HTTPException(status_code=404, detail="Routine not found")
-    doc_ref.delete()
+def delete_routine(routine_id: str, uow: UnitOfWork = Depends(get_uow)):
+    uow.delete(uow.db.collection("routines").document(routine_id))
+    _commit(uow, "Routine not found")
     return {"status": "deleted", "id": routine_id}
 
 class BatchProcessor:
@@ -431,174 +545,249 @@ class BatchProcessor:
             self.batch = self.db.batch()
             self.count = 0
 
+MAX_GENERATE_DAYS = 31
+GENERATION_META_DOC = "daily_generation"
+
+def _default_target_date(now: datetime) -> date:
+    # If running before 5AM, treat as previous day
+    if now.hour < 5:
+        return now.date() - timedelta(days=1)
+    return now.date()
+
+def _fetch_due_routines(db: firestore.Client, dates: List[date]) -> List[dict]:
+    """Routines due on any of `dates`, fetched by their compiled schedule keys (array_contains_any takes up to 30 values)."""
+    keys = []
+    for d in dates:
+        for k in due_keys(d):
+            if k not in keys:
+                keys.append(k)
+    routines = {}
+    for i in range(0, len(keys), 30):
+        docs = db.collection("routines").where(filter=FieldFilter("schedule_keys", "array_contains_any", keys[i:i + 30])).stream()
+        for d in docs:
+            routines[d.id] = d.to_dict()
+    return list(routines.values())
+
+CARRY_OVER_PAGE_SIZE = int(os.environ.get("CARRY_OVER_PAGE_SIZE", "300"))
+CARRY_OVER_BUDGET_SECONDS = float(os.environ.get("CARRY_OVER_BUDGET_SECONDS", "120"))
+
+def _drain_stale_tasks(db: firestore.Client, source_type: str, before_date_str: str, handle_page, deadline: float) -> dict:
+    """
+    Pages through TODO tasks of `source_type` dated before `before_date_str` with start_after cursors
+    and hands each page to `handle_page(docs)` (which queues writes). Each page is read fully before
+    its writes are committed, so nothing streams while we write.
+
+    The cursor is checkpointed in system_meta/carry_over_<source_type>; when the time budget runs out
+    the next run resumes from there. Returns metrics, including how many items are still waiting.
+    """
+    checkpoint_ref = db.collection("system_meta").document(f"carry_over_{source_type}")
+    base_query = db.collection("daily_tasks")\
+        .where(filter=FieldFilter("source_type", "==", source_type))\
+        .where(filter=FieldFilter("status", "==", TaskStatus.TODO.value))\
+        .where(filter=FieldFilter("target_date", "<", before_date_str))\
+        .order_by("target_date")\
+        .order_by("__name__")
+
+    cursor = None
+    checkpoint = checkpoint_ref.get()
+    cp = checkpoint.to_dict() if checkpoint.exists else None
+    if cp and cp.get("before_date") == before_date_str and cp.get("last_doc_id"):
+        cursor_snap = db.collection("daily_tasks").document(cp["last_doc_id"]).get()
+        if cursor_snap.exists:
+            cursor = cursor_snap
+
+    processed = 0
+    pages = 0
+    drained = False
+    while time.time() < deadline:
+        query = base_query.start_after(cursor) if cursor is not None else base_query
+        page = list(query.limit(CARRY_OVER_PAGE_SIZE).stream())
+        if not page:
+            drained = True
+            break
+        handle_page(page)
+        processed += len(page)
+        pages += 1
+        cursor = page[-1]
+        checkpoint_ref.set({"before_date": before_date_str, "last_doc_id": cursor.id, "updated_at": datetime.now(JST)})
+        if len(page) < CARRY_OVER_PAGE_SIZE:
+            drained = True
+            break
+
+    remaining = 0
+    if drained:
+        # Start from the beginning next time (e.g. items whose write failed)
+        checkpoint_ref.delete()
+    else:
+        query = base_query.start_after(cursor) if cursor is not None else base_query
+        remaining = query.count().get()[0][0].value
+
+    return {"source_type": source_type, "processed": processed, "pages": pages, "remaining": remaining, "drained": drained}
+
 @router.post("/generate-daily")
-def generate_daily_tasks(target_date: Optional[date] = None, db: firestore.Client = Depends(get_db)):
+def generate_daily_tasks(
+    target_date: Optional[date] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    backfill: bool = False,
+    db: firestore.Client = Depends(get_db)
+):
+    """
+    Generates daily tasks for one date (target_date), a range (start_date..end_date),
+    or every date since the last successful run (backfill=true, up to MAX_GENERATE_DAYS).
+    """
     start_time_total = time.time()
     
     today = datetime.now(JST).date()
     current_time_dt = datetime.now(JST)
-
-    if target_date is None:
-        # If running before 5AM, treat as previous day
-        if current_time_dt.hour < 5:
-            target_date = today - timedelta(days=1)
-        else:
-            target_date = today
-            
+    meta_ref = db.collection("system_meta").document(GENERATION_META_DOC)
+
+    if target_date is not None:
+        start_date = end_date = target_date
+    if end_date is None:
+        end_date = _default_target_date(current_time_dt)
+    if start_date is None and backfill:
+        meta = meta_ref.get()
+        last = (meta.to_dict() or {}).get("last_generated_date") if meta.exists else None
+        if last:
+            # Start from the last generated day itself: it may have run before every scheduled_time had passed
+            start_date = min(date.fromisoformat(last), end_date)
+    if start_date is None:
+        start_date = end_date
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must be on or before end_date")
+    if (end_date - start_date).days >= MAX_GENERATE_DAYS:
+        start_date = end_date - timedelta(days=MAX_GENERATE_DAYS - 1)
+
+    dates = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    date_strs = [d.isoformat() for d in dates]
+    target_date = end_date
     target_date_str = target_date.isoformat()
-    weekday = target_date.weekday()
-    day_of_month = target_date.day
-    month = target_date.month
     
-    print(f"Starting generate_daily_tasks for {target_date_str} (Current Time: {current_time_dt})")
-
-    # --- OPTIMIZATION: Fetch existing IDs once ---
-    existing_docs = db.collection("daily_tasks").where(filter=FieldFilter("target_date", "==", target_date_str)).stream()
-    existing_ids = {d.id for d in existing_docs}
+    # Apply any backlog<->daily changes still in the outbox (e.g. after an instance died) before generating
+    try:
+        sync_outbox.drain(include_not_due=True)
+    except Exception as e:
+        print(f"Sync outbox drain failed: {e}")
+    
+    print(f"Starting generate_daily_tasks for {date_strs[0]}..{target_date_str} (Current Time: {current_time_dt})")
+
+    # --- OPTIMIZATION: Fetch existing IDs (and max order per date) for the whole range once ---
+    existing_query = db.collection("daily_tasks")
+    if len(date_strs) == 1:
+        existing_query = existing_query.where(filter=FieldFilter("target_date", "==", target_date_str))
+    else:
+        existing_query = existing_query\
+            .where(filter=FieldFilter("target_date", ">=", date_strs[0]))\
+            .where(filter=FieldFilter("target_date", "<=", target_date_str))
+    existing_ids = set()
+    max_order = {d: 0 for d in date_strs}
+    for d in existing_query.select(["target_date", "order"]).stream():
+        t = d.to_dict()
+        existing_ids.add(d.id)
+        t_date = t.get('target_date')
+        if t_date in max_order:
+            max_order[t_date] = max(max_order[t_date], t.get('order', 0))
     # ---------------------------------------------
     
-    routines_stream = db.collection("routines").where(filter=FieldFilter("routine_type", "==", RoutineType.ACTION.value)).stream()
-    routines = [d.to_dict() for d in routines_stream]
+    # Only routines whose compiled schedule matches one of the dates (see services/routine_schedule.py)
+    ensure_schedule_index(db)
+    routines = _fetch_due_routines(db, dates)
     
     created_count = 0
     processor = BatchProcessor(db)
+    current_time_str = current_time_dt.strftime("%H:%M")
     
     # 1. Generate from Routines
-    for r in routines:
-        # 有効でないルーチンはタスク生成をスキップ
-        if not r.get('is_active', True):
-            continue
+    for day, day_str in zip(dates, date_strs):
+        is_target_today = (day == today)
+        for r in routines:
+            # 有効でないルーチンはタスク生成をスキップ (keys are already empty for those; double check)
+            if not r.get('is_active', True) or r.get('routine_type') != RoutineType.ACTION.value:
+                continue
+            if not is_due(r, day): continue
             
-        freq = r.get('frequency', {})
-        f_type = freq.get('type', 'DAILY')
-        
-        should_run = False
-        if f_type == 'DAILY': should_run = True
-        elif f_type == 'WEEKLY':
-            if weekday in freq.get('weekdays', []): should_run = True
-        elif f_type == 'MONTHLY':
-            if day_of_month in freq.get('month_days', []): should_run = True
-        elif f_type == 'YEARLY':
-            # Check specific dates
-            y_dates = freq.get('yearly_dates', [])
-            if y_dates:
-                for yd in y_dates:
-                    if yd.get('month') == month and yd.get('day') == day_of_month:
-                        should_run = True
-                        break
-            else:
-                # Fallback to old behavior (Cartesian product) if yearly_dates is empty (backward compatibility)
-                if month in freq.get('months', []) and day_of_month in freq.get('month_days', []): should_run = True
+            # --- SCHEDULED TIME CHECK ---
+            # Only check if we are generating for "today" (physical day).
+            # Past dates (catch up / backfill) get every due routine.
+            if is_target_today:
+                scheduled_time = r.get('scheduled_time', "05:00")
+                if current_time_str < scheduled_time:
+                    continue # Not yet time
+
+            doc_id = f"{r['id']}_{day_str}"
             
-        if not should_run: continue
-        
-        # --- SCHEDULED TIME CHECK ---
-        # Only check if we are generating for "today" (physical day)
-        # If target_date is in the past (e.g. yesterday before 5AM), we generally want to generate missed ones?
-        # Actually, if we are in "catch up" mode for yesterday, we should probably generate all.
-        # But if target_date == today, we must wait for time.
-        
-        is_target_today = (target_date == today)
-        if is_target_today:
-            scheduled_time = r.get('scheduled_time', "05:00")
-            current_time_str = current_time_dt.strftime("%H:%M")
-            if current_time_str < scheduled_time:
-                continue # Not yet time
-
-
-        doc_id = f"{r['id']}_{target_date_str}"
-        
-        if doc_id not in existing_ids:
-            doc_ref = db.collection("daily_tasks").document(doc_id)
-            new_task = {
-                "id": doc_id,
-                "source_id": r['id'],
-                "source_type": SourceType.ROUTINE.value,
-                "target_date": target_date_str,
-                "status": TaskStatus.TODO.value,
-                "created_at": datetime.now(JST),
-                "title": r.get('title', 'Untitled'),
-                "scheduled_time": r.get('scheduled_time', "05:00"),
-                "order": r.get('order', 1000), 
-                "is_highlighted": r.get('is_highlighted', False)
-            }
-            processor.set(doc_ref, new_task)
-            existing_ids.add(doc_id)
-            created_count += 1
+            if doc_id not in existing_ids:
+                doc_ref = db.collection("daily_tasks").document(doc_id)
+                new_task = {
+                    "id": doc_id,
+                    "source_id": r['id'],
+                    "source_type": SourceType.ROUTINE.value,
+                    "target_date": day_str,
+                    "status": TaskStatus.TODO.value,
+                    "created_at": datetime.now(JST),
+                    "title": r.get('title', 'Untitled'),
+                    "scheduled_time": r.get('scheduled_time', "05:00"),
+                    "order": r.get('order', 1000), 
+                    "is_highlighted": r.get('is_highlighted', False),
+                    "current_goal_progress": routine_goal_progress(r, goal_progress_time(day, current_time_dt))
+                }
+                processor.set(doc_ref, new_task)
+                existing_ids.add(doc_id)
+                max_order[day_str] = max(max_order[day_str], new_task['order'])
+                created_count += 1
             
     processor.commit() # Commit routines first
     
-    # --- CARRY OVER LOGIC ---
-    # Optimized: Limit processing to avoid timeout. Job should run hourly.
-    past_backlog_docs = db.collection("daily_tasks")\
-        .where(filter=FieldFilter("source_type", "==", SourceType.BACKLOG.value))\
-        .where(filter=FieldFilter("status", "==", TaskStatus.TODO.value))\
-        .where(filter=FieldFilter("target_date", "<", target_date_str))\
-        .limit(500)\
-        .stream()
-    
-    # --- AUTO-SKIP LOGIC (NEW) ---
-    past_routine_docs = db.collection("daily_tasks")\
-        .where(filter=FieldFilter("source_type", "==", SourceType.ROUTINE.value))\
-        .where(filter=FieldFilter("status", "==", TaskStatus.TODO.value))\
-        .where(filter=FieldFilter("target_date", "<", target_date_str))\
-        .limit(500)\
-        .stream()
+    # --- CARRY OVER / AUTO-SKIP / AUTO-PICK ---
+    # Only for the last date of the range: earlier dates are history, and anything still open
+    # on them is carried (backlog) or skipped (routines) onto the last date.
+    # Paged with cursors under a time budget; see _drain_stale_tasks.
+    deadline = time.time() + CARRY_OVER_BUDGET_SECONDS
 
-    # Fetch current tasks to check duplicates and determine max_order
-    # (re-fetching lightly since we added routines, but we have existing_ids)
-    # Actually, stick to existing_ids + manual order calculation
-    
-    # We need max_order from current existing tasks
-    # If we created routines, their order is fixed (1000+). 
-    # Backlog items usually go to the end.
-    
-    current_max_order = 0
-    # Quick query for max order if needed, but for now let's just assume 0 or iterate existing cache logic if possible
-    # But since we are backend, we don't have the full list in memory perfectly unless we re-query or track it.
-    # To be safe and simple: query current max order.
-    
-    # Optimization: Just query keys only? No, need order.
-    # Since we are batching, let's fetch 'order' only?
-    # db.collection("daily_tasks").where(...).select(["order"]).stream()
-    
-    # ... Or reusing the logic from before (fetching all today's tasks) is safer.
-    current_today_docs_list = db.collection("daily_tasks").where(filter=FieldFilter("target_date", "==", target_date_str)).stream()
-    for d in current_today_docs_list:
-        t = d.to_dict()
-        current_max_order = max(current_max_order, t.get('order', 0))
-        existing_ids.add(t['id'])
+    # Max order for the target date is already known from the range query + created routines
+    current_max_order = max_order[target_date_str]
 
     # Process Backlog Carry Over
-    for doc in past_backlog_docs:
-        t = doc.to_dict()
-        
-        # Mark old as CARRY_OVER
-        processor.update(doc.reference, {"status": TaskStatus.CARRY_OVER.value})
-        
-        new_id = f"{t['source_id']}_{target_date_str}"
-        
-        if new_id not in existing_ids:
-            new_ref = db.collection("daily_tasks").document(new_id)
-            current_max_order += 1
-            new_task = {
-                "id": new_id,
-                "source_id": t['source_id'],
-                "source_type": SourceType.BACKLOG.value,
-                "target_date": target_date_str,
-                "status": TaskStatus.TODO.value,
-                "created_at": datetime.now(JST),
-                "title": t.get('title', 'Unknown'),
-                "order": current_max_order,
-                "is_highlighted": t.get('is_highlighted', False)
-            }
-            processor.set(new_ref, new_task)
-            existing_ids.add(new_id)
-            created_count += 1
+    def carry_over_page(docs):
+        nonlocal current_max_order, created_count
+        for doc in docs:
+            t = doc.to_dict()
+            
+            # Mark old as CARRY_OVER
+            processor.update(doc.reference, {"status": TaskStatus.CARRY_OVER.value})
+            
+            new_id = f"{t['source_id']}_{target_date_str}"
+            
+            if new_id not in existing_ids:
+                new_ref = db.collection("daily_tasks").document(new_id)
+                current_max_order += 1
+                new_task = {
+                    "id": new_id,
+                    "source_id": t['source_id'],
+                    "source_type": SourceType.BACKLOG.value,
+                    "target_date": target_date_str,
+                    "status": TaskStatus.TODO.value,
+                    "created_at": datetime.now(JST),
+                    "title": t.get('title', 'Unknown'),
+                    "order": current_max_order,
+                    "is_highlighted": t.get('is_highlighted', False)
+                }
+                processor.set(new_ref, new_task)
+                existing_ids.add(new_id)
+                created_count += 1
+        processor.commit()
     
-    # Auto-skip routines
-    for doc in past_routine_docs:
-        processor.update(doc.reference, {"status": TaskStatus.SKIPPED.value})
+    # --- AUTO-SKIP LOGIC ---
+    def skip_page(docs):
+        for doc in docs:
+            processor.update(doc.reference, {"status": TaskStatus.SKIPPED.value})
+        processor.commit()
+
+    carry_over_stats = _drain_stale_tasks(db, SourceType.BACKLOG.value, target_date_str, carry_over_page, deadline)
+    skip_stats = _drain_stale_tasks(db, SourceType.ROUTINE.value, target_date_str, skip_page, deadline)
+    for stats in (carry_over_stats, skip_stats):
+        print(json.dumps({"type": "carry_over_metric", "target_date": target_date_str, **stats}))
 
     # --- AUTO-PICK SCHEDULED STOCK (NEW) ---
     scheduled_stock_docs = db.collection("backlog_items")\
@@ -632,15 +821,28 @@ def generate_daily_tasks(target_date: Optional[date] = None, db: firestore.Clien
 
     processor.commit() # Final commit
     
+    # Remember how far we got, so backfill=true can resume after missed scheduler runs
+    meta = meta_ref.get()
+    last = (meta.to_dict() or {}).get("last_generated_date") if meta.exists else None
+    if not last or last < target_date_str:
+        meta_ref.set({"last_generated_date": target_date_str, "updated_at": datetime.now(JST)}, merge=True)
+    
     end_time_total = time.time()
     print(json.dumps({
         "type": "perf_metric",
         "operation": "generate_daily_tasks",
         "duration_ms": (end_time_total - start_time_total) * 1000,
-        "detail": f"created={created_count}"
+        "detail": f"created={created_count} days={len(dates)} carry_over_remaining={carry_over_stats['remaining']} skip_remaining={skip_stats['remaining']}"
     }))
     
-    return {"message": f"Generated {created_count} tasks", "date": target_date_str}
+    return {
+        "message": f"Generated {created_count} tasks",
+        "date": target_date_str,
+        "start_date": date_strs[0],
+        "end_date": target_date_str,
+        "carry_over": carry_over_stats,
+        "auto_skip": skip_stats
+    }
 
 @router.get("/daily", response_model=List[DailyTaskResponse])
 def get_daily_tasks(target_date: Optional[date] = None, db: firestore.Client = Depends(get_db)):
@@ -653,16 +855,13 @@ def get_daily_tasks(target_date: Optional[date] = None, db: firestore.Client = D
     # Fetch daily tasks for the target date
     docs = db.collection("daily_tasks").where(filter=FieldFilter("target_date", "==", target_date_str)).stream()
     
-    tasks = []
-    
     # ---------------------------------------------------------
-    # ROUTINE STATS INJECTION
+    # ROUTINE STATS
     # ---------------------------------------------------------
-    # We need to inject "1/3" etc. into the daily tasks if they are routines.
-    # To do this efficiently, we first gather all tasks, then batch fetch relevant routines.
+    # "1/3" etc. is stored on the daily task itself, so this is a single query with no routine reads.
     
     raw_tasks = []
-    routine_ids = set()
+    legacy_routine_ids = set()
 
     now = datetime.now(JST)
     current_time_str = now.strftime("%H:%M")
@@ -686,38 +885,22 @@ def get_daily_tasks(target_date: Optional[date] = None, db: firestore.Client = D
         
         if show_task:
             raw_tasks.append(t)
-            if t.get('source_type') == SourceType.ROUTINE.value:
-                routine_ids.add(t['source_id'])
-
-    # Batch fetch routines
-    routine_map = {}
-    if routine_ids:
-        # Firestore 'in' query supports up to 10/30 items. If we have many, might need chunks.
-        # For a personal app, < 30 usually. Let's chunk safely at 10.
-        r_ids_list = list(routine_ids)
-        chunk_size = 10
-        for i in range(0, len(r_ids_list), chunk_size):
-            chunk = r_ids_list[i:i + chunk_size]
-            r_docs = db.collection("routines").where(filter=FieldFilter("id", "in", chunk)).stream()
-            for rd in r_docs:
-                routine_map[rd.id] = rd.to_dict()
-
-    # Inject Progress
-    for t in raw_tasks:
-        if t.get('source_type') == SourceType.ROUTINE.value:
-            r_data = routine_map.get(t['source_id'])
-            if r_data:
-                goal = r_data.get('goal_config')
-                stats = r_data.get('stats')
-                if goal and stats:
-                    current = 0
-                    if goal['period'] == 'WEEKLY': current = stats.get('weekly_count', 0)
-                    elif goal['period'] == 'MONTHLY': current = stats.get('monthly_count', 0)
-                    
-                    target = goal['target_count']
-                    t['current_goal_progress'] = f"{current}/{target}"
-        
-        tasks.append(t)
+            # current_goal_progress is materialized on the task (generation / update_routine_stats).
+            # Only tasks created before that have no field at all and need their routine once.
+            if t.get('source_type') == SourceType.ROUTINE.value and 'current_goal_progress' not in t:
+                legacy_routine_ids.add(t['source_id'])
+
+    if legacy_routine_ids:
+        # Computed for the response only; scripts/migrate_denormalize_tasks.py persists the field
+        routine_refs = [db.collection("routines").document(r_id) for r_id in legacy_routine_ids]
+        routine_map = {rd.id: rd.to_dict() for rd in db.get_all(routine_refs) if rd.exists}
+        at = goal_progress_time(target_date, now)
+        for t in raw_tasks:
+            if t.get('source_type') == SourceType.ROUTINE.value and 'current_goal_progress' not in t:
+                r_data = routine_map.get(t['source_id'])
+                t['current_goal_progress'] = routine_goal_progress(r_data, at) if r_data else None
+
+    tasks = raw_tasks
     
     tasks.sort(key=lambda x: x.get('order', 0))
     
@@ -732,23 +915,23 @@ def get_daily_tasks(target_date: Optional[date] = None, db: firestore.Client = D
     return tasks
 
 @router.post("/daily/pick")
-def pick_from_backlog(backlog_id: str, target_date: Optional[date] = None, db: firestore.Client = Depends(get_db)):
+def pick_from_backlog(backlog_id: str, target_date: Optional[date] = None, uow: UnitOfWork = Depends(get_uow)):
     start_time_total = time.time()
+    db = uow.db
     if target_date is None:
         target_date = datetime.now(JST).date()
     target_date_str = target_date.isoformat()
     item_ref = db.collection("backlog_items").document(backlog_id)
-    item_snap = item_ref.get()
-    
-    if not item_snap.exists:
-        raise HTTPException(status_code=404, detail="Backlog item not found")
-    
-    item_data = item_snap.to_dict()
-    
     doc_id = f"{backlog_id}_{target_date_str}"
     doc_ref = db.collection("daily_tasks").document(doc_id)
+    # Both existence checks in one round trip
+    uow.get_all([item_ref, doc_ref])
+    
+    item_data = uow.data(item_ref)
+    if item_data is None:
+        raise HTTPException(status_code=404, detail="Backlog item not found")
     
-    if doc_ref.get().exists:
+    if uow.data(doc_ref) is not None:
          return {"message": "Already picked"}
     
     new_task = {
@@ -772,25 +955,23 @@ def pick_from_backlog(backlog_id: str, target_date: Optional[date] = None, db: f
             .limit(1)\
             .stream()
         
-        max_order = 0
+        max_order = None
         for d in max_order_docs:
-            d_dict = d.to_dict()
-            max_order = d_dict.get('order', 0)
+            max_order = d.to_dict().get('order', 0)
             
-        new_task['order'] = max_order + 1
+        new_task['order'] = append_order(max_order)
         
     except Exception as e:
-        # Fallback if index missing or other error: Scan all (slower but safe)
+        # Index missing or other error: append by timestamp instead of scanning the whole day
         print(f"Optimization warning (Index might be missing): {e}")
-        existing_docs = db.collection("daily_tasks").where(filter=FieldFilter("target_date", "==", target_date_str)).stream()
-        max_order = -1
-        for d in existing_docs:
-            d_dict = d.to_dict()
-            o = d_dict.get('order', 0)
-            if o > max_order: max_order = o
-        new_task['order'] = max_order + 1
+        new_task['order'] = fallback_append_order()
 
-    doc_ref.set(new_task)
+    # Staged as create(): a concurrent pick of the same item/day loses instead of overwriting
+    uow.set(doc_ref, new_task)
+    try:
+        uow.commit()
+    except StaleWriteError:
+        return {"message": "Already picked"}
     
     end_time = time.time()
     print(json.dumps({
@@ -802,151 +983,134 @@ def pick_from_backlog(backlog_id: str, target_date: Optional[date] = None, db: f
     return new_task
 
 
-def update_routine_stats(routine_id: str, completed: bool, db: firestore.Client):
+def update_routine_stats(routine_id: str, completed: bool, db: firestore.Client, task_id: Optional[str] = None):
     """
     Update routine stats (weekly/monthly count) when a task is completed/uncompleted.
+    Runs in a transaction so double-taps don't lose counts; the period rollover and the
+    denormalized current_goal_progress on today's/future daily tasks are written in the same transaction.
     """
     try:
         doc_ref = db.collection("routines").document(routine_id)
-        snap = doc_ref.get()
-        if not snap.exists: return
-        
-        data = snap.to_dict()
-        goal = data.get('goal_config')
-        stats = data.get('stats')
-        
-        if not goal or not stats: return
-        
-        now = datetime.now(JST)
-        last_updated = stats.get('last_updated')
-        # If last_updated is naive, make it aware (firestore timestamps usually okay)
-        if last_updated and last_updated.tzinfo is None:
-             last_updated = last_updated.replace(tzinfo=JST)
-
-        # Reset Logic
-        # Simpson's method: Just check if we are in a new period relative to last_updated?
-        # Actually easier: Check if "this week" vs "last_updated week" is different.
-        
-        # Simple Logic:
-        # If period is WEEKLY, check isocalendar week.
-        # If period is MONTHLY, check month.
-        
-        needs_reset = False
-        if last_updated:
-            if goal['period'] == 'WEEKLY':
-                if now.isocalendar()[1] != last_updated.isocalendar()[1] or now.year != last_updated.year:
-                    needs_reset = True
-            elif goal['period'] == 'MONTHLY':
-                if now.month != last_updated.month or now.year != last_updated.year:
-                    needs_reset = True
-        else:
-            needs_reset = True # First time
+        transaction = db.transaction()
+
+        @firestore.transactional
+        def apply(txn):
+            snap = doc_ref.get(transaction=txn)
+            if not snap.exists: return None
+            
+            data = snap.to_dict()
+            goal = data.get('goal_config')
+            stats = data.get('stats')
+            
+            if not goal or not stats: return None
             
-        if needs_reset:
-            stats = {
-                "weekly_count": 0,
-                "monthly_count": 0,
-                "last_updated": now
-            }
-            # If we are completing, we start at 0 then add 1.
-            # If we are uncompleting logic is tricky if we just reset... 
-            # But usually we uncomplete a task from *today*. 
-            # If we uncomplete a task from last week, we shouldn't affect this week's stats?
-            # Complexity: "Unchecking a task from a previous period".
-            # For now, assume we operate on current relevant stats. 
-            # If I uncheck yesterday's task (same week), it decrements current week count.
-            # If I uncheck last month's task, it technically shouldn't affect this month.
-            # Let's just update "current stats" regardless for simplicity, 
-            # but ideally we reset if the *last update* was old. 
             # If I uncheck a task, I am updating it NOW. So I am affecting NOW stats.
-            pass
+            now = datetime.now(JST)
+            stats = _rolled_stats(goal, stats, now)
 
-        if completed:
-            if goal['period'] == 'WEEKLY': stats['weekly_count'] = stats.get('weekly_count', 0) + 1
-            if goal['period'] == 'MONTHLY': stats['monthly_count'] = stats.get('monthly_count', 0) + 1
-        else:
-            if goal['period'] == 'WEEKLY': stats['weekly_count'] = max(0, stats.get('weekly_count', 0) - 1)
-            if goal['period'] == 'MONTHLY': stats['monthly_count'] = max(0, stats.get('monthly_count', 0) - 1)
-            
-        stats['last_updated'] = now
-        doc_ref.update({"stats": stats})
+            if completed:
+                if goal['period'] == 'WEEKLY': stats['weekly_count'] = stats.get('weekly_count', 0) + 1
+                if goal['period'] == 'MONTHLY': stats['monthly_count'] = stats.get('monthly_count', 0) + 1
+            else:
+                if goal['period'] == 'WEEKLY': stats['weekly_count'] = max(0, stats.get('weekly_count', 0) - 1)
+                if goal['period'] == 'MONTHLY': stats['monthly_count'] = max(0, stats.get('monthly_count', 0) - 1)
+                
+            stats['last_updated'] = now
+            progress = _format_goal_progress(goal, stats)
+
+            def task_progress(task_data: dict) -> Optional[str]:
+                # Tasks in a later week/month show that period's (rolled-over) count, not this one's
+                return _format_goal_progress(goal, _rolled_stats(goal, stats, _task_progress_time(task_data, now)))
+
+            # Reads must happen before writes in a transaction
+            task_docs = _future_routine_tasks(txn, db, routine_id, now)
+
+            txn.update(doc_ref, {"stats": stats})
+            task_ids = set()
+            for d in task_docs:
+                txn.update(d.reference, {"current_goal_progress": task_progress(d.to_dict() or {})})
+                task_ids.add(d.id)
+            if task_id and task_id not in task_ids:
+                txn.update(db.collection("daily_tasks").document(task_id), {"current_goal_progress": progress})
+            return progress
+
+        apply(transaction)
         
     except Exception as e:
         print(f"Stats Update Error: {e}")
 
 @router.patch("/daily/{task_id}/complete")
-def complete_daily_task(task_id: str, completed: bool = True, background_tasks: BackgroundTasks = None, db: firestore.Client = Depends(get_db)):
-    doc_ref = db.collection("daily_tasks").document(task_id)
-    snap = doc_ref.get()
-    if not snap.exists:
+def complete_daily_task(task_id: str, completed: bool = True, background_tasks: BackgroundTasks = None, uow: UnitOfWork = Depends(get_uow)):
+    doc_ref = uow.db.collection("daily_tasks").document(task_id)
+    daily_data = uow.data(doc_ref)
+    if daily_data is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
     updates = {
         "status": TaskStatus.DONE.value if completed else TaskStatus.TODO.value,
         "completed_at": datetime.now(JST) if completed else None
     }
-    doc_ref.update(updates)
-
-    daily_data = snap.to_dict()
-    if background_tasks:
-        if daily_data.get('source_type') == SourceType.BACKLOG.value:
-            backlog_id = daily_data.get('source_id')
-            background_tasks.add_task(sync_daily_completion_to_backlog, backlog_id, completed, db)
-        elif daily_data.get('source_type') == SourceType.ROUTINE.value:
+    # Absolute values, independent of what was read: no update-time guard
+    uow.update(doc_ref, updates, guard=False)
+    _commit(uow, "Task not found")
+
+    if daily_data.get('source_type') == SourceType.BACKLOG.value:
+        backlog_id = daily_data.get('source_id')
+        sync_daily_completion_to_backlog(backlog_id, completed)
+    elif background_tasks:
+        if daily_data.get('source_type') == SourceType.ROUTINE.value:
             routine_id = daily_data.get('source_id')
-            background_tasks.add_task(update_routine_stats, routine_id, completed, db)
+            background_tasks.add_task(update_routine_stats, routine_id, completed, uow.db, task_id)
 
-    return {**snap.to_dict(), **updates}
+    return {**daily_data, **updates}
 
 @router.patch("/daily/{task_id}/skip")
-def skip_daily_task(task_id: str, db: firestore.Client = Depends(get_db)):
-    doc_ref = db.collection("daily_tasks").document(task_id)
-    snap = doc_ref.get()
-    if not snap.exists:
+def skip_daily_task(task_id: str, uow: UnitOfWork = Depends(get_uow)):
+    doc_ref = uow.db.collection("daily_tasks").document(task_id)
+    daily_data = uow.data(doc_ref)
+    if daily_data is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
     updates = {
         "status": TaskStatus.SKIPPED.value
     }
-    doc_ref.update(updates)
-    return {**snap.to_dict(), **updates}
+    uow.update(doc_ref, updates, guard=False)
+    _commit(uow, "Task not found")
+    return {**daily_data, **updates}
 
 @router.patch("/daily/{task_id}/highlight")
-def highlight_daily_task(task_id: str, highlighted: bool = True, background_tasks: BackgroundTasks = None, db: firestore.Client = Depends(get_db)):
-    doc_ref = db.collection("daily_tasks").document(task_id)
-    snap = doc_ref.get()
-    if not snap.exists:
+def highlight_daily_task(task_id: str, highlighted: bool = True, background_tasks: BackgroundTasks = None, uow: UnitOfWork = Depends(get_uow)):
+    doc_ref = uow.db.collection("daily_tasks").document(task_id)
+    daily_data = uow.data(doc_ref)
+    if daily_data is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
     updates = {
         "is_highlighted": highlighted
     }
-    doc_ref.update(updates)
+    uow.update(doc_ref, updates, guard=False)
+    _commit(uow, "Task not found")
     
-    daily_data = snap.to_dict()
-    if daily_data.get('source_type') == SourceType.BACKLOG.value and background_tasks:
-         background_tasks.add_task(sync_daily_highlight_to_backlog, daily_data['source_id'], highlighted, db)
+    if daily_data.get('source_type') == SourceType.BACKLOG.value:
+         sync_daily_highlight_to_backlog(daily_data['source_id'], highlighted)
 
-    return {**snap.to_dict(), **updates}
+    return {**daily_data, **updates}
 
 @router.patch("/daily/{task_id}/postpone")
-def postpone_daily_task(task_id: str, new_date: str, db: firestore.Client = Depends(get_db)):
-    doc_ref = db.collection("daily_tasks").document(task_id)
-    daily_snap = doc_ref.get()
+def postpone_daily_task(task_id: str, new_date: str, uow: UnitOfWork = Depends(get_uow)):
+    doc_ref = uow.db.collection("daily_tasks").document(task_id)
+    daily_data = uow.data(doc_ref)
     
-    if not daily_snap.exists:
+    if daily_data is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    daily_data = daily_snap.to_dict()
     source_type = daily_data.get('source_type')
     source_id = daily_data.get('source_id')
 
     if source_type != SourceType.BACKLOG.value:
         raise HTTPException(status_code=400, detail="Only Backlog items can be postponed")
 
-    backlog_ref = db.collection("backlog_items").document(source_id)
-    if not backlog_ref.get().exists:
-        raise HTTPException(status_code=404, detail="Original Backlog Item not found")
+    backlog_ref = uow.db.collection("backlog_items").document(source_id)
 
     try:
         new_date_obj = datetime.strptime(new_date, "%Y-%m-%d").date()
@@ -954,23 +1118,26 @@ def postpone_daily_task(task_id: str, new_date: str, db: firestore.Client = Depe
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format, use YYYY-MM-DD")
 
-    backlog_ref.update({"scheduled_date": new_date_dt})
-    doc_ref.delete()
+    # One atomic batch: the update fails with NotFound if the backlog item is gone, and the delete
+    # is guarded so a task edited meanwhile isn't dropped
+    uow.update(backlog_ref, {"scheduled_date": new_date_dt})
+    uow.delete(doc_ref)
+    _commit(uow, "Original Backlog Item not found")
 
     return {"status": "postponed", "new_date": new_date}
 
 @router.patch("/daily/{task_id}/title")
-def update_daily_task_title(task_id: str, title: str, background_tasks: BackgroundTasks, db: firestore.Client = Depends(get_db)):
-    doc_ref = db.collection("daily_tasks").document(task_id)
-    daily_snap = doc_ref.get()
+def update_daily_task_title(task_id: str, title: str, background_tasks: BackgroundTasks, uow: UnitOfWork = Depends(get_uow)):
+    doc_ref = uow.db.collection("daily_tasks").document(task_id)
+    daily_data = uow.data(doc_ref)
     
-    if not daily_snap.exists:
+    if daily_data is None:
         raise HTTPException(status_code=404, detail="Task not found")
         
-    doc_ref.update({"title": title})
+    uow.update(doc_ref, {"title": title}, guard=False)
+    _commit(uow, "Task not found")
     
-    daily_data = daily_snap.to_dict()
     if daily_data.get('source_type') == SourceType.BACKLOG.value:
-        background_tasks.add_task(sync_daily_title_to_backlog, daily_data['source_id'], title, db)
+        sync_daily_title_to_backlog(daily_data['source_id'], title)
         
     return {**daily_data, "title": title}
@@ -1,5 +1,6 @@
 
 import os
+import sys
 import json
 import base64
 import time
@@ -10,6 +11,10 @@ from google import genai
 from google.genai import types
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+# Allow importing backend services when run as a script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from services.bulk_writer import BufferedWriter
+
 # Configuration
 PROJECT_ID = os.getenv("PROJECT_ID")
 LOCATION = os.getenv("LOCATION")
@@ -191,7 +196,7 @@ def main():
     blobs = list(bucket.list_blobs(prefix="consulting_raw/"))
     
     tasks = []
-    with ThreadPoolExecutor(max_workers=5) as executor:
+    with ThreadPoolExecutor(max_workers=5) as executor, BufferedWriter(db, name="ingest-slides") as writer:
         for blob in blobs:
             tasks.append(executor.submit(process_blob, blob))
             
@@ -199,10 +204,10 @@ def main():
         for future in as_completed(tasks):
             result = future.result()
             if result:
-                # Write to Firestore
+                # Buffered write to Firestore (committed in batches)
                 doc_ref = db.collection(COLLECTION_NAME).document(result["id"])
-                doc_ref.set(result["data"])
-                print(f"Wrote {result['id']} to Firestore.")
+                writer.set(doc_ref, result["data"])
+                print(f"Queued {result['id']} for Firestore.")
                 count += 1
 
     print(f"Ingestion Complete. Processed {count} items.")
@@ -1,5 +1,6 @@
 import os
 import io
+import sys
 import argparse
 import requests
 import re
@@ -22,6 +23,10 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 env_path = os.path.join(script_dir, '../../.env.local')
 load_dotenv(env_path)
 
+# backend/ on the path for the shared Gemini gateway
+sys.path.append(os.path.abspath(os.path.join(script_dir, '..')))
+from services.gemini_gateway import gemini_generate
+
 # Windowsローカル実行用に認証パスを強制書き換え
 # .envには /app/key.json が書かれていることが多いが、ローカルでは ../../key.json にあるはず
 key_path = os.path.abspath(os.path.join(script_dir, '../../key.json'))
@@ -112,67 +117,49 @@ def analyze_batch_with_gemini(pages_bytes_list, batch_index, log_func=print):
     for p_bytes in pages_bytes_list:
         contents.append(types.Part.from_bytes(data=p_bytes, mime_type="application/pdf"))
 
-    # Retry settings
-    max_retries = 3
-    base_delay = 2
+    try:
+        # Throttling and 429/503 backoff are shared with the parallel batches through the gateway
+        response = gemini_generate(
+            client=client,
+            model="gemini-3-pro-preview",
+            contents=contents
+        )
+    except Exception as e:
+        log_func(f"[Batch-{batch_index} Error] {type(e).__name__}: {e}")
+        return []
 
-    for attempt in range(max_retries + 1):
-        try:
-            response = client.models.generate_content(
-                model="gemini-3-pro-preview", 
-                contents=contents
-            )
-            
-            # Parse JSON
-            try:
-                text = response.text
-            except ValueError:
-                 # Safety filters might block content, accessing .text raises ValueError
-                 log_func(f"[Batch-{batch_index} Warning] Response blocked or empty. Finish reason: {response.candidates[0].finish_reason if response.candidates else 'Unknown'}")
-                 return []
+    # Parse JSON
+    try:
+        text = response.text
+    except ValueError:
+         # Safety filters might block content, accessing .text raises ValueError
+         log_func(f"[Batch-{batch_index} Warning] Response blocked or empty. Finish reason: {response.candidates[0].finish_reason if response.candidates else 'Unknown'}")
+         return []
 
-            if not text:
-                return []
+    if not text:
+        return []
 
-            # Attempt to clean markdown code blocks
-            if text.startswith("```json"):
-                text = text.replace("```json", "").replace("```", "")
-            elif text.startswith("```"):
-                text = text.replace("```", "")
+    # Attempt to clean markdown code blocks
+    if text.startswith("```json"):
+        text = text.replace("```json", "").replace("```", "")
+    elif text.startswith("```"):
+        text = text.replace("```", "")
 
+    try:
+        data = json.loads(text)
+        return data
+    except json.JSONDecodeError:
+        # Fallback: Try to find JSON list via regex
+        match = re.search(r'\[.*\]', text, re.DOTALL)
+        if match:
             try:
-                data = json.loads(text)
+                data = json.loads(match.group(0))
                 return data
-            except json.JSONDecodeError:
-                # Fallback: Try to find JSON list via regex
-                match = re.search(r'\[.*\]', text, re.DOTALL)
-                if match:
-                    try:
-                        data = json.loads(match.group(0))
-                        return data
-                    except:
-                        pass
-                
-                log_func(f"[Batch-{batch_index} Error] Invalid JSON: {text[:100]}...")
-                return []
-                
-        except Exception as e:
-            # Check for Rate Limit (429) or Service Unavailable (503)
-            error_str = str(e)
-            if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
-                if attempt < max_retries:
-                    wait_time = base_delay * (2 ** attempt)
-                    log_func(f"[Batch-{batch_index}] Rate Limit Hit (429). Retrying in {wait_time}s... (Attempt {attempt+1}/{max_retries})")
-                    import time
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    log_func(f"[Batch-{batch_index} Error] Rate Limit Exceeded after {max_retries} retries: {e}")
-                    return []
-            else:
-                # Other errors
-                log_func(f"[Batch-{batch_index} Error] {type(e).__name__}: {e}")
-                return []
+            except:
+                pass
+        
+        log_func(f"[Batch-{batch_index} Error] Invalid JSON: {text[:100]}...")
+        return []
 
 def scan_pdf_with_gemini(file_stream, log_func=print):
     """Splits PDF and parses using parallel batch processing."""
@@ -10,6 +10,8 @@ current_dir = Path(__file__).parent
 backend_dir = current_dir.parent
 sys.path.append(str(backend_dir))
 
+from routers.tasks import routine_goal_progress, goal_progress_time, JST
+
 def get_db():
     key_path = backend_dir.parent / "key.json"
     if key_path.exists():
@@ -75,6 +77,11 @@ def main():
                 source_highlight = source_data.get('is_highlighted', False)
                 if 'is_highlighted' not in task or task['is_highlighted'] != source_highlight:
                     updates['is_highlighted'] = source_highlight
+
+                # Goal progress ("1/3") for routine tasks created before it was stored on the task
+                if source_type == "ROUTINE" and 'current_goal_progress' not in task and task.get('target_date'):
+                    at = goal_progress_time(datetime.date.fromisoformat(task['target_date']), datetime.datetime.now(JST))
+                    updates['current_goal_progress'] = routine_goal_progress(source_data, at)
                     
                 if updates:
                     batch.update(doc.reference, updates)
@@ -3,19 +3,15 @@ from typing import Dict, List, Any
 from google.genai import types
 from services.ai_shared import get_genai_client, trace
 from config import GEMINI_ANALYSIS_MODEL
+from services.gemini_gateway import gemini_generate, gemini_generate_async
+from services.response_cache import get_response_cache
 
-def analyze_slide_structure_batch(images_bytes: List[bytes]) -> List[Dict[str, Any]]:
-    """
-    Analyzes a batch of slide images using Gemini 1.5 Flash (High Speed, Low Cost).
-    Returns a list of analysis results corresponding to the input images.
-    """
-    client = get_genai_client()
-    if not client:
-        return [{"structure_type": "Error", "key_message": "Client unavailable", "description": ""} for _ in images_bytes]
-        
-    try:
-        # Prompt asking for a JSON Array
-        prompt = """
+# Bump when the slide analysis prompt changes so cached analyses are not reused (see services/slide_cache.py)
+ANALYSIS_PROMPT_VERSION = "v1"
+# Bump when the meaning of the quality evaluation answer changes (services/response_cache.py)
+QUALITY_PROMPT_VERSION = "v1"
+
+SLIDE_ANALYSIS_PROMPT = """
     Analyze the following slide images and return a JSON Array where each item corresponds to an image in order.
     For EACH image, provide:
     - "structure_type": Visual structure type (e.g., "Graph", "Table", "Text").
@@ -34,50 +30,80 @@ def analyze_slide_structure_batch(images_bytes: List[bytes]) -> List[Dict[str, A
     3. Determine the count of images provided and return exactly that many objects.
     4. Output Japanese.
     """
-        
-        contents = [types.Part.from_text(text=prompt)]
-        for img_data in images_bytes:
-             contents.append(types.Part.from_bytes(data=img_data, mime_type="image/jpeg"))
 
+
+def _slide_batch_contents(images_bytes: List[bytes]) -> list:
+    contents = [types.Part.from_text(text=SLIDE_ANALYSIS_PROMPT)]
+    for img_data in images_bytes:
+        contents.append(types.Part.from_bytes(data=img_data, mime_type="image/jpeg"))
+    return contents
+
+
+def _slide_batch_config() -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        temperature=0.2
+    )
+
+
+def _response_text(response) -> str:
+    if response.text:
+        return response.text
+    if response.candidates and response.candidates[0].content.parts:
+        return " ".join([p.text for p in response.candidates[0].content.parts if p.text])
+    return ""
+
+
+def _parse_slide_batch(text: str, count: int) -> List[Dict[str, Any]]:
+    """Parses the JSON Array answer. Raises ValueError if it cannot be used at all."""
+    clean_text = text.strip()
+    if clean_text.startswith("```json"):
+        clean_text = clean_text[7:]
+    if clean_text.endswith("```"):
+        clean_text = clean_text[:-3]
+
+    results = json.loads(clean_text)
+
+    # Validate it is a list
+    if isinstance(results, list):
+        # Ensure length matches (pad or truncate if model hallucinated count, but usually it's robust)
+        if len(results) < count:
+            # Pad with errors
+            results.extend([{"structure_type": "Error", "key_message": "Analysis missing", "description": "Model returned fewer results than images."}] * (count - len(results)))
+        return results[:count]
+    # It returned a single object? Wrap it if only 1 input
+    if count == 1:
+        return [results]
+    raise ValueError("Model returned object instead of array")
+
+
+def analyze_slide_structure_batch(images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+    """
+    Analyzes a batch of slide images using Gemini 1.5 Flash (High Speed, Low Cost).
+    Returns a list of analysis results corresponding to the input images.
+    """
+    client = get_genai_client()
+    if not client:
+        return [{"structure_type": "Error", "key_message": "Client unavailable", "description": ""} for _ in images_bytes]
+        
+    try:
         # Use gemini-2.0-flash-exp for high performance and low cost
-        response = client.models.generate_content(
+        response = gemini_generate(
+            client=client,
             model=GEMINI_ANALYSIS_MODEL,
-            contents=contents,
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json",
-                temperature=0.2
-            )
+            contents=_slide_batch_contents(images_bytes),
+            config=_slide_batch_config()
         )
         
         text = ""
         try:
-             if response.text:
-                 text = response.text
-             else:
-                 if response.candidates and response.candidates[0].content.parts:
-                     text = " ".join([p.text for p in response.candidates[0].content.parts if p.text])
-                 
-             clean_text = text.strip()
-             if clean_text.startswith("```json"):
-                 clean_text = clean_text[7:]
-             if clean_text.endswith("```"):
-                 clean_text = clean_text[:-3]
-             
-             results = json.loads(clean_text)
-             
-             # Validate it is a list
-             if isinstance(results, list):
-                 # Ensure length matches (pad or truncate if model hallucinated count, but usually it's robust)
-                 if len(results) < len(images_bytes):
-                      # Pad with errors
-                      results.extend([{"structure_type": "Error", "key_message": "Analysis missing", "description": "Model returned fewer results than images."}] * (len(images_bytes) - len(results)))
-                 return results[:len(images_bytes)]
-             else:
-                 # It returned a single object? Wrap it if only 1 input
-                 if len(images_bytes) == 1:
-                     return [results]
-                 return [{"structure_type": "Error", "key_message": "Invalid Format", "description": "Model returned object instead of array"}] * len(images_bytes)
-
+             text = _response_text(response)
+             return _parse_slide_batch(text, len(images_bytes))
+        except ValueError as fmt_err:
+             if isinstance(fmt_err, json.JSONDecodeError):
+                 print(f"JSON Parse Error for Batch Analysis: {fmt_err}, Raw: {text}")
+                 return [{"structure_type": "Error", "key_message": "JSON Error", "description": f"Parse failed."}] * len(images_bytes)
+             return [{"structure_type": "Error", "key_message": "Invalid Format", "description": str(fmt_err)}] * len(images_bytes)
         except Exception as json_err:
              print(f"JSON Parse Error for Batch Analysis: {json_err}, Raw: {text}")
              return [{"structure_type": "Error", "key_message": "JSON Error", "description": f"Parse failed."}] * len(images_bytes)
@@ -86,6 +112,24 @@ def analyze_slide_structure_batch(images_bytes: List[bytes]) -> List[Dict[str, A
         print(f"Batch Analysis error: {e}")
         return [{"structure_type": "Error", "key_message": "API Error", "description": str(e)}] * len(images_bytes)
 
+
+async def analyze_slide_structure_batch_async(images_bytes: List[bytes], client=None) -> List[Dict[str, Any]]:
+    """
+    Async variant used by services/analysis_engine.py (which passes the client owned by its loop).
+    Unlike the sync version it raises on API / format errors so the caller can split and retry.
+    """
+    client = client or get_genai_client()
+    if not client:
+        raise RuntimeError("Client unavailable")
+
+    response = await gemini_generate_async(
+        client=client,
+        model=GEMINI_ANALYSIS_MODEL,
+        contents=_slide_batch_contents(images_bytes),
+        config=_slide_batch_config()
+    )
+    return _parse_slide_batch(_response_text(response), len(images_bytes))
+
 def analyze_slide_structure(image_bytes: bytes) -> Dict[str, Any]:
     """Wraps batch analysis for single image backward compatibility."""
     results = analyze_slide_structure_batch([image_bytes])
@@ -154,7 +198,10 @@ def evaluate_document_quality(images_bytes: List[bytes]) -> Dict[str, Any]:
         for img_data in images_bytes:
             contents.append(types.Part.from_bytes(data=img_data, mime_type="image/jpeg"))
 
-        response = client.models.generate_content(
+        # Same first pages => same decision: re-ingesting a deck reuses the cached verdict
+        return get_response_cache().generate_json(
+            "quality_eval", QUALITY_PROMPT_VERSION,
+            client=client,
             model=GEMINI_ANALYSIS_MODEL,
             contents=contents,
             config=types.GenerateContentConfig(
@@ -163,21 +210,6 @@ def evaluate_document_quality(images_bytes: List[bytes]) -> Dict[str, Any]:
             )
         )
 
-        text = ""
-        if response.text:
-            text = response.text
-        else:
-            if response.candidates and response.candidates[0].content.parts:
-                text = " ".join([p.text for p in response.candidates[0].content.parts if p.text])
-        
-        clean_text = text.strip()
-        if clean_text.startswith("```json"):
-            clean_text = clean_text[7:]
-        if clean_text.endswith("```"):
-            clean_text = clean_text[:-3]
-            
-        return json.loads(clean_text)
-
     except Exception as e:
         print(f"Quality Evaluation Error: {e}")
         # Default to skipping if uncertain.
@@ -7,6 +7,8 @@ from google.cloud import storage
 from google.cloud import firestore
 from google import genai
 
+from services.clients import get_client_registry
+
 # Lazy import for vertexai
 # import vertexai
 # from vertexai.vision_models import MultiModalEmbeddingModel, Image
@@ -45,106 +47,47 @@ def trace(msg: str):
     print(f"[{now}] {msg}", flush=True)
 
 # --- Clients ---
-_genai_client = None
+# Shared instances from the ClientRegistry (services/clients.py); safe to call per request
 
 def get_genai_client():
-    global _genai_client
-    if _genai_client:
-        return _genai_client
-    
-    api_key = os.getenv("GOOGLE_CLOUD_API_KEY")
-    p_id = os.getenv("PROJECT_ID")
-    p_loc = os.getenv("LOCATION", "us-central1")
-
-    # 1. Try Vertex AI with API Key (Working pattern in car_quiz.py / generate.py)
-    if api_key:
-        try:
-            _genai_client = genai.Client(
-                vertexai=True,
-                api_key=api_key.strip(),
-                # http_options={'api_version': 'v1beta1'} # Let SDK decide
-            )
-            print("DEBUG: GenAI Client initialized in Vertex AI mode with API Key")
-            return _genai_client
-        except Exception as e:
-            print(f"Error initializing GenAI Client with API Key: {e}")
-
-    # 2. Fallback to Vertex AI with Service Account / Project ID
-    if p_id:
-        try:
-            _genai_client = genai.Client(
-                vertexai=True,
-                project=p_id,
-                location=p_loc,
-                # http_options={'api_version': 'v1beta1'} # Let SDK decide
-            )
-            print(f"DEBUG: GenAI Client initialized in Vertex AI mode (Project={p_id}, Location={p_loc})")
-            return _genai_client
-        except Exception as e:
-            print(f"Error initializing GenAI Client with Project ID: {e}")
-            
-    # 3. Last Fallback: Google AI Studio mode (not vertexai)
-    if api_key:
-        try:
-            _genai_client = genai.Client(
-                api_key=api_key.strip(),
-                # http_options={'api_version': 'v1beta1'} # Let SDK decide
-            )
-            print("DEBUG: GenAI Client initialized in Google AI Studio mode")
-            return _genai_client
-        except Exception as e:
-            print(f"Error initializing GenAI Client in AI Studio mode: {e}")
-
-    print("WARNING: No GenAI Client could be initialized (missing Project ID or API Key)")
-    return None
+    return get_client_registry().genai()
+
+def get_live_genai_client():
+    """Vertex AI (ADC, v1beta1) client for Live API sessions."""
+    return get_client_registry().genai_vertex(api_version="v1beta1")
+
+def get_api_key_genai_client():
+    """Vertex AI with GOOGLE_CLOUD_API_KEY (v1beta1), as used by the generate / RAG / car quiz endpoints."""
+    return get_client_registry().genai_api_key(api_version="v1beta1")
 
 def get_storage_client():
-    return storage.Client(project=os.getenv("PROJECT_ID"))
+    return get_client_registry().storage()
 
 def get_firestore_client():
-    return firestore.Client(project=os.getenv("PROJECT_ID"))
+    return get_client_registry().firestore()
 
 def get_embedding(text: str = None, image_bytes: bytes = None):
-    """Generates embedding using the stable Vertex AI MultiModalEmbeddingModel."""
+    """Generates embedding using the stable Vertex AI MultiModalEmbeddingModel (via the shared EmbeddingService)."""
     if not PROJECT_ID or not LOCATION:
         print("Project ID or Location missing for Vertex AI")
         return None
 
-    # Truncate text to satisfy model limit
-    if text and len(text) > 400:
-        # trace(f"Truncating text from {len(text)} to 400 chars for embedding.")
-        text = text[:400]
-
     try:
-        # Lazy init Vertex AI SDK
-        import vertexai
-        from vertexai.vision_models import MultiModalEmbeddingModel, Image
+        from services.embedding_service import get_embedding_service
+        return get_embedding_service().embed(text=text, image_bytes=image_bytes)
+    except Exception as e:
+        print(f"Embedding error (Vertex AI SDK): {e}")
+        return None
 
-        vertexai.init(project=PROJECT_ID, location=LOCATION)
-        
-        # Load the specific model designed for multimodal embeddings
-        model = MultiModalEmbeddingModel.from_pretrained("multimodalembedding@001")
-        
-        embeddings = None
-        if image_bytes and text:
-            # Multimodal (Image + Text)
-            image = Image(image_bytes)
-            embeddings = model.get_embeddings(image=image, contextual_text=text)
-        elif image_bytes:
-            # Image only
-            image = Image(image_bytes)
-            embeddings = model.get_embeddings(image=image)
-        elif text:
-            # Text only
-            embeddings = model.get_embeddings(contextual_text=text)
-            
-        if embeddings:
-            if image_bytes:
-                return embeddings.image_embedding
-            elif text:
-                return embeddings.text_embedding
-                
+async def get_embedding_async(text: str = None, image_bytes: bytes = None):
+    """Async variant of get_embedding for request handlers (does not block the event loop)."""
+    if not PROJECT_ID or not LOCATION:
+        print("Project ID or Location missing for Vertex AI")
         return None
+
+    try:
+        from services.embedding_service import get_embedding_service
+        return await get_embedding_service().embed_async(text=text, image_bytes=image_bytes)
     except Exception as e:
         print(f"Embedding error (Vertex AI SDK): {e}")
         return None
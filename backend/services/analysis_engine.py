@@ -0,0 +1,149 @@
+import os
+import asyncio
+import threading
+from typing import Any, Dict, List, Tuple
+
+from services.ai_shared import trace
+from services.clients import get_client_registry
+from services.ai_analysis import analyze_slide_structure_batch_async
+from services.gemini_gateway import get_gemini_gateway
+from config import GEMINI_ANALYSIS_MODEL
+
+MAX_CHUNK_PAGES = int(os.environ.get("ANALYSIS_MAX_CHUNK_PAGES", "10"))
+MAX_CHUNK_BYTES = int(os.environ.get("ANALYSIS_MAX_CHUNK_BYTES", str(4 * 1024 * 1024)))
+CONCURRENCY = int(os.environ.get("ANALYSIS_CONCURRENCY", "4"))
+RPM = float(os.environ.get("ANALYSIS_RPM", "60"))
+
+
+def plan_chunks(images_bytes: List[bytes], max_pages: int = MAX_CHUNK_PAGES, max_bytes: int = MAX_CHUNK_BYTES) -> List[Tuple[int, int]]:
+    """
+    Splits pages into [start, end) ranges capped by page count and total image bytes.
+    Dense, image-heavy slides end up in smaller requests; text slides still go 10 at a time.
+    """
+    chunks = []
+    start = 0
+    size = 0
+    for i, b in enumerate(images_bytes):
+        if i > start and (i - start >= max_pages or size + len(b) > max_bytes):
+            chunks.append((start, i))
+            start, size = i, 0
+        size += len(b)
+    if start < len(images_bytes):
+        chunks.append((start, len(images_bytes)))
+    return chunks
+
+
+def _error_result(message: str, description: str = "") -> Dict[str, Any]:
+    return {"structure_type": "Error", "key_message": message, "description": description}
+
+
+class AnalysisEngine:
+    """
+    Runs slide analysis requests concurrently on a long-lived asyncio loop.
+
+    Pages are planned into byte-bounded chunks, the chunks are sent in
+    parallel (at most CONCURRENCY in flight), and a chunk that fails is split
+    in half and retried, so one bad page costs a single Error entry instead of
+    the whole chunk. Rate limiting and 429/503 retries happen in the Gemini
+    gateway, where ANALYSIS_RPM is the analysis model's per-minute limit.
+
+    Sync callers (pipeline worker threads) use analyze(); code already on an
+    event loop uses analyze_async().
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, concurrency: int = CONCURRENCY, rpm: float = RPM):
+        self.concurrency = concurrency
+        get_gemini_gateway().configure(GEMINI_ANALYSIS_MODEL, rpm=rpm)
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = None
+        self._client = None
+        self._thread = threading.Thread(target=self._run_loop, name="analysis-engine", daemon=True)
+        self._thread.start()
+
+        self.requests = 0
+        self.splits = 0
+        self.failed_pages = 0
+
+    @classmethod
+    def get_instance(cls) -> "AnalysisEngine":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = AnalysisEngine()
+        return cls._instance
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        # The semaphore and the GenAI client's async connection pool must belong to the loop that uses them;
+        # the shared client's pool is used from the server loop
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._client = get_client_registry().genai_dedicated("analysis-engine")
+        self._loop.run_forever()
+
+    # --- Public API ---
+
+    def analyze(self, images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+        """Blocking entry point for worker threads."""
+        if not images_bytes:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._analyze(images_bytes), self._loop)
+        return future.result()
+
+    async def analyze_async(self, images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+        """Awaitable entry point for callers on another event loop."""
+        if not images_bytes:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._analyze(images_bytes), self._loop)
+        return await asyncio.wrap_future(future)
+
+    # --- Internals (run on the engine loop) ---
+
+    async def _analyze(self, images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+        chunks = plan_chunks(images_bytes)
+        parts = await asyncio.gather(*(self._analyze_chunk(images_bytes[s:e]) for s, e in chunks))
+        results = []
+        for part in parts:
+            results.extend(part)
+        return results
+
+    async def _analyze_chunk(self, images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+        try:
+            return await self._request(images_bytes)
+        except Exception as e:
+            if len(images_bytes) == 1:
+                self.failed_pages += 1
+                print(f"AnalysisEngine: page analysis failed: {e}")
+                return [_error_result("API Error", str(e))]
+
+            # Split in half and retry each side, so the healthy pages still get analyzed
+            self.splits += 1
+            mid = len(images_bytes) // 2
+            trace(f"AnalysisEngine: chunk of {len(images_bytes)} failed ({e}). Splitting.")
+            left, right = await asyncio.gather(
+                self._analyze_chunk(images_bytes[:mid]),
+                self._analyze_chunk(images_bytes[mid:])
+            )
+            return left + right
+
+    async def _request(self, images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+        async with self._semaphore:
+            self.requests += 1
+            # Throttling and 429/503 backoff are done by the gateway
+            if self._client is None:
+                raise RuntimeError("Client unavailable")
+            return await analyze_slide_structure_batch_async(images_bytes, client=self._client)
+
+
+def get_analysis_engine() -> AnalysisEngine:
+    return AnalysisEngine.get_instance()
+
+
+def analyze_slides_parallel(images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+    return get_analysis_engine().analyze(images_bytes)
+
+
+async def analyze_slides_parallel_async(images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+    return await get_analysis_engine().analyze_async(images_bytes)
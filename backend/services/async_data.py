@@ -0,0 +1,78 @@
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+BLOCKING_IO_WORKERS = int(os.environ.get("BLOCKING_IO_WORKERS", "16"))
+
+# Dedicated pool so slow GCS/legacy calls can't exhaust the default executor used by FastAPI's sync endpoints
+_pool = ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS, thread_name_prefix="blocking-io")
+
+
+async def offload(fn: Callable, *args, **kwargs) -> Any:
+    """Runs a blocking call (sync Firestore/GCS/SDK) off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, functools.partial(fn, *args, **kwargs))
+
+
+class AsyncStorage:
+    """
+    Awaitable facade over the (sync-only) GCS client for `async def` handlers.
+
+    Every call runs on the blocking-io pool, so an upload or a slow listing
+    never holds the event loop that also serves the Live API WebSockets.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @classmethod
+    def get_instance(cls) -> "AsyncStorage":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = AsyncStorage()
+        return cls._instance
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._instance_lock:
+                if self._client is None:
+                    from services.ai_shared import get_storage_client
+                    self._client = get_storage_client()
+        return self._client
+
+    def blob(self, bucket_name: str, blob_name: str):
+        return self.client.bucket(bucket_name).blob(blob_name)
+
+    async def upload_bytes(self, bucket_name: str, blob_name: str, data: bytes, content_type: Optional[str] = None):
+        blob = self.blob(bucket_name, blob_name)
+        await offload(blob.upload_from_string, data, content_type=content_type)
+        return blob
+
+    async def download_bytes(self, bucket_name: str, blob_name: str) -> bytes:
+        return await offload(self.blob(bucket_name, blob_name).download_as_bytes)
+
+    async def delete(self, bucket_name: str, blob_name: str):
+        await offload(self.blob(bucket_name, blob_name).delete)
+
+    async def exists(self, bucket_name: str, blob_name: str) -> bool:
+        return await offload(self.blob(bucket_name, blob_name).exists)
+
+    async def list_blobs(self, bucket_name: str, **kwargs):
+        """(blobs, next_page_token). Iterated in the worker thread, since each page is a network fetch."""
+        def run():
+            iterator = self.client.bucket(bucket_name).list_blobs(**kwargs)
+            blobs = list(iterator)
+            return blobs, iterator.next_page_token
+        return await offload(run)
+
+
+def get_async_storage() -> AsyncStorage:
+    return AsyncStorage.get_instance()
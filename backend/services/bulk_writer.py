@@ -0,0 +1,153 @@
+import os
+import time
+import threading
+from typing import Any, Dict, List, Tuple
+
+from google.cloud import firestore
+
+from services.ai_shared import trace
+
+FIRESTORE_BATCH_LIMIT = 500 # Hard limit of writes per commit
+FLUSH_SIZE = int(os.environ.get("BULK_WRITER_FLUSH_SIZE", "200"))
+FLUSH_INTERVAL = float(os.environ.get("BULK_WRITER_FLUSH_INTERVAL", "2.0"))
+
+
+class BufferedWriter:
+    """
+    Buffers Firestore writes and commits them as WriteBatches.
+
+    A batch is committed when FLUSH_SIZE writes are pending, or by a
+    background timer once the oldest pending write is FLUSH_INTERVAL seconds
+    old. Writes are committed in submission order, so an `update` queued after
+    the `set` that creates the document is safe. Counter increments on the
+    same document are merged into a single update per flush.
+
+    If a batch commit fails (e.g. one `update` targets a missing document),
+    its writes are retried one by one so a single bad write does not drop the
+    rest.
+
+    Use as a context manager or call close() to flush remaining writes.
+    """
+
+    def __init__(self, db, flush_size: int = FLUSH_SIZE, flush_interval: float = FLUSH_INTERVAL, name: str = "writer"):
+        self.db = db
+        self.flush_size = min(flush_size, FIRESTORE_BATCH_LIMIT)
+        self.flush_interval = flush_interval
+        self.name = name
+
+        self._lock = threading.Lock() # guards the buffers
+        self._commit_lock = threading.Lock() # serializes commits to keep ordering
+        self._ops: List[Tuple[str, Any, Any, Dict[str, Any]]] = []
+        self._increments: Dict[str, Tuple[Any, Dict[str, int]]] = {}
+        self._oldest = None
+        self._closed = threading.Event()
+
+        self.commits = 0
+        self.writes = 0
+        self.failed_writes = 0
+
+        self._timer = threading.Thread(target=self._timer_loop, name=f"{name}-flush", daemon=True)
+        self._timer.start()
+
+    # --- Write API (mirrors DocumentReference / WriteBatch) ---
+
+    def set(self, ref, data: Dict[str, Any], merge: bool = False):
+        self._add(("set", ref, data, {"merge": merge}))
+
+    def update(self, ref, data: Dict[str, Any]):
+        self._add(("update", ref, data, {}))
+
+    def delete(self, ref):
+        self._add(("delete", ref, None, {}))
+
+    def increment(self, ref, field: str, amount: int = 1):
+        """Accumulates firestore.Increment(amount) on ref.field until the next flush."""
+        with self._lock:
+            entry = self._increments.setdefault(ref.path, (ref, {}))
+            entry[1][field] = entry[1].get(field, 0) + amount
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def _add(self, op):
+        with self._lock:
+            self._ops.append(op)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            should_flush = len(self._ops) >= self.flush_size
+        if should_flush:
+            self.flush()
+
+    # --- Flushing ---
+
+    def flush(self):
+        """Commits everything buffered so far. Blocks until done."""
+        with self._commit_lock:
+            with self._lock:
+                ops = self._ops
+                increments = self._increments
+                self._ops = []
+                self._increments = {}
+                self._oldest = None
+
+            for ref, fields in increments.values():
+                ops.append(("update", ref, {f: firestore.Increment(n) for f, n in fields.items()}, {}))
+
+            for i in range(0, len(ops), FIRESTORE_BATCH_LIMIT):
+                self._commit(ops[i:i + FIRESTORE_BATCH_LIMIT])
+
+    def close(self):
+        self._closed.set()
+        self.flush()
+        trace(f"[{self.name}] {self.writes} writes in {self.commits} commits ({self.failed_writes} failed)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _timer_loop(self):
+        while not self._closed.wait(self.flush_interval / 2):
+            with self._lock:
+                due = self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval
+            if due:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"[{self.name}] Timed flush failed: {e}")
+
+    def _commit(self, ops):
+        if not ops:
+            return
+        batch = self.db.batch()
+        for op in ops:
+            self._apply(batch, op)
+        try:
+            batch.commit()
+            self.commits += 1
+            self.writes += len(ops)
+            return
+        except Exception as e:
+            print(f"[{self.name}] Batch commit of {len(ops)} writes failed ({e}). Retrying individually.")
+
+        for op in ops:
+            try:
+                single = self.db.batch()
+                self._apply(single, op)
+                single.commit()
+                self.commits += 1
+                self.writes += 1
+            except Exception as e:
+                self.failed_writes += 1
+                print(f"[{self.name}] Write to {op[1].path} failed: {e}")
+
+    @staticmethod
+    def _apply(batch, op):
+        kind, ref, data, opts = op
+        if kind == "set":
+            batch.set(ref, data, merge=opts.get("merge", False))
+        elif kind == "update":
+            batch.update(ref, data)
+        elif kind == "delete":
+            batch.delete(ref)
@@ -0,0 +1,224 @@
+import os
+import json
+import importlib.util
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+GCS_HTTP_POOL_SIZE = int(os.environ.get("GCS_HTTP_POOL_SIZE", "32"))
+GENAI_MAX_CONNECTIONS = int(os.environ.get("GENAI_MAX_CONNECTIONS", "32"))
+GENAI_KEEPALIVE_SECONDS = float(os.environ.get("GENAI_KEEPALIVE_SECONDS", "120"))
+
+# key.json is in the project root (one level up from backend); used for local runs only
+KEY_PATH = Path(__file__).parent.parent.parent / "key.json"
+
+
+class ClientRegistry:
+    """
+    Process-wide owner of the Google Cloud / GenAI clients.
+
+    Every client is created once, on first use, and then shared by all
+    requests and worker threads (all of them are thread-safe), so credential
+    discovery, TLS handshakes and gRPC channel setup happen once per process
+    instead of per request or per file.
+
+    - Firestore: one sync and one async client, each with a single gRPC
+      channel (the library already enables 30s keepalive pings on it).
+    - Storage: HTTP session pool sized to GCS_HTTP_POOL_SIZE, so the
+      blocking-io / signing / ingestion threads keep their connections alive
+      instead of the default 10-connection pool dropping them.
+    - GenAI: one client per configuration (default chain, Live API, API key),
+      with a larger keep-alive httpx pool where the SDK supports it, plus
+      dedicated clients for components that run their own event loop.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._clients: Dict[Any, Any] = {}
+        self._lock = threading.RLock()
+        self.created: Dict[str, int] = {}
+
+    @classmethod
+    def get_instance(cls) -> "ClientRegistry":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = ClientRegistry()
+        return cls._instance
+
+    def _get(self, key, factory: Callable[[], Any]):
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = factory()
+                if client is not None:
+                    self._clients[key] = client
+                    name = key[0] if isinstance(key, tuple) else key
+                    self.created[name] = self.created.get(name, 0) + 1
+            return client
+
+    # --- Firestore ---
+
+    def firestore(self):
+        def create():
+            from google.cloud import firestore
+            if KEY_PATH.exists():
+                return firestore.Client.from_service_account_json(str(KEY_PATH))
+            return firestore.Client(project=os.getenv("PROJECT_ID"))
+        return self._get("firestore", create)
+
+    def async_firestore(self):
+        """Its gRPC channel binds to the event loop that first uses it, so use it only from the server loop."""
+        def create():
+            from google.cloud import firestore
+            if KEY_PATH.exists():
+                return firestore.AsyncClient.from_service_account_json(str(KEY_PATH))
+            return firestore.AsyncClient(project=os.getenv("PROJECT_ID"))
+        return self._get("async_firestore", create)
+
+    # --- Storage ---
+
+    def storage(self):
+        def create():
+            from google.cloud import storage
+            from google.oauth2 import service_account
+            if KEY_PATH.exists():
+                credentials = service_account.Credentials.from_service_account_file(str(KEY_PATH), scopes=storage.Client.SCOPE)
+                return self._pooled_storage(credentials, credentials.project_id)
+            import google.auth
+            credentials, project = google.auth.default(scopes=storage.Client.SCOPE)
+            return self._pooled_storage(credentials, os.getenv("PROJECT_ID") or project)
+        return self._get("storage", create)
+
+    def signing_storage(self):
+        """
+        Storage client for generating signed PUT/GET URLs.
+        Uses SERVICE_ACCOUNT_KEY (injected from Secret Manager) when set, since ADC on
+        Cloud Run has no private key to sign with; otherwise the default client.
+        """
+        def create():
+            info_str = os.getenv("SERVICE_ACCOUNT_KEY")
+            if not info_str:
+                return None
+            try:
+                from google.cloud import storage
+                from google.oauth2 import service_account
+                # Handle potential quoting issues if raw json was stringified weirdly
+                if info_str.startswith("'") and info_str.endswith("'"):
+                    info_str = info_str[1:-1]
+                credentials = service_account.Credentials.from_service_account_info(json.loads(info_str), scopes=storage.Client.SCOPE)
+                return self._pooled_storage(credentials, os.getenv("PROJECT_ID") or credentials.project_id)
+            except Exception as e:
+                print(f"Warning: Failed to parse SERVICE_ACCOUNT_KEY: {e}")
+                return None
+        # A missing/broken key is not cached as a client; remember the fallback instead of re-parsing per call
+        client = self._get("signing_storage", lambda: create() or False)
+        return client or self.storage()
+
+    def _pooled_storage(self, credentials, project: Optional[str]):
+        import requests
+        from google.cloud import storage
+        from google.auth.transport.requests import AuthorizedSession
+
+        session = AuthorizedSession(credentials)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=GCS_HTTP_POOL_SIZE, pool_maxsize=GCS_HTTP_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return storage.Client(project=project, credentials=credentials, _http=session)
+
+    # --- GenAI ---
+
+    def genai(self):
+        """Default client: Vertex AI with API key, then Vertex AI with ADC, then AI Studio. None if none works."""
+        return self._get("genai", self._create_default_genai)
+
+    def genai_dedicated(self, owner: str):
+        """
+        Default-chain client used only by `owner`. For code running its own event loop
+        (e.g. the analysis engine): the async HTTP pool keeps connections bound to the
+        loop that opened them, so it must not be shared with the server loop.
+        """
+        return self._get(("genai_dedicated", owner), self._create_default_genai)
+
+    def genai_vertex(self, project: Optional[str] = None, location: Optional[str] = None, api_version: Optional[str] = None):
+        """Vertex AI with ADC (Live API sessions use api_version="v1beta1")."""
+        project = project or os.getenv("PROJECT_ID")
+        location = location or os.getenv("LOCATION", "us-central1")
+        return self._get(
+            ("genai_vertex", project, location, api_version),
+            lambda: self._create_genai(vertexai=True, project=project, location=location, api_version=api_version),
+        )
+
+    def genai_api_key(self, vertexai: bool = True, api_version: Optional[str] = None):
+        """Vertex AI (or AI Studio) with GOOGLE_CLOUD_API_KEY."""
+        api_key = os.getenv("GOOGLE_CLOUD_API_KEY")
+        api_key = api_key.strip() if api_key else None
+        return self._get(
+            ("genai_api_key", vertexai, api_version),
+            lambda: self._create_genai(vertexai=vertexai, api_key=api_key, api_version=api_version),
+        )
+
+    def _create_default_genai(self):
+        api_key = os.getenv("GOOGLE_CLOUD_API_KEY")
+        p_id = os.getenv("PROJECT_ID")
+        p_loc = os.getenv("LOCATION", "us-central1")
+
+        # 1. Try Vertex AI with API Key (Working pattern in car_quiz.py / generate.py)
+        if api_key:
+            try:
+                client = self._create_genai(vertexai=True, api_key=api_key.strip())
+                print("DEBUG: GenAI Client initialized in Vertex AI mode with API Key")
+                return client
+            except Exception as e:
+                print(f"Error initializing GenAI Client with API Key: {e}")
+
+        # 2. Fallback to Vertex AI with Service Account / Project ID
+        if p_id:
+            try:
+                client = self._create_genai(vertexai=True, project=p_id, location=p_loc)
+                print(f"DEBUG: GenAI Client initialized in Vertex AI mode (Project={p_id}, Location={p_loc})")
+                return client
+            except Exception as e:
+                print(f"Error initializing GenAI Client with Project ID: {e}")
+
+        # 3. Last Fallback: Google AI Studio mode (not vertexai)
+        if api_key:
+            try:
+                client = self._create_genai(api_key=api_key.strip())
+                print("DEBUG: GenAI Client initialized in Google AI Studio mode")
+                return client
+            except Exception as e:
+                print(f"Error initializing GenAI Client in AI Studio mode: {e}")
+
+        print("WARNING: No GenAI Client could be initialized (missing Project ID or API Key)")
+        return None
+
+    def _create_genai(self, api_version: Optional[str] = None, **kwargs):
+        from google import genai
+
+        options = {"api_version": api_version} if api_version else {}
+        try:
+            import httpx
+            limits = httpx.Limits(
+                max_connections=GENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=GENAI_MAX_CONNECTIONS,
+                keepalive_expiry=GENAI_KEEPALIVE_SECONDS,
+            )
+            http_options = {**options, "client_args": {"limits": limits}}
+            # Newer SDKs send .aio calls through aiohttp when it is installed, and
+            # aiohttp rejects httpx's `limits`; only size the async pool on httpx
+            if importlib.util.find_spec("aiohttp") is None:
+                http_options["async_client_args"] = {"limits": limits}
+            return genai.Client(http_options=http_options, **kwargs)
+        except (ImportError, TypeError, ValueError):
+            # Older SDKs have no client_args: keep their default pool
+            return genai.Client(http_options=options or None, **kwargs)
+
+
+def get_client_registry() -> ClientRegistry:
+    return ClientRegistry.get_instance()
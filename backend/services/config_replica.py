@@ -0,0 +1,212 @@
+import os
+import copy
+import time
+import threading
+from typing import Any, Dict, List, Optional
+
+from services.async_data import offload
+
+TTL_SECONDS = float(os.environ.get("CONFIG_REPLICA_TTL_SECONDS", "30"))
+# Safety net: even with a live listener, an entry is re-read once it is this old
+MAX_AGE_SECONDS = float(os.environ.get("CONFIG_REPLICA_MAX_AGE_SECONDS", "600"))
+
+
+class _Entry:
+    def __init__(self, ref, is_collection: bool):
+        self.ref = ref
+        self.is_collection = is_collection
+        self.data = None # dict for documents, {doc_id: dict} for collections; None = not loaded / invalidated
+        self.fetched_at = 0.0
+        self.watch = None
+        self.listening = False
+        self.lock = threading.RLock() # serializes the load + listener attach of this entry
+
+
+class ConfigReplica:
+    """
+    Process-wide replica of small, hot Firestore documents and collections
+    (chat settings, DAB memory / hot topics, training config).
+
+    The first read fetches the data and attaches a snapshot listener, which
+    keeps the copy current from then on, so later reads are dictionary
+    lookups. Where listeners are unavailable (local stand-ins, emulators
+    without watch), or after a listener's stream has died, entries are re-read
+    once they are older than TTL_SECONDS and a new listener is attached.
+    Listened entries are still re-read after MAX_AGE_SECONDS.
+    Local writes call put() or invalidate() so the writer sees its own change
+    immediately.
+
+    Returned values are deep copies; callers may modify them freely.
+    Coroutines use document_async()/collection_async(): cached reads stay
+    inline, a cold or expired entry is loaded on the blocking-io pool.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    @classmethod
+    def get_instance(cls) -> "ConfigReplica":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = ConfigReplica()
+        return cls._instance
+
+    # --- Reads ---
+
+    def document(self, db, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        """The document's data, or None if it does not exist."""
+        key = f"{collection}/{doc_id}"
+        entry = self._entry(key, lambda: _Entry(db.collection(collection).document(doc_id), False))
+        data = self._read(entry)
+        return copy.deepcopy(data) if data else None
+
+    def collection(self, db, collection: str) -> Dict[str, Dict[str, Any]]:
+        """{doc_id: data} for every document in the collection (filter/sort in Python)."""
+        key = f"{collection}/*"
+        entry = self._entry(key, lambda: _Entry(db.collection(collection), True))
+        return copy.deepcopy(self._read(entry) or {})
+
+    async def document_async(self, db, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        """document() for coroutines: the Firestore read and listener attach never run on the event loop."""
+        entry = self._entries.get(f"{collection}/{doc_id}")
+        if entry is not None and self._cached(entry):
+            self.hits += 1
+            return copy.deepcopy(entry.data) if entry.data else None
+        return await offload(self.document, db, collection, doc_id)
+
+    async def collection_async(self, db, collection: str) -> Dict[str, Dict[str, Any]]:
+        entry = self._entries.get(f"{collection}/*")
+        if entry is not None and self._cached(entry):
+            self.hits += 1
+            return copy.deepcopy(entry.data or {})
+        return await offload(self.collection, db, collection)
+
+    # --- Local writes ---
+
+    def put(self, collection: str, doc_id: str, data: Optional[Dict[str, Any]]):
+        """Write-through after a local set() (data=None after a delete)."""
+        with self._lock:
+            doc_entry = self._entries.get(f"{collection}/{doc_id}")
+            if doc_entry is not None:
+                doc_entry.data = copy.deepcopy(data) if data is not None else {}
+                doc_entry.fetched_at = time.time()
+            col_entry = self._entries.get(f"{collection}/*")
+            if col_entry is not None and col_entry.data is not None:
+                if data is None:
+                    col_entry.data.pop(doc_id, None)
+                else:
+                    col_entry.data[doc_id] = copy.deepcopy(data)
+
+    def invalidate(self, collection: str, doc_id: Optional[str] = None):
+        """Forces a re-read after a local update() whose resulting document we don't have."""
+        with self._lock:
+            keys = [f"{collection}/*"] + ([f"{collection}/{doc_id}"] if doc_id else [k for k in self._entries if k.startswith(f"{collection}/")])
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.data = None
+
+    # --- Internals ---
+
+    def _entry(self, key: str, factory) -> _Entry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = factory()
+                self._entries[key] = entry
+            return entry
+
+    def _cached(self, entry: _Entry) -> bool:
+        """Fresh without any I/O: a dead listener counts as stale, so the (offloaded) read path drops it."""
+        if entry.data is None:
+            return False
+        age = time.time() - entry.fetched_at
+        if entry.listening:
+            return self._listener_alive(entry) and age < MAX_AGE_SECONDS
+        return age < TTL_SECONDS
+
+    def _fresh(self, entry: _Entry) -> bool:
+        if entry.data is None:
+            return False
+        age = time.time() - entry.fetched_at
+        if entry.listening:
+            if self._listener_alive(entry):
+                return age < MAX_AGE_SECONDS
+            # The Watch stream stopped (non-retryable error / closed): back to TTL, re-attach on the next load
+            self._drop_listener(entry)
+        return age < TTL_SECONDS
+
+    def _read(self, entry: _Entry):
+        if self._fresh(entry):
+            self.hits += 1
+            return entry.data
+
+        with entry.lock:
+            # Another thread may have loaded (and attached the listener) while we waited
+            if self._fresh(entry):
+                self.hits += 1
+                return entry.data
+            self._load(entry)
+            if entry.watch is None and not entry.listening:
+                self._listen(entry)
+            return entry.data
+
+    def _load(self, entry: _Entry):
+        self.loads += 1
+        if entry.is_collection:
+            data = {snap.id: snap.to_dict() or {} for snap in entry.ref.stream()}
+        else:
+            snap = entry.ref.get()
+            data = (snap.to_dict() or {}) if snap.exists else {}
+        with self._lock:
+            entry.data = data
+            entry.fetched_at = time.time()
+
+    def _listen(self, entry: _Entry):
+        def on_snapshot(snapshots, changes, read_time):
+            if entry.is_collection:
+                data = {snap.id: snap.to_dict() or {} for snap in snapshots}
+            else:
+                data = {}
+                for snap in snapshots:
+                    if snap.exists:
+                        data = snap.to_dict() or {}
+            with self._lock:
+                entry.data = data
+                entry.fetched_at = time.time()
+
+        try:
+            entry.watch = entry.ref.on_snapshot(on_snapshot)
+            entry.listening = True
+        except Exception as e:
+            # TTL polling from here on
+            entry.watch = False
+            print(f"ConfigReplica: listener unavailable for {entry.ref.id} ({e}). Using {TTL_SECONDS}s TTL.")
+
+    @staticmethod
+    def _listener_alive(entry: _Entry) -> bool:
+        # firestore Watch exposes is_active; it turns False once the stream is closed for good
+        return bool(getattr(entry.watch, "is_active", True))
+
+    def _drop_listener(self, entry: _Entry):
+        with entry.lock:
+            if not entry.listening:
+                return
+            print(f"ConfigReplica: listener for {entry.ref.id} stopped. Using {TTL_SECONDS}s TTL until it is re-attached.")
+            try:
+                entry.watch.unsubscribe()
+            except Exception:
+                pass
+            entry.watch = None
+            entry.listening = False
+
+
+def get_config_replica() -> ConfigReplica:
+    return ConfigReplica.get_instance()
@@ -0,0 +1,237 @@
+import os
+import time
+import hashlib
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from google.genai import types
+
+from services.gemini_gateway import gemini_generate, gemini_generate_async
+from services.response_cache import _feed
+
+DEFAULT_TTL_SECONDS = int(os.environ.get("CONTEXT_CACHE_TTL_SECONDS", "900"))
+# Below this much text (and without media) explicit caching is refused by the API / not worth it
+MIN_CACHE_CHARS = int(os.environ.get("CONTEXT_CACHE_MIN_CHARS", "4096"))
+# A handle is not used in its last seconds, so a request never races its expiry
+EXPIRY_MARGIN_SECONDS = 30
+MAX_TRACKED = 1024
+
+
+class _Handle:
+    def __init__(self, name: Optional[str], expires_at: float):
+        self.name = name # None = this prefix could not be cached; don't retry until expires_at
+        self.expires_at = expires_at
+
+
+def _key(client, model: str, system_instruction, contents) -> str:
+    h = hashlib.sha256()
+    _feed(h, [str(id(client)), model, system_instruction, contents])
+    return h.hexdigest()
+
+
+def _size_hint(value: Any) -> int:
+    """Rough prefix size: text length, or MIN_CACHE_CHARS for any media part (always large enough)."""
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_size_hint(v) for v in value)
+    if isinstance(value, types.Content):
+        return _size_hint(value.parts or [])
+    if isinstance(value, types.Part):
+        if value.file_data is not None or value.inline_data is not None:
+            return MIN_CACHE_CHARS
+        return len(value.text or "")
+    return 0
+
+
+class ContextCacheManager:
+    """
+    Explicit Gemini context caches for prompt prefixes that are sent repeatedly:
+    large media, long reference documents, system prompts and rubrics.
+
+    generate()/generate_async() take the reusable prefix separately from the
+    per-call contents. The prefix (plus the config's system_instruction) is
+    uploaded once as cached content and later calls refer to it by name, so the
+    prefix tokens are billed at the cached rate and not re-processed. Handles
+    expire after ttl_seconds; a new one is created on the next use. Caches are
+    model-scoped, so the same media sent to two models gets two handles.
+
+    With min_uses=2 a prefix is only cached once it is seen again (re-runs of
+    the same upload), so one-off requests don't pay for cache creation.
+    Whenever a prefix can't be cached (too small, unsupported model, API error)
+    the call is sent inline exactly as before.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._handles: "OrderedDict[str, _Handle]" = OrderedDict()
+        self._uses: "OrderedDict[str, int]" = OrderedDict()
+        self._creating: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.created = 0
+        self.inline = 0
+
+    @classmethod
+    def get_instance(cls) -> "ContextCacheManager":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = ContextCacheManager()
+        return cls._instance
+
+    # --- Public API ---
+
+    def generate(self, model: str, cached_contents: List[Any], contents: List[Any], config: Optional[types.GenerateContentConfig] = None,
+                 client=None, ttl_seconds: int = DEFAULT_TTL_SECONDS, min_uses: int = 1):
+        """gemini_generate(model, cached_contents + contents, config) with the prefix served from a context cache."""
+        client = client or _default_client()
+        system_instruction = config.system_instruction if config else None
+        key, owner, pending = self._lookup(client, model, system_instruction, cached_contents, min_uses)
+        if owner:
+            self._create(key, owner, client, model, system_instruction, cached_contents, ttl_seconds)
+        name = pending.result() if pending else None
+        if name:
+            try:
+                return gemini_generate(model=model, contents=contents, config=_with_cache(config, name), client=client)
+            except Exception as e:
+                if not self._handle_gone(key, e):
+                    raise
+        self.inline += 1
+        return gemini_generate(model=model, contents=list(cached_contents) + list(contents), config=config, client=client)
+
+    async def generate_async(self, model: str, cached_contents: List[Any], contents: List[Any], config: Optional[types.GenerateContentConfig] = None,
+                             client=None, ttl_seconds: int = DEFAULT_TTL_SECONDS, min_uses: int = 1):
+        client = client or _default_client()
+        system_instruction = config.system_instruction if config else None
+        key, owner, pending = self._lookup(client, model, system_instruction, cached_contents, min_uses)
+        if owner:
+            await self._create_async(key, owner, client, model, system_instruction, cached_contents, ttl_seconds)
+        name = await asyncio.wrap_future(pending) if pending else None
+        if name:
+            try:
+                return await gemini_generate_async(model=model, contents=contents, config=_with_cache(config, name), client=client)
+            except Exception as e:
+                if not self._handle_gone(key, e):
+                    raise
+        self.inline += 1
+        return await gemini_generate_async(model=model, contents=list(cached_contents) + list(contents), config=config, client=client)
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            live = sum(1 for h in self._handles.values() if h.name and h.expires_at > now)
+        return {"live_handles": live, "hits": self.hits, "created": self.created, "inline_calls": self.inline}
+
+    # --- Internals ---
+
+    def _lookup(self, client, model: str, system_instruction, cached_contents, min_uses: int):
+        """(key, owner future or None, future resolving to the handle name or None)."""
+        key = _key(client, model, system_instruction, cached_contents)
+        now = time.time()
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None and handle.expires_at - EXPIRY_MARGIN_SECONDS > now:
+                self._handles.move_to_end(key)
+                if handle.name:
+                    self.hits += 1
+                return key, None, _done(handle.name)
+
+            pending = self._creating.get(key)
+            if pending is not None:
+                return key, None, pending
+
+            uses = self._uses.get(key, 0) + 1
+            self._uses[key] = uses
+            self._uses.move_to_end(key)
+            while len(self._uses) > MAX_TRACKED:
+                self._uses.popitem(last=False)
+            if uses < min_uses or _size_hint([system_instruction, cached_contents]) < MIN_CACHE_CHARS:
+                return key, None, None
+
+            owner = Future()
+            self._creating[key] = owner
+            return key, owner, owner
+
+    def _create(self, key: str, owner: Future, client, model: str, system_instruction, cached_contents, ttl_seconds: int):
+        try:
+            cache = client.caches.create(model=model, config=_cache_config(system_instruction, cached_contents, ttl_seconds))
+            self._finish(key, owner, cache.name, ttl_seconds)
+        except Exception as e:
+            print(f"ContextCache: caching prefix for {model} failed, sending inline: {e}")
+            self._finish(key, owner, None, ttl_seconds)
+
+    async def _create_async(self, key: str, owner: Future, client, model: str, system_instruction, cached_contents, ttl_seconds: int):
+        try:
+            cache = await client.aio.caches.create(model=model, config=_cache_config(system_instruction, cached_contents, ttl_seconds))
+            self._finish(key, owner, cache.name, ttl_seconds)
+        except asyncio.CancelledError:
+            # Let concurrent waiters go inline; the next call tries again
+            with self._lock:
+                self._creating.pop(key, None)
+            owner.set_result(None)
+            raise
+        except Exception as e:
+            print(f"ContextCache: caching prefix for {model} failed, sending inline: {e}")
+            self._finish(key, owner, None, ttl_seconds)
+
+    def _finish(self, key: str, owner: Future, name: Optional[str], ttl_seconds: int):
+        with self._lock:
+            self._handles[key] = _Handle(name, time.time() + ttl_seconds)
+            self._handles.move_to_end(key)
+            while len(self._handles) > MAX_TRACKED:
+                self._handles.popitem(last=False)
+            self._creating.pop(key, None)
+            if name:
+                self.created += 1
+        owner.set_result(name)
+
+    def _handle_gone(self, key: str, e: Exception) -> bool:
+        """A handle deleted or expired server-side: forget it and fall back to an inline call."""
+        msg = str(e)
+        if getattr(e, "code", None) == 404 or "NOT_FOUND" in msg or "cached content" in msg.lower():
+            with self._lock:
+                self._handles.pop(key, None)
+            print(f"ContextCache: handle unavailable ({e}), sending inline")
+            return True
+        return False
+
+
+def _cache_config(system_instruction, cached_contents, ttl_seconds: int) -> types.CreateCachedContentConfig:
+    return types.CreateCachedContentConfig(
+        contents=list(cached_contents) or None,
+        system_instruction=system_instruction,
+        ttl=f"{int(ttl_seconds)}s",
+    )
+
+
+def _with_cache(config: Optional[types.GenerateContentConfig], name: str) -> types.GenerateContentConfig:
+    # The system instruction lives in the cache; sending it again is rejected by the API
+    if config is None:
+        return types.GenerateContentConfig(cached_content=name)
+    return config.model_copy(update={"cached_content": name, "system_instruction": None})
+
+
+def _done(value) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _default_client():
+    from services.ai_shared import get_genai_client
+    client = get_genai_client()
+    if client is None:
+        raise RuntimeError("GenAI client unavailable")
+    return client
+
+
+def get_context_cache() -> ContextCacheManager:
+    return ContextCacheManager.get_instance()
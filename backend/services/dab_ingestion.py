@@ -27,8 +27,15 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from database import get_db
 from google.genai import types
 from services.ai_shared import get_genai_client
+from services.config_replica import get_config_replica
 # DAB処理にはコスト対効果の良いflash-liteモデルを使用（標準flashの約1/2のコスト）
 from config import GEMINI_FLASH_MODEL, GEMINI_FLASH_LITE_MODEL
+from services.gemini_gateway import gemini_generate_async
+from services.response_cache import get_response_cache
+
+# 判定・要約・マッピングの回答はキャッシュされる (services/response_cache.py)。
+# プロンプト本文の変更は自動で別キーになるため、解釈だけを変えた場合にこの値を上げる
+DAB_CACHE_VERSION = "v1"
 
 def fetch_zenn_rss() -> List[Dict[str, Any]]:
     """Zennの全体RSSフィード(RSS 2.0形式)から最新記事を取得してパースする"""
@@ -333,7 +340,8 @@ async def fetch_website_updates(url: str, expert_name: str, expert_id: str) -> L
     prompt = f"Webサイト「{url}」の最新の更新、リリース、お知らせ、または最近のブログ記事を検索し、最近のアップデート情報を最大3件抽出してJSONで返してください。"
     
     try:
-        response = await client.aio.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_FLASH_MODEL,
             contents=prompt,
             config=types.GenerateContentConfig(
@@ -403,10 +411,10 @@ async def filter_article_by_ai(article_title: str, article_url: str) -> bool:
         return True # AIクライアントがない場合はセーフティにTrueとする
         
     db = get_db()
-    memory_doc = db.collection("dab_user_memory").document("default_user").get()
+    memory = await get_config_replica().document_async(db, "dab_user_memory", "default_user")
     filter_prompt = ""
-    if memory_doc.exists:
-        filter_prompt = memory_doc.to_dict().get("filter_prompt_template", "")
+    if memory:
+        filter_prompt = memory.get("filter_prompt_template", "")
         
     if not filter_prompt:
         filter_prompt = DEFAULT_FILTER_PROMPT
@@ -419,7 +427,9 @@ async def filter_article_by_ai(article_title: str, article_url: str) -> bool:
     )
     
     try:
-        response = await client.aio.models.generate_content(
+        res_dict = await get_response_cache().generate_json_async(
+            "dab_filter", DAB_CACHE_VERSION,
+            client=client,
             model=GEMINI_FLASH_MODEL,
             contents=prompt,
             config=types.GenerateContentConfig(
@@ -429,7 +439,6 @@ async def filter_article_by_ai(article_title: str, article_url: str) -> bool:
             )
         )
         
-        res_dict = json.loads(response.text.strip())
         is_relevant = res_dict.get("is_relevant", True)
         reason = res_dict.get("reason", "")
         print(f"  AIノイズ判定: {'採用' if is_relevant else '除外'} ({reason})")
@@ -465,7 +474,8 @@ async def fetch_web_trends_via_gemini(topic_name: str) -> List[Dict[str, Any]]:
     prompt = f"トピック: 「{topic_name}」に関連する、2025年〜2026年現在の最新の技術動向や詳細な技術解説・ブログ記事を10件検索し、重要度スコアとともにリストアップしてください。"
     
     try:
-        response = await client.aio.models.generate_content(
+        response = await gemini_generate_async(
+            client=client,
             model=GEMINI_FLASH_MODEL,
             contents=prompt,
             config=types.GenerateContentConfig(
@@ -527,10 +537,10 @@ async def generate_article_metadata(article_title: str, article_url: str, brief_
     db = get_db()
     
     # Firestoreからユーザー独自の要約プロンプトを取得
-    memory_doc = db.collection("dab_user_memory").document("default_user").get()
+    memory = await get_config_replica().document_async(db, "dab_user_memory", "default_user")
     summary_prompt = ""
-    if memory_doc.exists:
-        summary_prompt = memory_doc.to_dict().get("summary_prompt_template", "")
+    if memory:
+        summary_prompt = memory.get("summary_prompt_template", "")
         
     if not summary_prompt:
         # フォールバック用デフォルトプロンプト（意思決定支援型サマリ構成）
@@ -579,7 +589,9 @@ async def generate_article_metadata(article_title: str, article_url: str, brief_
     )
     
     try:
-        response = await client.aio.models.generate_content(
+        res_dict = await get_response_cache().generate_json_async(
+            "dab_metadata", DAB_CACHE_VERSION,
+            client=client,
             model=GEMINI_FLASH_MODEL,  # サマリ・Mermaid生成は品質重視でflashを使用
             contents=prompt,
             config=types.GenerateContentConfig(
@@ -589,8 +601,6 @@ async def generate_article_metadata(article_title: str, article_url: str, brief_
             )
         )
         
-        res_dict = json.loads(response.text.strip())
-        
         # image_urlはフロントエンドのSlideCardコンポーネントで代替するため空を1ンマイアスディックが対応
         return {
             "summary": res_dict.get("summary", "サマリの生成に失敗しました。"),
@@ -642,7 +652,9 @@ async def map_article_to_topics(article_title: str, summary: str, active_topics:
     )
     
     try:
-        response = await client.aio.models.generate_content(
+        topic_ids = await get_response_cache().generate_json_async(
+            "dab_topic_map", DAB_CACHE_VERSION,
+            client=client,
             model=GEMINI_FLASH_MODEL,
             contents=prompt,
             config=types.GenerateContentConfig(
@@ -651,8 +663,6 @@ async def map_article_to_topics(article_title: str, summary: str, active_topics:
                 temperature=0.1
             )
         )
-        
-        topic_ids = json.loads(response.text)
         # 有効なトピックIDのみにフィルタ
         valid_ids = {t['id'] for t in active_topics}
         mapped_ids = [tid for tid in topic_ids if tid in valid_ids]
@@ -667,8 +677,8 @@ async def run_ingestion_pipeline(expert_only: bool = True):
     db = get_db()
     
     # 1. Get active topics (10 selected)
-    topics_docs = db.collection("dab_hot_topics").where("status", "==", "ACTIVE").get()
-    active_topics = [doc.to_dict() for doc in topics_docs]
+    hot_topics = await get_config_replica().collection_async(db, "dab_hot_topics")
+    active_topics = [t for t in hot_topics.values() if t.get("status") == "ACTIVE"]
     
     if not active_topics:
         print("Active hot topics not found. Exiting batch.")
@@ -0,0 +1,200 @@
+import os
+import time
+import queue
+import random
+import asyncio
+import hashlib
+import threading
+import concurrent.futures
+from typing import Optional, List, Dict
+
+from services.ai_shared import PROJECT_ID, LOCATION, trace
+
+MULTIMODAL_EMBEDDING_MODEL = "multimodalembedding@001"
+TEXT_LIMIT = 400 # multimodalembedding@001 contextual_text limit
+
+# Tuning
+MAX_CONCURRENCY = int(os.environ.get("EMBED_MAX_CONCURRENCY", "8"))
+BATCH_WINDOW_MS = int(os.environ.get("EMBED_BATCH_WINDOW_MS", "20"))
+MAX_BATCH = int(os.environ.get("EMBED_MAX_BATCH", "32"))
+MAX_RETRIES = int(os.environ.get("EMBED_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.environ.get("EMBED_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = float(os.environ.get("EMBED_BACKOFF_MAX", "30.0"))
+
+
+def _is_retryable(e: Exception) -> bool:
+    try:
+        from google.api_core import exceptions as gexc
+        if isinstance(e, (gexc.ResourceExhausted, gexc.TooManyRequests, gexc.ServiceUnavailable)):
+            return True
+    except ImportError:
+        pass
+    msg = str(e)
+    return "429" in msg or "RESOURCE_EXHAUSTED" in msg or "503" in msg or "UNAVAILABLE" in msg
+
+
+class _EmbedRequest:
+    __slots__ = ("key", "text", "image_bytes", "future")
+
+    def __init__(self, text: Optional[str], image_bytes: Optional[bytes]):
+        self.text = text
+        self.image_bytes = image_bytes
+        h = hashlib.sha256()
+        h.update((text or "").encode("utf-8"))
+        h.update(b"\x00")
+        h.update(image_bytes or b"")
+        self.key = h.hexdigest()
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+
+
+class EmbeddingService:
+    """
+    Process-wide multimodal embedding service.
+
+    - Initializes Vertex AI and loads the model handle once.
+    - A dispatcher thread drains a request queue in short windows, coalescing
+      identical concurrent requests (same text + image) into one model call.
+    - Model calls run on a bounded pool (EMBED_MAX_CONCURRENCY) with jittered
+      exponential backoff on 429 / 503.
+    multimodalembedding@001 accepts a single instance per predict call, so a
+    "batch" is fanned out over the pool rather than sent as one request.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY):
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._queue: "queue.Queue[_EmbedRequest]" = queue.Queue()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="embed"
+        )
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "coalesced": 0, "model_calls": 0, "retries": 0, "errors": 0}
+
+        t = threading.Thread(target=self._dispatch_loop, name="embed-dispatcher", daemon=True)
+        t.start()
+
+    @classmethod
+    def get_instance(cls) -> "EmbeddingService":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = EmbeddingService()
+        return cls._instance
+
+    # --- Public API ---
+
+    def embed(self, text: str = None, image_bytes: bytes = None, timeout: Optional[float] = None) -> Optional[List[float]]:
+        """Blocking embed. Returns the image embedding when an image is given, else the text embedding."""
+        return self.submit(text=text, image_bytes=image_bytes).result(timeout=timeout)
+
+    async def embed_async(self, text: str = None, image_bytes: bytes = None) -> Optional[List[float]]:
+        return await asyncio.wrap_future(self.submit(text=text, image_bytes=image_bytes))
+
+    def submit(self, text: str = None, image_bytes: bytes = None) -> concurrent.futures.Future:
+        if text and len(text) > TEXT_LIMIT:
+            text = text[:TEXT_LIMIT]
+        req = _EmbedRequest(text, image_bytes)
+        if not text and not image_bytes:
+            req.future.set_result(None)
+            return req.future
+        self._bump("requests")
+        self._queue.put(req)
+        return req.future
+
+    # --- Internals ---
+
+    def _bump(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _get_model(self):
+        if self._model is not None:
+            return self._model
+        with self._model_lock:
+            if self._model is None:
+                import vertexai
+                from vertexai.vision_models import MultiModalEmbeddingModel
+
+                vertexai.init(project=PROJECT_ID, location=LOCATION)
+                self._model = MultiModalEmbeddingModel.from_pretrained(MULTIMODAL_EMBEDDING_MODEL)
+                trace(f"EmbeddingService: loaded {MULTIMODAL_EMBEDDING_MODEL}")
+        return self._model
+
+    def _dispatch_loop(self):
+        while True:
+            try:
+                self._dispatch_once()
+            except Exception as e:
+                print(f"EmbeddingService dispatcher error: {e}")
+
+    def _dispatch_once(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = time.monotonic() + BATCH_WINDOW_MS / 1000.0
+        while len(batch) < MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        groups: Dict[str, List[_EmbedRequest]] = {}
+        for req in batch:
+            groups.setdefault(req.key, []).append(req)
+        if len(groups) < len(batch):
+            self._bump("coalesced", len(batch) - len(groups))
+
+        for reqs in groups.values():
+            self._executor.submit(self._run_group, reqs)
+
+    def _run_group(self, reqs: List[_EmbedRequest]):
+        head = reqs[0]
+        try:
+            result = self._call_with_retry(head.text, head.image_bytes)
+        except Exception as e:
+            self._bump("errors")
+            print(f"Embedding error (Vertex AI SDK): {e}")
+            result = None
+        for req in reqs:
+            if not req.future.done():
+                req.future.set_result(result)
+
+    def _call_with_retry(self, text: Optional[str], image_bytes: Optional[bytes]):
+        attempt = 0
+        while True:
+            try:
+                self._bump("model_calls")
+                return self._call_model(text, image_bytes)
+            except Exception as e:
+                if attempt >= MAX_RETRIES or not _is_retryable(e):
+                    raise
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+                delay = delay / 2 + random.uniform(0, delay / 2)
+                attempt += 1
+                self._bump("retries")
+                trace(f"Embedding rate limited ({e}). Retry {attempt}/{MAX_RETRIES} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _call_model(self, text: Optional[str], image_bytes: Optional[bytes]):
+        from vertexai.vision_models import Image
+
+        model = self._get_model()
+        if image_bytes:
+            image = Image(image_bytes)
+            if text:
+                embeddings = model.get_embeddings(image=image, contextual_text=text)
+            else:
+                embeddings = model.get_embeddings(image=image)
+            return embeddings.image_embedding if embeddings else None
+
+        embeddings = model.get_embeddings(contextual_text=text)
+        return embeddings.text_embedding if embeddings else None
+
+
+def get_embedding_service() -> EmbeddingService:
+    return EmbeddingService.get_instance()
@@ -0,0 +1,404 @@
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from services.rate_limit import TokenBucket
+
+DEFAULT_CONCURRENCY = int(os.environ.get("GEMINI_DEFAULT_CONCURRENCY", "8"))
+DEFAULT_RPM = float(os.environ.get("GEMINI_DEFAULT_RPM", "120"))
+MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = float(os.environ.get("GEMINI_BACKOFF_BASE_SECONDS", "1"))
+BACKOFF_MAX_SECONDS = float(os.environ.get("GEMINI_BACKOFF_MAX_SECONDS", "30"))
+# Per-model overrides, e.g. {"gemini-2.5-flash-lite": {"rpm": 300, "concurrency": 16}}
+MODEL_LIMITS = json.loads(os.environ.get("GEMINI_LIMITS", "{}") or "{}")
+
+RETRYABLE_CODES = (429, 503)
+RETRYABLE_STATUSES = ("RESOURCE_EXHAUSTED", "UNAVAILABLE")
+
+# Absolute time.monotonic() by which the current request must be done (None = no deadline)
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("gemini_deadline", default=None)
+
+
+class GeminiDeadlineExceeded(TimeoutError):
+    pass
+
+
+@contextmanager
+def gemini_deadline(seconds: Optional[float]):
+    """
+    Bounds every gateway call made inside the block (including nested helpers and
+    tasks started from it) to one shared time budget. Nested scopes can only shorten it.
+    """
+    if seconds is None:
+        yield
+        return
+    current = _deadline.get()
+    deadline = time.monotonic() + seconds
+    token = _deadline.set(min(deadline, current) if current is not None else deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def _remaining() -> Optional[float]:
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def _status_code(e: Exception) -> Optional[int]:
+    code = getattr(e, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(e: Exception) -> bool:
+    if _status_code(e) in RETRYABLE_CODES:
+        return True
+    msg = str(e)
+    return any(str(c) in msg for c in RETRYABLE_CODES) or any(s in msg for s in RETRYABLE_STATUSES)
+
+
+def _backoff(attempt: int) -> float:
+    # Equal jitter: at least half the exponential step, so retries from a burst spread out
+    step = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt))
+    return step / 2 + random.uniform(0, step / 2)
+
+
+class _Slots:
+    """
+    Counting semaphore shared by threads and any number of event loops (FIFO hand-off).
+    The analysis engine, the server loop and ingestion threads all draw from the same per-model limit.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.in_use = 0
+        self._lock = threading.Lock()
+        self._waiters = deque()
+
+    def _enter(self, notify: Callable[[], None]):
+        """Takes a slot (None) or queues a waiter (returned) that notify() wakes once it owns one."""
+        with self._lock:
+            if self.in_use < self.limit and not self._waiters:
+                self.in_use += 1
+                return None
+            waiter = {"notify": notify, "granted": False}
+            self._waiters.append(waiter)
+            return waiter
+
+    def _abandon(self, waiter) -> None:
+        with self._lock:
+            granted = waiter["granted"]
+            if not granted:
+                self._waiters.remove(waiter)
+        if granted:
+            self.release()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        event = threading.Event()
+        waiter = self._enter(event.set)
+        if waiter is None:
+            return True
+        if event.wait(timeout):
+            return True
+        self._abandon(waiter)
+        return False
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enter(wake)
+        if waiter is None:
+            return True
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            return False
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+    def set_limit(self, limit: int):
+        """Changes the limit in place. Held slots stay valid; a raised limit admits queued waiters now."""
+        with self._lock:
+            self.limit = max(1, limit)
+            while self._waiters and self.in_use < self.limit:
+                waiter = self._waiters.popleft()
+                waiter["granted"] = True
+                try:
+                    waiter["notify"]()
+                    self.in_use += 1
+                except RuntimeError:
+                    continue # its event loop is gone
+
+    def release(self):
+        with self._lock:
+            while self._waiters and self.in_use <= self.limit:
+                # The slot passes straight to the next waiter; in_use stays the same
+                waiter = self._waiters.popleft()
+                waiter["granted"] = True
+                try:
+                    waiter["notify"]()
+                    return
+                except RuntimeError:
+                    continue # its event loop is gone
+            self.in_use -= 1
+
+
+class _ModelStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.deadline_exceeded = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.total_tokens = 0
+        self.cached_tokens = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.queue_wait_total = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "deadline_exceeded": self.deadline_exceeded,
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "total_tokens": self.total_tokens,
+            "cached_tokens": self.cached_tokens,
+            "avg_latency_seconds": round(self.latency_total / self.calls, 3) if self.calls else None,
+            "max_latency_seconds": round(self.latency_max, 3),
+            "avg_queue_wait_seconds": round(self.queue_wait_total / self.calls, 3) if self.calls else None,
+        }
+
+
+class _ModelLimiter:
+    def __init__(self, rpm: float, concurrency: int):
+        self.bucket = TokenBucket.per_minute(rpm)
+        self.slots = _Slots(concurrency)
+        self.stats = _ModelStats()
+
+    def set_limits(self, rpm: float, concurrency: int):
+        per_minute = TokenBucket.per_minute(rpm)
+        self.bucket.set_rate(per_minute.rate, per_minute.capacity)
+        self.slots.set_limit(concurrency)
+
+
+class GeminiGateway:
+    """
+    Single entry point for Gemini generate/embed calls.
+
+    Each model gets a concurrency limit (shared by threads and event loops)
+    and a requests-per-minute token bucket, so bursts such as DAB ingestion or
+    batch slide analysis queue up instead of failing with RESOURCE_EXHAUSTED.
+    429/503 answers are retried with jittered exponential backoff, with the slot
+    released while backing off. A deadline (timeout=, or gemini_deadline() around
+    the request) bounds queueing, backoff and, for async calls, the call itself;
+    when it runs out GeminiDeadlineExceeded is raised. Latency and token usage
+    are accounted per model (metrics()).
+
+    Limits: GEMINI_DEFAULT_RPM / GEMINI_DEFAULT_CONCURRENCY, per model via GEMINI_LIMITS.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._limiters: Dict[str, _ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> "GeminiGateway":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = GeminiGateway()
+        return cls._instance
+
+    def configure(self, model: str, rpm: Optional[float] = None, concurrency: Optional[int] = None):
+        """
+        Sets a model's limits from code (GEMINI_LIMITS still wins). Safe after the model is in use:
+        the existing limiter is updated in place, so in-flight slots and stats carry over.
+        """
+        limits = MODEL_LIMITS.get(model, {})
+        rpm = limits.get("rpm", rpm if rpm is not None else DEFAULT_RPM)
+        concurrency = limits.get("concurrency", concurrency if concurrency is not None else DEFAULT_CONCURRENCY)
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                self._limiters[model] = _ModelLimiter(rpm, concurrency)
+                return
+        limiter.set_limits(rpm, concurrency)
+
+    def _limiter(self, model: str) -> _ModelLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.get(model)
+                if limiter is None:
+                    limits = MODEL_LIMITS.get(model, {})
+                    limiter = _ModelLimiter(limits.get("rpm", DEFAULT_RPM), limits.get("concurrency", DEFAULT_CONCURRENCY))
+                    self._limiters[model] = limiter
+        return limiter
+
+    # --- Public API ---
+
+    def generate(self, model: str, contents, config=None, client=None, timeout: Optional[float] = None):
+        """client.models.generate_content through the model's limits (blocking)."""
+        client = client or _default_client()
+        return self._call(model, lambda: client.models.generate_content(model=model, contents=contents, config=config), timeout)
+
+    async def generate_async(self, model: str, contents, config=None, client=None, timeout: Optional[float] = None):
+        """client.aio.models.generate_content through the model's limits."""
+        client = client or _default_client()
+        return await self._call_async(model, lambda: client.aio.models.generate_content(model=model, contents=contents, config=config), timeout)
+
+    def embed(self, model: str, contents, config=None, client=None, timeout: Optional[float] = None):
+        client = client or _default_client()
+        return self._call(model, lambda: client.models.embed_content(model=model, contents=contents, config=config), timeout)
+
+    async def embed_async(self, model: str, contents, config=None, client=None, timeout: Optional[float] = None):
+        client = client or _default_client()
+        return await self._call_async(model, lambda: client.aio.models.embed_content(model=model, contents=contents, config=config), timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            model: {
+                **limiter.stats.as_dict(),
+                "in_flight": limiter.slots.in_use,
+                "queued": len(limiter.slots._waiters),
+                "concurrency": limiter.slots.limit,
+                "rpm": round(limiter.bucket.rate * 60, 1),
+            }
+            for model, limiter in list(self._limiters.items())
+        }
+
+    # --- Internals ---
+
+    def _call(self, model: str, fn: Callable[[], Any], timeout: Optional[float]):
+        limiter = self._limiter(model)
+        with gemini_deadline(timeout):
+            for attempt in range(MAX_RETRIES + 1):
+                queued_at = time.monotonic()
+                self._check(limiter, model)
+                if not limiter.bucket.acquire(timeout=_remaining()):
+                    self._expired(limiter, model)
+                if not limiter.slots.acquire(timeout=_remaining()):
+                    self._expired(limiter, model)
+                started = time.monotonic()
+                try:
+                    response = fn()
+                    self._record(limiter, response, started, queued_at)
+                    return response
+                except Exception as e:
+                    if not self._should_retry(limiter, model, e, attempt):
+                        raise
+                finally:
+                    limiter.slots.release()
+                time.sleep(self._retry_delay(limiter, model, attempt))
+
+    async def _call_async(self, model: str, fn: Callable[[], Any], timeout: Optional[float]):
+        limiter = self._limiter(model)
+        with gemini_deadline(timeout):
+            for attempt in range(MAX_RETRIES + 1):
+                queued_at = time.monotonic()
+                self._check(limiter, model)
+                if not await limiter.bucket.acquire_async(timeout=_remaining()):
+                    self._expired(limiter, model)
+                if not await limiter.slots.acquire_async(timeout=_remaining()):
+                    self._expired(limiter, model)
+                started = time.monotonic()
+                try:
+                    remaining = _remaining()
+                    response = await (asyncio.wait_for(fn(), remaining) if remaining is not None else fn())
+                    self._record(limiter, response, started, queued_at)
+                    return response
+                except asyncio.TimeoutError:
+                    self._expired(limiter, model)
+                except Exception as e:
+                    if not self._should_retry(limiter, model, e, attempt):
+                        raise
+                finally:
+                    limiter.slots.release()
+                await asyncio.sleep(self._retry_delay(limiter, model, attempt))
+
+    def _check(self, limiter: _ModelLimiter, model: str):
+        remaining = _remaining()
+        if remaining is not None and remaining <= 0:
+            self._expired(limiter, model)
+
+    def _expired(self, limiter: _ModelLimiter, model: str):
+        limiter.stats.deadline_exceeded += 1
+        raise GeminiDeadlineExceeded(f"Deadline exceeded waiting for {model}")
+
+    def _should_retry(self, limiter: _ModelLimiter, model: str, e: Exception, attempt: int) -> bool:
+        if attempt < MAX_RETRIES and is_retryable(e):
+            limiter.stats.retries += 1
+            return True
+        limiter.stats.errors += 1
+        return False
+
+    def _retry_delay(self, limiter: _ModelLimiter, model: str, attempt: int) -> float:
+        delay = _backoff(attempt)
+        remaining = _remaining()
+        if remaining is not None and delay >= remaining:
+            self._expired(limiter, model)
+        print(f"GeminiGateway: {model} busy (attempt {attempt + 1}/{MAX_RETRIES + 1}). Retrying in {delay:.1f}s")
+        return delay
+
+    def _record(self, limiter: _ModelLimiter, response, started: float, queued_at: float):
+        now = time.monotonic()
+        stats = limiter.stats
+        stats.calls += 1
+        latency = now - started
+        stats.latency_total += latency
+        stats.latency_max = max(stats.latency_max, latency)
+        stats.queue_wait_total += started - queued_at
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            stats.prompt_tokens += getattr(usage, "prompt_token_count", None) or 0
+            stats.output_tokens += getattr(usage, "candidates_token_count", None) or 0
+            stats.total_tokens += getattr(usage, "total_token_count", None) or 0
+            stats.cached_tokens += getattr(usage, "cached_content_token_count", None) or 0
+
+
+def _default_client():
+    from services.ai_shared import get_genai_client
+    client = get_genai_client()
+    if client is None:
+        raise RuntimeError("GenAI client unavailable")
+    return client
+
+
+def get_gemini_gateway() -> GeminiGateway:
+    return GeminiGateway.get_instance()
+
+
+def gemini_generate(model: str, contents, config=None, client=None, timeout: Optional[float] = None):
+    return get_gemini_gateway().generate(model, contents, config=config, client=client, timeout=timeout)
+
+
+async def gemini_generate_async(model: str, contents, config=None, client=None, timeout: Optional[float] = None):
+    return await get_gemini_gateway().generate_async(model, contents, config=config, client=client, timeout=timeout)
+
+
+async def gemini_embed_async(model: str, contents, config=None, client=None, timeout: Optional[float] = None):
+    return await get_gemini_gateway().embed_async(model, contents, config=config, client=client, timeout=timeout)
@@ -1,418 +1,525 @@
-import io
 import os
 import gc
 import tempfile
 import datetime
-import concurrent.futures
-from pdf2image import convert_from_path, pdfinfo_from_path
+import threading
+from typing import List, Dict, Any
+from pdf2image import pdfinfo_from_path
 from google.cloud import firestore
 
 
 from services.ai_shared import (
     get_firestore_client,
     get_storage_client,
-    get_embedding,
     trace,
     GCS_BUCKET_NAME,
     BATCH_COLLECTION_NAME,
     RESULT_COLLECTION_NAME,
-    RESULT_COLLECTION_NAME,
     FIRESTORE_COLLECTION_NAME,
     Vector
 )
-from services.ai_analysis import (
-    analyze_slide_structure,
-    evaluate_document_quality
-)
+from services.ai_analysis import evaluate_document_quality
+from services.slide_cache import analyze_slides_cached, embed_slide_cached
+from services.pipeline import Stage, StagedPipeline
+from services.bulk_writer import BufferedWriter
+from services.ingestion_control import BatchControl, prefetch_file_statuses
+from services.work_queue import WorkQueue
+from services.page_render_cache import PageRenderCache, RENDER_DPI, THUMBNAIL_DPI, EVAL_DPI
+from services.vector_index import note_slide_written
 
 # Cloud Run Jobs Environment Variables
 TASK_INDEX = int(os.environ.get("CLOUD_RUN_TASK_INDEX", "0"))
 TASK_COUNT = int(os.environ.get("CLOUD_RUN_TASK_COUNT", "1"))
 
+# Pipeline tuning (per Cloud Run Job task)
+DOWNLOAD_WORKERS = int(os.environ.get("INGEST_DOWNLOAD_WORKERS", "2"))
+RASTERIZE_WORKERS = int(os.environ.get("INGEST_RASTERIZE_WORKERS", "2"))
+ANALYZE_WORKERS = int(os.environ.get("INGEST_ANALYZE_WORKERS", "3"))
+EMBED_WORKERS = int(os.environ.get("INGEST_EMBED_WORKERS", "4"))
+WRITE_WORKERS = int(os.environ.get("INGEST_WRITE_WORKERS", "2"))
+QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "4"))
+# Files this task may hold leases on at once (in the pipeline); the rest stay claimable by other tasks
+MAX_LEASED_FILES = int(os.environ.get("INGEST_MAX_LEASED_FILES", str(ANALYZE_WORKERS + 1)))
+
+BATCH_SIZE = 10 # Pages per Gemini batch analysis call
+MAX_PAGES = 150
+QUALITY_EVAL_PAGES = 7
+
+
+def safe_name(name: str) -> str:
+    return "".join(c for c in name if c.isalnum() or c in "._-")
+
+
+class FileJob:
+    """Tracks one PDF while its pages are spread across pipeline stages."""
+
+    def __init__(self, blob, res_doc_ref, summary_ref):
+        self.blob = blob
+        self.safe_filename = safe_name(blob.name)
+        self.res_doc_ref = res_doc_ref
+        self.summary_ref = summary_ref
+        self.tmp_pdf_path = None
+        self.pages = None # PageRenderCache, alive between gating and the last rendered chunk
+        self.total_pages = 0
+        self.pages_success = 0
+        self.should_process = True
+        self.error = None
+
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self._rasterized = False
+        self._finalized = False
+
+    def add_pages(self, n: int):
+        with self._lock:
+            self._outstanding += n
+
+    def page_done(self, success: bool) -> bool:
+        """Marks a page as settled. Returns True if the file is now complete."""
+        with self._lock:
+            self._outstanding -= 1
+            if success:
+                self.pages_success += 1
+            return self._claim_finalize()
+
+    def rasterize_done(self) -> bool:
+        """Marks that no more pages will be emitted. Returns True if the file is now complete."""
+        with self._lock:
+            self._rasterized = True
+            return self._claim_finalize()
+
+    def _claim_finalize(self) -> bool:
+        if self._rasterized and self._outstanding <= 0 and not self._finalized:
+            self._finalized = True
+            return True
+        return False
+
+
+class PageChunk:
+    """A group of rendered pages sent to Gemini in one batch call."""
+
+    def __init__(self, job: FileJob, start_page: int, images_bytes: List[bytes]):
+        self.job = job
+        self.start_page = start_page
+        self.images_bytes = images_bytes
+        self.handed_off = 0
+
+
+class PageItem:
+    def __init__(self, job: FileJob, page_num: int, image_bytes: bytes, analysis: Dict[str, Any]):
+        self.job = job
+        self.page_num = page_num
+        self.image_bytes = image_bytes
+        self.analysis = analysis
+        self.embedding = None
+
+
+class BatchIngestionRun:
+    """
+    Staged ingestion pipeline for one batch shard:
+    download -> rasterize -> Gemini analysis -> embedding -> Firestore write.
+    Bounded queues between stages let GCS I/O, poppler rendering and model
+    calls of different files overlap.
+    """
+
+    def __init__(self, batch_id: str, db, writer: BufferedWriter, work_queue: WorkQueue = None):
+        self.batch_id = batch_id
+        self.db = db
+        self.writer = writer
+        self.work_queue = work_queue
+        self.batch_ref = db.collection(BATCH_COLLECTION_NAME).document(batch_id)
+        self.results_ref = db.collection(RESULT_COLLECTION_NAME)
+        self.summary_collection = db.collection("ingestion_file_summaries")
+        self.main_collection = db.collection(FIRESTORE_COLLECTION_NAME)
+
+        # Cancellation is pushed by a snapshot listener instead of a read per file
+        self.control = BatchControl(self.batch_ref, on_cancel=self._mark_cancelled)
+
+        self.pipeline = StagedPipeline([
+            Stage("download", self._download_stage, DOWNLOAD_WORKERS, QUEUE_SIZE, self._on_file_error),
+            Stage("rasterize", self._rasterize_stage, RASTERIZE_WORKERS, QUEUE_SIZE, self._on_rasterize_error),
+            Stage("analyze", self._analyze_stage, ANALYZE_WORKERS, QUEUE_SIZE, self._on_chunk_error),
+            Stage("embed", self._embed_stage, EMBED_WORKERS, QUEUE_SIZE * BATCH_SIZE, self._on_page_error),
+            Stage("write", self._write_stage, WRITE_WORKERS, QUEUE_SIZE * BATCH_SIZE, self._on_page_error),
+        ], name=f"ingest-{batch_id[:8]}")
+
+    def run(self, blobs):
+        """Processes `blobs` (any iterable; a WorkQueue claim generator is consumed lazily)."""
+        with self.control:
+            self.pipeline.run(blobs)
+
+    @property
+    def cancelled(self) -> bool:
+        return self.control.cancelled
+
+    # --- Stage 1: Download ---
+
+    def _download_stage(self, blob, emit):
+        if self.cancelled:
+            return
+
+        safe_filename = safe_name(blob.name)
+        summary_ref = self.summary_collection.document(safe_filename)
+
+        trace(f"Processing file: {blob.name}")
+        res_doc_ref = self.results_ref.document(f"{self.batch_id}_{safe_filename}")
+        job = FileJob(blob, res_doc_ref, summary_ref)
+
+        init_data = {"status": "processing", "updated_at": firestore.SERVER_TIMESTAMP, "batch_id": self.batch_id, "filename": blob.name}
+        self._write_file_status(job, init_data)
+
+        try:
+            trace(f"Downloading {blob.name}...")
+            # Stream straight to disk instead of holding the whole PDF in memory
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp_pdf:
+                job.tmp_pdf_path = tmp_pdf.name
+            blob.download_to_filename(job.tmp_pdf_path)
+        except Exception as e:
+            self._cleanup_tmp(job)
+            job.error = str(e)
+            if job.rasterize_done():
+                self._finalize(job)
+            return
+
+        emit(job)
+
+    def _mark_cancelled(self):
+        # Called once from the BatchControl listener thread
+        trace(f"Batch {self.batch_id} cancelled by user.")
+        self.pipeline.stop()
+        # Flush-on-cancel: persist everything buffered so far before marking the batch
+        self.writer.flush()
+        self.batch_ref.update({"status": "cancelled", "completed_at": firestore.SERVER_TIMESTAMP})
+
+    # --- Stage 2: Rasterize (+ cheap gating checks) ---
+
+    def _rasterize_stage(self, job: FileJob, emit):
+        try:
+            self._gate_file(job)
+
+            if job.should_process:
+                trace(f"Total pages estimated: {job.total_pages}. Processing in chunks...")
+                for start_page in range(1, job.total_pages + 1, BATCH_SIZE):
+                    if self.cancelled:
+                        job.error = "Cancelled"
+                        break
+                    end_page = min(start_page + BATCH_SIZE - 1, job.total_pages)
+                    trace(f"Rendering pages {start_page}-{end_page} of {job.blob.name}...")
+                    try:
+                        batch_images_bytes = job.pages.get_pages(start_page, end_page, RENDER_DPI)
+                        if not batch_images_bytes:
+                            break
+                    except Exception as chunk_err:
+                        print(f"ERROR rendering batch {start_page}-{end_page}: {chunk_err}")
+                        continue
+
+                    job.add_pages(len(batch_images_bytes))
+                    emit(PageChunk(job, start_page, batch_images_bytes))
+        finally:
+            if job.pages:
+                trace(f"Render cache for {job.blob.name}: {job.pages.renders} renders, {job.pages.hits} reused pages.")
+                job.pages.close()
+                job.pages = None
+            self._cleanup_tmp(job)
+            gc.collect()
+
+        if job.rasterize_done():
+            self._finalize(job)
+
+    def _gate_file(self, job: FileJob):
+        """Page count, orientation and AI quality checks. Clears job.should_process on skip."""
+        blob = job.blob
+        try:
+            info = pdfinfo_from_path(job.tmp_pdf_path)
+            job.total_pages = info["Pages"]
+        except Exception:
+            print("WARNING: Could not get PDF info, defaulting to chunked read until empty.")
+            job.total_pages = 9999
+
+        # Every page is rendered once per DPI and shared by the checks below and slide analysis
+        page_key = f"{job.safe_filename}_{getattr(blob, 'generation', None) or 0}"
+        job.pages = PageRenderCache(job.tmp_pdf_path, page_key, total_pages=job.total_pages)
+
+        # ASPECT RATIO CHECK (Portrait vs Landscape) on the cheap thumbnail path
+        try:
+            size = job.pages.get_page_size(1, THUMBNAIL_DPI)
+            if size:
+                w, h = size
+                if h > w:
+                    trace(f"Detected Portrait orientation ({w}x{h}). Skipping {blob.name} (likely report).")
+                    self._write_file_status(job, {
+                        "status": "skipped",
+                        "error": "Skipped: Portrait orientation (likely report/document)",
+                        "filter_reason": "Portrait orientation",
+                        "updated_at": firestore.SERVER_TIMESTAMP
+                    })
+                    job.should_process = False
+                else:
+                    trace(f"Detected Landscape orientation ({w}x{h}). Processing...")
+        except Exception as e:
+            print(f"WARNING: Could not check aspect ratio for {blob.name}: {e}. Proceeding.")
+
+        # PAGE COUNT CHECK
+        if job.should_process and job.total_pages > MAX_PAGES:
+            trace(f"Skipping {blob.name} due to page count {job.total_pages} > {MAX_PAGES}.")
+            self._write_file_status(job, {
+                "status": "skipped",
+                "error": f"Skipped: Page count {job.total_pages} > {MAX_PAGES}",
+                "filter_reason": f"Page count {job.total_pages} > {MAX_PAGES}",
+                "page_count": job.total_pages,
+                "updated_at": firestore.SERVER_TIMESTAMP
+            })
+            job.should_process = False
+
+        # AI QUALITY CHECK (Major Firm / Design)
+        if job.should_process:
+            try:
+                eval_pages_num = min(job.total_pages, QUALITY_EVAL_PAGES)
+                trace(f"Analyzing first {eval_pages_num} pages for Quality Evaluation...")
+
+                eval_images_bytes = job.pages.get_pages(1, eval_pages_num, EVAL_DPI)
+
+                if eval_images_bytes:
+                    decision_data = evaluate_document_quality(eval_images_bytes)
+                    trace(f"Quality Evaluation Result: {decision_data}")
+
+                    update_data = {
+                        "firm_name": decision_data.get("firm_name"),
+                        "design_rating": decision_data.get("design_rating"),
+                        "filter_reason": decision_data.get("reason"),
+                        "page_count": job.total_pages,
+                        "updated_at": firestore.SERVER_TIMESTAMP
+                    }
+
+                    if decision_data.get("decision") == "SKIP":
+                        update_data["status"] = "skipped"
+                        update_data["error"] = f"Skipped: {decision_data.get('reason')}"
+                        job.should_process = False
+                        trace(f"AI decided to SKIP {blob.name}.")
+                    else:
+                        trace(f"AI decided to ACCEPT {blob.name}.")
+
+                    self._write_file_status(job, update_data)
+
+            except Exception as eval_e:
+                print(f"WARNING: Quality Evaluation Failed for {blob.name}: {eval_e}. Proceeding.")
+
+    # --- Stage 3: Gemini analysis ---
+
+    def _analyze_stage(self, chunk: PageChunk, emit):
+        if self.cancelled:
+            chunk.job.error = "Cancelled"
+            self._on_chunk_error(chunk, None)
+            return
+
+        end_page = chunk.start_page + len(chunk.images_bytes) - 1
+        trace(f"Calling Gemini Batch API for {chunk.job.blob.name} pages {chunk.start_page}-{end_page}...")
+        batch_results = analyze_slides_cached(chunk.images_bytes)
+
+        for i, result in enumerate(batch_results):
+            page_num = chunk.start_page + i
+            chunk.handed_off += 1
+            if result.get("structure_type") == "Error":
+                print(f"Error analyzing page {page_num}: {result.get('key_message')}")
+                self._settle_page(chunk.job, False)
+                continue
+            emit(PageItem(chunk.job, page_num, chunk.images_bytes[i], result))
+
+    # --- Stage 4: Embedding ---
+
+    def _embed_stage(self, page: PageItem, emit):
+        if self.cancelled:
+            page.job.error = "Cancelled"
+            self._settle_page(page.job, False)
+            return
+
+        result = page.analysis
+        text_context = f"{result.get('structure_type', '')}. {result.get('key_message', '')}. {result.get('description', '')}"
+        if text_context and len(text_context) > 400:
+            text_context = text_context[:400]
+
+        emb = embed_slide_cached(page.image_bytes, text_context)
+        if not emb:
+            print(f"WARNING: Embedding generation failed for page {page.page_num}")
+            self._settle_page(page.job, False)
+            return
+
+        page.embedding = emb
+        page.image_bytes = None # Not needed downstream
+        emit(page)
+
+    # --- Stage 5: Firestore write ---
+
+    def _write_stage(self, page: PageItem, emit):
+        job = page.job
+        result = page.analysis
+        doc_id = f"{job.safe_filename}_p{page.page_num}"
+        doc_data = {
+            "uri": f"gs://{GCS_BUCKET_NAME}/{job.blob.name}",
+            "filename": job.blob.name,
+            "page_number": page.page_num,
+            "structure_type": result.get("structure_type"),
+            "key_message": result.get("key_message"),
+            "description": result.get("description"),
+            "embedding": Vector(page.embedding),
+            "created_at": firestore.SERVER_TIMESTAMP
+        }
+        self.writer.set(self.main_collection.document(doc_id), doc_data)
+        note_slide_written(doc_id, doc_data, page.embedding)
+        trace(f"Page {page.page_num} of {job.blob.name} saved.")
+        self._settle_page(job, True)
+
+    # --- Error hooks ---
+
+    def _on_file_error(self, blob, exc: Exception):
+        print(f"ERROR processing file {blob.name}: {exc}")
+        if self.work_queue:
+            self.work_queue.complete(blob.name, "failed", writer=self.writer)
+
+    def _on_rasterize_error(self, job: FileJob, exc: Exception):
+        print(f"ERROR processing file {job.blob.name}: {exc}")
+        job.error = str(exc)
+        if job.rasterize_done():
+            self._finalize(job)
+
+    def _on_chunk_error(self, chunk: PageChunk, exc: Exception):
+        if exc is not None:
+            print(f"ERROR processing batch starting at page {chunk.start_page}: {exc}")
+        for _ in range(len(chunk.images_bytes) - chunk.handed_off):
+            self._settle_page(chunk.job, False)
+
+    def _on_page_error(self, page: PageItem, exc: Exception):
+        print(f"Error saving page {page.page_num}: {exc}")
+        self._settle_page(page.job, False)
+
+    # --- Bookkeeping ---
+
+    def _settle_page(self, job: FileJob, success: bool):
+        if job.page_done(success):
+            self._finalize(job)
+
+    def _finalize(self, job: FileJob):
+        """Writes the final file status and bumps batch counters once per file."""
+        success = False
+        try:
+            if job.error:
+                self._write_file_status(job, {
+                    "status": "failed",
+                    "error": job.error,
+                    "updated_at": firestore.SERVER_TIMESTAMP
+                })
+            elif job.should_process:
+                if job.pages_success > 0:
+                    self._write_file_status(job, {
+                        "status": "success",
+                        "pages_processed": job.pages_success,
+                        "updated_at": firestore.SERVER_TIMESTAMP
+                    })
+                    success = True
+                else:
+                    self._write_file_status(job, {
+                        "status": "failed",
+                        "error": "No pages processed successfully",
+                        "updated_at": firestore.SERVER_TIMESTAMP
+                    })
+        except Exception as e:
+            print(f"ERROR finalizing file {job.blob.name}: {e}")
+
+        if job.error == "Cancelled":
+            # Not processed: its lease goes back to the queue (release_all), so it must not count as failed
+            return
+
+        # Atomic Increment for Batch Counters (merged per flush by the writer)
+        self.writer.increment(self.batch_ref, "processed_files", 1)
+        self.writer.increment(self.batch_ref, "success_files" if success else "failed_files", 1)
+
+        if self.work_queue:
+            outcome = "success" if success else ("skipped" if not job.should_process and not job.error else "failed")
+            self.work_queue.complete(job.blob.name, outcome, writer=self.writer)
+
+    def _write_file_status(self, job: FileJob, data: Dict[str, Any]):
+        self.writer.update(job.res_doc_ref, data)
+        self.writer.set(job.summary_ref, data, merge=True)
+
+    @staticmethod
+    def _cleanup_tmp(job: FileJob):
+        if job.tmp_pdf_path and os.path.exists(job.tmp_pdf_path):
+            os.remove(job.tmp_pdf_path)
+        job.tmp_pdf_path = None
+
+
 def run_batch_ingestion(batch_id: str):
     """
     Main entry point for batch ingestion worker.
     Can be run from Cloud Run Job or local thread.
+
+    Task 0 discovers the PDFs and seeds a lease-based work queue; every task
+    (including task 0) then claims files one at a time until the queue is
+    drained, and the last task to finish marks the batch `completed`.
     """
     trace(f"Starting batch ingest {batch_id}")
     db = get_firestore_client()
     batch_ref = db.collection(BATCH_COLLECTION_NAME).document(batch_id)
     results_ref = db.collection(RESULT_COLLECTION_NAME)
-    
+    summary_collection = db.collection("ingestion_file_summaries")
+
     try:
-        # 1. Discovery Phase
-        batch_ref.update({"status": "discovering"})
         g_client = get_storage_client()
         bucket = g_client.bucket(GCS_BUCKET_NAME)
-        blobs = list(bucket.list_blobs(prefix="consulting_raw/"))
-        
-        # Create result entries for all proper files
-        target_blobs = []
-        all_pdf_blobs = [b for b in blobs if b.name.lower().endswith(".pdf")]
-        
-        # SHARDING LOGIC: Filter blobs for this specific task
-        my_blobs = [b for i, b in enumerate(all_pdf_blobs) if i % TASK_COUNT == TASK_INDEX]
-        
-        trace(f"Task {TASK_INDEX}/{TASK_COUNT}: Processing {len(my_blobs)} files out of {len(all_pdf_blobs)} total.")
-
-        for blob in my_blobs:
-                safe_id = "".join(c for c in blob.name if c.isalnum() or c in "._-")
-                res_id = f"{batch_id}_{safe_id}"
-                # Use set(merge=True) to avoid overwriting exist status if we are restarting same batch?
-                # Actually for new batch, we set new items.
-                results_ref.document(res_id).set({
-                    "batch_id": batch_id,
-                    "filename": blob.name,
-                    "status": "pending",
-                    "created_at": firestore.SERVER_TIMESTAMP,
-                    "updated_at": firestore.SERVER_TIMESTAMP
-                })
-                target_blobs.append(blob)
-
-        # Only update total count if we are the first task (coordinator role approximation)
-        # OR: Just update status. The total count might be set by Workflow in future, 
-        # but for now, each task will try to update it. 
-        # Race condition on total_files is acceptable or we use start-up script.
-        # Let's just have Task 0 update the status to "processing".
-        if TASK_INDEX == 0:
-            batch_ref.set({
-                "status": "processing", 
-                "total_files": len(all_pdf_blobs), # Total across all tasks
-                "started_at": firestore.SERVER_TIMESTAMP
-            }, merge=True)
-
-        # Remove local update of status here to avoid race conditions overlapping Task 0
-        pass
-
-        # 2. Processing Phase
-        main_collection = db.collection(FIRESTORE_COLLECTION_NAME)
-        processed_count = 0
-        success_count = 0
-        failed_count = 0
-
-        summary_collection = db.collection("ingestion_file_summaries")
-
-        for blob in target_blobs:
-            # Check for cancellation
-            current_batch = batch_ref.get().to_dict()
-            if current_batch.get("status") == "cancelling":
-                trace(f"Batch {batch_id} cancelled by user.")
-                batch_ref.update({"status": "cancelled", "completed_at": firestore.SERVER_TIMESTAMP})
-                break
-
-            safe_filename = "".join(c for c in blob.name if c.isalnum() or c in "._-")
-            summary_ref = summary_collection.document(safe_filename)
-            
-            # RESUME LOGIC: Check if already processed
-            try:
-                summary_doc = summary_ref.get()
-                if summary_doc.exists:
-                    s_data = summary_doc.to_dict()
-                    if s_data.get("status") in ["success", "skipped"]:
-                        trace(f"Skipping {blob.name} (Already processed: {s_data.get('status')})")
-                        continue
-            except Exception as check_e:
-                print(f"Warning: Failed to check summary for {blob.name}: {check_e}")
-
-            trace(f"Processing file: {blob.name}")
-            success_data = False # Default to False (failed or skipped)
-            res_id = f"{batch_id}_{safe_filename}"
-            res_doc_ref = results_ref.document(res_id)
-            summary_ref = summary_collection.document(safe_filename)
-            
-            init_data = {"status": "processing", "updated_at": firestore.SERVER_TIMESTAMP, "batch_id": batch_id, "filename": blob.name}
-            res_doc_ref.update(init_data)
-            summary_ref.set(init_data, merge=True)
-            
-            try:
-                trace(f"Downloading {blob.name}...")
-                pdf_bytes = blob.download_as_bytes()
-                
-                # OPTIMIZATION: Process in chunks to avoid OOM
-                with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp_pdf:
-                    tmp_pdf.write(pdf_bytes)
-                    tmp_pdf_path = tmp_pdf.name
-                
-                # Free memory immediately after writing to disk
-                del pdf_bytes
-                gc.collect()
-                
+        work_queue = WorkQueue(db, batch_id, max_outstanding=MAX_LEASED_FILES)
+        writer = BufferedWriter(db, name=f"ingest-writer-{batch_id[:8]}")
+
+        try:
+            if TASK_INDEX == 0:
+                # 1. Discovery Phase (coordinator only)
+                batch_ref.update({"status": "discovering"})
+                blobs = list(bucket.list_blobs(prefix="consulting_raw/"))
+                all_pdf_blobs = [b for b in blobs if b.name.lower().endswith(".pdf")]
+                trace(f"Task {TASK_INDEX}/{TASK_COUNT}: Discovered {len(all_pdf_blobs)} files.")
+
+                # RESUME LOGIC: one get_all for the whole batch instead of a summary read per file
                 try:
-                    # Get info first
-                    try:
-                        info = pdfinfo_from_path(tmp_pdf_path)
-                        total_pages = info["Pages"]
-                    except Exception:
-                        print("WARNING: Could not get PDF info, defaulting to chunked read until empty.")
-                        total_pages = 9999 
-
-                    # ASPECT RATIO CHECK (Portrait vs Landscape)
-                    should_process = True
-                    try:
-                        first_page_img = convert_from_path(tmp_pdf_path, first_page=1, last_page=1, fmt="jpeg")
-                        if first_page_img:
-                            w, h = first_page_img[0].size
-                            if h > w:
-                                trace(f"Detected Portrait orientation ({w}x{h}). Skipping {blob.name} (likely report).")
-                                skip_report_data = {
-                                    "status": "skipped",
-                                    "error": "Skipped: Portrait orientation (likely report/document)",
-                                    "filter_reason": "Portrait orientation",
-                                    "updated_at": firestore.SERVER_TIMESTAMP
-                                }
-                                res_doc_ref.update(skip_report_data)
-                                summary_ref.set(skip_report_data, merge=True)
-                                should_process = False
-                            else:
-                                trace(f"Detected Landscape orientation ({w}x{h}). Processing...")
-                            del first_page_img
-                    except Exception as e:
-                        print(f"WARNING: Could not check aspect ratio for {blob.name}: {e}. Proceeding.")
-
-                    # PAGE COUNT CHECK
-                    if should_process and total_pages > 150:
-                        trace(f"Skipping {blob.name} due to page count {total_pages} > 150.")
-                        skip_page_data = {
-                            "status": "skipped",
-                            "error": f"Skipped: Page count {total_pages} > 150",
-                            "filter_reason": f"Page count {total_pages} > 150",
-                            "page_count": total_pages,
-                            "updated_at": firestore.SERVER_TIMESTAMP
-                        }
-                        res_doc_ref.update(skip_page_data)
-                        summary_ref.set(skip_page_data, merge=True)
-                        should_process = False
-
-                    # AI QUALITY CHECK (Major Firm / Design)
-                    if should_process:
-                        try:
-                            eval_pages_num = min(total_pages, 7)
-                            trace(f"Analyzing first {eval_pages_num} pages for Quality Evaluation...")
-                            
-                            # Convert first few pages for analysis
-                            eval_images = convert_from_path(tmp_pdf_path, first_page=1, last_page=eval_pages_num, fmt="jpeg")
-                            
-                            eval_images_bytes = []
-                            for img in eval_images:
-                                buf = io.BytesIO()
-                                img.save(buf, format='JPEG')
-                                eval_images_bytes.append(buf.getvalue())
-                                
-                            del eval_images
-                            gc.collect()
-
-                            if eval_images_bytes:
-                                decision_data = evaluate_document_quality(eval_images_bytes)
-                                trace(f"Quality Evaluation Result: {decision_data}")
-                                
-                                update_data = {
-                                    "firm_name": decision_data.get("firm_name"),
-                                    "design_rating": decision_data.get("design_rating"),
-                                    "filter_reason": decision_data.get("reason"),
-                                    "page_count": total_pages,
-                                    "updated_at": firestore.SERVER_TIMESTAMP
-                                }
-                                
-                                if decision_data.get("decision") == "SKIP":
-                                    update_data["status"] = "skipped"
-                                    update_data["error"] = f"Skipped: {decision_data.get('reason')}"
-                                    should_process = False
-                                    trace(f"AI decided to SKIP {blob.name}.")
-                                else:
-                                    trace(f"AI decided to ACCEPT {blob.name}.")
-                                
-                                res_doc_ref.update(update_data)
-                                summary_ref.set(update_data, merge=True)
-                                
-                        except Exception as eval_e:
-                            print(f"WARNING: Quality Evaluation Failed for {blob.name}: {eval_e}. Proceeding.")
-
-
-                    if should_process:
-                        trace(f"Total pages estimated: {total_pages}. Processing in chunks...")
-                        pages_success = 0
-                        
-                        # Parallel Page Processing
-                        # Use ThreadPoolExecutor to process pages concurrently.
-                        # Limit max_workers to avoid OOM with large images.
-                        MAX_WORKERS = 5 
-                        
-                        def process_page_task(page_num, image_bytes):
-                            try:
-                                trace(f"Analyzing structure for page {page_num}...")
-                                analysis = analyze_slide_structure(image_bytes)
-                                
-                                text_context = f"{analysis.get('structure_type', '')}. {analysis.get('key_message', '')}. {analysis.get('description', '')}"
-                                
-                                if text_context and len(text_context) > 400:
-                                    text_context = text_context[:400]
-                                
-                                trace(f"Generating embedding for page {page_num}...")
-                                emb = get_embedding(image_bytes=image_bytes, text=text_context)
-                                
-                                if emb:
-                                    safe_filename = "".join(c for c in blob.name if c.isalnum() or c in "._-")
-                                    doc_id = f"{safe_filename}_p{page_num}"
-                                    
-                                    doc_data = {
-                                        "uri": f"gs://{GCS_BUCKET_NAME}/{blob.name}",
-                                        "filename": blob.name,
-                                        "page_number": page_num,
-                                        "structure_type": analysis.get("structure_type"),
-                                        "key_message": analysis.get("key_message"),
-                                        "description": analysis.get("description"),
-                                        "embedding": Vector(emb),
-                                        "created_at": firestore.SERVER_TIMESTAMP
-                                    }
-                                    main_collection.document(doc_id).set(doc_data)
-                                    return True
-                                else:
-                                    print(f"WARNING: Embedding generation failed for page {page_num}")
-                                    return False
-                            except Exception as e:
-                                print(f"ERROR in worker for page {page_num}: {e}")
-                                return False
-
-                        # Serial Batch Processing (More efficient API usage)
-                        # Load pages in chunks and send to Batch API
-                        BATCH_SIZE = 10 # Send 10 pages at once
-                        
-                        from services.ai_analysis import analyze_slide_structure_batch
-                        
-                        for start_page in range(1, total_pages + 1, BATCH_SIZE):
-                            end_page = min(start_page + BATCH_SIZE - 1, total_pages)
-                            trace(f"Processing batch: pages {start_page}-{end_page}...")
-                            
-                            try:
-                                chunk_images = convert_from_path(tmp_pdf_path, first_page=start_page, last_page=end_page, fmt="jpeg")
-                                if not chunk_images:
-                                    break
-                                
-                                # Prepare images for API
-                                batch_images_bytes = []
-                                for image in chunk_images:
-                                    img_byte_arr = io.BytesIO()
-                                    image.save(img_byte_arr, format='JPEG')
-                                    batch_images_bytes.append(img_byte_arr.getvalue())
-                                
-                                # Call Gemini Batch API
-                                trace(f"Calling Gemini Batch API for {len(batch_images_bytes)} slides...")
-                                batch_results = analyze_slide_structure_batch(batch_images_bytes)
-                                
-                                # Process results
-                                for i, result in enumerate(batch_results):
-                                    page_num = start_page + i
-                                    
-                                    # Basic Validation
-                                    if result.get("structure_type") == "Error":
-                                        print(f"Error analyzing page {page_num}: {result.get('key_message')}")
-                                        continue
-
-                                    try:
-                                        text_context = f"{result.get('structure_type', '')}. {result.get('key_message', '')}. {result.get('description', '')}"
-                                        
-                                        if text_context and len(text_context) > 400:
-                                            text_context = text_context[:400]
-                                        
-                                        # trace(f"Generating embedding for page {page_num}...") 
-                                        # Note: Embedding is still 1-by-1 because it's a different model/API (Vertex Multimodal)
-                                        # We could parallelize this part if needed, but keeping it serial for now to avoid complexity
-                                        # since the expensive part (Thinking model) is gone.
-                                        emb = get_embedding(image_bytes=batch_images_bytes[i], text=text_context)
-                                        
-                                        if emb:
-                                            safe_filename = "".join(c for c in blob.name if c.isalnum() or c in "._-")
-                                            doc_id = f"{safe_filename}_p{page_num}"
-                                            
-                                            doc_data = {
-                                                "uri": f"gs://{GCS_BUCKET_NAME}/{blob.name}",
-                                                "filename": blob.name,
-                                                "page_number": page_num,
-                                                "structure_type": result.get("structure_type"),
-                                                "key_message": result.get("key_message"),
-                                                "description": result.get("description"),
-                                                "embedding": Vector(emb),
-                                                "created_at": firestore.SERVER_TIMESTAMP
-                                            }
-                                            main_collection.document(doc_id).set(doc_data)
-                                            pages_success += 1
-                                            trace(f"Page {page_num} saved.")
-                                        else:
-                                            print(f"WARNING: Embedding generation failed for page {page_num}")
-                                            
-                                    except Exception as save_err:
-                                            print(f"Error saving page {page_num}: {save_err}")
-                                
-                                # Cleanup chunk memory
-                                del chunk_images
-                                del batch_images_bytes
-                                gc.collect()
-                                
-                            except Exception as chunk_err:
-                                print(f"ERROR processing batch {start_page}-{end_page}: {chunk_err}")
-                                pass
-                            
-                finally:
-                    # Clean up temp file
-                    if os.path.exists(tmp_pdf_path):
-                        os.remove(tmp_pdf_path)
-                    gc.collect()
-
-                
-                if should_process:
-                    if pages_success > 0:
-                        success_data = {
-                            "status": "success",
-                            "pages_processed": pages_success,
-                            "updated_at": firestore.SERVER_TIMESTAMP
-                        }
-                        res_doc_ref.update(success_data)
-                        summary_ref.set(success_data, merge=True)
-                        success_count += 1
-                        success_data = True # Flag for increment
-                    else:
-                        fail_data = {
-                            "status": "failed",
-                            "error": "No pages processed successfully",
-                            "updated_at": firestore.SERVER_TIMESTAMP
-                        }
-                        res_doc_ref.update(fail_data)
-                        summary_ref.set(fail_data, merge=True)
-                        failed_count += 1
-                        success_data = False
-                else:
-                    pass
+                    statuses = prefetch_file_statuses(db, summary_collection, [safe_name(b.name) for b in all_pdf_blobs])
+                except Exception as e:
+                    print(f"Warning: Failed to prefetch file summaries: {e}")
+                    statuses = {}
 
-            except Exception as e:
-                print(f"ERROR processing file {blob.name}: {e}")
-                err_data = {
-                    "status": "failed",
-                    "error": str(e),
-                    "updated_at": firestore.SERVER_TIMESTAMP
-                }
-                res_doc_ref.update(err_data)
-                summary_ref.set(err_data, merge=True)
-                failed_count += 1
-                success_data = False
-            
-            processed_count += 1
-
-            
-            # Atomic Increment for Batch Counters
-            batch_ref.update({
-                "processed_files": firestore.Increment(1),
-                "success_files": firestore.Increment(1) if success_data else firestore.Increment(0),
-                "failed_files": firestore.Increment(1) if not success_data else firestore.Increment(0)
-            })
+                pending_names = []
+                for blob in all_pdf_blobs:
+                    writer.set(results_ref.document(f"{batch_id}_{safe_name(blob.name)}"), {
+                        "batch_id": batch_id,
+                        "filename": blob.name,
+                        "status": "pending",
+                        "created_at": firestore.SERVER_TIMESTAMP,
+                        "updated_at": firestore.SERVER_TIMESTAMP
+                    })
+                    status = statuses.get(safe_name(blob.name))
+                    if status in ["success", "skipped"]:
+                        trace(f"Skipping {blob.name} (Already processed: {status})")
+                        continue
+                    pending_names.append(blob.name)
+
+                batch_ref.set({
+                    "status": "processing",
+                    "total_files": len(all_pdf_blobs),
+                    "started_at": firestore.SERVER_TIMESTAMP
+                }, merge=True)
+                work_queue.seed(pending_names, writer)
+            elif not work_queue.wait_until_seeded():
+                trace(f"Task {TASK_INDEX}: queue for batch {batch_id} never seeded. Exiting.")
+                return
+
+            # 2. Processing Phase (staged pipeline fed by work-stealing claims)
+            run = BatchIngestionRun(batch_id, db, writer, work_queue)
+            claimed_blobs = (bucket.blob(name) for name in work_queue.claims(should_stop=lambda: run.cancelled))
+            run.run(claimed_blobs)
+        finally:
+            # Flushes discovery entries, file statuses, slide vectors, counters and queue state
+            writer.close()
+            work_queue.release_all()
 
-        # Only Task 0 marks as fully completed? 
-        # No, "completed" status is tricky in parallel. 
-        # If we set "completed", the UI might stop polling.
-        # Ideally, we wait for all tasks. Cloud Run Job "Execution" status handles this natively.
-        # The App UI can poll the JOB EXECUTION status if we linked it.
-        # For now, let's NOT mark "completed" from python. Let Firestore track progress.
-        # OR: We check if processed_files == total_files (eventually consistent).
-        
+        # 3. Completion: whichever task drains the last item flips the batch to "completed"
+        work_queue.check_batch_completion()
         trace(f"Task {TASK_INDEX} finished.")
 
     except Exception as e:
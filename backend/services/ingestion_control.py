@@ -0,0 +1,97 @@
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+from services.ai_shared import trace
+
+POLL_INTERVAL = float(os.environ.get("INGEST_CONTROL_POLL_SECONDS", "5"))
+GET_ALL_CHUNK = 300
+
+
+class BatchControl:
+    """
+    Watches an ingestion batch document and flips a local cancellation flag.
+
+    Uses a Firestore snapshot listener so a "cancelling" status is seen
+    immediately, without a document read per file. Falls back to polling the
+    document every POLL_INTERVAL seconds when listeners are unavailable
+    (e.g. local stand-ins / emulators without watch support).
+    """
+
+    def __init__(self, batch_ref, on_cancel: Optional[Callable[[], None]] = None, poll_interval: float = POLL_INTERVAL):
+        self.batch_ref = batch_ref
+        self.on_cancel = on_cancel
+        self.poll_interval = poll_interval
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._watch = None
+        self._poller = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def start(self):
+        try:
+            self._watch = self.batch_ref.on_snapshot(self._on_snapshot)
+            trace(f"BatchControl: watching {self.batch_ref.id} via snapshot listener")
+        except Exception as e:
+            print(f"BatchControl: snapshot listener unavailable ({e}). Falling back to polling every {self.poll_interval}s.")
+            self._poller = threading.Thread(target=self._poll_loop, name=f"batch-control-{self.batch_ref.id[:8]}", daemon=True)
+            self._poller.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception as e:
+                print(f"BatchControl: unsubscribe failed: {e}")
+            self._watch = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def _on_snapshot(self, doc_snapshots, changes, read_time):
+        for snap in doc_snapshots:
+            if snap.exists:
+                self._apply_status((snap.to_dict() or {}).get("status"))
+
+    def _poll_loop(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                snap = self.batch_ref.get()
+                if snap.exists:
+                    self._apply_status((snap.to_dict() or {}).get("status"))
+            except Exception as e:
+                print(f"BatchControl: poll failed: {e}")
+
+    def _apply_status(self, status: Optional[str]):
+        if status != "cancelling":
+            return
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self._cancelled.set()
+        if self.on_cancel:
+            try:
+                self.on_cancel()
+            except Exception as e:
+                print(f"BatchControl: on_cancel failed: {e}")
+
+
+def prefetch_file_statuses(db, summary_collection, safe_filenames: List[str]) -> Dict[str, str]:
+    """Reads ingestion_file_summaries statuses for a whole shard with get_all instead of one read per file."""
+    statuses = {}
+    for i in range(0, len(safe_filenames), GET_ALL_CHUNK):
+        refs = [summary_collection.document(n) for n in safe_filenames[i:i + GET_ALL_CHUNK]]
+        for snap in db.get_all(refs):
+            if snap.exists:
+                statuses[snap.id] = (snap.to_dict() or {}).get("status")
+    return statuses
@@ -0,0 +1,76 @@
+import time
+from typing import Callable, Optional, Tuple
+
+ORDER_STEP = 1024.0 # Spacing used when appending and after a rebalance
+MIN_GAP = 1e-6 # Below this the neighbours are rewritten evenly spaced
+
+
+def order_between(prev_order: Optional[float], next_order: Optional[float]) -> float:
+    """A fractional `order` strictly between two neighbours (either may be None for a list end)."""
+    if prev_order is None and next_order is None:
+        return 0.0
+    if prev_order is None:
+        return next_order - ORDER_STEP
+    if next_order is None:
+        return prev_order + ORDER_STEP
+    if prev_order > next_order:
+        prev_order, next_order = next_order, prev_order
+    return (prev_order + next_order) / 2.0
+
+
+def append_order(max_order: Optional[float]) -> float:
+    return order_between(max_order, None) if max_order is not None else 0.0
+
+
+def fallback_append_order() -> float:
+    """Used when the max-order query can't run (e.g. missing index): sorts after any ranked item."""
+    return float(int(time.time()))
+
+
+def _neighbour_orders(db, collection_ref, prev_id: Optional[str], next_id: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
+    refs = [collection_ref.document(i) for i in (prev_id, next_id) if i]
+    orders = {}
+    for snap in db.get_all(refs):
+        if snap.exists:
+            orders[snap.id] = (snap.to_dict() or {}).get("order", 0)
+    for i in (prev_id, next_id):
+        if i and i not in orders:
+            raise KeyError(i)
+    return (orders[prev_id] if prev_id else None), (orders[next_id] if next_id else None)
+
+
+def move_item(db, collection_ref, item_id: str, prev_id: Optional[str], next_id: Optional[str], list_query: Optional[Callable] = None) -> Tuple[float, bool]:
+    """
+    Moves `item_id` between `prev_id` and `next_id` (its neighbours after the drop) with a single write.
+    Returns (new order, needs_rebalance). needs_rebalance means the gap is getting small and the
+    caller should run rebalance() in the background. If the neighbours share the same order
+    (e.g. legacy items all at 0) the list from `list_query()` is rebalanced first, synchronously.
+    """
+    prev_order, next_order = _neighbour_orders(db, collection_ref, prev_id, next_id)
+    if prev_order is not None and next_order is not None and prev_order == next_order and list_query is not None:
+        rebalance(db, list_query())
+        prev_order, next_order = _neighbour_orders(db, collection_ref, prev_id, next_id)
+
+    new_order = order_between(prev_order, next_order)
+    collection_ref.document(item_id).update({"order": new_order})
+
+    needs_rebalance = prev_order is not None and next_order is not None and abs(next_order - prev_order) / 2.0 < MIN_GAP
+    return new_order, needs_rebalance
+
+
+def rebalance(db, query, label: str = "list"):
+    """Rewrites `order` of every document in `query` (already ordered by `order`) to ORDER_STEP spacing."""
+    batch = db.batch()
+    count = 0
+    total = 0
+    for index, doc in enumerate(query.stream()):
+        batch.update(doc.reference, {"order": index * ORDER_STEP})
+        count += 1
+        total += 1
+        if count >= 400:
+            batch.commit()
+            batch = db.batch()
+            count = 0
+    if count > 0:
+        batch.commit()
+    print(f"Rebalanced order of {total} items in {label}")
@@ -0,0 +1,134 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from pdf2image import convert_from_path
+
+# Full-quality render used for slide analysis / embeddings (pdf2image default)
+RENDER_DPI = int(os.environ.get("INGEST_RENDER_DPI", "200"))
+# Cheap path for the orientation check (only the aspect ratio matters)
+THUMBNAIL_DPI = int(os.environ.get("INGEST_THUMBNAIL_DPI", "36"))
+# Quality evaluation defaults to the full DPI so its pages are reused by slide analysis.
+# Set lower to trade an extra (cheap) render of the first pages for smaller Gemini payloads.
+EVAL_DPI = int(os.environ.get("INGEST_EVAL_DPI", str(RENDER_DPI)))
+# Number of rendered pages kept in memory; everything else is read back from disk
+MEMORY_PAGES = int(os.environ.get("INGEST_RENDER_MEMORY_PAGES", "10"))
+
+
+class PageRenderCache:
+    """
+    Renders each (page, dpi) of one PDF at most once.
+
+    pdftoppm writes JPEGs straight to a per-file spill directory (no PIL
+    decode / re-encode round trip); a small LRU keeps the most recent pages
+    in memory. Entries are keyed by file key + page + DPI.
+    """
+
+    def __init__(self, pdf_path: str, file_key: str, total_pages: Optional[int] = None,
+                 root_dir: Optional[str] = None, memory_pages: int = MEMORY_PAGES):
+        self.pdf_path = pdf_path
+        self.file_key = file_key
+        self.total_pages = total_pages
+        self.memory_pages = memory_pages
+        self._dir = tempfile.mkdtemp(prefix="pages_", dir=root_dir)
+        self._paths = {} # (page, dpi) -> path on disk
+        self._memory: "OrderedDict[Tuple[int, int], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.renders = 0
+        self.hits = 0
+
+    def _key_path(self, page: int, dpi: int) -> str:
+        return os.path.join(self._dir, f"{self.file_key}_p{page}_d{dpi}.jpg")
+
+    def get_pages(self, first_page: int, last_page: int, dpi: int = RENDER_DPI) -> List[bytes]:
+        """Returns JPEG bytes for pages first_page..last_page (inclusive), rendering only missing ones."""
+        if self.total_pages:
+            last_page = min(last_page, self.total_pages)
+        if last_page < first_page:
+            return []
+
+        with self._lock:
+            missing = [p for p in range(first_page, last_page + 1) if (p, dpi) not in self._paths]
+            self.hits += (last_page - first_page + 1) - len(missing)
+            # Render contiguous runs of missing pages with a single poppler call each
+            for run_start, run_end in self._runs(missing):
+                self._render(run_start, run_end, dpi)
+
+            pages = []
+            for p in range(first_page, last_page + 1):
+                data = self._read(p, dpi)
+                if data is None:
+                    break # Past the real end of the document
+                pages.append(data)
+            return pages
+
+    def get_page(self, page: int, dpi: int = RENDER_DPI) -> Optional[bytes]:
+        pages = self.get_pages(page, page, dpi)
+        return pages[0] if pages else None
+
+    def get_page_size(self, page: int = 1, dpi: int = THUMBNAIL_DPI) -> Optional[Tuple[int, int]]:
+        """(width, height) of a page, rendered on the cheap thumbnail path."""
+        data = self.get_page(page, dpi)
+        if data is None:
+            return None
+        from PIL import Image
+        with Image.open(io.BytesIO(data)) as img:
+            return img.size
+
+    def close(self):
+        with self._lock:
+            self._memory.clear()
+            self._paths.clear()
+            shutil.rmtree(self._dir, ignore_errors=True)
+
+    # --- internals (caller holds _lock) ---
+
+    @staticmethod
+    def _runs(pages: List[int]):
+        if not pages:
+            return
+        start = prev = pages[0]
+        for p in pages[1:]:
+            if p != prev + 1:
+                yield start, prev
+                start = p
+            prev = p
+        yield start, prev
+
+    def _render(self, first_page: int, last_page: int, dpi: int):
+        out_paths = convert_from_path(
+            self.pdf_path,
+            dpi=dpi,
+            first_page=first_page,
+            last_page=last_page,
+            fmt="jpeg",
+            output_folder=self._dir,
+            output_file=f"render_d{dpi}_{first_page}_",
+            paths_only=True,
+        )
+        self.renders += len(out_paths)
+        # pdf2image returns the paths sorted by page number
+        for offset, path in enumerate(out_paths):
+            page = first_page + offset
+            key_path = self._key_path(page, dpi)
+            os.replace(path, key_path)
+            self._paths[(page, dpi)] = key_path
+
+    def _read(self, page: int, dpi: int) -> Optional[bytes]:
+        key = (page, dpi)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        path = self._paths.get(key)
+        if not path:
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+        self._memory[key] = data
+        if len(self._memory) > self.memory_pages:
+            self._memory.popitem(last=False)
+        return data
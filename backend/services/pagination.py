@@ -0,0 +1,125 @@
+import os
+import json
+import base64
+import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from google.cloud import firestore
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("LIST_DEFAULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.environ.get("LIST_MAX_PAGE_SIZE", "200"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+Row = Tuple[str, Dict[str, Any]]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class PageParams:
+    """
+    Common list query parameters (FastAPI dependency).
+
+    - cursor: opaque token from the previous page (X-Next-Cursor header, or next_cursor in object responses)
+    - page_size: enables paging (clamped to MAX_PAGE_SIZE); omitted = the whole list, as before
+    - view: "summary" projects list items to their summary fields; fetch the rest from the detail endpoint
+    """
+
+    def __init__(self, cursor: Optional[str] = None, page_size: Optional[int] = None, view: str = "full"):
+        self.cursor = cursor or None
+        # Decoded here so a bad cursor fails as 400 (main.py handler) before any endpoint try/except
+        self.after = decode_cursor(self.cursor) if self.cursor else None
+        if page_size is None and self.cursor:
+            page_size = DEFAULT_PAGE_SIZE
+        self.page_size = max(1, min(page_size, MAX_PAGE_SIZE)) if page_size is not None else None
+        self.summary = view == "summary"
+
+    def default_size(self, page_size: int) -> "PageParams":
+        """For endpoints that always returned a bounded list (limit=N): keep that as the default page."""
+        if self.page_size is None:
+            self.page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        return self
+
+    def fields(self, summary_fields: Sequence[str]) -> Optional[List[str]]:
+        return list(summary_fields) if self.summary else None
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(order_value: Any, doc_id: str) -> str:
+    raw = json.dumps([_encode_value(order_value), doc_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        order_value, doc_id = json.loads(raw)
+        return _decode_value(order_value), str(doc_id)
+    except Exception:
+        raise InvalidCursor("Invalid or expired cursor")
+
+
+def _page_query(query, collection, params: PageParams, order_field: Optional[str], descending: bool, fields: Optional[Sequence[str]]):
+    direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+    q = query
+    if order_field:
+        q = q.order_by(order_field, direction=direction)
+    # Document name breaks ties, so equal timestamps never repeat or skip items between pages
+    q = q.order_by("__name__", direction=direction)
+
+    if fields is not None:
+        q = q.select(sorted(set(fields) | ({order_field} if order_field else set())))
+
+    if params.after:
+        order_value, doc_id = params.after
+        start = {"__name__": collection.document(doc_id)}
+        if order_field:
+            start[order_field] = order_value
+        q = q.start_after(start)
+
+    if params.page_size is not None:
+        q = q.limit(params.page_size + 1)
+    return q
+
+
+def _finish(rows: List[Tuple[str, Dict[str, Any]]], params: PageParams, order_field: Optional[str]) -> Tuple[List[Row], Optional[str]]:
+    if params.page_size is None or len(rows) <= params.page_size:
+        return rows, None
+    rows = rows[:params.page_size]
+    last_id, last = rows[-1]
+    return rows, encode_cursor(last.get(order_field) if order_field else None, last_id)
+
+
+def fetch_page(query, params: PageParams, collection=None, order_field: Optional[str] = "created_at", descending: bool = True, fields: Optional[Sequence[str]] = None) -> Tuple[List[Row], Optional[str]]:
+    """
+    One page of `query` as [(doc_id, data)] plus the next cursor (None on the last page).
+    `collection` is needed when `query` is a filtered Query rather than the CollectionReference itself.
+    Filtered queries ordered by a field other than the filter need the matching composite index.
+    """
+    collection = collection if collection is not None else query
+    q = _page_query(query, collection, params, order_field, descending, fields)
+    return _finish([(d.id, d.to_dict() or {}) for d in q.stream()], params, order_field)
+
+
+async def fetch_page_async(query, params: PageParams, collection=None, order_field: Optional[str] = "created_at", descending: bool = True, fields: Optional[Sequence[str]] = None) -> Tuple[List[Row], Optional[str]]:
+    """fetch_page for firestore.AsyncClient queries."""
+    collection = collection if collection is not None else query
+    q = _page_query(query, collection, params, order_field, descending, fields)
+    return _finish([(d.id, d.to_dict() or {}) async for d in q.stream()], params, order_field)
+
+
+def set_next_cursor(response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -0,0 +1,135 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, List, Optional
+
+from services.ai_shared import trace
+
+# Sentinel pushed through the queues to tell workers that upstream is finished.
+_STOP = object()
+
+
+class Stage:
+    """
+    One step of a StagedPipeline.
+
+    `fn(item, emit)` processes a single item and calls `emit(next_item)` zero or
+    more times to hand work to the next stage. `on_error(item, exc)` is called
+    when `fn` raises, so the owner can keep its own bookkeeping consistent.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Any, Callable[[Any], None]], None],
+        workers: int = 1,
+        queue_size: int = 4,
+        on_error: Optional[Callable[[Any, Exception], None]] = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, queue_size))
+        self.on_error = on_error
+
+        # Stats (guarded by _lock)
+        self._lock = threading.Lock()
+        self._alive = 0
+        self.processed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+
+
+class StagedPipeline:
+    """
+    Thread-based pipeline with bounded queues between stages.
+
+    Each stage runs `workers` threads; a full downstream queue blocks the
+    upstream workers (back-pressure), so memory stays bounded while I/O,
+    rendering and model calls of different items overlap.
+    """
+
+    def __init__(self, stages: List[Stage], name: str = "pipeline"):
+        if not stages:
+            raise ValueError("StagedPipeline requires at least one stage")
+        self.stages = stages
+        self.name = name
+        self._stop_requested = threading.Event()
+
+    def stop(self):
+        """Stops feeding new source items. Items already in flight are drained."""
+        self._stop_requested.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop_requested.is_set()
+
+    def run(self, source: Iterable[Any]):
+        """Feeds `source` into the first stage and blocks until every stage is drained."""
+        started = time.time()
+        threads = []
+        for idx, stage in enumerate(self.stages):
+            next_stage = self.stages[idx + 1] if idx + 1 < len(self.stages) else None
+            stage._alive = stage.workers
+            for w in range(stage.workers):
+                t = threading.Thread(
+                    target=self._worker_loop,
+                    args=(stage, next_stage),
+                    name=f"{self.name}-{stage.name}-{w}",
+                    daemon=True,
+                )
+                t.start()
+                threads.append(t)
+
+        first = self.stages[0]
+        try:
+            for item in source:
+                if self._stop_requested.is_set():
+                    break
+                first.queue.put(item)
+        finally:
+            for _ in range(first.workers):
+                first.queue.put(_STOP)
+
+        for t in threads:
+            t.join()
+
+        elapsed = time.time() - started
+        for stage in self.stages:
+            trace(
+                f"[{self.name}] stage={stage.name} workers={stage.workers} "
+                f"processed={stage.processed} errors={stage.errors} busy={stage.busy_seconds:.1f}s"
+            )
+        trace(f"[{self.name}] finished in {elapsed:.1f}s")
+
+    def _worker_loop(self, stage: Stage, next_stage: Optional[Stage]):
+        emit = next_stage.queue.put if next_stage else (lambda _item: None)
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                break
+            t0 = time.time()
+            try:
+                stage.fn(item, emit)
+                failed = False
+            except Exception as e:
+                failed = True
+                print(f"[{self.name}] Error in stage '{stage.name}': {e}")
+                if stage.on_error:
+                    try:
+                        stage.on_error(item, e)
+                    except Exception as cb_e:
+                        print(f"[{self.name}] on_error callback failed in '{stage.name}': {cb_e}")
+            with stage._lock:
+                stage.processed += 1
+                stage.busy_seconds += time.time() - t0
+                if failed:
+                    stage.errors += 1
+
+        # The last worker of this stage to exit propagates shutdown downstream.
+        with stage._lock:
+            stage._alive -= 1
+            last = stage._alive == 0
+        if last and next_stage:
+            for _ in range(next_stage.workers):
+                next_stage.queue.put(_STOP)
@@ -0,0 +1,65 @@
+import time
+import asyncio
+import threading
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket usable from both sync and async code.
+
+    `rate` tokens are added per second up to `capacity`. acquire() blocks the
+    calling thread; acquire_async() sleeps on the event loop instead.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = max(rate, 1e-6)
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, rpm: float, burst: float = None) -> "TokenBucket":
+        return cls(rpm / 60.0, burst if burst is not None else max(1.0, rpm / 10.0))
+
+    def set_rate(self, rate: float, capacity: float = None):
+        """Changes the refill rate in place; tokens already accrued are kept (capped to the new capacity)."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.rate = max(rate, 1e-6)
+            self.capacity = capacity if capacity is not None else max(1.0, rate)
+            self._tokens = min(self._tokens, self.capacity)
+
+    def _reserve(self, tokens: float) -> float:
+        """Takes tokens if available. Returns 0, or the seconds to wait before retrying."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        """Waits for tokens. With a timeout, gives up (False) once the wait would exceed it."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
@@ -0,0 +1,208 @@
+import os
+import json
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from google.cloud import firestore
+
+from services.gemini_gateway import gemini_generate, gemini_generate_async
+from services.async_data import offload
+
+CACHE_COLLECTION_NAME = os.getenv("RESPONSE_CACHE_COLLECTION_NAME", "gemini_response_cache")
+MEMORY_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MEMORY_ENTRIES", "4096"))
+DEFAULT_TTL_DAYS = float(os.environ.get("RESPONSE_CACHE_TTL_DAYS", "30"))
+
+
+def _feed(h, value: Any):
+    """Feeds a canonical form of prompt contents/config into the hash (str, bytes, dicts, lists, SDK models)."""
+    if value is None:
+        h.update(b"\x00n")
+    elif isinstance(value, bytes):
+        h.update(b"\x00b%d:" % len(value))
+        h.update(value)
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+        h.update(b"\x00s%d:" % len(data))
+        h.update(data)
+    elif isinstance(value, dict):
+        h.update(b"\x00d%d" % len(value))
+        for k in sorted(value):
+            _feed(h, str(k))
+            _feed(h, value[k])
+    elif isinstance(value, (list, tuple)):
+        h.update(b"\x00l%d" % len(value))
+        for item in value:
+            _feed(h, item)
+    elif hasattr(value, "model_dump"):
+        # google.genai types (Part, GenerateContentConfig, ...) are pydantic models
+        _feed(h, value.model_dump(exclude_none=True))
+    else:
+        _feed(h, repr(value))
+
+
+def _hash(value: Any) -> str:
+    h = hashlib.sha256()
+    _feed(h, value)
+    return h.hexdigest()
+
+
+def parse_json(text: str) -> Any:
+    """json.loads that tolerates a ```json fenced answer."""
+    clean = (text or "").strip()
+    if clean.startswith("```json"):
+        clean = clean[7:]
+    elif clean.startswith("```"):
+        clean = clean[3:]
+    if clean.endswith("```"):
+        clean = clean[:-3]
+    return json.loads(clean.strip())
+
+
+def response_text(response) -> str:
+    if response.text:
+        return response.text
+    if response.candidates and response.candidates[0].content.parts:
+        return " ".join([p.text for p in response.candidates[0].content.parts if p.text])
+    return ""
+
+
+def _split_config(config) -> tuple:
+    """(system instruction, rest of the config as a dict) so the system prompt gets its own hash."""
+    if config is None:
+        return None, {}
+    data = config.model_dump(exclude_none=True) if hasattr(config, "model_dump") else dict(config)
+    system = data.pop("system_instruction", None)
+    return system, data
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class ResponseCache:
+    """
+    Persistent cache for deterministic (low-temperature, no tools) Gemini calls.
+
+    The key is (namespace, prompt version, model, system prompt hash, contents
+    hash, config hash). Editing a prompt stored in Firestore (e.g. DAB's
+    filter_prompt_template) changes the system prompt hash, so old answers are
+    simply no longer found. Prompts that live in code carry a version string
+    that is bumped when they change. Entries expire after a TTL (`expires_at`,
+    also usable as a Firestore TTL policy field), live in Firestore so reruns
+    and other instances share them, and have an in-process LRU in front.
+
+    Only answers that parse are stored. Parsed values must be JSON-like (Firestore types).
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, db=None):
+        self._db = db
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def get_instance(cls) -> "ResponseCache":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = ResponseCache()
+        return cls._instance
+
+    @property
+    def collection(self):
+        if self._db is None:
+            from services.ai_shared import get_firestore_client
+            self._db = get_firestore_client()
+        return self._db.collection(CACHE_COLLECTION_NAME)
+
+    @staticmethod
+    def key(namespace: str, version: str, model: str, contents, config=None) -> str:
+        system, rest = _split_config(config)
+        digest = _hash([namespace, version, model, _hash(system), _hash(contents), _hash(rest)])
+        return f"{namespace}_{digest}"
+
+    # --- Public API ---
+
+    def generate_json(self, namespace: str, version: str, model: str, contents, config=None, client=None,
+                      parse: Callable[[str], Any] = parse_json, ttl_days: Optional[float] = None) -> Any:
+        """Parsed answer for the prompt, from the cache or from Gemini (blocking)."""
+        key = self.key(namespace, version, model, contents, config)
+        found = self._get(key)
+        if found is not None:
+            return found
+        response = gemini_generate(model=model, contents=contents, config=config, client=client)
+        value = parse(response_text(response))
+        self._put(key, namespace, version, model, value, ttl_days)
+        return value
+
+    async def generate_json_async(self, namespace: str, version: str, model: str, contents, config=None, client=None,
+                                  parse: Callable[[str], Any] = parse_json, ttl_days: Optional[float] = None) -> Any:
+        key = self.key(namespace, version, model, contents, config)
+        found = await offload(self._get, key)
+        if found is not None:
+            return found
+        response = await gemini_generate_async(model=model, contents=contents, config=config, client=client)
+        value = parse(response_text(response))
+        await offload(self._put, key, namespace, version, model, value, ttl_days)
+        return value
+
+    # --- Storage ---
+
+    def _get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+
+        if entry is None:
+            try:
+                snap = self.collection.document(key).get()
+                entry = snap.to_dict() if snap.exists else None
+            except Exception as e:
+                print(f"ResponseCache read error: {e}")
+                entry = None
+            if entry is not None:
+                self._remember(key, entry)
+
+        if entry is None or (entry.get("expires_at") and entry["expires_at"] <= _now()):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry.get("value")
+
+    def _put(self, key: str, namespace: str, version: str, model: str, value: Any, ttl_days: Optional[float]):
+        if value is None:
+            return
+        ttl = DEFAULT_TTL_DAYS if ttl_days is None else ttl_days
+        entry = {
+            "namespace": namespace,
+            "prompt_version": version,
+            "model": model,
+            "value": value,
+            "expires_at": _now() + datetime.timedelta(days=ttl),
+        }
+        self._remember(key, entry)
+        try:
+            self.collection.document(key).set({**entry, "created_at": firestore.SERVER_TIMESTAMP})
+        except Exception as e:
+            print(f"ResponseCache write error: {e}")
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+
+
+def get_response_cache() -> ResponseCache:
+    return ResponseCache.get_instance()
@@ -0,0 +1,129 @@
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+SCHEDULE_INDEX_VERSION = 1
+META_COLLECTION = "system_meta"
+META_DOC = "routine_schedule_index"
+
+_index_ready = False
+
+KEY_DAILY = "D"
+
+
+def weekday_key(weekday: int) -> str:
+    return f"W{weekday}"
+
+
+def month_day_key(day: int) -> str:
+    return f"M{day}"
+
+
+def yearly_key(month: int, day: int) -> str:
+    return f"Y{month:02d}{day:02d}"
+
+
+def compile_schedule(frequency: Optional[Dict[str, Any]], routine_type: str = "ACTION", is_active: bool = True) -> Dict[str, Any]:
+    """
+    Compiles a routine's frequency config into the fields stored next to it:
+
+    - schedule: weekday bitmask, month-day set and yearly (month, day) table
+    - schedule_keys: flat tokens ("D", "W3", "M15", "Y0315") that
+      generate_daily_tasks matches with a single array_contains_any query
+
+    Inactive and MINDSET routines get no keys, so they are never fetched.
+    """
+    freq = frequency or {}
+    f_type = freq.get("type", "DAILY")
+    if hasattr(f_type, "value"):
+        f_type = f_type.value
+
+    weekday_mask = 0
+    month_days: List[int] = []
+    yearly: List[str] = []
+    keys: List[str] = []
+
+    if f_type == "DAILY":
+        keys.append(KEY_DAILY)
+    elif f_type == "WEEKLY":
+        for wd in freq.get("weekdays", []) or []:
+            if 0 <= wd <= 6:
+                weekday_mask |= 1 << wd
+        keys.extend(weekday_key(wd) for wd in range(7) if weekday_mask & (1 << wd))
+    elif f_type == "MONTHLY":
+        month_days = sorted({d for d in freq.get("month_days", []) or [] if 1 <= d <= 31})
+        keys.extend(month_day_key(d) for d in month_days)
+    elif f_type == "YEARLY":
+        y_dates = freq.get("yearly_dates", []) or []
+        if y_dates:
+            pairs = {(yd.get("month"), yd.get("day")) for yd in y_dates}
+        else:
+            # Old configs: Cartesian product of months x month_days
+            pairs = {(m, d) for m in freq.get("months", []) or [] for d in freq.get("month_days", []) or []}
+        yearly = sorted(yearly_key(m, d) for m, d in pairs if isinstance(m, int) and isinstance(d, int) and 1 <= m <= 12 and 1 <= d <= 31)
+        keys.extend(yearly)
+
+    if routine_type != "ACTION" or not is_active:
+        keys = []
+
+    return {
+        "schedule": {
+            "type": f_type,
+            "weekday_mask": weekday_mask,
+            "month_days": month_days,
+            "yearly": yearly,
+            "version": SCHEDULE_INDEX_VERSION,
+        },
+        "schedule_keys": keys,
+    }
+
+
+def due_keys(target: date) -> List[str]:
+    """The schedule_keys any routine due on `target` carries at least one of."""
+    return [
+        KEY_DAILY,
+        weekday_key(target.weekday()),
+        month_day_key(target.day),
+        yearly_key(target.month, target.day),
+    ]
+
+
+def is_due(routine: Dict[str, Any], target: date) -> bool:
+    """Checks a routine against its compiled keys (compiling on the fly for unindexed documents)."""
+    keys = routine.get("schedule_keys")
+    if keys is None:
+        keys = compile_schedule(routine.get("frequency"), routine.get("routine_type", "ACTION"), routine.get("is_active", True))["schedule_keys"]
+    return not set(keys).isdisjoint(due_keys(target))
+
+
+def ensure_schedule_index(db):
+    """
+    One-time backfill of schedule fields on routines written before the index existed.
+    A marker document records the index version so this runs once per deployment, not per call.
+    """
+    global _index_ready
+    if _index_ready:
+        return
+    meta_ref = db.collection(META_COLLECTION).document(META_DOC)
+    snap = meta_ref.get()
+    if snap.exists and (snap.to_dict() or {}).get("version") == SCHEDULE_INDEX_VERSION:
+        _index_ready = True
+        return
+
+    batch = db.batch()
+    count = 0
+    total = 0
+    for doc in db.collection("routines").stream():
+        r = doc.to_dict()
+        batch.update(doc.reference, compile_schedule(r.get("frequency"), r.get("routine_type", "ACTION"), r.get("is_active", True)))
+        count += 1
+        total += 1
+        if count >= 400:
+            batch.commit()
+            batch = db.batch()
+            count = 0
+    if count > 0:
+        batch.commit()
+
+    meta_ref.set({"version": SCHEDULE_INDEX_VERSION, "routines": total})
+    print(f"Routine schedule index backfilled for {total} routines")
+    _index_ready = True
@@ -0,0 +1,148 @@
+import os
+import time
+import datetime
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+from google.cloud import storage
+
+DEFAULT_MINUTES = 15
+CACHE_ENTRIES = int(os.environ.get("SIGNED_URL_CACHE_ENTRIES", "5000"))
+SIGN_WORKERS = int(os.environ.get("SIGNED_URL_SIGN_WORKERS", "8"))
+
+
+def parse_gcs_uri(gcs_uri: str) -> Optional[Tuple[str, str]]:
+    """gs://bucket/path -> (bucket, path), or None if it is not a GCS URI."""
+    if not gcs_uri or not gcs_uri.startswith("gs://"):
+        return None
+    parts = gcs_uri[len("gs://"):].split("/", 1)
+    if len(parts) != 2 or not parts[1]:
+        return None
+    return parts[0], parts[1]
+
+
+class SignedUrlService:
+    """
+    Shared v4 GET URL signer with a TTL cache.
+
+    One storage client (and therefore one credential load) is reused for all
+    signatures. URLs are cached per (uri, expiry minutes) and dropped well
+    before they expire, so a cached link always has at least a fifth of its
+    lifetime (and never less than a minute) left when handed out.
+
+    On Cloud Run the default credentials have no private key; they are then
+    refreshed once and the URL is signed through IAM with the access token.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=SIGN_WORKERS, thread_name_prefix="url-signer")
+        self.hits = 0
+        self.signed = 0
+
+    @classmethod
+    def get_instance(cls) -> "SignedUrlService":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = SignedUrlService()
+        return cls._instance
+
+    @property
+    def client(self) -> storage.Client:
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from services.ai_shared import get_storage_client
+                    self._client = get_storage_client()
+        return self._client
+
+    # --- Public API ---
+
+    def sign(self, gcs_uri: str, minutes: int = DEFAULT_MINUTES) -> str:
+        """Signed URL for one gs:// URI, or "" if it cannot be signed."""
+        return self.sign_many([gcs_uri], minutes).get(gcs_uri, "")
+
+    def sign_many(self, gcs_uris: Iterable[str], minutes: int = DEFAULT_MINUTES) -> Dict[str, str]:
+        """Signs many URIs at once: cached ones are returned directly, the rest are signed in parallel."""
+        result = {}
+        missing = []
+        now = time.time()
+        with self._lock:
+            for uri in gcs_uris:
+                if not uri or uri in result:
+                    continue
+                entry = self._cache.get((uri, minutes))
+                if entry and entry[1] > now:
+                    self._cache.move_to_end((uri, minutes))
+                    result[uri] = entry[0]
+                    self.hits += 1
+                elif uri not in missing:
+                    missing.append(uri)
+
+        if len(missing) == 1:
+            result[missing[0]] = self._sign_and_cache(missing[0], minutes)
+        elif missing:
+            for uri, url in zip(missing, self._pool.map(lambda u: self._sign_and_cache(u, minutes), missing)):
+                result[uri] = url
+        return result
+
+    # --- Internals ---
+
+    def _sign_and_cache(self, gcs_uri: str, minutes: int) -> str:
+        parsed = parse_gcs_uri(gcs_uri)
+        if not parsed:
+            return ""
+        try:
+            url = self._sign(parsed[0], parsed[1], minutes)
+        except Exception as e:
+            print(f"Signed URL Gen Error for {gcs_uri}: {e}")
+            return ""
+
+        ttl = minutes * 60
+        valid_until = time.time() + ttl - max(60, ttl // 5)
+        with self._lock:
+            self._cache[(gcs_uri, minutes)] = (url, valid_until)
+            self._cache.move_to_end((gcs_uri, minutes))
+            while len(self._cache) > CACHE_ENTRIES:
+                self._cache.popitem(last=False)
+            self.signed += 1
+        return url
+
+    def _sign(self, bucket_name: str, blob_name: str, minutes: int) -> str:
+        blob = self.client.bucket(bucket_name).blob(blob_name)
+        kwargs = {}
+        credentials = self.client._credentials
+        if not hasattr(credentials, "sign_bytes") and hasattr(credentials, "service_account_email"):
+            # Token-only credentials (metadata server): sign via IAM
+            if not credentials.valid:
+                import google.auth.transport.requests
+                with self._client_lock:
+                    credentials.refresh(google.auth.transport.requests.Request())
+            kwargs = {"service_account_email": credentials.service_account_email, "access_token": credentials.token}
+        return blob.generate_signed_url(
+            version="v4",
+            expiration=datetime.timedelta(minutes=minutes),
+            method="GET",
+            **kwargs
+        )
+
+
+def get_signed_url_service() -> SignedUrlService:
+    return SignedUrlService.get_instance()
+
+
+def generate_signed_url(gcs_uri: str, minutes: int = DEFAULT_MINUTES) -> str:
+    return get_signed_url_service().sign(gcs_uri, minutes)
+
+
+def generate_signed_urls(gcs_uris: Iterable[str], minutes: int = DEFAULT_MINUTES) -> Dict[str, str]:
+    return get_signed_url_service().sign_many(gcs_uris, minutes)
@@ -0,0 +1,183 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from google.cloud import firestore
+
+from services.ai_shared import get_firestore_client, get_embedding, Vector
+from services.ai_analysis import ANALYSIS_PROMPT_VERSION
+from services.analysis_engine import analyze_slides_parallel
+from services.embedding_service import MULTIMODAL_EMBEDDING_MODEL
+from config import GEMINI_ANALYSIS_MODEL
+
+CACHE_COLLECTION_NAME = os.getenv("SLIDE_CACHE_COLLECTION_NAME", "slide_content_cache")
+MEMORY_ENTRIES = int(os.environ.get("SLIDE_CACHE_MEMORY_ENTRIES", "2048"))
+
+
+def page_hash(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+class SlideCache:
+    """
+    Content-addressed cache for slide analysis JSON and embedding vectors.
+
+    Keys are derived from the hash of the rendered page bytes plus the model
+    name and prompt version (analysis) or the contextual text (embedding), so
+    re-ingesting or retrying an unchanged deck skips the Gemini/Vertex calls.
+    Entries live in Firestore (shared across Cloud Run Job tasks) with an
+    in-process LRU in front.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, db=None):
+        self._db = db
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def get_instance(cls) -> "SlideCache":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = SlideCache()
+        return cls._instance
+
+    @property
+    def collection(self):
+        if self._db is None:
+            self._db = get_firestore_client()
+        return self._db.collection(CACHE_COLLECTION_NAME)
+
+    @staticmethod
+    def analysis_key(p_hash: str) -> str:
+        return "a_" + _digest(p_hash, GEMINI_ANALYSIS_MODEL, ANALYSIS_PROMPT_VERSION)
+
+    @staticmethod
+    def embedding_key(p_hash: str, text: Optional[str]) -> str:
+        return "e_" + _digest(p_hash, MULTIMODAL_EMBEDDING_MODEL, text or "")
+
+    # --- Analysis ---
+
+    def get_analyses(self, p_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Returns {page_hash: analysis} for every hash found in the cache."""
+        keys = {self.analysis_key(h): h for h in p_hashes}
+        found = self._get_many(list(keys.keys()))
+        return {keys[k]: v["analysis"] for k, v in found.items() if v.get("analysis")}
+
+    def put_analysis(self, p_hash: str, analysis: Dict[str, Any]):
+        self._put(self.analysis_key(p_hash), {
+            "kind": "analysis",
+            "page_hash": p_hash,
+            "model": GEMINI_ANALYSIS_MODEL,
+            "prompt_version": ANALYSIS_PROMPT_VERSION,
+            "analysis": analysis,
+        })
+
+    # --- Embedding ---
+
+    def get_embedding(self, p_hash: str, text: Optional[str]) -> Optional[List[float]]:
+        key = self.embedding_key(p_hash, text)
+        found = self._get_many([key])
+        vec = found.get(key, {}).get("embedding")
+        return list(vec) if vec is not None else None
+
+    def put_embedding(self, p_hash: str, text: Optional[str], embedding: List[float]):
+        self._put(self.embedding_key(p_hash, text), {
+            "kind": "embedding",
+            "page_hash": p_hash,
+            "model": MULTIMODAL_EMBEDDING_MODEL,
+            "embedding": Vector(list(embedding)),
+        })
+
+    # --- Storage ---
+
+    def _get_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        remote = []
+        with self._lock:
+            for k in keys:
+                if k in self._memory:
+                    self._memory.move_to_end(k)
+                    result[k] = self._memory[k]
+                else:
+                    remote.append(k)
+
+        if remote:
+            try:
+                refs = [self.collection.document(k) for k in remote]
+                for snap in self._db.get_all(refs):
+                    if snap.exists:
+                        data = snap.to_dict()
+                        result[snap.id] = data
+                        self._remember(snap.id, data)
+            except Exception as e:
+                print(f"SlideCache read error: {e}")
+
+        with self._lock:
+            self.hits += len(result)
+            self.misses += len(keys) - len(result)
+        return result
+
+    def _put(self, key: str, data: Dict[str, Any]):
+        self._remember(key, data)
+        try:
+            self.collection.document(key).set({**data, "created_at": firestore.SERVER_TIMESTAMP})
+        except Exception as e:
+            print(f"SlideCache write error: {e}")
+
+    def _remember(self, key: str, data: Dict[str, Any]):
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+
+
+def get_slide_cache() -> SlideCache:
+    return SlideCache.get_instance()
+
+
+def analyze_slides_cached(images_bytes: List[bytes]) -> List[Dict[str, Any]]:
+    """Slide analysis where only pages missing from the cache are sent to Gemini (in parallel chunks)."""
+    cache = get_slide_cache()
+    hashes = [page_hash(b) for b in images_bytes]
+    cached = cache.get_analyses(hashes)
+
+    miss_idx = [i for i, h in enumerate(hashes) if h not in cached]
+    fresh = analyze_slides_parallel([images_bytes[i] for i in miss_idx]) if miss_idx else []
+
+    results = []
+    fresh_map = dict(zip(miss_idx, fresh))
+    for i, h in enumerate(hashes):
+        if h in cached:
+            results.append(cached[h])
+            continue
+        result = fresh_map.get(i) or {"structure_type": "Error", "key_message": "Analysis missing", "description": ""}
+        if result.get("structure_type") != "Error":
+            cache.put_analysis(h, result)
+        results.append(result)
+    return results
+
+
+def embed_slide_cached(image_bytes: bytes, text: Optional[str]) -> Optional[List[float]]:
+    """get_embedding for a slide image, served from the cache when the page bytes and text are unchanged."""
+    cache = get_slide_cache()
+    p_hash = page_hash(image_bytes)
+    emb = cache.get_embedding(p_hash, text)
+    if emb is not None:
+        return emb
+    emb = get_embedding(image_bytes=image_bytes, text=text)
+    if emb:
+        cache.put_embedding(p_hash, text, emb)
+    return emb
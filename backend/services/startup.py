@@ -0,0 +1,265 @@
+import os
+import sys
+import time
+import threading
+import importlib
+import importlib.abc
+import importlib.machinery
+from typing import Any, Dict, List, Optional
+
+IMPORT_PROFILE_ENABLED = os.environ.get("STARTUP_IMPORT_PROFILE", "1") != "0"
+# Routers imported during warm-up instead of on their first request ("*" = all)
+WARM_ROUTERS = [r.strip() for r in os.environ.get("STARTUP_WARM_ROUTERS", "").split(",") if r.strip()]
+# Heavy libraries pre-imported by warm-up (the former fixed BackgroundLoader list)
+WARM_MODULES = [m.strip() for m in os.environ.get(
+    "STARTUP_WARM_MODULES",
+    "vertexai,pdf2image,google.cloud.aiplatform,services.ai_analysis,services.ingestion",
+).split(",") if m.strip()]
+# Warm-up waits for the first request to finish (or this long), so it doesn't compete with it
+WARM_DELAY_SECONDS = float(os.environ.get("STARTUP_WARM_DELAY_SECONDS", "10"))
+
+_TIMED_LOADERS = (
+    importlib.machinery.SourceFileLoader,
+    importlib.machinery.SourcelessFileLoader,
+    importlib.machinery.ExtensionFileLoader,
+)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """
+    Records how long each module takes to import (like `python -X importtime`,
+    but queryable at runtime). Sits first on sys.meta_path, lets the real
+    finders locate the module and times the loader's exec_module. `total_ms`
+    includes the module's own imports, `self_ms` does not.
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self._local = threading.local()
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._local, "finding", False):
+            return None
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.finding = False
+
+        # File loaders are created per module, so patching the instance is local to this import
+        if isinstance(spec.loader, _TIMED_LOADERS):
+            spec.loader.exec_module = self._timed(fullname, spec.loader.exec_module)
+        return spec
+
+    def _timed(self, fullname: str, exec_module):
+        def exec_timed(module):
+            stack = self._stack()
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                total = time.perf_counter() - start
+                children = stack.pop()
+                if stack:
+                    stack[-1] += total
+                self.timings[fullname] = {
+                    "total_ms": round(total * 1000, 2),
+                    "self_ms": round((total - children) * 1000, 2),
+                }
+        return exec_timed
+
+    def _stack(self) -> List[float]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def report(self, top: int = 30) -> Dict[str, Any]:
+        timings = list(self.timings.items())
+        by_package: Dict[str, float] = {}
+        for name, t in timings:
+            package = name.split(".")[0]
+            by_package[package] = by_package.get(package, 0.0) + t["self_ms"]
+        return {
+            "modules": len(timings),
+            "slowest": [{"module": name, **t} for name, t in sorted(timings, key=lambda x: -x[1]["total_ms"])[:top]],
+            "by_package_ms": {k: round(v, 2) for k, v in sorted(by_package.items(), key=lambda x: -x[1])[:top]},
+        }
+
+
+class _LazyRouter:
+    def __init__(self, name: str, module: str, prefixes: List[str], tags: List[str]):
+        self.name = name
+        self.module = module
+        self.prefixes = prefixes
+        self.tags = tags
+        self.loaded = False
+        self.load_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self.lock = threading.Lock()
+
+
+class LazyRouterRegistry:
+    """
+    Routers that are imported and mounted on the first request under one of
+    their path prefixes (see middleware.LazyRouterMiddleware), so a cold
+    instance only imports what the request it is serving needs. The most
+    specific prefix wins (/api/consulting/training loads only that router).
+    """
+
+    def __init__(self, app, api_prefix: str = "/api"):
+        self._app = app
+        self._api_prefix = api_prefix
+        self._routers: Dict[str, _LazyRouter] = {}
+
+    def register(self, name: str, prefixes: List[str], module: Optional[str] = None, tags: Optional[List[str]] = None):
+        self._routers[name] = _LazyRouter(
+            name,
+            module or f"routers.{name}",
+            [self._api_prefix + p for p in prefixes],
+            tags or [name],
+        )
+
+    def pending_for(self, path: str) -> List[str]:
+        """Names of the not-yet-loaded routers needed to serve `path`."""
+        best, best_len = None, -1
+        for router in self._routers.values():
+            for prefix in router.prefixes:
+                if (path == prefix or path.startswith(prefix + "/")) and len(prefix) > best_len:
+                    best, best_len = router, len(prefix)
+        return [best.name] if best is not None and not best.loaded else []
+
+    def pending(self) -> List[str]:
+        return [r.name for r in self._routers.values() if not r.loaded]
+
+    def load(self, name: str):
+        """Imports and mounts the router once (thread-safe); raises if the module fails to import."""
+        router = self._routers[name]
+        if router.loaded:
+            return
+        with router.lock:
+            if router.loaded:
+                return
+            start = time.perf_counter()
+            try:
+                module = importlib.import_module(router.module)
+                self._app.include_router(module.router, prefix=self._api_prefix, tags=router.tags)
+            except Exception as e:
+                router.error = str(e)
+                print(f"[Startup] Failed to load router {name}: {e}")
+                raise
+            # Regenerate /openapi.json with the new routes
+            self._app.openapi_schema = None
+            router.load_ms = round((time.perf_counter() - start) * 1000, 2)
+            router.error = None
+            router.loaded = True
+            print(f"[Startup] Loaded router {name} in {router.load_ms}ms")
+
+    def load_all(self):
+        for name in self.pending():
+            try:
+                self.load(name)
+            except Exception:
+                pass
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            r.name: {"loaded": r.loaded, "load_ms": r.load_ms, "error": r.error}
+            for r in self._routers.values()
+        }
+
+
+class Startup:
+    """
+    Cold-start bookkeeping: import-time profile, lazy router registry and the
+    background warm-up whose completion /ready reports.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.created_at = time.time()
+        self.profiler = ImportProfiler()
+        if IMPORT_PROFILE_ENABLED:
+            self.profiler.install()
+        self.routers: Optional[LazyRouterRegistry] = None
+        self.first_request = threading.Event()
+        self.app_ready_ms: Optional[float] = None
+        self.warm_ms: Optional[float] = None
+        self._ready = threading.Event()
+        self._warm_started = False
+
+    @classmethod
+    def get_instance(cls) -> "Startup":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = Startup()
+        return cls._instance
+
+    def lazy_routers(self, app, api_prefix: str = "/api") -> LazyRouterRegistry:
+        if self.routers is None:
+            self.routers = LazyRouterRegistry(app, api_prefix)
+        return self.routers
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def warm_up(self, routers: Optional[List[str]] = None, modules: Optional[List[str]] = None):
+        """Starts the warm-up thread: warm routers first, then heavy libraries; marks the instance ready at the end."""
+        if self._warm_started:
+            return
+        self._warm_started = True
+        self.app_ready_ms = round((time.time() - self.created_at) * 1000, 2)
+        routers = WARM_ROUTERS if routers is None else routers
+        modules = WARM_MODULES if modules is None else modules
+
+        def _warm():
+            self.first_request.wait(WARM_DELAY_SECONDS)
+            start = time.time()
+            if self.routers is not None:
+                names = self.routers.pending() if "*" in routers else routers
+                for name in names:
+                    try:
+                        self.routers.load(name)
+                    except Exception:
+                        pass
+            if modules:
+                from services.background_loader import BackgroundLoader
+                BackgroundLoader.get_instance().load_now(modules)
+            self.warm_ms = round((time.time() - start) * 1000, 2)
+            self._ready.set()
+            print(f"[Startup] Warm-up finished in {self.warm_ms}ms")
+
+        threading.Thread(target=_warm, name="startup-warm", daemon=True).start()
+
+    def status(self, top: int = 30) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "app_ready_ms": self.app_ready_ms,
+            "warm_ms": self.warm_ms,
+            "routers": self.routers.status() if self.routers is not None else {},
+            "imports": self.profiler.report(top) if IMPORT_PROFILE_ENABLED else None,
+        }
+
+
+def get_startup() -> Startup:
+    return Startup.get_instance()
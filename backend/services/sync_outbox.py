@@ -0,0 +1,304 @@
+import os
+import time
+import uuid
+import datetime
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.cloud import firestore
+from google.api_core.exceptions import AlreadyExists
+
+from services.bulk_writer import FIRESTORE_BATCH_LIMIT
+
+OUTBOX_COLLECTION = "sync_outbox"
+DEAD_LETTER_COLLECTION = "sync_outbox_dead"
+COALESCE_SECONDS = float(os.environ.get("SYNC_OUTBOX_COALESCE_SECONDS", "3"))
+POLL_SECONDS = float(os.environ.get("SYNC_OUTBOX_POLL_SECONDS", "2"))
+LEASE_SECONDS = int(os.environ.get("SYNC_OUTBOX_LEASE_SECONDS", "60"))
+DRAIN_BATCH = 50
+# After this many failed attempts an event is moved to DEAD_LETTER_COLLECTION instead of retried
+MAX_ATTEMPTS = int(os.environ.get("SYNC_OUTBOX_MAX_ATTEMPTS", "8"))
+
+
+class EventWrites:
+    """
+    The writes of one event (same set/update/delete/increment API as BufferedWriter).
+    Nothing is written until commit(), so a handler that raises partway leaves no trace.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._ops: List[Tuple[str, Any, Any]] = []
+
+    def set(self, ref, data: Dict[str, Any], merge: bool = False):
+        self._ops.append(("set", ref, (data, merge)))
+
+    def update(self, ref, data: Dict[str, Any]):
+        self._ops.append(("update", ref, data))
+
+    def delete(self, ref):
+        self._ops.append(("delete", ref, None))
+
+    def increment(self, ref, field: str, amount: int = 1):
+        self._ops.append(("update", ref, {field: firestore.Increment(amount)}))
+
+    def commit(self):
+        """Commits all writes; raises if any batch fails (atomic for events up to FIRESTORE_BATCH_LIMIT writes)."""
+        for i in range(0, len(self._ops), FIRESTORE_BATCH_LIMIT):
+            batch = self.db.batch()
+            for kind, ref, data in self._ops[i:i + FIRESTORE_BATCH_LIMIT]:
+                if kind == "set":
+                    batch.set(ref, data[0], merge=data[1])
+                elif kind == "update":
+                    batch.update(ref, data)
+                else:
+                    batch.delete(ref)
+            batch.commit()
+
+
+# handler(db, source_id, payload, writer) applies one coalesced change through the event's EventWrites
+Handler = Callable[[Any, str, Dict[str, Any], EventWrites], None]
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class SyncOutbox:
+    """
+    Durable outbox for backlog <-> daily propagation.
+
+    enqueue() upserts one document per (kind, source_id): later edits merge
+    their fields into the same payload and push `due_at` out by
+    COALESCE_SECONDS, so typing into a title field ends up as a single
+    propagation. A worker thread claims due events with a lease (safe with
+    several Cloud Run instances), collects each event's writes in its own
+    EventWrites and commits them, and deletes the event only if that commit
+    succeeded and no newer edit arrived meanwhile. Events survive an instance
+    dying and are picked up by the next drain(). An event that keeps failing
+    (e.g. its target was deleted) is moved to DEAD_LETTER_COLLECTION after
+    MAX_ATTEMPTS.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, db=None):
+        self._db = db
+        self._handlers: Dict[str, Handler] = {}
+        self._worker = None
+        self._stop = threading.Event()
+        self._drain_lock = threading.Lock()
+        self.worker_id = f"outbox-{uuid.uuid4().hex[:6]}"
+
+        self.applied = 0
+        self.coalesced_edits = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self.last_lag_seconds = None
+        self.max_lag_seconds = 0.0
+
+    @classmethod
+    def get_instance(cls) -> "SyncOutbox":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = SyncOutbox()
+        return cls._instance
+
+    @property
+    def db(self):
+        if self._db is None:
+            from database import get_db
+            self._db = get_db()
+        return self._db
+
+    @property
+    def collection(self):
+        return self.db.collection(OUTBOX_COLLECTION)
+
+    def register(self, kind: str, handler: Handler):
+        self._handlers[kind] = handler
+
+    # --- Producer side ---
+
+    def enqueue(self, kind: str, source_id: str, fields: Dict[str, Any]):
+        """Records (or merges into) the pending change for this source. One document write."""
+        now = _now()
+        ref = self.collection.document(f"{kind}__{source_id}")
+        data = {
+            "kind": kind,
+            "source_id": source_id,
+            "payload": fields,
+            "updated_at": now,
+            "due_at": now + datetime.timedelta(seconds=COALESCE_SECONDS),
+        }
+        try:
+            ref.create({**data, "enqueued_at": now, "version": 1, "attempts": 0, "lease_until": None})
+        except AlreadyExists:
+            # Nested merge: only the edited payload fields are replaced
+            ref.set({**data, "version": firestore.Increment(1)}, merge=True)
+        self.start()
+
+    # --- Worker ---
+
+    def start(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._instance_lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._stop.clear()
+            self._worker = threading.Thread(target=self._run, name="sync-outbox", daemon=True)
+            self._worker.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(POLL_SECONDS):
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"SyncOutbox drain failed: {e}")
+
+    def drain(self, include_not_due: bool = False) -> int:
+        """Applies due events (all pending ones with include_not_due). Returns how many were applied."""
+        with self._drain_lock:
+            now = _now()
+            query = self.collection
+            if not include_not_due:
+                query = query.where("due_at", "<=", now)
+            snaps = list(query.order_by("due_at").limit(DRAIN_BATCH).stream())
+            claimed = [c for c in (self._claim(s.reference, now) for s in snaps) if c]
+            if not claimed:
+                return 0
+
+            done = 0
+            for ref, data in claimed:
+                handler = self._handlers.get(data.get("kind"))
+                if handler is None:
+                    print(f"SyncOutbox: no handler for {data.get('kind')}, leaving {ref.id} queued")
+                    continue
+                writes = EventWrites(self.db)
+                try:
+                    handler(self.db, data["source_id"], data.get("payload") or {}, writes)
+                    writes.commit()
+                except Exception as e:
+                    self.failures += 1
+                    print(f"SyncOutbox: {ref.id} failed: {e}")
+                    self._release(ref, data, failed=True, error=str(e))
+                    continue
+                # Only events whose writes all landed are dropped
+                self._finish(ref, data)
+                done += 1
+            return done
+
+    def _claim(self, ref, now: datetime.datetime):
+        transaction = self.db.transaction()
+
+        @firestore.transactional
+        def claim(txn):
+            snap = ref.get(transaction=txn)
+            if not snap.exists:
+                return None
+            data = snap.to_dict()
+            lease_until = data.get("lease_until")
+            if lease_until and lease_until > now:
+                return None
+            txn.update(ref, {"lease_until": now + datetime.timedelta(seconds=LEASE_SECONDS), "lease_owner": self.worker_id})
+            return data
+
+        try:
+            data = claim(transaction)
+        except Exception as e:
+            print(f"SyncOutbox: claim of {ref.id} failed: {e}")
+            return None
+        return (ref, data) if data else None
+
+    def _finish(self, ref, data: Dict[str, Any]):
+        transaction = self.db.transaction()
+
+        @firestore.transactional
+        def finish(txn):
+            snap = ref.get(transaction=txn)
+            if not snap.exists:
+                return True
+            if snap.to_dict().get("version") != data.get("version"):
+                # Edited while we were applying: keep it (with the merged newer payload) for the next pass
+                txn.update(ref, {"lease_until": None, "lease_owner": None})
+                return False
+            txn.delete(ref)
+            return True
+
+        try:
+            finished = finish(transaction)
+        except Exception as e:
+            print(f"SyncOutbox: finishing {ref.id} failed: {e}")
+            return
+        if finished:
+            lag = (_now() - data["enqueued_at"]).total_seconds() if data.get("enqueued_at") else None
+            self.applied += 1
+            self.coalesced_edits += max(0, (data.get("version") or 1) - 1)
+            if lag is not None:
+                self.last_lag_seconds = lag
+                self.max_lag_seconds = max(self.max_lag_seconds, lag)
+
+    def _release(self, ref, data: Dict[str, Any], failed: bool = False, error: Optional[str] = None):
+        attempts = (data.get("attempts") or 0) + (1 if failed else 0)
+        if failed and attempts >= MAX_ATTEMPTS:
+            self._dead_letter(ref, data, attempts, error)
+            return
+        backoff = min(300, 5 * (2 ** attempts)) if failed else 0
+        try:
+            ref.update({
+                "lease_until": None,
+                "lease_owner": None,
+                "attempts": attempts,
+                "due_at": _now() + datetime.timedelta(seconds=backoff),
+            })
+        except Exception as e:
+            print(f"SyncOutbox: release of {ref.id} failed: {e}")
+
+    def _dead_letter(self, ref, data: Dict[str, Any], attempts: int, error: Optional[str]):
+        batch = self.db.batch()
+        batch.set(self.db.collection(DEAD_LETTER_COLLECTION).document(ref.id), {
+            **data,
+            "lease_until": None,
+            "lease_owner": None,
+            "attempts": attempts,
+            "last_error": error,
+            "dead_lettered_at": _now(),
+        })
+        batch.delete(ref)
+        try:
+            batch.commit()
+            self.dead_lettered += 1
+            print(f"SyncOutbox: {ref.id} moved to {DEAD_LETTER_COLLECTION} after {attempts} attempts: {error}")
+        except Exception as e:
+            print(f"SyncOutbox: dead-lettering {ref.id} failed: {e}")
+
+    # --- Metrics ---
+
+    def metrics(self) -> Dict[str, Any]:
+        pending = self.collection.count().get()[0][0].value
+        oldest_age = None
+        for snap in self.collection.order_by("enqueued_at").limit(1).stream():
+            enqueued_at = snap.to_dict().get("enqueued_at")
+            if enqueued_at:
+                oldest_age = (_now() - enqueued_at).total_seconds()
+        return {
+            "pending": pending,
+            "oldest_pending_age_seconds": oldest_age,
+            "applied": self.applied,
+            "coalesced_edits": self.coalesced_edits,
+            "failures": self.failures,
+            "dead_lettered": self.dead_lettered,
+            "last_lag_seconds": self.last_lag_seconds,
+            "max_lag_seconds": self.max_lag_seconds,
+            "worker_alive": self._worker is not None and self._worker.is_alive(),
+        }
+
+
+def get_sync_outbox() -> SyncOutbox:
+    return SyncOutbox.get_instance()
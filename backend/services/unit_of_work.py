@@ -0,0 +1,110 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+from google.cloud import firestore
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+
+
+class StaleWriteError(Exception):
+    """A document changed (or was created) between our read and our commit."""
+
+
+class UnitOfWork:
+    """
+    Request-scoped read cache and write buffer over a Firestore client.
+
+    Snapshots are fetched at most once per document per request (get/get_all/data),
+    writes are staged and sent in a single batch by commit(). Writes to a document
+    that was read through this unit of work are guarded with the snapshot's
+    update_time (or exists=False if it was missing), so a concurrent change makes
+    the whole batch fail with StaleWriteError instead of being silently overwritten.
+    Pass guard=False for blind field writes that don't depend on what was read.
+    """
+
+    def __init__(self, db: firestore.Client):
+        self.db = db
+        self._snaps: Dict[str, Any] = {}
+        self._data: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._writes: List[tuple] = []
+        self.reads = 0
+
+    # --- Reads ---
+
+    def get(self, ref):
+        snap = self._snaps.get(ref.path)
+        if snap is None:
+            snap = ref.get()
+            self.reads += 1
+            self._snaps[ref.path] = snap
+        return snap
+
+    def get_all(self, refs: Iterable) -> list:
+        refs = list(refs)
+        missing = [r for r in refs if r.path not in self._snaps]
+        if missing:
+            for snap in self.db.get_all(missing):
+                self._snaps[snap.reference.path] = snap
+            self.reads += len(missing)
+        return [self._snaps[r.path] for r in refs]
+
+    def data(self, ref) -> Optional[Dict[str, Any]]:
+        """The document as read (one to_dict() per request), or None if it does not exist. Shared: don't mutate."""
+        if ref.path not in self._data:
+            snap = self.get(ref)
+            self._data[ref.path] = snap.to_dict() if snap.exists else None
+        return self._data[ref.path]
+
+    # --- Writes (staged until commit) ---
+
+    def set(self, ref, data: Dict[str, Any], guard: bool = True):
+        snap = self._snaps.get(ref.path) if guard else None
+        if snap is None:
+            self._writes.append(("set", ref, data, None))
+        elif not snap.exists:
+            self._writes.append(("create", ref, data, None))
+        else:
+            # set() takes no precondition: replace via a guarded update that also drops removed fields
+            fields = dict(data)
+            for key in (snap.to_dict() or {}):
+                if key not in fields:
+                    fields[key] = firestore.DELETE_FIELD
+            self._writes.append(("update", ref, fields, self._option(snap)))
+
+    def update(self, ref, data: Dict[str, Any], guard: bool = True):
+        """Fails with NotFound at commit if the document does not exist."""
+        snap = self._snaps.get(ref.path) if guard else None
+        self._writes.append(("update", ref, data, self._option(snap)))
+
+    def delete(self, ref, guard: bool = True):
+        """Fails with NotFound at commit if the document does not exist."""
+        snap = self._snaps.get(ref.path) if guard else None
+        option = self._option(snap) or self.db.write_option(exists=True)
+        self._writes.append(("delete", ref, None, option))
+
+    def commit(self):
+        if not self._writes:
+            return
+        writes, self._writes = self._writes, []
+        batch = self.db.batch()
+        for op, ref, data, option in writes:
+            if op == "create":
+                batch.create(ref, data)
+            elif op == "set":
+                batch.set(ref, data)
+            elif op == "update":
+                batch.update(ref, data, option=option)
+            else:
+                batch.delete(ref, option=option)
+        try:
+            batch.commit()
+        except (FailedPrecondition, AlreadyExists) as e:
+            raise StaleWriteError(str(e)) from e
+        finally:
+            # Whatever happened, cached snapshots of written documents are no longer current
+            for _, ref, _, _ in writes:
+                self._snaps.pop(ref.path, None)
+                self._data.pop(ref.path, None)
+
+    def _option(self, snap):
+        if snap is None or not snap.exists:
+            return None
+        return self.db.write_option(last_update_time=snap.update_time)
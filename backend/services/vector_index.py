@@ -0,0 +1,352 @@
+import os
+import json
+import time
+import datetime
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from services.ai_shared import get_firestore_client, trace, FIRESTORE_COLLECTION_NAME
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+INDEX_DIR = os.environ.get("VECTOR_INDEX_DIR", "/tmp/consulting_slide_index")
+REFRESH_SECONDS = int(os.environ.get("VECTOR_INDEX_REFRESH_SECONDS", "60"))
+REBUILD_SECONDS = int(os.environ.get("VECTOR_INDEX_REBUILD_SECONDS", str(6 * 3600)))
+ANN_THRESHOLD = int(os.environ.get("VECTOR_INDEX_ANN_THRESHOLD", "20000")) # Brute force below this many rows
+ANN_OVERSAMPLE = 8
+
+META_FIELDS = ["uri", "filename", "page_number", "structure_type", "key_message", "description"]
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+class SlideVectorIndex:
+    """
+    In-process cosine index over the `consulting_slides` embeddings.
+
+    Vectors are L2-normalized and kept in a float32 matrix that is persisted
+    under VECTOR_INDEX_DIR and reopened memory-mapped, so a restart does not
+    re-read the whole collection. New slides are picked up incrementally
+    (created_at watermark every REFRESH_SECONDS, or upsert() from an
+    in-process ingestion run); a full rebuild every REBUILD_SECONDS drops
+    slides deleted in Firestore.
+
+    Search is an exact dot product for small sets. Above ANN_THRESHOLD rows an
+    HNSW graph is used when hnswlib is installed, and the candidates are
+    re-scored exactly.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, collection_name: str = FIRESTORE_COLLECTION_NAME, index_dir: str = INDEX_DIR):
+        self.collection_name = collection_name
+        self.index_dir = index_dir
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+
+        # Base rows (persisted, memory-mapped) + delta rows added since the last persist
+        self._base = np.zeros((0, 0), dtype=np.float32)
+        self._delta: List[np.ndarray] = []
+        self._ids: List[str] = []
+        self._meta: List[Dict[str, Any]] = []
+        self._row_of: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._ann = None
+
+        self._watermark: Optional[datetime.datetime] = None
+        self._loaded = False
+        self._last_refresh = 0.0
+        self._last_rebuild = 0.0
+
+    @classmethod
+    def get_instance(cls) -> "SlideVectorIndex":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = SlideVectorIndex()
+        return cls._instance
+
+    @classmethod
+    def loaded_instance(cls) -> Optional["SlideVectorIndex"]:
+        """The index if this process already built it, else None (used by ingestion hooks)."""
+        inst = cls._instance
+        return inst if inst is not None and inst._loaded else None
+
+    @property
+    def size(self) -> int:
+        return int(self._alive.sum())
+
+    # --- Search ---
+
+    def search(self, vector: List[float], top_k: int = 5, structure_type: Optional[str] = None, filename: Optional[str] = None) -> List[Dict[str, Any]]:
+        self._ensure_fresh()
+        query = _normalize(np.asarray([vector], dtype=np.float32))[0]
+
+        with self._lock:
+            matrix = self._matrix()
+            if matrix.shape[0] == 0 or matrix.shape[1] != query.shape[0]:
+                return []
+            mask = self._alive.copy()
+            if structure_type:
+                mask &= np.array([m.get("structure_type") == structure_type for m in self._meta], dtype=bool)
+            if filename:
+                mask &= np.array([m.get("filename") == filename for m in self._meta], dtype=bool)
+
+            candidates = self._ann_candidates(query, top_k, mask)
+            if candidates is None:
+                idx = np.flatnonzero(mask)
+                if idx.size == 0:
+                    return []
+                scores = matrix[idx] @ query
+            else:
+                idx = candidates
+                scores = matrix[idx] @ query
+
+            k = min(top_k, idx.size)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [self._result(int(idx[i]), float(scores[i])) for i in top]
+
+    def _ann_candidates(self, query: np.ndarray, top_k: int, mask: np.ndarray) -> Optional[np.ndarray]:
+        """Row ids proposed by the HNSW graph, or None to fall back to brute force."""
+        if self._ann is None:
+            return None
+        n = self._ann.get_current_count()
+        labels, _ = self._ann.knn_query(query, k=min(n, top_k * ANN_OVERSAMPLE))
+        rows = labels[0].astype(np.int64)
+        # Rows added after the graph was built are always scored exactly
+        rows = np.concatenate([rows, np.arange(n, self._alive.shape[0])])
+        rows = rows[mask[rows]]
+        if rows.size < top_k and mask.sum() > rows.size:
+            return None # Filter is too selective for the oversampled graph result
+        return rows
+
+    def _result(self, row: int, score: float) -> Dict[str, Any]:
+        meta = self._meta[row]
+        return {
+            "id": meta.get("uri"), # GCS URI
+            "doc_id": self._ids[row],
+            "score": score,
+            "metadata": {
+                "structure_type": meta.get("structure_type"),
+                "key_message": meta.get("key_message"),
+                "description": meta.get("description"),
+                "page_number": meta.get("page_number"),
+                "filename": meta.get("filename"),
+            }
+        }
+
+    # --- Updates ---
+
+    def upsert(self, doc_id: str, embedding: List[float], meta: Dict[str, Any]):
+        vec = _normalize(np.asarray([embedding], dtype=np.float32))
+        with self._lock:
+            if self._dim() and vec.shape[1] != self._dim():
+                print(f"SlideVectorIndex: skipping {doc_id}, dimension {vec.shape[1]} != {self._dim()}")
+                return
+            old = self._row_of.get(doc_id)
+            if old is not None:
+                self._alive[old] = False
+            self._row_of[doc_id] = len(self._ids)
+            self._ids.append(doc_id)
+            self._meta.append({f: meta.get(f) for f in META_FIELDS})
+            self._delta.append(vec)
+            self._alive = np.append(self._alive, True)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            row = self._row_of.pop(doc_id, None)
+            if row is not None:
+                self._alive[row] = False
+
+    # --- Loading / refresh ---
+
+    def _ensure_fresh(self):
+        if not self._loaded:
+            with self._refresh_lock:
+                if not self._loaded:
+                    if not self._load_from_disk():
+                        self.rebuild()
+                    else:
+                        self.refresh()
+                    self._loaded = True
+            return
+
+        now = time.time()
+        if now - self._last_refresh < REFRESH_SECONDS:
+            return
+        # Stale: refresh in the background, keep serving the current rows
+        if self._refresh_lock.acquire(blocking=False):
+            self._last_refresh = now
+            def run():
+                try:
+                    if time.time() - self._last_rebuild > REBUILD_SECONDS:
+                        self.rebuild()
+                    else:
+                        self.refresh()
+                except Exception as e:
+                    print(f"SlideVectorIndex: background refresh failed: {e}")
+                finally:
+                    self._refresh_lock.release()
+            threading.Thread(target=run, name="vector-index-refresh", daemon=True).start()
+
+    def _stream(self, query):
+        for snap in query.select(META_FIELDS + ["embedding", "created_at"]).stream():
+            data = snap.to_dict() or {}
+            emb = data.get("embedding")
+            if emb is None:
+                continue
+            yield snap.id, list(emb), data
+
+    def rebuild(self):
+        """Reads the whole collection and replaces the index."""
+        start = time.time()
+        collection = get_firestore_client().collection(self.collection_name)
+        ids, meta, vectors = [], [], []
+        watermark = None
+        for doc_id, emb, data in self._stream(collection):
+            ids.append(doc_id)
+            meta.append({f: data.get(f) for f in META_FIELDS})
+            vectors.append(emb)
+            created = data.get("created_at")
+            if isinstance(created, datetime.datetime) and (watermark is None or created > watermark):
+                watermark = created
+
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32)) if vectors else np.zeros((0, 0), dtype=np.float32)
+        with self._lock:
+            self._base = matrix
+            self._delta = []
+            self._ids = ids
+            self._meta = meta
+            self._row_of = {d: i for i, d in enumerate(ids)}
+            self._alive = np.ones(len(ids), dtype=bool)
+            self._watermark = watermark
+            self._build_ann()
+        self._last_rebuild = self._last_refresh = time.time()
+        trace(f"SlideVectorIndex: rebuilt {len(ids)} rows in {time.time() - start:.2f}s")
+        self._persist()
+
+    def refresh(self):
+        """Pulls slides created after the watermark."""
+        collection = get_firestore_client().collection(self.collection_name)
+        query = collection
+        if self._watermark is not None:
+            query = collection.where("created_at", ">", self._watermark)
+        added = 0
+        for doc_id, emb, data in self._stream(query):
+            self.upsert(doc_id, emb, data)
+            created = data.get("created_at")
+            if isinstance(created, datetime.datetime) and (self._watermark is None or created > self._watermark):
+                self._watermark = created
+            added += 1
+        self._last_refresh = time.time()
+        if added:
+            trace(f"SlideVectorIndex: refreshed {added} rows")
+            self._persist()
+
+    # --- Persistence ---
+
+    def _paths(self):
+        return os.path.join(self.index_dir, "vectors.npy"), os.path.join(self.index_dir, "meta.json")
+
+    def _persist(self):
+        vec_path, meta_path = self._paths()
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            with self._lock:
+                # Only live rows are written; the next start reopens this file memory-mapped
+                keep = np.flatnonzero(self._alive)
+                matrix = self._matrix()[keep] if keep.size else np.zeros((0, self._dim()), dtype=np.float32)
+                ids = [self._ids[i] for i in keep]
+                meta = [self._meta[i] for i in keep]
+                watermark = self._watermark
+
+            np.save(vec_path + ".tmp.npy", matrix)
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump({
+                    "ids": ids,
+                    "meta": meta,
+                    "watermark": watermark.isoformat() if watermark else None,
+                    "rebuilt_at": self._last_rebuild,
+                }, f, default=str)
+            os.replace(vec_path + ".tmp.npy", vec_path)
+            os.replace(meta_path + ".tmp", meta_path)
+        except Exception as e:
+            print(f"SlideVectorIndex: persist failed: {e}")
+
+    def _load_from_disk(self) -> bool:
+        vec_path, meta_path = self._paths()
+        if not (os.path.exists(vec_path) and os.path.exists(meta_path)):
+            return False
+        try:
+            matrix = np.load(vec_path, mmap_mode="r")
+            with open(meta_path) as f:
+                saved = json.load(f)
+            if matrix.shape[0] != len(saved["ids"]):
+                print("SlideVectorIndex: persisted index is inconsistent, rebuilding")
+                return False
+        except Exception as e:
+            print(f"SlideVectorIndex: failed to load persisted index: {e}")
+            return False
+
+        with self._lock:
+            self._base = matrix
+            self._delta = []
+            self._ids = saved["ids"]
+            self._meta = saved["meta"]
+            self._row_of = {d: i for i, d in enumerate(self._ids)}
+            self._alive = np.ones(len(self._ids), dtype=bool)
+            wm = saved.get("watermark")
+            self._watermark = datetime.datetime.fromisoformat(wm) if wm else None
+            self._last_rebuild = saved.get("rebuilt_at") or 0.0
+            self._build_ann()
+        return True
+
+    # --- Helpers ---
+
+    def _dim(self) -> int:
+        if self._base.shape[0]:
+            return self._base.shape[1]
+        return self._delta[0].shape[1] if self._delta else 0
+
+    def _matrix(self) -> np.ndarray:
+        if not self._delta:
+            return self._base
+        # Fold the delta rows in once so repeated searches don't re-stack
+        parts = ([self._base] if self._base.shape[0] else []) + self._delta
+        self._base = np.vstack(parts)
+        self._delta = []
+        return self._base
+
+    def _build_ann(self):
+        self._ann = None
+        if hnswlib is None or self._base.shape[0] < ANN_THRESHOLD:
+            return
+        n, dim = self._base.shape
+        ann = hnswlib.Index(space="ip", dim=dim) # Vectors are normalized, so inner product == cosine
+        ann.init_index(max_elements=n, ef_construction=200, M=16)
+        ann.add_items(np.asarray(self._base), np.arange(n))
+        ann.set_ef(max(64, ANN_OVERSAMPLE * 10))
+        self._ann = ann
+        trace(f"SlideVectorIndex: built HNSW graph over {n} rows")
+
+
+def get_slide_index() -> SlideVectorIndex:
+    return SlideVectorIndex.get_instance()
+
+
+def note_slide_written(doc_id: str, doc_data: Dict[str, Any], embedding: List[float]):
+    """Ingestion hook: adds a freshly written slide to the index if this process has one loaded."""
+    index = SlideVectorIndex.loaded_instance()
+    if index is not None:
+        index.upsert(doc_id, embedding, doc_data)
@@ -0,0 +1,256 @@
+import os
+import time
+import uuid
+import random
+import datetime
+import threading
+from typing import Callable, Dict, Iterator, List, Optional
+
+from google.cloud import firestore
+
+from services.ai_shared import trace, BATCH_COLLECTION_NAME
+
+WORK_COLLECTION_NAME = "ingestion_work_items"
+LEASE_SECONDS = int(os.environ.get("INGEST_LEASE_SECONDS", "600"))
+MAX_ATTEMPTS = int(os.environ.get("INGEST_MAX_ATTEMPTS", "3"))
+SEED_WAIT_SECONDS = int(os.environ.get("INGEST_SEED_WAIT_SECONDS", "300"))
+CLAIM_CANDIDATES = 10
+
+STATE_QUEUED = "queued"
+STATE_LEASED = "leased"
+STATE_DONE = "done"
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class WorkQueue:
+    """
+    Lease-based work queue for one ingestion batch, stored in Firestore.
+
+    One document per file in `ingestion_work_items`. Cloud Run Job tasks claim
+    the next queued file in a transaction instead of taking a fixed
+    `i % TASK_COUNT` shard, so fast tasks keep pulling work while slow ones
+    finish their large decks. Held leases are renewed by a heartbeat thread;
+    leases of crashed tasks expire and are reclaimed (up to MAX_ATTEMPTS).
+
+    A task holds at most `max_outstanding` leases: claims() waits for a
+    complete() before claiming more, so queued files stay available to idle
+    tasks instead of sitting in this task's pipeline buffers.
+    """
+
+    def __init__(self, db, batch_id: str, worker_id: Optional[str] = None, max_outstanding: Optional[int] = None):
+        self.db = db
+        self.batch_id = batch_id
+        self.worker_id = worker_id or f"task-{os.environ.get('CLOUD_RUN_TASK_INDEX', '0')}-{uuid.uuid4().hex[:6]}"
+        self.collection = db.collection(WORK_COLLECTION_NAME)
+        self.batch_ref = db.collection(BATCH_COLLECTION_NAME).document(batch_id)
+
+        self._held: Dict[str, str] = {} # item id -> filename
+        self._held_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_outstanding) if max_outstanding else None
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    @staticmethod
+    def item_id(batch_id: str, filename: str) -> str:
+        safe = "".join(c for c in filename if c.isalnum() or c in "._-")
+        return f"{batch_id}_{safe}"
+
+    # --- Seeding (coordinator task) ---
+
+    def seed(self, filenames: List[str], writer):
+        """Enqueues every file (through a BufferedWriter) and marks the batch as seeded."""
+        for name in filenames:
+            writer.set(self.collection.document(self.item_id(self.batch_id, name)), {
+                "batch_id": self.batch_id,
+                "filename": name,
+                "state": STATE_QUEUED,
+                "attempts": 0,
+                "lease_owner": None,
+                "lease_expires_at": None,
+                "created_at": firestore.SERVER_TIMESTAMP,
+            })
+        writer.flush()
+        self.batch_ref.set({"queue_seeded": True, "queued_files": len(filenames)}, merge=True)
+        trace(f"WorkQueue: seeded {len(filenames)} items for batch {self.batch_id}")
+
+    def wait_until_seeded(self, timeout: int = SEED_WAIT_SECONDS) -> bool:
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            snap = self.batch_ref.get()
+            if snap.exists and (snap.to_dict() or {}).get("queue_seeded"):
+                return True
+            time.sleep(2)
+        print(f"WorkQueue: batch {self.batch_id} was not seeded within {timeout}s")
+        return False
+
+    # --- Claiming ---
+
+    def claims(self, should_stop: Callable[[], bool] = lambda: False) -> Iterator[str]:
+        """Yields filenames claimed by this worker until the queue is drained or should_stop() is True."""
+        self._start_heartbeat()
+        while not should_stop():
+            if self._slots is not None:
+                # Wait for a held file to complete before leasing another
+                while not self._slots.acquire(timeout=1):
+                    if should_stop():
+                        return
+            filename = self.claim_next()
+            if filename is None:
+                self._release_slot()
+                return
+            yield filename
+
+    def claim_next(self, max_rounds: int = 20) -> Optional[str]:
+        for _ in range(max_rounds):
+            candidates = list(
+                self.collection
+                .where("batch_id", "==", self.batch_id)
+                .where("state", "==", STATE_QUEUED)
+                .limit(CLAIM_CANDIDATES)
+                .stream()
+            )
+            if not candidates:
+                candidates = self._expired_leases()
+                if not candidates:
+                    return None
+
+            # Random pick spreads concurrent tasks over different documents
+            random.shuffle(candidates)
+            for snap in candidates:
+                filename = self._try_claim(snap.reference)
+                if filename:
+                    return filename
+            # Every candidate was taken by another task meanwhile; query again
+        print(f"WorkQueue: giving up claiming after {max_rounds} contended rounds")
+        return None
+
+    def _expired_leases(self):
+        now = _now()
+        leased = self.collection.where("batch_id", "==", self.batch_id).where("state", "==", STATE_LEASED).stream()
+        return [s for s in leased if (s.to_dict() or {}).get("lease_expires_at") and s.to_dict()["lease_expires_at"] < now]
+
+    def _try_claim(self, ref) -> Optional[str]:
+        transaction = self.db.transaction()
+
+        @firestore.transactional
+        def claim(txn):
+            snap = ref.get(transaction=txn)
+            if not snap.exists:
+                return None
+            data = snap.to_dict()
+            state = data.get("state")
+            expired = state == STATE_LEASED and data.get("lease_expires_at") and data["lease_expires_at"] < _now()
+            if state != STATE_QUEUED and not expired:
+                return None
+            attempts = data.get("attempts", 0) + 1
+            if attempts > MAX_ATTEMPTS:
+                txn.update(ref, {"state": STATE_DONE, "outcome": "abandoned", "completed_at": firestore.SERVER_TIMESTAMP})
+                trace(f"WorkQueue: abandoning {data.get('filename')} after {attempts - 1} attempts")
+                return None
+            txn.update(ref, {
+                "state": STATE_LEASED,
+                "lease_owner": self.worker_id,
+                "lease_expires_at": _now() + datetime.timedelta(seconds=LEASE_SECONDS),
+                "attempts": attempts,
+            })
+            return data.get("filename")
+
+        try:
+            filename = claim(transaction)
+        except Exception as e:
+            print(f"WorkQueue: claim of {ref.id} failed: {e}")
+            return None
+        if filename:
+            with self._held_lock:
+                self._held[ref.id] = filename
+        return filename
+
+    # --- Completion ---
+
+    def complete(self, filename: str, outcome: str, writer=None):
+        """Marks a claimed file as done. Pass the run's writer to keep it ordered after the file status."""
+        item_ref = self.collection.document(self.item_id(self.batch_id, filename))
+        data = {"state": STATE_DONE, "outcome": outcome, "lease_owner": None, "completed_at": firestore.SERVER_TIMESTAMP}
+        if writer is not None:
+            writer.update(item_ref, data)
+        else:
+            item_ref.update(data)
+        with self._held_lock:
+            held = self._held.pop(item_ref.id, None)
+        if held is not None:
+            self._release_slot()
+
+    def _release_slot(self):
+        if self._slots is not None:
+            try:
+                self._slots.release()
+            except ValueError:
+                pass
+
+    def release_all(self):
+        """Returns unfinished leases to the queue (e.g. after a cancel) and stops the heartbeat."""
+        self._stop.set()
+        with self._held_lock:
+            held = list(self._held.keys())
+            self._held.clear()
+        for item_id in held:
+            try:
+                self.collection.document(item_id).update({"state": STATE_QUEUED, "lease_owner": None, "lease_expires_at": None})
+            except Exception as e:
+                print(f"WorkQueue: failed to release {item_id}: {e}")
+
+    def check_batch_completion(self) -> bool:
+        """
+        Marks the batch `completed` once no item is queued or leased.
+        Runs in a transaction on the batch document so only one task flips it.
+        """
+        remaining_query = (
+            self.collection
+            .where("batch_id", "==", self.batch_id)
+            .where("state", "in", [STATE_QUEUED, STATE_LEASED])
+        )
+        remaining = remaining_query.count().get()[0][0].value
+        if remaining > 0:
+            trace(f"WorkQueue: {remaining} items still pending for batch {self.batch_id}")
+            return False
+
+        transaction = self.db.transaction()
+
+        @firestore.transactional
+        def mark_completed(txn):
+            snap = self.batch_ref.get(transaction=txn)
+            if not snap.exists or (snap.to_dict() or {}).get("status") != "processing":
+                return False
+            txn.update(self.batch_ref, {"status": "completed", "completed_at": firestore.SERVER_TIMESTAMP})
+            return True
+
+        done = mark_completed(transaction)
+        if done:
+            trace(f"WorkQueue: batch {self.batch_id} completed")
+        return done
+
+    # --- Heartbeat ---
+
+    def _start_heartbeat(self):
+        if self._heartbeat is not None:
+            return
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name=f"lease-heartbeat-{self.worker_id}", daemon=True)
+        self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(LEASE_SECONDS / 3):
+            with self._held_lock:
+                held = list(self._held.keys())
+            for item_id in held:
+                try:
+                    self.collection.document(item_id).update({
+                        "lease_expires_at": _now() + datetime.timedelta(seconds=LEASE_SECONDS)
+                    })
+                except Exception as e:
+                    print(f"WorkQueue: lease renewal for {item_id} failed: {e}")
+
+    def stop(self):
+        self._stop.set()
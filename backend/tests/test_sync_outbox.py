@@ -0,0 +1,239 @@
+import copy
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("google.cloud.firestore")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from google.api_core.exceptions import AlreadyExists
+from google.cloud import firestore
+
+from services import sync_outbox
+from services.sync_outbox import SyncOutbox, OUTBOX_COLLECTION, DEAD_LETTER_COLLECTION
+
+
+# --- In-memory Firestore stand-in (only what the outbox uses) ---
+
+def _merge(target: dict, data: dict):
+    for key, value in data.items():
+        if isinstance(value, firestore.Increment):
+            target[key] = (target.get(key) or 0) + value.value
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+class FakeSnapshot:
+    def __init__(self, ref, data):
+        self.reference = ref
+        self.id = ref.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+class FakeRef:
+    def __init__(self, db, collection, doc_id):
+        self.db = db
+        self.collection = collection
+        self.id = doc_id
+
+    @property
+    def _docs(self):
+        return self.db.docs.setdefault(self.collection, {})
+
+    def get(self, transaction=None):
+        return FakeSnapshot(self, self._docs.get(self.id))
+
+    def create(self, data):
+        if self.id in self._docs:
+            raise AlreadyExists(f"{self.collection}/{self.id}")
+        self.set(data)
+
+    def set(self, data, merge=False):
+        if merge and self.id in self._docs:
+            _merge(self._docs[self.id], data)
+        else:
+            self._docs[self.id] = {}
+            _merge(self._docs[self.id], data)
+
+    def update(self, data):
+        if self.id not in self._docs:
+            raise KeyError(f"{self.collection}/{self.id} not found")
+        _merge(self._docs[self.id], data)
+
+    def delete(self):
+        self._docs.pop(self.id, None)
+
+
+class FakeQuery:
+    def __init__(self, db, collection, filters=(), order=None, limit=None):
+        self.db = db
+        self.name = collection
+        self.filters = list(filters)
+        self.order = order
+        self._limit = limit
+
+    def document(self, doc_id):
+        return FakeRef(self.db, self.name, doc_id)
+
+    def where(self, field, op, value):
+        assert op == "<="
+        return FakeQuery(self.db, self.name, self.filters + [(field, value)], self.order, self._limit)
+
+    def order_by(self, field):
+        return FakeQuery(self.db, self.name, self.filters, field, self._limit)
+
+    def limit(self, n):
+        return FakeQuery(self.db, self.name, self.filters, self.order, n)
+
+    def stream(self):
+        docs = self.db.docs.get(self.name, {})
+        ids = [i for i in docs if all(docs[i].get(f) <= v for f, v in self.filters)]
+        if self.order:
+            ids.sort(key=lambda i: docs[i].get(self.order))
+        return [FakeSnapshot(self.document(i), copy.deepcopy(docs[i])) for i in ids[:self._limit]]
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, ref, data, merge=False):
+        self.ops.append(lambda: ref.set(data, merge=merge))
+
+    def update(self, ref, data):
+        self.ops.append(lambda: ref.update(data))
+
+    def delete(self, ref):
+        self.ops.append(ref.delete)
+
+    def commit(self):
+        # All-or-nothing, like a Firestore batch
+        snapshot = copy.deepcopy(self.db.docs)
+        try:
+            for op in self.ops:
+                op()
+        except Exception:
+            self.db.docs = snapshot
+            raise
+
+
+class FakeTransaction:
+    def update(self, ref, data):
+        ref.update(data)
+
+    def delete(self, ref):
+        ref.delete()
+
+
+class FakeDB:
+    def __init__(self):
+        self.docs = {}
+
+    def collection(self, name):
+        return FakeQuery(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def transaction(self):
+        return FakeTransaction()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    # The fake transaction applies writes directly; run the transactional functions once
+    monkeypatch.setattr(sync_outbox.firestore, "transactional", lambda fn: fn)
+    return FakeDB()
+
+
+@pytest.fixture
+def outbox(db, monkeypatch):
+    box = SyncOutbox(db=db)
+    monkeypatch.setattr(box, "start", lambda: None)
+    return box
+
+
+def _event(db, doc_id):
+    return db.docs.get(OUTBOX_COLLECTION, {}).get(doc_id)
+
+
+def test_enqueue_merges_into_pending_event(db, outbox):
+    outbox.enqueue("backlog_to_daily", "b1", {"title": "Draft", "is_highlighted": False})
+    outbox.enqueue("backlog_to_daily", "b1", {"title": "Final"})
+
+    assert list(db.docs[OUTBOX_COLLECTION]) == ["backlog_to_daily__b1"]
+    event = _event(db, "backlog_to_daily__b1")
+    assert event["version"] == 2
+    assert event["payload"] == {"title": "Final", "is_highlighted": False}
+
+
+def test_finish_keeps_event_edited_while_applying(db, outbox):
+    outbox.enqueue("backlog_to_daily", "b1", {"title": "Draft"})
+    ref = outbox.collection.document("backlog_to_daily__b1")
+    claimed = ref.get().to_dict()
+    ref.update({"lease_until": sync_outbox._now(), "lease_owner": outbox.worker_id})
+
+    outbox.enqueue("backlog_to_daily", "b1", {"title": "Final"})
+    outbox._finish(ref, claimed)
+
+    event = _event(db, "backlog_to_daily__b1")
+    assert event is not None
+    assert event["payload"] == {"title": "Final"}
+    assert event["lease_until"] is None and event["lease_owner"] is None
+    assert outbox.applied == 0
+
+    outbox._finish(ref, ref.get().to_dict())
+    assert _event(db, "backlog_to_daily__b1") is None
+    assert outbox.applied == 1
+
+
+def test_failed_handler_leaves_no_writes(db, outbox):
+    db.collection("daily_tasks").document("t1").set({"title": "Old"})
+
+    def handler(db_, source_id, payload, writer):
+        writer.update(db_.collection("daily_tasks").document("t1"), payload)
+        raise RuntimeError("boom")
+
+    outbox.register("backlog_to_daily", handler)
+    outbox.enqueue("backlog_to_daily", "b1", {"title": "New"})
+
+    assert outbox.drain(include_not_due=True) == 0
+    assert db.docs["daily_tasks"]["t1"] == {"title": "Old"}
+    event = _event(db, "backlog_to_daily__b1")
+    assert event["attempts"] == 1
+    assert event["lease_until"] is None
+    assert outbox.failures == 1
+
+
+def test_event_is_dead_lettered_after_max_attempts(db, outbox, monkeypatch):
+    monkeypatch.setattr(sync_outbox, "MAX_ATTEMPTS", 3)
+
+    def handler(db_, source_id, payload, writer):
+        raise RuntimeError("target gone")
+
+    outbox.register("backlog_to_daily", handler)
+    outbox.enqueue("backlog_to_daily", "b1", {"title": "New"})
+
+    for attempt in range(1, 3):
+        outbox.drain(include_not_due=True)
+        assert _event(db, "backlog_to_daily__b1")["attempts"] == attempt
+
+    outbox.drain(include_not_due=True)
+    assert _event(db, "backlog_to_daily__b1") is None
+    dead = db.docs[DEAD_LETTER_COLLECTION]["backlog_to_daily__b1"]
+    assert dead["attempts"] == 3
+    assert dead["last_error"] == "target gone"
+    assert dead["payload"] == {"title": "New"}
+    assert outbox.dead_lettered == 1